@@ -20,9 +20,11 @@
 - WHERE 引用 SELECT 别名(非窗口), WHERE 引用窗口函数别名(自动重写为子查询)
 """
 
+import copy
 import csv
 import datetime
 import difflib
+import functools
 import hashlib
 import io
 import json
@@ -35,6 +37,7 @@ import shutil
 import tempfile
 import threading
 import time
+from collections import OrderedDict
 from collections.abc import Generator
 from contextlib import contextmanager
 from decimal import Decimal, InvalidOperation
@@ -222,62 +225,1047 @@ try:
 except ImportError:
     HeaderAnalyzer = None
 
+# 工作表/跨文件引用的并行加载
+from ..utils.concurrent_utils import parallel_map, parallel_read_files
+
 # 配置常量
 from ..utils.config import (
+    CACHE_TARGET_MEMORY_MB,
     MARKDOWN_TABLE_MAX_ROWS,
     MAX_CACHE_SIZE,
+    MAX_COLUMN_STATS_CACHE_SIZE,
+    MAX_CROSS_JOIN_ROWS,
+    MAX_INSERT_SELECT_ROWS,
+    MAX_JOIN_INDEX_CACHE_SIZE,
+    MAX_PLAN_CACHE_SIZE,
     MAX_QUERY_CACHE_SIZE,
     MAX_RESULT_ROWS,
+    POINT_INDEX_MIN_ROWS,
+    QUERY_CACHE_MAX_CELLS,
     QUERY_CACHE_TTL,
+    SHEET_DISK_CACHE_DIR_ENV,
+    SHEET_LOAD_MAX_WORKERS,
+    SHEET_PARALLEL_MIN_FILE_MB,
     STREAMING_WRITE_MIN_CHANGES,
     STREAMING_WRITE_MIN_FILE_SIZE_MB,
     STREAMING_WRITE_MIN_ROWS,
+    ZONE_MAP_BLOCK_ROWS,
 )
 
+# 工作表磁盘缓存(可选持久层)
+from .sheet_disk_cache import SheetDiskCache
+
+# sheet级增量刷新: zip 中央目录中的 sheet 部件 CRC
+from .xlsx_parts import read_sheet_part_signatures
+
+# infer_dtype 结果中可整列 astype(float64) 的类别 (skipna=True, 纯 NaN 列为 "empty")
+_NUMERIC_INFERRED_KINDS = frozenset({"integer", "floating", "mixed-integer-float", "empty"})
+_INT64_LIMIT = float(2**63)
+
+# ExcelManager.batch_insert_rows 单次插入行数上限, 更大的 INSERT ... SELECT 直接走 StreamingWriter
+_MANAGER_INSERT_LIMIT = 10000
+
+# 查询结果缓存: 引号内的内容原样保留, 其余部分折叠空白作为规范化SQL
+_SQL_QUOTED_RE = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)""", re.DOTALL)
+# 含不确定函数的查询每次结果可能不同, 不进入结果缓存
+_NONDETERMINISTIC_SQL_RE = re.compile(
+    r"\b(RAND|RANDOM|UUID|NOW|SYSDATE|CURDATE|CURTIME|CURRENT_DATE|CURRENT_TIME|CURRENT_TIMESTAMP|LOCALTIME|LOCALTIMESTAMP|UNIX_TIMESTAMP|UTC_DATE|UTC_TIME|UTC_TIMESTAMP)\b",
+    re.IGNORECASE,
+)
+# 跨文件引用 @'path' / @"path"
+_CROSS_FILE_REF_RE = re.compile(r"""@(['"])(.*?)\1""", re.DOTALL)
+
+
+def _copy_on_write_enabled() -> bool:
+    """pandas 是否启用 Copy-on-Write(3.0 起始终启用; 2.x 需 mode.copy_on_write=True)"""
+    if int(pd.__version__.split(".", 1)[0]) >= 3:
+        return True
+    try:
+        return pd.get_option("mode.copy_on_write") is True
+    except (KeyError, pd.errors.OptionError):
+        return False
+
+
+def _frame_view(df: pd.DataFrame) -> pd.DataFrame:
+    """取缓存中 DataFrame 的可写副本: CoW 下为浅拷贝(首次写入某列时才复制该列), 否则退回深拷贝"""
+    return df.copy(deep=not _copy_on_write_enabled())
+
+
+class _NotVectorizable(Exception):
+    """WHERE 条件含无法整列求值的结构(EXISTS/ALL/ANY/关联子查询等), 调用方回退到 df.query/逐行过滤"""
+
+
+class _ScalarSubqueryRowsError(ValueError):
+    """标量子查询对某一外层行返回了多行; 属于查询错误, 不回退到其他求值路径"""
+
+
+# WHERE 整列求值路径的快慢顺序, query_info["where_path"] 报告一次查询中最慢的那条
+_WHERE_PATH_ORDER = ("vectorized", "query", "row")
+
+
+def _kleene(values, unknown=None) -> pd.arrays.BooleanArray:
+    """由真值数组和 UNKNOWN 掩码构造 SQL 三值逻辑数组(可空布尔, &、|、~ 按 Kleene 逻辑运算)"""
+    values = np.asarray(values, dtype=bool)
+    if unknown is None:
+        unknown = np.zeros(len(values), dtype=bool)
+    return pd.arrays.BooleanArray(values & ~unknown, np.asarray(unknown, dtype=bool))
+
+
+# pandas 3 起 read_excel(engine="calamine") 保留 datetime/timedelta 单元格原值(date 转 datetime), 此前转为 Timestamp/Timedelta
+_EXCEL_KEEPS_DATETIME = int(pd.__version__.split(".", 1)[0]) >= 3
+
+
+def _excel_cell_value(value):
+    """复刻已安装 pandas 的 pd.read_excel(engine="calamine") 单元格转换: 整数值 float→int, 日期/时长按 _EXCEL_KEEPS_DATETIME."""
+    if isinstance(value, float):
+        if math.isfinite(value):
+            as_int = int(value)
+            if as_int == value:
+                return as_int
+        return value
+    if _EXCEL_KEEPS_DATETIME:
+        if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+            return datetime.datetime(value.year, value.month, value.day)
+        return value
+    if isinstance(value, datetime.date):
+        return pd.Timestamp(value)
+    if isinstance(value, datetime.timedelta):
+        return pd.Timedelta(value)
+    return value
+
+
+def _excel_text_dtype():
+    """read_excel 对非数值、全为字符串的列推断的 dtype: 启用 future.infer_string(pandas 3 默认)时为 str, 否则为 object"""
+    return pd.Series(["x"]).dtype
+
+
+def _calamine_rows_to_array(rows: list[list]) -> np.ndarray:
+    """CalamineSheet.to_python() 行列表 → 二维 object 数组, 空串视为 NaN (对齐 keep_default_na=False, na_values=[""])."""
+    if not rows:
+        return np.empty((0, 0), dtype=object)
+    width = max(len(row) for row in rows)
+    raw = np.empty((len(rows), width), dtype=object)
+    raw.fill("")
+    for i, row in enumerate(rows):
+        raw[i, : len(row)] = row
+    raw[raw == ""] = np.nan
+    return raw
+
+
+def _type_excel_column(values: np.ndarray, kind: str | None = None) -> np.ndarray:
+    """单列类型推断: 逐单元格转换后尝试整列转数值, 含非数字则保持 object."""
+    if kind == "string":
+        # 纯字符串列无需单元格转换 (只有 float/日期会被改写)
+        converted = values.copy()
+    else:
+        converted = np.empty(len(values), dtype=object)
+        converted[:] = [_excel_cell_value(v) for v in values]
+    try:
+        return pd.to_numeric(converted, errors="raise")
+    except (ValueError, TypeError):
+        return converted
+
+
+def _type_excel_columns(data: np.ndarray, header: np.ndarray | None = None) -> list[np.ndarray]:
+    """
+    数据区按列推断 dtype, 结果与 pd.read_excel(header=None) 切片后再 to_numeric 一致.
+
+    header 为数据区之上的表头行: 连同表头整列都是字符串(可含空值)的列, read_excel 推断为文本 dtype
+    (见 _excel_text_dtype), 切片后不再转数值, 这类列直接按文本 dtype 构造.
+    纯数值列 (calamine 数字单元格均为 float) 合并成一个块整体 astype(float64),
+    无 NaN 且全为整数值的列转 int64; 其余列 (字符串/日期/混合) 逐单元格转换.
+    """
+    n_rows, n_cols = data.shape
+    columns: list[np.ndarray | None] = [None] * n_cols
+    kinds = [pd.api.types.infer_dtype(data[:, j], skipna=True) for j in range(n_cols)] if n_rows else [None] * n_cols
+    text_dtype = _excel_text_dtype()
+    if text_dtype != object and header is not None and len(header):
+        for j, kind in enumerate(kinds):
+            if kind in ("string", "empty") and pd.api.types.infer_dtype(np.concatenate([header[:, j], data[:, j]]), skipna=True) == "string":
+                columns[j] = pd.array(data[:, j], dtype=text_dtype)
+                kinds[j] = "text"
+    numeric_idx = [j for j, kind in enumerate(kinds) if kind in _NUMERIC_INFERRED_KINDS]
+    if numeric_idx:
+        block = data[:, numeric_idx].astype(np.float64)
+        finite = np.isfinite(block)
+        as_int = finite.all(axis=0) & (block == np.trunc(block)).all(axis=0) & (np.abs(block).max(axis=0) < _INT64_LIMIT)
+        for k, j in enumerate(numeric_idx):
+            if as_int[k]:
+                columns[j] = block[:, k].astype(np.int64)
+            elif not np.isinf(block[:, k]).any():
+                columns[j] = block[:, k].copy()
+            # 含 ±inf 的列留给逐单元格路径
+    for j in range(n_cols):
+        if columns[j] is None:
+            columns[j] = _type_excel_column(data[:, j], kinds[j])
+    return columns
+
+
+def _excel_header_rows(raw: np.ndarray) -> tuple[list, list, dict[int, np.ndarray]]:
+    """
+    取前两行表头的单元格值.
+
+    read_excel(header=None) 对整列 (含表头行) 做类型推断: 表头单元格为数字/空的列若整列是数值,
+    表头值会随整列变成 float/int (如 5 → 5.0). 这类列返回整列推断结果, 供切片复用.
+    """
+    header = raw[:2]
+    first_row: list = []
+    second_row: list = []
+    full_columns: dict[int, np.ndarray] = {}
+    for j in range(raw.shape[1]):
+        typed = None
+        if all(_is_numeric_header_cell(c) for c in header[:, j]):
+            typed = _type_excel_column(raw[:, j])
+        if typed is not None and typed.dtype != object:
+            full_columns[j] = typed
+            cells = typed[:2].tolist()
+        else:
+            cells = [_excel_cell_value(c) for c in header[:, j]]
+            if pd.api.types.infer_dtype(raw[:, j], skipna=True) in ("datetime", "date", "timedelta"):
+                # 表头为空的纯日期列: read_excel 会把整列推断为 datetime64 (表头仍按空处理, 回退 col_N 列名);
+                # 单表头时第 2 行已是数据, 按整列判定而不是只看前两行
+                inferred = pd.Series([_excel_cell_value(v) for v in raw[:, j]])
+                if inferred.dtype.kind in "mM":
+                    full_columns[j] = inferred.to_numpy()
+        first_row.append(cells[0])
+        if len(cells) > 1:
+            second_row.append(cells[1])
+    return first_row, second_row, full_columns
+
+
+def _is_numeric_header_cell(value) -> bool:
+    """表头单元格是否可能随整列被推断为数值 (空/数字/布尔/数字字符串)"""
+    if isinstance(value, (bool, int, float)):
+        return True
+    if isinstance(value, str):
+        try:
+            float(value)
+        except ValueError:
+            return False
+        return True
+    return False
+
+
+class _SheetFrameCache(OrderedDict):
+    """按字节预算淘汰的 LRU 工作表缓存。
+
+    键为 "file_path|sheet", 值为 (mtime, {sheet: df}, {sheet: header_descriptions}, sheet部件签名)。
+    每个条目的字节数只在写入时用 memory_usage(deep=True) 测量一次; 命中时移到末尾(最近使用),
+    超出字节预算或文件数上限时从最久未使用的条目开始淘汰。单个条目超过整个预算时不缓存,
+    避免一个超大工作簿把所有热点小表挤出缓存。
+    文件 mtime 变化但该 sheet 的 zip 部件签名未变时, 条目更新 mtime 后继续使用(计入 revalidated)。
+    """
+
+    def __init__(self, max_files: int, max_bytes: int, on_evict=None):
+        super().__init__()
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._on_evict = on_evict  # 淘汰回调(key),用于同步清理列名映射等附属缓存
+        self._lock = threading.RLock()
+        self._nbytes: dict[str, int] = {}
+        self._file_of: dict[str, str] = {}
+        self._file_refs: dict[str, int] = {}
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+        self.revalidated = 0
+
+    def lookup(self, key: str, mtime: float, part_signature=None):
+        """读取条目并刷新最近使用顺序
+
+        mtime 不一致时调用 part_signature() 取该 sheet 当前的部件签名: 与条目记录的一致则更新 mtime
+        继续使用, 否则丢弃旧条目并计为未命中。签名要读 zip 中央目录, 在锁外计算, 不阻塞其他线程的命中
+        """
+        with self._lock:
+            entry = dict.get(self, key)
+            stale = entry is not None and entry[0] != mtime
+        signature = part_signature() if stale and part_signature is not None else None
+        with self._lock:
+            # 计算签名期间条目可能已被其他线程替换或淘汰, 以当前条目为准
+            entry = dict.get(self, key)
+            if entry is not None and entry[0] != mtime:
+                if signature is not None and signature == entry[3]:
+                    entry = (mtime, *entry[1:])
+                    OrderedDict.__setitem__(self, key, entry)
+                    self.revalidated += 1
+                else:
+                    self._discard(key)
+                    entry = None
+            if entry is not None:
+                self.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def store(self, key: str, file_path: str, entry: tuple) -> bool:
+        """写入条目并按预算淘汰; 单条目超过预算时拒绝缓存, 返回是否已缓存"""
+        nbytes = int(sum(df.memory_usage(deep=True).sum() for df in entry[1].values()))
+        with self._lock:
+            if key in self:
+                self._discard(key)
+            if nbytes > self.max_bytes:
+                self.rejected += 1
+                return False
+            OrderedDict.__setitem__(self, key, entry)
+            self._nbytes[key] = nbytes
+            self._file_of[key] = file_path
+            self._file_refs[file_path] = self._file_refs.get(file_path, 0) + 1
+            self.resident_bytes += nbytes
+            self._evict_while(lambda: self.resident_bytes > self.max_bytes or len(self._file_refs) > self.max_files, keep=key)
+            return True
+
+    def evict_to(self, target_bytes: int) -> None:
+        """按最久未使用顺序淘汰, 直到常驻字节数不超过 target_bytes"""
+        with self._lock:
+            self._evict_while(lambda: self.resident_bytes > target_bytes)
+
+    def _evict_while(self, over_budget, keep: str | None = None) -> None:
+        while len(self) and over_budget():
+            victim = next(iter(self))
+            if victim == keep:
+                break
+            self._discard(victim)
+            self.evictions += 1
+
+    def _discard(self, key: str) -> None:
+        OrderedDict.pop(self, key, None)
+        self.resident_bytes -= self._nbytes.pop(key, 0)
+        file_path = self._file_of.pop(key, None)
+        if file_path is not None:
+            self._file_refs[file_path] -= 1
+            if not self._file_refs[file_path]:
+                del self._file_refs[file_path]
+        if self._on_evict is not None:
+            self._on_evict(key)
+
+    def pop(self, key, *default):
+        with self._lock:
+            if key in self:
+                entry = dict.__getitem__(self, key)
+                self._discard(key)
+                return entry
+            if default:
+                return default[0]
+            raise KeyError(key)
+
+    def __delitem__(self, key):
+        self.pop(key)
+
+    def discard_file(self, file_path: str) -> None:
+        """删除某个文件的全部sheet条目(本引擎写入该文件后调用)"""
+        with self._lock:
+            for key in [k for k, owner in self._file_of.items() if owner == file_path]:
+                self._discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self):
+                self._discard(key)
+
+    def get_stats(self) -> dict[str, Any]:
+        """缓存统计: 命中/未命中/淘汰/拒绝次数与常驻字节数"""
+        with self._lock:
+            return {
+                "entries": len(self),
+                "files": len(self._file_refs),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "rejected": self.rejected,
+                "revalidated": self.revalidated,
+                "resident_bytes": self.resident_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class _QueryResultCache(OrderedDict):
+    """SELECT 结果缓存(LRU + TTL)。
+
+    键由调用方构造(规范化SQL + 查询参数 + 涉及文件的指纹), 值为 (写入时间, 涉及文件集合, 结果dict)。
+    结果在写入和命中时都深拷贝, 调用方修改返回值不会污染缓存。
+    """
+
+    def __init__(self, max_entries: int, ttl: float, max_cells: int):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_cells = max_cells  # 单条结果的单元格数上限, 超出不缓存
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key) -> dict[str, Any] | None:
+        with self._lock:
+            entry = dict.get(self, key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[2])
+            if entry is not None:
+                OrderedDict.pop(self, key, None)  # 已过期
+            self.misses += 1
+            return None
+
+    def store(self, key, files: frozenset[str], result: dict[str, Any]) -> bool:
+        data = result.get("data") or []
+        if len(data) * max((len(row) for row in data[:1]), default=1) > self.max_cells:
+            return False
+        entry = (time.monotonic(), files, copy.deepcopy(result))
+        with self._lock:
+            OrderedDict.pop(self, key, None)
+            OrderedDict.__setitem__(self, key, entry)
+            while len(self) > self.max_entries:
+                self.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def discard_file(self, file_path: str) -> None:
+        """删除所有涉及该文件的结果"""
+        with self._lock:
+            for key in [k for k, entry in self.items() if file_path in entry[1]]:
+                OrderedDict.pop(self, key, None)
+
+    def get_stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "ttl_seconds": self.ttl,
+            }
+
+
+class _ParsedPlanCache(OrderedDict):
+    """SQL 解析计划缓存(LRU)。
+
+    键由调用方构造: ("plan", SQL, 表结构指纹) 存放 (预处理后的SQL, 解析树, 校验结果),
+    ("tables", SQL) 存放按需加载探测出的表名集合。解析树在写入时复制一份,
+    命中后由调用方再复制使用, 执行阶段对解析树的改写不会污染缓存。
+    """
+
+    def __init__(self, max_entries: int):
+        super().__init__()
+        self.max_entries = max_entries
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key):
+        with self._lock:
+            if key in self:
+                self.move_to_end(key)
+                self.hits += 1
+                return dict.__getitem__(self, key)
+            self.misses += 1
+            return None
+
+    def store(self, key, value) -> None:
+        with self._lock:
+            OrderedDict.pop(self, key, None)
+            OrderedDict.__setitem__(self, key, value)
+            while len(self) > self.max_entries:
+                self.popitem(last=False)
+                self.evictions += 1
+
+    def get_stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class _JoinIndexCache(_ParsedPlanCache):
+    """列哈希索引缓存(LRU), 供 JOIN 构建侧与 WHERE 等值点查共用; 列统计目录缓存也用此结构。
+
+    键为 ("file_path|sheet", 列名), 值为 (缓存中的 sheet DataFrame, 索引/统计)。
+    sheet 内容变化时 DataFrame 缓存会换成新的 DataFrame 对象, 因此只有值中记录的对象与本次
+    查询的构建侧是同一对象时才算命中; DataFrame 缓存淘汰/刷新条目时经 discard_sheet 同步清理。
+    """
+
+    def lookup_frame(self, key, frame: pd.DataFrame):
+        """取 frame 对应的索引; 条目属于已被替换的旧 DataFrame 时计为未命中"""
+        with self._lock:
+            entry = dict.get(self, key)
+            if entry is not None and entry[0] is frame:
+                self.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def discard_sheet(self, sheet_key: str) -> None:
+        with self._lock:
+            for key in [k for k in self if k[0] == sheet_key]:
+                OrderedDict.pop(self, key)
+
+
+def _join_key_values(keys: pd.Series) -> pd.Series:
+    """object 列中的 None/NaN 统一为 NaN, 使两侧的 NULL 键与 pd.merge 一样互相匹配"""
+    if keys.dtype == object:
+        return keys.where(keys.notna(), np.nan)
+    return keys
+
+
+def _build_join_index(keys: pd.Series) -> tuple[pd.Index, np.ndarray, np.ndarray]:
+    """构建侧哈希索引: (去重键 Index, 按键分组排列的行位置, 各键在行位置数组中的起始偏移)
+
+    NULL 与 pd.merge 一致作为普通键参与匹配.
+    """
+    codes, uniques = _join_key_values(keys).factorize(use_na_sentinel=False)
+    order = np.argsort(codes, kind="stable")
+    starts = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    return uniques, order, starts
+
+
+def _probe_join_index(index: tuple[pd.Index, np.ndarray, np.ndarray], keys: pd.Series, how: str) -> tuple[np.ndarray, np.ndarray]:
+    """用探测侧键查哈希索引, 返回 (探测侧行位置, 构建侧行位置); LEFT JOIN 未匹配行的构建侧位置为 -1
+
+    输出顺序与 pd.merge 一致: 按探测侧行顺序, 同一行的多个匹配按构建侧行顺序.
+    """
+    uniques, order, starts = index
+    codes = uniques.get_indexer(_join_key_values(keys))
+    matched = codes >= 0
+    begin = np.where(matched, starts[codes], 0)
+    counts = np.where(matched, starts[codes + 1] - begin, 0)
+    emit = np.maximum(counts, 1) if how == "left" else counts
+    left_pos = np.repeat(np.arange(len(keys)), emit)
+    within = np.arange(len(left_pos)) - np.repeat(np.cumsum(emit) - emit, emit)
+    right_pos = np.full(len(left_pos), -1, dtype=np.intp)
+    hit = np.repeat(counts > 0, emit)
+    right_pos[hit] = order[(np.repeat(begin, emit) + within)[hit]]
+    return left_pos, right_pos
+
+
+def _lookup_join_index(index: tuple[pd.Index, np.ndarray, np.ndarray], values: list) -> np.ndarray:
+    """哈希索引点查: 返回键等于 values 中任一值的行位置(升序)"""
+    _, positions = _probe_join_index(index, pd.Series(values).drop_duplicates(), "inner")
+    return np.sort(positions)
+
+
+# 加载时预建哈希索引的 ID 列名(仅检查首列; 双表头配置表的首列无论列名都视为 ID 列)
+_ID_COLUMN_RE = re.compile(r"^(?:id|ID|Id|.*(?:_id|_ID|Id|ID)|编号|.*编号|序号)$")
+
+
+# 近似去重数: 行数超过该值时按哈希值抽样计数
+_DISTINCT_SAMPLE_ROWS = 65_536
+
+
+def _approx_distinct(values: pd.Series) -> int:
+    """非空值的近似去重数
+
+    对值取 64 位哈希; 行数较多时只统计哈希值落在前 1/step 区间内的不同哈希再乘回 step
+    (同一值哈希相同, 抽样与取值无关); 抽样结果过少(低基数列)时退回精确计数.
+    """
+    if values.empty:
+        return 0
+    hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    step = len(hashes) // _DISTINCT_SAMPLE_ROWS
+    if step > 1:
+        sampled = len(pd.unique(hashes[hashes < np.iinfo(np.uint64).max // np.uint64(step)]))
+        if sampled >= 1024:
+            return min(sampled * step, len(hashes))
+    return len(pd.unique(hashes))
+
+
+def _compute_column_stats(values: pd.Series, block_rows: int) -> dict[str, Any]:
+    """单列统计目录
+
+    null_count 与 IS NULL 语义一致(含空字符串); head 为前 100 个非空值.
+    数值(不含布尔)/日期列另有 min/max; 数值列另有 zones = (各块最小值, 各块最大值) float64 数组,
+    每块 block_rows 行, 全空块为 NaN. sorted 为非空值的有序性: "asc"/"desc"/None.
+    """
+    nulls = values.isna()
+    if values.dtype == object:
+        nulls |= values.eq("")
+    present = values[~nulls]
+    stats: dict[str, Any] = {
+        "rows": len(values),
+        "null_count": int(nulls.sum()),
+        "distinct": _approx_distinct(present),
+        "min": None,
+        "max": None,
+        "sorted": None,
+        "head": present.head(100).tolist(),
+        "zones": None,
+        "block_rows": block_rows,
+    }
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype) and len(values):
+        numbers = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        starts = np.arange(0, len(numbers), block_rows)
+        stats["zones"] = (np.fmin.reduceat(numbers, starts), np.fmax.reduceat(numbers, starts))
+    if present.empty:
+        return stats
+    try:
+        if present.is_monotonic_increasing:
+            stats["sorted"] = "asc"
+        elif present.is_monotonic_decreasing:
+            stats["sorted"] = "desc"
+    except TypeError:
+        pass
+    if pd.api.types.is_bool_dtype(values.dtype) or not (pd.api.types.is_numeric_dtype(values.dtype) or pd.api.types.is_datetime64_any_dtype(values.dtype)):
+        return stats
+    stats["min"], stats["max"] = present.min(), present.max()
+    return stats
+
+
+def _sort_key_array(values: pd.Series, ascending: bool, nulls_first: bool) -> np.ndarray | None:
+    """单列排序键转为 float64 数组, 按升序比较即为 sort_values 的排序先后(降序取负, NULL 按 nulls_first 置为 ∓inf)
+
+    字符串/object 列按去重值排序后的名次编码; 值之间无法比较(类型混杂)时返回 None.
+    大整数/纳秒时间戳转为 float64 时相邻值可能并列, 只会让并列的候选行变多, 不会漏行.
+    """
+    if pd.api.types.is_bool_dtype(values.dtype) or pd.api.types.is_numeric_dtype(values.dtype):
+        keys = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    elif pd.api.types.is_datetime64_any_dtype(values.dtype):
+        stamps = values.to_numpy(dtype="datetime64[ns]")
+        keys = np.where(np.isnat(stamps), np.nan, stamps.astype("int64").astype(np.float64))
+    elif values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+        codes, uniques = pd.factorize(values)
+        try:
+            order = np.argsort(np.asarray(uniques, dtype=object), kind="stable")
+        except TypeError:
+            return None
+        ranks = np.empty(len(uniques), dtype=np.float64)
+        ranks[order] = np.arange(len(uniques))
+        keys = np.where(codes < 0, np.nan, ranks[codes])
+    else:
+        return None
+    keys = -keys if not ascending else keys.copy()
+    keys[np.isnan(keys)] = -np.inf if nulls_first else np.inf
+    return keys
+
+
+def _top_n_positions(values: pd.Series, ascending: bool, nulls_first: bool, n: int) -> np.ndarray | None:
+    """按单列排序时可能排进前 n 位的行位置(升序): 排序键不大于第 n 小键的行, 与第 n 位并列的行全部保留
+
+    候选行上的稳定排序与整表稳定排序的前 n 行一致; 列无法转为排序键时返回 None.
+    """
+    keys = _sort_key_array(values, ascending, nulls_first)
+    if keys is None:
+        return None
+    if n >= len(keys):
+        return np.arange(len(keys))
+    threshold = np.partition(keys, n - 1)[n - 1]
+    return np.flatnonzero(keys <= threshold)
+
+
+def _group_top_n_mask(keys: np.ndarray, codes: np.ndarray, n: int) -> np.ndarray:
+    """分组 Top-N: 组内严格小于本行排序键的行数 < n(即 RANK 方式的组内名次 <= n)的行掩码
+
+    行按组号排好后逐轮取各组剩余行的最小键, 每轮每组至少取走一个并列值, 最多 n 轮; 每轮都是整列运算.
+    """
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    group_of = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(keys)]))
+    remaining = keys[order].astype(np.float64)
+    taken = np.zeros(len(starts), dtype=np.int64)
+    keep = np.zeros(len(keys), dtype=bool)
+    for _ in range(n):
+        mins = np.fmin.reduceat(remaining, starts)
+        hit = (remaining == mins[group_of]) & (taken < n)[group_of]
+        if not hit.any():
+            break
+        keep[order[hit]] = True
+        taken += np.add.reduceat(hit.astype(np.int64), starts)
+        # 取走的行置为 NaN, fmin 忽略
+        remaining[hit] = np.nan
+    return keep
+
+
+def _frame_search(codes: np.ndarray, keys: np.ndarray, targets: np.ndarray, side: str) -> np.ndarray:
+    """RANGE 窗口框架边界: 每行在本分区中 keys 首个 >= targets(left) / > targets(right) 的全局位置
+
+    codes 非降序、分区内 keys 升序(NULL 为 NaN 排在最后). 分区平均不少于 8 行时逐分区 searchsorted;
+    小分区很多时目标值与各行的键合并后 lexsort 一次, 目标值之前的键行数即为位置. NaN 目标值落在本分区 NULL 段的首/尾.
+    """
+    n = len(keys)
+    bounds = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1], True])
+    if n >= 8 * (len(bounds) - 1):
+        positions = np.empty(n, dtype=np.int64)
+        for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            positions[start:end] = np.searchsorted(keys[start:end], targets[start:end], side=side) + start
+        return positions
+    flags = np.r_[np.ones(n, dtype=np.int8), np.full(n, 0 if side == "left" else 2, dtype=np.int8)]
+    order = np.lexsort((flags, np.r_[keys, targets], np.r_[codes, codes]))
+    is_key = order < n
+    before = np.cumsum(is_key) - is_key
+    positions = np.empty(n, dtype=np.int64)
+    positions[order[~is_key] - n] = before[~is_key]
+    return positions
+
+
+# 不超过该行数的窗口框架逐项直接相加, 更宽的框架取分区内前缀和之差
+_FRAME_DIRECT_SUM_ROWS = 32
+
+
+def _frame_sum(values: np.ndarray, lo: np.ndarray, hi: np.ndarray, codes: np.ndarray, part_start: np.ndarray) -> np.ndarray:
+    """滑动框架 [lo, hi) 内 values 之和, 空框架为 0
+
+    窄框架(不超过 _FRAME_DIRECT_SUM_ROWS 行)按位置逐项相加, 单行框架即原值; 宽框架取前缀和之差,
+    前缀和在每个分区起点重新累计, 舍入误差不随整表行数增长.
+    """
+    lengths = hi - lo
+    total = np.zeros(len(lo), dtype=values.dtype)
+    narrow = lengths <= _FRAME_DIRECT_SUM_ROWS
+    for k in range(int(lengths[narrow].max(initial=0))):
+        rows = np.flatnonzero(narrow & (lengths > k))
+        total[rows] += values[lo[rows] + k]
+    wide = np.flatnonzero(~narrow)
+    if wide.size:
+        prefix = pd.Series(values).groupby(codes, sort=False).cumsum().to_numpy()
+        before = np.where(lo[wide] > part_start[wide], prefix[np.maximum(lo[wide] - 1, 0)], 0)
+        total[wide] = prefix[hi[wide] - 1] - before
+    return total
+
+
+def _frame_extreme(values: np.ndarray, lo: np.ndarray, hi: np.ndarray, reduce) -> np.ndarray:
+    """滑动框架 [lo, hi) 内的最小/最大值(reduce 为 np.fmin/np.fmax, 忽略 NaN), 空框架为 NaN
+
+    稀疏表逐层倍增: 第 k 层为从各位置起 2^k 个值的最值, 长度在 [2^k, 2^(k+1)) 的框架在该层取两段重叠区间的最值;
+    只保留当前层, 内存 O(n), 层数为 log2(最长框架).
+    """
+    lengths = hi - lo
+    result = np.full(len(lo), np.nan)
+    nonempty = lengths > 0
+    if not nonempty.any():
+        return result
+    levels = np.zeros(len(lo), dtype=np.int64)
+    levels[nonempty] = np.floor(np.log2(lengths[nonempty])).astype(np.int64)
+    levels[nonempty & (np.left_shift(1, levels) > lengths)] -= 1
+    levels[nonempty & (np.left_shift(1, levels + 1) <= lengths)] += 1
+    table = values.astype(np.float64)
+    top = int(levels[nonempty].max())
+    for level in range(top + 1):
+        rows = np.flatnonzero(nonempty & (levels == level))
+        if rows.size:
+            result[rows] = reduce(table[lo[rows]], table[hi[rows] - (1 << level)])
+        if level < top:
+            table = reduce(table[: -(1 << level)], table[1 << level :])
+    return result
+
+
+_BAND_COMPARE = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal}
+
+
+def _band_values(values: pd.Series) -> tuple[str, np.ndarray] | None:
+    """区间JOIN的比较列转为 (类型, float64 数组), NULL 为 NaN; 无法按数值/日期比较时返回 None"""
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return None
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        stamps = values.to_numpy(dtype="datetime64[ns]")
+        return "datetime", np.where(np.isnat(stamps), np.nan, stamps.astype("int64").astype(np.float64))
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return "number", values.to_numpy(dtype=np.float64, na_value=np.nan)
+    numeric = pd.to_numeric(values, errors="coerce")
+    if (numeric.isna() & values.notna()).any():
+        return None
+    return "number", numeric.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _band_join_positions(
+    left_keys: list[pd.Series],
+    right_keys: list[pd.Series],
+    ranges: list[tuple[np.ndarray, str, np.ndarray]],
+    how: str,
+) -> tuple[np.ndarray, np.ndarray]:
+    """区间(band)JOIN: 返回 (左表行位置, 右表行位置); LEFT JOIN 未匹配行的右表位置为 -1
+
+    等值键把两侧分区, 右表按 (分区, 首个区间条件的右列) 排序后, 每个左行在每个区间条件上的匹配都是
+    排序数组中的一段连续区间, 用 searchsorted 求出并取交集; 右列在该排序下不单调的区间条件
+    (如重叠的 [min, max] 区间)在展开后的候选行对上向量化过滤. 比较值先映射为两侧共同的秩, 与 NULL 比较不匹配.
+    复杂度 O((n+m) log(n+m) + 候选行对数).
+    """
+    n, m = len(ranges[0][0]), len(ranges[0][2])
+    left_code, right_code = np.zeros(n, dtype=np.int64), np.zeros(m, dtype=np.int64)
+    for left_key, right_key in zip(left_keys, right_keys):
+        key_codes, uniques = pd.concat([_join_key_values(left_key), _join_key_values(right_key)], ignore_index=True).factorize()
+        combined = np.concatenate([left_code, right_code]) * max(len(uniques), 1) + key_codes
+        combined[(key_codes < 0) | (np.concatenate([left_code, right_code]) < 0)] = -1
+        valid = combined >= 0
+        combined[valid] = pd.factorize(combined[valid])[0]
+        left_code, right_code = combined[:n], combined[n:]
+
+    ranked = []  # (左秩, 比较符, 右秩, 去重值个数)
+    for left_values, op, right_values in ranges:
+        uniques = np.unique(np.concatenate([left_values, right_values]))
+        uniques = uniques[~np.isnan(uniques)]
+        left_rank = np.where(np.isnan(left_values), -1, np.searchsorted(uniques, left_values))
+        right_rank = np.where(np.isnan(right_values), -1, np.searchsorted(uniques, right_values))
+        ranked.append((left_rank, op, right_rank, len(uniques)))
+
+    right_valid = right_code >= 0
+    left_dead = left_code < 0
+    for left_rank, _, right_rank, _ in ranked:
+        right_valid &= right_rank >= 0
+        left_dead |= left_rank < 0
+    candidates = np.flatnonzero(right_valid)
+    sorted_pos = candidates[np.lexsort((ranked[0][2][candidates], right_code[candidates]))]
+    sorted_code = right_code[sorted_pos]
+
+    start = np.searchsorted(sorted_code, left_code, side="left")
+    end = np.searchsorted(sorted_code, left_code, side="right")
+    residual = []
+    for left_rank, op, right_rank, distinct in ranked:
+        sorted_key = sorted_code * (distinct + 1) + right_rank[sorted_pos]
+        if len(sorted_key) > 1 and (np.diff(sorted_key) < 0).any():
+            residual.append((left_rank, op, right_rank))
+            continue
+        probe = left_code * (distinct + 1) + left_rank
+        if op in ("<", "<="):
+            # 左 < 右: 右值在 probe 之后的部分
+            start = np.maximum(start, np.searchsorted(sorted_key, probe, side="right" if op == "<" else "left"))
+        else:
+            end = np.minimum(end, np.searchsorted(sorted_key, probe, side="left" if op == ">" else "right"))
+
+    counts = np.where(left_dead, 0, np.maximum(end - start, 0))
+    left_pos = np.repeat(np.arange(n), counts)
+    within = np.arange(len(left_pos)) - np.repeat(np.cumsum(counts) - counts, counts)
+    right_pos = sorted_pos[np.repeat(start, counts) + within]
+    for left_rank, op, right_rank in residual:
+        keep = _BAND_COMPARE[op](left_rank[left_pos], right_rank[right_pos])
+        left_pos, right_pos = left_pos[keep], right_pos[keep]
+
+    if how == "left":
+        unmatched = np.ones(n, dtype=bool)
+        unmatched[left_pos] = False
+        extra = np.flatnonzero(unmatched)
+        left_pos = np.concatenate([left_pos, extra])
+        right_pos = np.concatenate([right_pos, np.full(len(extra), -1, dtype=right_pos.dtype)])
+        order = np.argsort(left_pos, kind="stable")
+        left_pos, right_pos = left_pos[order], right_pos[order]
+    return left_pos, right_pos
+
+
+class _LazyWorksheets(dict):
+    """按需加载的工作表映射。
+
+    已加载的 sheet 直接存放在 dict 中; 未加载的 sheet 只登记名称和加载函数,
+    首次 ``worksheets_data[name]`` 访问时才真正解析。``in`` / ``keys()`` / ``get()``
+    对未加载 sheet 同样可见, 因此表名校验和 available_tables 提示与全量加载一致。
+
+    注意: ``values()`` / ``items()`` 只遍历已加载的 sheet, 不会触发加载。
+    """
+
+    def __init__(
+        self,
+        loaded: dict[str, pd.DataFrame] | None = None,
+        pending: dict[str, Any] | None = None,
+        order: list[str] | None = None,
+    ):
+        super().__init__(loaded or {})
+        # {sheet_name: 无参加载函数 -> DataFrame | None}
+        self._pending: dict[str, Any] = {name: loader for name, loader in (pending or {}).items() if not dict.__contains__(self, name)}
+        # keys() 的展示顺序(工作簿中的sheet顺序),不在其中的名称排在后面
+        self._order: list[str] = list(order or [])
+
+    def __missing__(self, key):
+        loader = self._pending.pop(key, None)
+        if loader is None:
+            raise KeyError(key)
+        df = loader()
+        if df is None:
+            raise KeyError(key)
+        self[key] = df
+        return df
+
+    def __contains__(self, key) -> bool:
+        return dict.__contains__(self, key) or key in self._pending
+
+    def __bool__(self) -> bool:
+        return dict.__len__(self) > 0 or bool(self._pending)
+
+    def get(self, key, default=None):
+        if key in self:
+            try:
+                return self[key]
+            except KeyError:
+                return default
+        return default
+
+    def keys(self) -> list[str]:
+        names = list(dict.keys(self)) + [name for name in self._pending if not dict.__contains__(self, name)]
+        if self._order:
+            rank = {name: i for i, name in enumerate(self._order)}
+            names.sort(key=lambda name: rank.get(name, len(rank)))
+        return names
+
+    def pending_loader(self, key):
+        """返回未加载 sheet 的加载函数(已加载或不存在返回 None)。"""
+        return self._pending.get(key)
+
+    def add_pending(self, key, loader) -> None:
+        """登记一个延迟加载的 sheet。"""
+        if not dict.__contains__(self, key):
+            self._pending[key] = loader
+
+    def copy(self) -> "_LazyWorksheets":
+        return _LazyWorksheets(dict(self), dict(self._pending), self._order)
+
+
+class _QueryContext:
+    """单次查询的执行上下文。
+
+    列名映射、表别名、WHERE前数据等随查询变化的状态保存在这里, 每个线程持有自己的上下文,
+    因此同一引擎上互不相关的 SELECT 可以在多个线程中并行执行。缓存中的 DataFrame 在查询间
+    只读共享(执行时先 copy), 不属于上下文。
+    """
+
+    _current_file_path: str | None = None
+    _df_before_where: pd.DataFrame | None = None
+
+    def __init__(self):
+        self.active = False  # 是否处于 execute_sql_query 调用中(用于嵌套查询恢复外层上下文)
+
+
+class _QueryState:
+    """引擎上的按查询状态属性: 读写转发到当前线程的 _QueryContext。
+
+    未赋值时与普通实例属性一样抛出 AttributeError, 现有的 getattr/hasattr 判断保持不变。
+    """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, engine, owner=None):
+        if engine is None:
+            return self
+        return getattr(engine._query_context(), self.name)
+
+    def __set__(self, engine, value):
+        setattr(engine._query_context(), self.name, value)
+
+    def __delete__(self, engine):
+        delattr(engine._query_context(), self.name)
+
 
 class AdvancedSQLQueryEngine:
     """高级SQL查询引擎,支持完整的SQL语法"""
 
-    def __init__(self, disable_streaming_aggregate: bool = False):
+    # 按查询变化的状态(存放在当前线程的 _QueryContext 中, 见 _query_scope)
+    _original_to_clean_cols = _QueryState()
+    _header_descriptions = _QueryState()
+    _current_file_path = _QueryState()
+    _parsed_sql = _QueryState()
+    _table_aliases = _QueryState()
+    _join_column_mapping = _QueryState()
+    _pending_join_filters = _QueryState()
+    _pending_tmp_cols = _QueryState()
+    _worksheets_data = _QueryState()
+    _current_worksheets = _QueryState()
+    _df_before_where = _QueryState()
+    _df_before_having = _QueryState()
+    _group_by_columns = _QueryState()
+    _having_agg_alias_map = _QueryState()
+    _having_agg_in_select_map = _QueryState()
+    _nested_window_columns = _QueryState()
+    _window_layouts = _QueryState()
+    _load_timings = _QueryState()
+    _where_paths = _QueryState()
+
+    def __init__(self, disable_streaming_aggregate: bool = False, disk_cache_dir: str | None = None):
         """
         初始化SQL查询引擎
 
         Args:
             disable_streaming_aggregate: 禁用流式聚合优化(大文件处理)
+            disk_cache_dir: 工作表磁盘缓存目录, 默认读取环境变量 EXCEL_MCP_SHEET_CACHE_DIR, 均未设置时不启用
         """
         self.disable_streaming_aggregate = disable_streaming_aggregate
-        # DataFrame缓存:{file_path: (mtime, worksheets_data, header_descriptions)}
-        self._df_cache = {}
         self._max_cache_size = MAX_CACHE_SIZE  # 最大缓存文件数,防止内存泄漏
-        # 列名映射缓存:{file_path: {原始列名: 清洗列名}}
-        # 与_df_cache同步,避免缓存命中时_original_to_clean_cols为空
+        self._max_cache_bytes = int(CACHE_TARGET_MEMORY_MB * 1024 * 1024)  # 缓存字节预算
+        # 列名映射缓存:{"file_path|sheet": {原始列名: 清洗列名}}
+        # 与_df_cache同步(随条目淘汰一起清理),避免缓存命中时_original_to_clean_cols为空
         self._col_map_cache = {}
+        # JOIN构建侧哈希索引缓存:{("file_path|sheet", 键列): (df, 索引)},同样随_df_cache条目淘汰清理
+        self._join_index_cache = _JoinIndexCache(MAX_JOIN_INDEX_CACHE_SIZE)
+        # 列统计目录缓存:{("file_path|sheet", 列名): (df, 统计)},首次用到该列时计算,同样随_df_cache条目淘汰清理
+        self._column_stats_cache = _JoinIndexCache(MAX_COLUMN_STATS_CACHE_SIZE)
+        # DataFrame缓存(按sheet粒度, 字节预算LRU):{"file_path|sheet": (mtime, {sheet: df}, {sheet: header_descriptions}, 部件签名)}
+        self._df_cache = _SheetFrameCache(self._max_cache_size, self._max_cache_bytes, on_evict=self._on_sheet_evicted)
+        # 工作表名列表缓存:{file_path: (mtime, [sheet_name, ...])},按需加载时用于判断表是否存在
+        self._sheet_names_cache = {}
+        # sheet部件签名缓存:{file_path: (mtime, {sheet_name: 签名})},mtime变化后只重新解析部件有变化的sheet
+        self._part_sig_cache = {}
+        # 单次查询内并行加载sheet/跨文件引用的线程数(1 表示串行)
+        self._load_workers = SHEET_LOAD_MAX_WORKERS
+        # 磁盘缓存层:_df_cache未命中时先映射磁盘上已清洗的sheet,跨进程/重启复用解析结果
+        self._disk_cache: SheetDiskCache | None = None
+        disk_cache_dir = disk_cache_dir or os.environ.get(SHEET_DISK_CACHE_DIR_ENV)
+        if disk_cache_dir:
+            try:
+                self._disk_cache = SheetDiskCache(disk_cache_dir)
+            except OSError as e:
+                logger.warning(f"工作表磁盘缓存目录不可用, 已禁用: {disk_cache_dir} ({e})")
 
         # Fix: P1-concurrent — 每个文件的线程级写锁,防止多线程并发写入导致xlsx损坏
         # fcntl.flock是进程级锁,同进程内多线程共享FD表无法互斥;threading.Lock提供线程级互斥
         self._write_locks: dict[str, threading.Lock] = {}
         self._write_locks_global = threading.Lock()  # 保护_write_locks字典本身的并发访问
 
-        # Fix: BUG-004 — 查询级可重入锁,防止并发查询(如excel_query + run_python内的query())
-        # 污染共享可变状态(_original_to_clean_cols, _current_file_path, _parsed_sql等)
-        # 使用RLock允许同一线程嵌套调用(如run_python内query→引擎内部再查询)
-        self._query_lock = threading.RLock()
+        # Fix: BUG-004 — 按查询状态(_original_to_clean_cols, _current_file_path, _parsed_sql等)
+        # 存放在线程本地的 _QueryContext 中,并发查询互不污染,无需全局查询锁
+        self._local = threading.local()
 
-        # 性能优化:查询结果缓存 {hash(sql): (result_df, file_mtime)}
-        self._query_result_cache = {}
+        # 性能优化:查询结果缓存 {(规范化SQL, 查询参数, 文件指纹...): (写入时间, 涉及文件, 结果)}
         self._max_query_cache_size = MAX_QUERY_CACHE_SIZE  # 最大查询缓存数,防止内存泄漏
         self._query_cache_ttl = QUERY_CACHE_TTL  # 查询缓存TTL
+        self._query_result_cache = _QueryResultCache(self._max_query_cache_size, self._query_cache_ttl, QUERY_CACHE_MAX_CELLS)
+        # 解析计划缓存:跳过重复/模板化查询的正则预处理与sqlglot解析
+        self._plan_cache = _ParsedPlanCache(MAX_PLAN_CACHE_SIZE)
 
         if not SQLGLOT_AVAILABLE:
             raise ImportError("SQLGlot未安装,请运行: pip install sqlglot")
 
-        # 当前查询的文件路径(用于同文件JOIN时动态加载其他sheet)
-        self._current_file_path = None
+    def _query_context(self) -> _QueryContext:
+        """当前线程的查询上下文(首次访问时创建)"""
+        ctx = getattr(self._local, "context", None)
+        if ctx is None:
+            ctx = self._local.context = _QueryContext()
+        return ctx
+
+    @contextmanager
+    def _query_scope(self) -> Generator[_QueryContext, None, None]:
+        """为一次查询建立全新的执行上下文.
+
+        同线程嵌套调用(run_python内query()→引擎再查询)结束后恢复外层上下文;
+        最外层查询结束后上下文保留在线程上, 便于调用方查看本次查询的列名映射等状态。
+        """
+        outer = getattr(self._local, "context", None)
+        ctx = self._local.context = _QueryContext()
+        ctx.active = True
+        try:
+            yield ctx
+        finally:
+            ctx.active = False
+            if outer is not None and outer.active:
+                self._local.context = outer
+
+    def _on_sheet_evicted(self, key: str) -> None:
+        """DataFrame缓存条目淘汰/失效时同步清理该sheet的列名映射、JOIN索引和列统计"""
+        self._col_map_cache.pop(key, None)
+        self._join_index_cache.discard_sheet(key)
+        self._column_stats_cache.discard_sheet(key)
 
     def clear_cache(self):
         """清除所有缓存，释放内存。"""
         self._df_cache.clear()
+        self._col_map_cache.clear()
+        self._join_index_cache.clear()
+        self._column_stats_cache.clear()
+        self._sheet_names_cache.clear()
+        self._part_sig_cache.clear()
         self._query_result_cache.clear()
+        self._plan_cache.clear()
 
     def _find_column_name(self, col_name: str, df: pd.DataFrame) -> str | None:
         """大小写不敏感的列名查找（符合SQL标准：未引用标识符大小写不敏感）
@@ -352,13 +1340,15 @@ class AdvancedSQLQueryEngine:
                     - json_output: JSON格式输出（output_format=json时）
                     - csv_output: CSV格式输出（output_format=csv时）
         """
-        # Fix: BUG-004 — 查询级锁保护,防止并发调用(如excel_query + run_python的query())
-        # 互相污染 _original_to_clean_cols / _current_file_path / _parsed_sql 等共享状态
-        # RLock允许同线程嵌套(run_python→query()→引擎内部跨表JOIN再查询同引擎)
-        with self._query_lock:
-            return self._execute_sql_query_locked(file_path, sql, sheet_name, limit, include_headers, output_format)
-
-    def _execute_sql_query_locked(
+        # 缓存按绝对路径建键: 相对路径查询与缓存预热(cache_warmer)、其他写法的同一文件共用缓存条目
+        file_path = os.path.abspath(file_path)
+        # Fix: BUG-004 — 每次查询使用独立的执行上下文,并发调用(如多个agent的excel_query)
+        # 不会互相污染 _original_to_clean_cols / _current_file_path / _parsed_sql 等状态,
+        # 缓存的DataFrame只读共享,互不相关的SELECT可并行执行
+        with self._query_scope():
+            return self._execute_sql_query_scoped(file_path, sql, sheet_name, limit, include_headers, output_format)
+
+    def _execute_sql_query_scoped(
         self,
         file_path: str,
         sql: str,
@@ -367,7 +1357,7 @@ class AdvancedSQLQueryEngine:
         include_headers: bool = True,
         output_format: str = "table",
     ) -> dict[str, Any]:
-        """execute_sql_query 的核心逻辑(已在_query_lock保护内)"""
+        """execute_sql_query 的核心逻辑(已在独立的查询上下文中)"""
         try:
             # 验证文件存在性
             if not os.path.exists(file_path):
@@ -398,10 +1388,37 @@ class AdvancedSQLQueryEngine:
             # 保存当前文件路径(用于同文件JOIN时动态加载其他sheet)
             self._current_file_path = file_path
 
+            # 清理ANSI转义序列(终端粘贴可能带入的不可见字符)
+            sql = re.sub(r"\x1b\[[0-9;]*[a-zA-Z]", "", sql)
+            # 清理残余控制字符(保留\t\n\r,它们在SQL中有意义)
+            sql = re.sub(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]", "", sql)
+            # 清理残余的ANSI括号伪影:未配对的[后紧跟非ASCII字符
+            # 有效的SQL Server标识符 [名称] 有配对的],ANSI伪影 [中文 无配对
+            if sql.count("[") != sql.count("]"):
+                # 存在未配对括号,清理[后紧跟非ASCII字符的情况
+                sql = re.sub(r"\[(?=[^\x00-\x7F])", "", sql)
+
+            # 查询结果缓存:键包含规范化SQL、查询参数及主文件/跨文件引用的指纹,文件变化后自然失效
+            result_cache_key, result_cache_files = self._query_cache_key(file_path, sql, sheet_name, limit, include_headers, output_format)
+            if result_cache_key is not None:
+                _lookup_start = time.time()
+                cached_result = self._query_result_cache.lookup(result_cache_key)
+                if cached_result is not None:
+                    cached_result["query_info"]["cache_hit"] = True
+                    cached_result["query_info"]["load_timings"] = []
+                    cached_result["query_info"]["execution_time_ms"] = round((time.time() - _lookup_start) * 1000, 1)
+                    return cached_result
+
             # 加载Excel数据(带缓存)
             # 重置列名映射(每次查询重新构建)
             self._original_to_clean_cols = {}
-            worksheets_data = self._load_data_with_cache(file_path, sheet_name)
+            self._load_timings = []
+            self._where_paths = []
+            # 按需加载:只解析SQL实际引用的sheet,其余sheet登记为延迟加载
+            referenced_tables = None if sheet_name else self._collect_referenced_tables(sql)
+            _load_start = time.time()
+            worksheets_data = self._load_data_with_cache(file_path, sheet_name, sheets=referenced_tables)
+            self._record_load_timing(file_path, worksheets_data, _load_start)
 
             if not worksheets_data:
                 return {
@@ -414,20 +1431,16 @@ class AdvancedSQLQueryEngine:
             # 跨文件引用解析:FROM 表名@'path' 语法
             # 在sqlglot解析前处理,加载外部文件并合并worksheets_data
             if "@'" in sql or '@"' in sql:
-                sql, worksheets_data = self._resolve_cross_file_references(sql, file_path, worksheets_data)
-
-            # 清理ANSI转义序列(终端粘贴可能带入的不可见字符)
-            sql = re.sub(r"\x1b\[[0-9;]*[a-zA-Z]", "", sql)
-            # 清理残余控制字符(保留\t\n\r,它们在SQL中有意义)
-            sql = re.sub(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]", "", sql)
-            # 清理残余的ANSI括号伪影:未配对的[后紧跟非ASCII字符
-            # 有效的SQL Server标识符 [名称] 有配对的],ANSI伪影 [中文 无配对
-            if sql.count("[") != sql.count("]"):
-                # 存在未配对括号,清理[后紧跟非ASCII字符的情况
-                sql = re.sub(r"\[(?=[^\x00-\x7F])", "", sql)
+                sql, worksheets_data = self._resolve_cross_file_references(sql, file_path, worksheets_data, referenced_tables)
 
-            # 中文列名替换:将SQL中的中文列名替换为英文列名(在解析前)
-            sql = self._replace_cn_columns_in_sql(sql, worksheets_data)
+            # 解析计划缓存:同一SQL在表结构(列名映射/中文表头)不变时复用预处理和解析结果
+            plan_key = ("plan", sql, self._plan_schema_fingerprint())
+            cached_plan = self._plan_cache.lookup(plan_key)
+            if cached_plan is not None:
+                sql = cached_plan[0]
+            else:
+                # 中文列名替换:将SQL中的中文列名替换为英文列名(在解析前)
+                sql = self._replace_cn_columns_in_sql(sql, worksheets_data)
 
             # DESCRIBE命令友好提示
             sql_stripped = sql.strip().upper()
@@ -449,40 +1462,48 @@ class AdvancedSQLQueryEngine:
             # 解析和执行SQL
             _query_start = time.time()
             try:
-                # 预处理:将双引号引用的原始列名替换为清洗后的列名
-                # 解决用户写 SELECT "Player Name" 但内部列名已变为 Player_Name 的问题
-                sql = self._preprocess_quoted_identifiers(sql)
-
-                # 预处理: 将 || 字符串拼接操作符转为 CONCAT()
-                # 因为 MySQL 方言将 || 解析为逻辑 OR，需要提前转换
-                sql = self._preprocess_dpipe_to_concat(sql)
-
-                # 预处理: 自动为 MySQL 保留字标识符添加反引号
-                # 解决 Key/Value/Status 等常见列名导致 sqlglot ParseError 的问题
-                sql = self._preprocess_reserved_words(sql)
-
-                # Fix: P0-2 SELECT 分号多语句注入
-                # 安全检测: 禁止SQL中出现外部分号(多语句注入攻击向量)
-                # 使用 _has_dangerous_semicolon() 跳过字符串字面量内的分号，避免误报
-                if self._has_dangerous_semicolon(sql):
-                    # 包含中间分号 → 拒绝执行(安全策略: 不支持多语句)
-                    return {
-                        "success": False,
-                        "message": "SQL语法错误: 不支持分号分隔的多语句执行(安全限制).💡 请将每条SQL语句分开执行",
-                        "data": [],
-                        "query_info": {
-                            "error_type": "multi_statement_rejected",
-                            "reason": "semicolon_injection_blocked",
-                        },
-                    }
+                if cached_plan is not None:
+                    # 缓存的解析树保持原样,执行阶段可能改写AST,因此每次取副本
+                    parsed_sql = cached_plan[1].copy()
+                    validation_result = dict(cached_plan[2])
+                else:
+                    # 预处理:将双引号引用的原始列名替换为清洗后的列名
+                    # 解决用户写 SELECT "Player Name" 但内部列名已变为 Player_Name 的问题
+                    sql = self._preprocess_quoted_identifiers(sql)
+
+                    # 预处理: 将 || 字符串拼接操作符转为 CONCAT()
+                    # 因为 MySQL 方言将 || 解析为逻辑 OR，需要提前转换
+                    sql = self._preprocess_dpipe_to_concat(sql)
+
+                    # 预处理: 自动为 MySQL 保留字标识符添加反引号
+                    # 解决 Key/Value/Status 等常见列名导致 sqlglot ParseError 的问题
+                    sql = self._preprocess_reserved_words(sql)
+
+                    # Fix: P0-2 SELECT 分号多语句注入
+                    # 安全检测: 禁止SQL中出现外部分号(多语句注入攻击向量)
+                    # 使用 _has_dangerous_semicolon() 跳过字符串字面量内的分号，避免误报
+                    if self._has_dangerous_semicolon(sql):
+                        # 包含中间分号 → 拒绝执行(安全策略: 不支持多语句)
+                        return {
+                            "success": False,
+                            "message": "SQL语法错误: 不支持分号分隔的多语句执行(安全限制).💡 请将每条SQL语句分开执行",
+                            "data": [],
+                            "query_info": {
+                                "error_type": "multi_statement_rejected",
+                                "reason": "semicolon_injection_blocked",
+                            },
+                        }
+
+                    parsed_sql = sqlglot.parse_one(sql, dialect="mysql")
 
-                parsed_sql = sqlglot.parse_one(sql, dialect="mysql")
+                    # 验证SQL支持范围
+                    validation_result = self._validate_sql_support(parsed_sql)
+                    if parsed_sql is not None:
+                        self._plan_cache.store(plan_key, (sql, parsed_sql.copy(), dict(validation_result)))
 
                 # 保存解析后的SQL,用于错误提示中的窗口函数别名检测
                 self._parsed_sql = parsed_sql
 
-                # 验证SQL支持范围
-                validation_result = self._validate_sql_support(parsed_sql)
                 if not validation_result["valid"]:
                     error_msg = validation_result.get("error", "不支持的SQL语法")
                     hint = _unsupported_error_hint(error_msg)
@@ -522,6 +1543,12 @@ class AdvancedSQLQueryEngine:
                 )
                 # 注入执行时间
                 result["query_info"]["execution_time_ms"] = round(_query_elapsed, 1)
+                result["query_info"]["cache_hit"] = False
+                result["query_info"]["load_timings"] = list(self._load_timings)
+                if self._where_paths:
+                    result["query_info"]["where_path"] = max(self._where_paths, key=_WHERE_PATH_ORDER.index)
+                if result_cache_key is not None and result.get("success"):
+                    self._query_result_cache.store(result_cache_key, result_cache_files, result)
 
                 return result
 
@@ -612,6 +1639,7 @@ class AdvancedSQLQueryEngine:
         sql: str,
         primary_file_path: str,
         primary_worksheets: dict[str, pd.DataFrame],
+        referenced_tables: set[str] | None = None,
     ) -> tuple[str, dict[str, pd.DataFrame]]:
         """
         解析SQL中的跨文件引用(@'path'语法),加载外部文件数据并合并到worksheets_data
@@ -623,56 +1651,63 @@ class AdvancedSQLQueryEngine:
             sql: 原始SQL语句
             primary_file_path: 主文件路径
             primary_worksheets: 主文件的worksheets_data
+            referenced_tables: SQL引用的表名集合(None 表示外部文件全部加载)
 
         Returns:
             Tuple[str, Dict]: (清理后的SQL, 合并后的worksheets_data)
         """
         # 正则匹配 @'path' 或 @"path" 模式
         # 路径可以包含字母,数字,./,../,_,-,空格等
-        cross_file_pattern = re.compile(r"""@(['"])(.*?)\1""", re.DOTALL)
-
-        matches = list(cross_file_pattern.finditer(sql))
+        matches = list(_CROSS_FILE_REF_RE.finditer(sql))
         if not matches:
             return sql, primary_worksheets
 
-        merged_data = dict(primary_worksheets)
+        merged_data = primary_worksheets.copy() if isinstance(primary_worksheets, _LazyWorksheets) else _LazyWorksheets(primary_worksheets)
+        # 外部文件加载会覆盖当前表头描述/列名映射,先保存主文件的,最后合并(主文件优先)
+        primary_descriptions = dict(getattr(self, "_header_descriptions", {}) or {})
+        primary_col_map = dict(getattr(self, "_original_to_clean_cols", {}) or {})
         cleaned_sql = sql
         primary_dir = os.path.dirname(os.path.abspath(primary_file_path))
         loaded_files = {}  # filepath -> worksheets_data(避免重复加载)
 
-        # 从后向前替换,避免索引偏移
+        # 从后向前(与SQL中出现顺序相反)确定外部文件的合并顺序,先全部校验再加载
+        ref_paths: list[str] = []
         for match in reversed(matches):
-            quote_char = match.group(1)
-            ref_path = match.group(2).strip()
-
             # 解析相对路径(相对于主文件目录)
-            if not os.path.isabs(ref_path):
-                ref_path = os.path.join(primary_dir, ref_path)
-
-            ref_path = os.path.normpath(ref_path)
-
             # 安全检查: 防止路径遍历攻击 (../)
-            primary_dir_norm = os.path.normpath(primary_dir)
-            if not ref_path.startswith(primary_dir_norm + os.sep) and ref_path != primary_dir_norm:
+            ref_path = self._resolve_cross_file_path(match.group(2), primary_dir)
+            if ref_path is None:
                 raise ValueError("跨文件引用的路径不允许访问主文件目录之外的文件")
 
             # 验证文件存在(错误信息不泄露完整路径)
             if not os.path.exists(ref_path):
                 raise ValueError(f"跨文件引用的文件不存在: {os.path.basename(ref_path)}.请检查文件名是否正确")
-
-            # 加载文件(带缓存,避免重复加载)
-            if ref_path not in loaded_files:
-                ext_worksheets = self._load_data_with_cache(ref_path)
-                if not ext_worksheets:
-                    raise ValueError(f"无法加载跨文件引用的Excel数据: {ref_path}")
-                loaded_files[ref_path] = ext_worksheets
-
-            ext_worksheets = loaded_files[ref_path]
+            if ref_path not in ref_paths:
+                ref_paths.append(ref_path)
+
+        # 多个外部文件并行加载(各自独立的calamine句柄);加载函数不修改查询状态,合并按上面的固定顺序进行
+        def _timed_load(path: str):
+            start = time.time()
+            return self._load_file_frames(path, sheets=referenced_tables, raise_errors=True), start
+
+        for ref_path, loaded in parallel_read_files(ref_paths, _timed_load, max_workers=self._load_workers, return_exceptions=True):
+            if isinstance(loaded, Exception):
+                raise ValueError(f"无法加载跨文件引用的Excel数据: {ref_path}: {loaded}") from loaded
+            if not loaded[0][0]:
+                raise ValueError(f"无法加载跨文件引用的Excel数据: {ref_path}")
+            (ext_worksheets, ext_descriptions, ext_col_map), start = loaded
+            self._record_load_timing(ref_path, ext_worksheets, start)
+            loaded_files[ref_path] = ext_worksheets
+            for ext_sheet, desc_map in ext_descriptions.items():
+                primary_descriptions.setdefault(ext_sheet, desc_map)
+            for orig_col, clean_col in ext_col_map.items():
+                primary_col_map.setdefault(orig_col, clean_col)
 
             # 合并工作表数据,处理名称冲突
             # 冲突时:主文件优先(已存在的不覆盖),外部文件重命名添加文件前缀
+            # 未被引用的外部sheet保持延迟加载(不触发解析)
             file_basename = os.path.splitext(os.path.basename(ref_path))[0]
-            for sheet_name, df in ext_worksheets.items():
+            for sheet_name in ext_worksheets.keys():
                 if sheet_name in merged_data:
                     # 名称冲突:为外部文件的工作表添加文件前缀
                     prefixed_name = f"{file_basename}.{sheet_name}"
@@ -682,81 +1717,366 @@ class AdvancedSQLQueryEngine:
                         while f"{prefixed_name}_{counter}" in merged_data:
                             counter += 1
                         prefixed_name = f"{prefixed_name}_{counter}"
-                    merged_data[prefixed_name] = df
+                    target_name = prefixed_name
                 else:
-                    merged_data[sheet_name] = df
+                    target_name = sheet_name
+                if dict.__contains__(ext_worksheets, sheet_name):
+                    merged_data[target_name] = ext_worksheets[sheet_name]
+                else:
+                    merged_data.add_pending(target_name, ext_worksheets.pending_loader(sheet_name))
 
-            # 从SQL中移除 @'path' 部分,保留表名和别名
+        # 从SQL中移除所有 @'path' 部分,保留表名和别名(从后向前,避免索引偏移)
+        for match in reversed(matches):
             cleaned_sql = cleaned_sql[: match.start()] + cleaned_sql[match.end() :]
 
+        self._header_descriptions = primary_descriptions
+        self._original_to_clean_cols = primary_col_map
         return cleaned_sql, merged_data
 
-    def _load_data_with_cache(self, file_path: str, sheet_name: str | None = None) -> dict[str, pd.DataFrame] | None:
+    def _load_data_with_cache(
+        self,
+        file_path: str,
+        sheet_name: str | None = None,
+        sheets: set[str] | None = None,
+    ) -> dict[str, pd.DataFrame] | None:
         """
         带缓存的Excel数据加载(公共方法,供execute_sql_query和execute_update_query复用)
 
-        使用mtime检测文件变更,LRU淘汰防止内存泄漏.
-        大文件(>500MB)使用分块读取减少内存峰值.
+        缓存按sheet粒度存储(key: "file_path|sheet"),使用mtime检测文件变更,LRU淘汰防止内存泄漏.
+        mtime变化时比较xlsx中各sheet部件的CRC,只重新加载部件有变化的sheet.
 
         Args:
             file_path: Excel文件路径
-            sheet_name: 工作表名称(可选)
+            sheet_name: 工作表名称(可选,指定时只加载该sheet)
+            sheets: 需要立即加载的sheet名集合(可选).指定时返回 _LazyWorksheets,
+                其余sheet只登记名称,首次访问时才解析;为None时加载全部sheet
 
         Returns:
             worksheets_data字典,加载失败返回None
         """
+        worksheets_data, header_descriptions, col_map = self._load_file_frames(file_path, sheet_name, sheets)
+        self._header_descriptions = header_descriptions
+        # 重置列名映射为当前文件的正确映射,避免其他文件的映射干扰
+        self._original_to_clean_cols = col_map
+        return worksheets_data
+
+    def _load_file_frames(
+        self,
+        file_path: str,
+        sheet_name: str | None = None,
+        sheets: set[str] | None = None,
+        raise_errors: bool = False,
+    ) -> tuple[dict[str, pd.DataFrame], dict[str, dict[str, str]], dict[str, str]]:
+        """_load_data_with_cache 的加载部分: 不修改查询状态, 可在并行加载的工作线程中调用.
+
+        raise_errors=True 时读取sheet列表失败直接抛出异常(带原因), 默认按空工作簿返回.
+
+        Returns:
+            (worksheets_data, header_descriptions, 原始列名->清洗列名映射)
+        """
         mtime = os.path.getmtime(file_path)
-        cache_key = f"{file_path}|{sheet_name or ''}"
-        if cache_key in self._df_cache:
-            cached_mtime, cached_data, cached_desc = self._df_cache[cache_key]
-            if cached_mtime == mtime:
-                self._header_descriptions = cached_desc
-                # 缓存命中时,重置列名映射为当前文件的正确映射,避免其他文件的映射干扰
-                self._original_to_clean_cols = {}
-                if cache_key in self._col_map_cache:
-                    self._original_to_clean_cols.update(self._col_map_cache[cache_key])
-                return cached_data
-            else:
-                # 文件已修改,重新加载
-                worksheets_data = self._load_excel_data(file_path, sheet_name)
-                self._df_cache[cache_key] = (
-                    mtime,
-                    worksheets_data,
-                    self._header_descriptions,
-                )
-                # 保存列名映射到缓存
-                self._col_map_cache[cache_key] = dict(self._original_to_clean_cols)
-                return worksheets_data
+        if sheet_name:
+            all_names = [sheet_name]
+            wanted = [sheet_name]
         else:
-            worksheets_data = self._load_excel_data(file_path, sheet_name)
-            self._df_cache[cache_key] = (
-                mtime,
-                worksheets_data,
-                self._header_descriptions,
-            )
-            # 保存列名映射到缓存
-            self._col_map_cache[cache_key] = dict(self._original_to_clean_cols)
-            # LRU淘汰:超过最大缓存数时删除最早缓存的文件
-            while len(self._df_cache) > self._max_cache_size:
-                evicted_key = next(iter(self._df_cache))
-                self._df_cache.pop(evicted_key)
-                self._col_map_cache.pop(evicted_key, None)
-            return worksheets_data
+            all_names = self._get_sheet_names(file_path, mtime, raise_errors=raise_errors)
+            wanted = all_names if sheets is None else [name for name in all_names if name in sheets]
+
+        worksheets_data, header_descriptions, col_map = self._fetch_sheets_with_cache(file_path, mtime, wanted)
+        if sheet_name or sheets is None:
+            return worksheets_data, header_descriptions, col_map
+
+        pending = {name: functools.partial(self._load_pending_sheet, file_path, name) for name in all_names if name not in worksheets_data}
+        return _LazyWorksheets(worksheets_data, pending, all_names), header_descriptions, col_map
+
+    def _record_load_timing(self, file_path: str, worksheets_data: dict | None, start: float) -> None:
+        """记录一次文件加载的耗时(本次查询实际加载的sheet及毫秒数),随结果返回在 query_info.load_timings"""
+        timings = getattr(self, "_load_timings", None)
+        if timings is None:
+            return
+        timings.append(
+            {
+                "file": os.path.basename(file_path),
+                "sheets": list(dict.keys(worksheets_data)) if worksheets_data else [],
+                "ms": round((time.time() - start) * 1000, 1),
+            }
+        )
+
+    def _fetch_sheets_with_cache(
+        self,
+        file_path: str,
+        mtime: float,
+        sheet_names: list[str],
+    ) -> tuple[dict[str, pd.DataFrame], dict[str, dict[str, str]], dict[str, str]]:
+        """按sheet读取缓存,未命中(或mtime变化)的sheet一次性批量加载后写回缓存.
+
+        Returns:
+            (worksheets_data, header_descriptions, 原始列名->清洗列名映射),顺序与 sheet_names 一致
+        """
+        cached: dict[str, tuple] = {}
+        missing: list[str] = []
+        for name in sheet_names:
+            cache_key = f"{file_path}|{name}"
+            entry = self._df_cache.lookup(cache_key, mtime, lambda name=name: self._sheet_part_signatures(file_path, mtime).get(name))
+            if entry is not None:
+                # 列名映射在此取出: 本次写入新条目时命中的条目可能被淘汰
+                cached[name] = (entry, self._col_map_cache.get(cache_key, {}))
+            else:
+                missing.append(name)
+
+        loaded: dict[str, pd.DataFrame] = {}
+        loaded_desc: dict[str, dict[str, str]] = {}
+        loaded_col_maps: dict[str, dict[str, str]] = {}
+        if missing:
+            # 部件签名与磁盘层指纹须在解析前获取, 防止解析期间文件被改写后把旧内容记到新签名下
+            part_sigs = self._sheet_part_signatures(file_path, mtime)
+            fingerprint = None
+            to_parse = missing
+            if self._disk_cache is not None:
+                # 磁盘层: 有部件签名的sheet按签名存取, 文件其他sheet变化时仍可命中
+                fingerprint = self._disk_cache.fingerprint(file_path)
+                to_parse = []
+                for name in missing:
+                    hit = self._disk_cache.load(file_path, name, part_sigs.get(name, fingerprint))
+                    if hit is None:
+                        to_parse.append(name)
+                        continue
+                    loaded[name], desc, loaded_col_maps[name] = hit
+                    if desc is not None:
+                        loaded_desc[name] = desc
+            if to_parse:
+                parsed, parsed_desc, parsed_col_maps = self._read_excel_sheets(file_path, to_parse)
+                for name, df in parsed.items():
+                    if fingerprint is not None:
+                        self._disk_cache.store(file_path, name, part_sigs.get(name, fingerprint), df, parsed_desc.get(name), parsed_col_maps.get(name, {}))
+                loaded.update(parsed)
+                loaded_desc.update(parsed_desc)
+                loaded_col_maps.update(parsed_col_maps)
+            for name, df in loaded.items():
+                cache_key = f"{file_path}|{name}"
+                # 超出字节预算/文件数上限时由 _SheetFrameCache 按最久未使用淘汰
+                entry = (mtime, {name: df}, {name: loaded_desc[name]} if name in loaded_desc else {}, part_sigs.get(name))
+                if self._df_cache.store(cache_key, file_path, entry):
+                    self._col_map_cache[cache_key] = loaded_col_maps.get(name, {})
+                    self._prebuild_key_index(cache_key, df, name in loaded_desc)
+
+        worksheets_data: dict[str, pd.DataFrame] = {}
+        header_descriptions: dict[str, dict[str, str]] = {}
+        col_map: dict[str, str] = {}
+        for name in sheet_names:
+            if name in cached:
+                (_mtime, sheet_data, sheet_desc, _sig), sheet_col_map = cached[name]
+                worksheets_data[name] = sheet_data[name]
+                # 表头描述按查询复制: JOIN会向其中追加重命名列, 不能改到缓存中共享的字典
+                header_descriptions.update({sheet: dict(desc_map) for sheet, desc_map in sheet_desc.items()})
+                col_map.update(sheet_col_map)
+            elif name in loaded:
+                worksheets_data[name] = loaded[name]
+                if name in loaded_desc:
+                    header_descriptions[name] = dict(loaded_desc[name])
+                col_map.update(loaded_col_maps.get(name, {}))
+        return worksheets_data, header_descriptions, col_map
+
+    def _load_pending_sheet(self, file_path: str, sheet: str) -> pd.DataFrame | None:
+        """_LazyWorksheets 的加载回调:加载单个sheet并合并其表头描述/列名映射到当前查询状态."""
+        if not os.path.exists(file_path):
+            return None
+        _load_start = time.time()
+        worksheets_data, header_descriptions, col_map = self._fetch_sheets_with_cache(file_path, os.path.getmtime(file_path), [sheet])
+        self._record_load_timing(file_path, worksheets_data, _load_start)
+        if sheet not in worksheets_data:
+            return None
+        if not hasattr(self, "_header_descriptions") or self._header_descriptions is None:
+            self._header_descriptions = {}
+        for name, desc_map in header_descriptions.items():
+            self._header_descriptions.setdefault(name, desc_map)
+        if not hasattr(self, "_original_to_clean_cols") or self._original_to_clean_cols is None:
+            self._original_to_clean_cols = {}
+        for orig_col, clean_col in col_map.items():
+            self._original_to_clean_cols.setdefault(orig_col, clean_col)
+        return worksheets_data[sheet]
+
+    def _sheet_part_signatures(self, file_path: str, mtime: float) -> dict[str, tuple[int, ...]]:
+        """sheet部件签名(按mtime缓存); 非zip或无法识别结构时返回空字典, 缓存退回按mtime整文件失效"""
+        cached = self._part_sig_cache.get(file_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        signatures = read_sheet_part_signatures(file_path) or {}
+        self._part_sig_cache[file_path] = (mtime, signatures)
+        return signatures
+
+    def _get_sheet_names(self, file_path: str, mtime: float | None = None, raise_errors: bool = False) -> list[str]:
+        """获取工作簿的sheet名列表(按mtime缓存,只读取workbook元数据,不解析sheet内容).
+
+        读取失败时返回空列表; raise_errors=True 时改为抛出 ValueError, 调用方可把原因带进错误信息.
+        """
+        if mtime is None:
+            mtime = os.path.getmtime(file_path)
+        cached = self._sheet_names_cache.get(file_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            from python_calamine import CalamineWorkbook
+
+            names = list(CalamineWorkbook.from_path(file_path).sheet_names)
+        except Exception as e:
+            logger.error(f"读取工作表列表失败: {e}")
+            if raise_errors:
+                raise ValueError(f"读取工作表列表失败: {e}") from e
+            return []
+        self._sheet_names_cache[file_path] = (mtime, names)
+        return names
+
+    def _query_cache_key(
+        self,
+        file_path: str,
+        sql: str,
+        sheet_name: str | None,
+        limit: int | None,
+        include_headers: bool,
+        output_format: str,
+    ) -> tuple[tuple | None, frozenset[str]]:
+        """构造查询结果缓存键.
+
+        键 = 规范化SQL + 查询参数 + 涉及的每个文件(主文件与 @'path' 引用)的 (绝对路径, 大小, mtime_ns)。
+        sheet 内容随文件指纹变化, 文件被任何方式修改后旧结果不再命中。
+
+        Returns:
+            (缓存键, 涉及文件的绝对路径集合); 含不确定函数或引用无法解析时键为 None(不缓存)
+        """
+        if _NONDETERMINISTIC_SQL_RE.search(sql):
+            return None, frozenset()
+        parts = _SQL_QUOTED_RE.split(sql.strip().rstrip(";"))
+        normalized_sql = "".join(part if i % 2 else " ".join(part.split()) for i, part in enumerate(parts))
+        paths = [os.path.abspath(file_path)]
+        primary_dir = os.path.dirname(paths[0])
+        for match in _CROSS_FILE_REF_RE.finditer(sql):
+            ref_path = self._resolve_cross_file_path(match.group(2), primary_dir)
+            if ref_path is None or not os.path.exists(ref_path):
+                return None, frozenset()
+            paths.append(ref_path)
+        fingerprints = []
+        for path in sorted(set(paths)):
+            st = os.stat(path)
+            fingerprints.append((path, st.st_size, st.st_mtime_ns))
+        key = (normalized_sql, sheet_name, limit, include_headers, output_format, tuple(fingerprints))
+        return key, frozenset(paths)
+
+    @staticmethod
+    def _resolve_cross_file_path(ref_path: str, primary_dir: str) -> str | None:
+        """解析跨文件引用路径(相对路径相对于主文件目录); 越出主文件目录时返回 None"""
+        ref_path = ref_path.strip()
+        if not os.path.isabs(ref_path):
+            ref_path = os.path.join(primary_dir, ref_path)
+        ref_path = os.path.normpath(ref_path)
+        primary_dir_norm = os.path.normpath(primary_dir)
+        if not ref_path.startswith(primary_dir_norm + os.sep) and ref_path != primary_dir_norm:
+            return None
+        return ref_path
+
+    def _invalidate_file_caches(self, file_path: str) -> None:
+        """本引擎写入文件后清理该文件的 DataFrame 缓存、sheet 列表缓存和涉及它的查询结果缓存"""
+        self._df_cache.discard_file(file_path)
+        self._sheet_names_cache.pop(file_path, None)
+        self._part_sig_cache.pop(file_path, None)
+        self._query_result_cache.discard_file(os.path.abspath(file_path))
+
+    def _collect_referenced_tables(self, sql: str) -> set[str] | None:
+        """
+        解析SQL,收集FROM/JOIN/子查询/CTE中引用的表名(不含CTE自身定义的名称).
+
+        用于按需加载:冷查询只解析真正被引用的sheet.跨文件 @'path' 后缀会先剥离.
+
+        Returns:
+            表名集合;SQL无法解析时返回None(调用方回退为全部加载)
+        """
+        # 表名集合只取决于SQL文本,与表结构无关,按原始SQL缓存
+        cache_key = ("tables", sql)
+        cached = self._plan_cache.lookup(cache_key)
+        if cached is not None:
+            return set(cached)
+        probe_sql = re.sub(r"""@(['"])(.*?)\1""", "", sql, flags=re.DOTALL)
+        probe_sql = self._preprocess_reserved_words(probe_sql)
+        parsed = None
+        # postgres 方言兜底: MySQL 方言无法解析的 || 拼接等写法
+        for dialect in ("mysql", "postgres"):
+            try:
+                parsed = sqlglot.parse_one(probe_sql, dialect=dialect)
+                break
+            except Exception:
+                continue
+        if parsed is None:
+            return None
+        cte_names = {cte.alias for cte in parsed.find_all(exp.CTE) if cte.alias}
+        tables = {table.name for table in parsed.find_all(exp.Table) if table.name and table.name not in cte_names}
+        self._plan_cache.store(cache_key, frozenset(tables))
+        return tables
+
+    def _plan_schema_fingerprint(self) -> tuple:
+        """解析计划缓存的表结构指纹.
+
+        预处理管线只读取列名映射(双引号原始列名→清洗列名)和中文表头描述(中文→英文列名),
+        二者都由本次查询加载的sheet决定, 其内容即为表结构指纹。
+        """
+        descriptions = getattr(self, "_header_descriptions", None) or {}
+        col_map = getattr(self, "_original_to_clean_cols", None) or {}
+        return (
+            tuple((sheet, tuple(desc_map.items())) for sheet, desc_map in descriptions.items()),
+            tuple(col_map.items()),
+        )
 
     def _estimate_cache_memory_mb(self) -> float:
-        """估算当前缓存占用的内存(MB)"""
-        total = 0.0
-        for _key, (_mtime, worksheets_data, _desc) in self._df_cache.items():
-            for _sheet, df in worksheets_data.items():
-                total += df.memory_usage(deep=True).sum() / 1024 / 1024
-        return total
+        """当前缓存占用的内存(MB),按写入时测量的条目字节数累计"""
+        return self._df_cache.resident_bytes / 1024 / 1024
 
     def evict_cache_by_memory(self, target_mb: float = 50.0):
-        """按内存目标驱逐缓存条目"""
-        while self._estimate_cache_memory_mb() > target_mb and self._df_cache:
-            evicted_key = next(iter(self._df_cache))
-            self._df_cache.pop(evicted_key)
-            self._col_map_cache.pop(evicted_key, None)
+        """按内存目标驱逐缓存条目(最久未使用的先淘汰)"""
+        self._df_cache.evict_to(int(target_mb * 1024 * 1024))
+
+    def preload_workbook(self, file_path: str) -> list[str]:
+        """预热: 加载并清洗文件的全部sheet写入DataFrame缓存(启用磁盘缓存时同时写入磁盘层), 不修改查询状态
+
+        Returns:
+            已加载的sheet名称列表
+
+        Raises:
+            ValueError: 文件无法读取或没有可加载的sheet
+        """
+        worksheets_data, _, _ = self._load_file_frames(os.path.abspath(file_path))
+        if not worksheets_data:
+            raise ValueError(f"无法加载文件: {file_path}")
+        return list(worksheets_data)
+
+    def get_cache_stats(self) -> dict[str, Any]:
+        """缓存统计: DataFrame缓存的命中/未命中/淘汰次数与常驻内存, 查询结果缓存, 解析计划缓存, JOIN索引缓存, 列统计缓存, 以及磁盘缓存层统计(未启用时为None)"""
+        df_stats = self._df_cache.get_stats()
+        df_stats["resident_mb"] = round(df_stats["resident_bytes"] / 1024 / 1024, 2)
+        return {
+            "df_cache": df_stats,
+            "query_cache": self._query_result_cache.get_stats(),
+            "plan_cache": self._plan_cache.get_stats(),
+            "join_index_cache": self._join_index_cache.get_stats(),
+            "column_stats_cache": self._column_stats_cache.get_stats(),
+            "disk_cache": self._disk_cache.get_stats() if self._disk_cache is not None else None,
+        }
+
+    def get_sheet_statistics(self, file_path: str, sheet_name: str) -> dict[str, Any] | None:
+        """经 DataFrame 缓存取 sheet 的统计目录: {"row_count": 行数, "columns": {列名: 列统计}}, 供 excel_describe_table 使用
+
+        列统计(空值数/近似去重数/最值/有序性/前 100 个非空值)随缓存复用, 重复调用不再扫描数据;
+        sheet 不存在或加载失败时返回 None.
+        """
+        file_path = os.path.abspath(file_path)
+        try:
+            frames, _, _ = self._load_file_frames(file_path, sheet_name)
+        except Exception as e:
+            logger.debug("载入sheet统计失败(%s): %s|%s", e, file_path, sheet_name)
+            return None
+        frame = frames.get(sheet_name)
+        if frame is None:
+            return None
+        sheet_key = self._cached_sheet_key(sheet_name, frame, file_path)
+        return {"row_count": len(frame), "columns": {column: self._column_stats(sheet_key, frame, column) for column in frame.columns}}
 
     def _load_excel_data(self, file_path: str, sheet_name: str | None = None) -> dict[str, pd.DataFrame]:
         """
@@ -776,8 +2096,30 @@ class AdvancedSQLQueryEngine:
         Returns:
             Dict[str, pd.DataFrame]: 工作表名到DataFrame的映射
         """
+        worksheets_data, header_descriptions, col_maps = self._read_excel_sheets(file_path, [sheet_name] if sheet_name else None)
+        self._header_descriptions = header_descriptions
+        if not hasattr(self, "_original_to_clean_cols") or self._original_to_clean_cols is None:
+            self._original_to_clean_cols = {}
+        for col_map in col_maps.values():
+            self._original_to_clean_cols.update(col_map)
+        return worksheets_data
+
+    def _read_excel_sheets(
+        self,
+        file_path: str,
+        sheet_names: list[str] | None = None,
+    ) -> tuple[dict[str, pd.DataFrame], dict[str, dict[str, str]], dict[str, dict[str, str]]]:
+        """
+        读取指定sheet(None 表示全部)并完成双行表头检测、清洗和dtype优化.
+
+        不修改引擎的查询状态,结果由调用方决定如何缓存/合并.
+
+        Returns:
+            (worksheets_data, {sheet: {字段名: 描述}}, {sheet: {原始列名: 清洗列名}})
+        """
         worksheets_data = {}
-        self._header_descriptions = {}  # {sheet_name: {field_name: description}}
+        header_descriptions = {}  # {sheet_name: {field_name: description}}
+        col_maps = {}  # {sheet_name: {original_col: clean_col}}
 
         try:
             # P3-01: 大文件内存优化 - 文件大小预检
@@ -787,164 +2129,190 @@ class AdvancedSQLQueryEngine:
             elif file_size_mb > 10:
                 logger.info(f"加载较大文件: {file_path} ({file_size_mb:.1f}MB)")
 
-            # 单次读取优化 (P1): 每个 sheet 只读一次 pd.read_excel(header=None),
-            # 从结果的前 2 行检测双行表头并切片, 彻底消除 cal_wb 物化 + pd.read_excel 二次读取.
-            # 类型推断仍由 pandas _convert_cell 完成 (float→int), 不手写类型逻辑 (P1 失败教训).
+            # 单次打开: 所有 sheet 共用同一个 CalamineWorkbook 句柄 (zip/sharedStrings 只解析一次),
+            # 直接用 to_python() 的行数据构建 DataFrame, 不再按 sheet 调用 pd.read_excel 重复打开文件.
+            # 类型推断复刻 pd.read_excel(header=None) + to_numeric 的结果 (见 _type_excel_columns).
             from python_calamine import CalamineWorkbook
 
-            from .header_analyzer import HeaderInfo, _cell_str, detect_from_rows
-
             cal_wb = CalamineWorkbook.from_path(file_path)
             all_sheet_names = cal_wb.sheet_names
 
-            if sheet_name:
-                sheets_to_load = [sheet_name] if sheet_name in all_sheet_names else []
+            if sheet_names is not None:
+                sheets_to_load = [name for name in sheet_names if name in all_sheet_names]
             else:
                 sheets_to_load = all_sheet_names
 
+            workers = min(self._load_workers, len(sheets_to_load))
+            if workers <= 1 or file_size_mb < SHEET_PARALLEL_MIN_FILE_MB:
+                return self._read_sheet_group(file_path, cal_wb, sheets_to_load)
+
+            # 大文件多sheet: 句柄不能跨线程共享, 除第一组外每个线程打开自己的句柄解析一组sheet
+            groups = [(cal_wb if n == 0 else None, sheets_to_load[n::workers]) for n in range(workers)]
+            group_results = parallel_map(groups, lambda group: self._read_sheet_group(file_path, *group), max_workers=workers, serial_threshold=1)
+            # 按工作簿中的sheet顺序合并, 与串行加载结果一致
             for sheet in sheets_to_load:
-                try:
-                    # 单次读取: header=None 拿到所有行 (含表头行) 作为数据
-                    raw_df = pd.read_excel(
-                        file_path,
-                        sheet_name=sheet,
-                        engine="calamine",
-                        header=None,
-                        keep_default_na=False,
-                        na_values=[""],
-                    )
+                for group_result in group_results:
+                    if group_result is not None and sheet in group_result[0]:
+                        worksheets_data[sheet] = group_result[0][sheet]
+                        if sheet in group_result[1]:
+                            header_descriptions[sheet] = group_result[1][sheet]
+                        col_maps[sheet] = group_result[2].get(sheet, {})
+                        break
+
+        except Exception as e:
+            logger.error(f"加载Excel数据失败: {e}")
+            return {}, {}, {}
+
+        return worksheets_data, header_descriptions, col_maps
+
+    def _read_sheet_group(
+        self,
+        file_path: str,
+        cal_wb,
+        sheet_names: list[str],
+    ) -> tuple[dict[str, pd.DataFrame], dict[str, dict[str, str]], dict[str, dict[str, str]]]:
+        """用一个 CalamineWorkbook 句柄解析一组sheet(cal_wb 为 None 时自行打开), 返回值同 _read_excel_sheets."""
+        from .header_analyzer import HeaderInfo, _cell_str, detect_from_rows
+
+        if cal_wb is None:
+            from python_calamine import CalamineWorkbook
+
+            cal_wb = CalamineWorkbook.from_path(file_path)
+
+        worksheets_data = {}
+        header_descriptions = {}  # {sheet_name: {field_name: description}}
+        col_maps = {}  # {sheet_name: {original_col: clean_col}}
+        for sheet in sheet_names:
+            try:
+                # 单次读取: 拿到所有行 (含表头行) 作为数据
+                raw = _calamine_rows_to_array(cal_wb.get_sheet_by_name(sheet).to_python(skip_empty_area=False))
 
-                    if len(raw_df) == 0:
-                        # 空表
-                        worksheets_data[sheet] = self._optimize_dtypes(self._clean_dataframe(pd.DataFrame()))
-                        continue
+                if raw.shape[0] == 0:
+                    # 空表
+                    worksheets_data[sheet] = self._optimize_dtypes(self._clean_dataframe(pd.DataFrame(), col_map={}))
+                    col_maps[sheet] = {}
+                    continue
 
-                    # 从前 2 行检测双行表头 (与 HeaderAnalyzer 完全相同的语义)
-                    first_row = raw_df.iloc[0].tolist()
-                    second_row = raw_df.iloc[1].tolist() if len(raw_df) > 1 else []
-                    first_row_values = [_cell_str(c) or "" for c in first_row]
-                    second_row_values = [_cell_str(c) or "" for c in second_row]
-                    is_dual_header, _hri, _desc = detect_from_rows([first_row, second_row])
-
-                    # 回填 HeaderAnalyzer 缓存 (供 upsert_row / get_data_start_row 等调用方复用)
-                    if HeaderAnalyzer is not None:
-                        info = HeaderInfo()
-                        info.raw_first_row = first_row
-                        info.raw_second_row = second_row
-                        info.is_dual = is_dual_header
-                        if is_dual_header:
-                            info.header_rows = [1, 2]
-                            info.data_start_row = 3
-                            info.descriptions = first_row_values
-                            info.column_names = second_row_values
-                        else:
-                            info.header_rows = [1]
-                            info.data_start_row = 2
-                            info.descriptions = []
-                            info.column_names = first_row_values
-                        _nec = [i for i, v in enumerate(info.column_names) if v]
-                        info.total_columns = max(_nec) + 1 if _nec else 0
-                        for _i, _name in enumerate(info.column_names):
-                            if _name:
-                                info.name_to_index[_name] = _i
-                        if is_dual_header:
-                            for _i, (_d, _e) in enumerate(zip(info.descriptions, info.column_names)):
-                                if _d and _e:
-                                    info.column_map[_d] = _e
-                        HeaderAnalyzer._set_cached(file_path, sheet, info)
-
-                    # 切片: 双表头取第2行做列名+第3行起数据; 单表头取第1行做列名+第2行起数据
+                # 从前 2 行检测双行表头 (与 HeaderAnalyzer 完全相同的语义)
+                first_row, second_row, full_columns = _excel_header_rows(raw)
+                first_row_values = [_cell_str(c) or "" for c in first_row]
+                second_row_values = [_cell_str(c) or "" for c in second_row]
+                is_dual_header, _hri, _desc = detect_from_rows([first_row, second_row])
+
+                # 回填 HeaderAnalyzer 缓存 (供 upsert_row / get_data_start_row 等调用方复用)
+                if HeaderAnalyzer is not None:
+                    info = HeaderInfo()
+                    info.raw_first_row = first_row
+                    info.raw_second_row = second_row
+                    info.is_dual = is_dual_header
                     if is_dual_header:
-                        header_row = second_row_values
-                        raw_desc_pairs = []
-                        if second_row_values and first_row_values:
-                            for col_idx, fname in enumerate(second_row_values):
-                                fname = fname.strip() if fname else ""
-                                desc = first_row_values[col_idx].strip() if col_idx < len(first_row_values) else ""
-                                if fname and desc and desc != fname:
-                                    raw_desc_pairs.append((col_idx, fname, desc))
-                        df = raw_df.iloc[2:].copy()
+                        info.header_rows = [1, 2]
+                        info.data_start_row = 3
+                        info.descriptions = first_row_values
+                        info.column_names = second_row_values
                     else:
-                        header_row = first_row_values
-                        raw_desc_pairs = []
-                        df = raw_df.iloc[1:].copy()
-
-                    df.columns = header_row
-                    # P10: 英文字段名为空时(列名 Unnamed: N), 回退用中文描述做列名
-                    # P11: 修复 MapEvent 表头 5 个空列导致的 bug
-                    #   原因: 第二行表头有空单元格 → _cell_str 返回 None → '' 空串
-                    #         → 5 列都叫 '' 重复列名 → df[''] 返回 DataFrame 而非 Series
-                    #         → 后续 .dtype 访问崩溃 → 整个 sheet 被 except 静默吞掉
-                    #   修复: (a) 空串列名也回退用中文描述; (b) 仍有重复则加后缀去重
-                    # P11: 修复 MapEvent 表头 5 个空列导致的 bug
-                    #   原因: 第二行表头有空单元格 → _cell_str 返回 None → '' 空串
-                    #         → 5 列都叫 '' 重复列名 → df[''] 返回 DataFrame 而非 Series
-                    #         → 后续 .dtype 访问崩溃 → 整个 sheet 被 except 静默吞掉
-                    #   修复: 直接按位置重建列名 (rename 用列名做 key, 重复列名会一起被改, 不安全)
-                    new_columns: list[str] = []
-                    seen_names: dict[str, int] = {}
-                    for col_idx in range(len(df.columns)):
-                        col_name = str(df.columns[col_idx])
-                        is_empty_or_unnamed = (col_name == "") or (col_name == "nan") or ("unnamed" in col_name.lower())
-                        if is_empty_or_unnamed:
-                            # 回退 1: 用中文描述(第一行)作为列名
-                            if col_idx < len(first_row_values) and first_row_values[col_idx]:
-                                col_name = str(first_row_values[col_idx])
-                            else:
-                                # 回退 2: 用列序号兜底
-                                col_name = f"col_{col_idx}"
-                        # 去重: 若列名仍重复, 加 _dup{N} 后缀
-                        if col_name in seen_names:
-                            seen_names[col_name] += 1
-                            col_name = f"{col_name}_dup{seen_names[col_name]}"
+                        info.header_rows = [1]
+                        info.data_start_row = 2
+                        info.descriptions = []
+                        info.column_names = first_row_values
+                    _nec = [i for i, v in enumerate(info.column_names) if v]
+                    info.total_columns = max(_nec) + 1 if _nec else 0
+                    for _i, _name in enumerate(info.column_names):
+                        if _name:
+                            info.name_to_index[_name] = _i
+                    if is_dual_header:
+                        for _i, (_d, _e) in enumerate(zip(info.descriptions, info.column_names)):
+                            if _d and _e:
+                                info.column_map[_d] = _e
+                    HeaderAnalyzer._set_cached(file_path, sheet, info)
+
+                # 切片: 双表头取第2行做列名+第3行起数据; 单表头取第1行做列名+第2行起数据
+                if is_dual_header:
+                    header_row = second_row_values
+                    raw_desc_pairs = []
+                    if second_row_values and first_row_values:
+                        for col_idx, fname in enumerate(second_row_values):
+                            fname = fname.strip() if fname else ""
+                            desc = first_row_values[col_idx].strip() if col_idx < len(first_row_values) else ""
+                            if fname and desc and desc != fname:
+                                raw_desc_pairs.append((col_idx, fname, desc))
+                    data_start = 2
+                else:
+                    header_row = first_row_values
+                    raw_desc_pairs = []
+                    data_start = 1
+
+                # 类型推断: 整列已推断的列 (表头为数字/空) 直接切片, 其余列按数据区推断
+                columns = _type_excel_columns(np.delete(raw[data_start:], list(full_columns), axis=1), np.delete(raw[:data_start], list(full_columns), axis=1))
+                for col_idx in sorted(full_columns):
+                    columns.insert(col_idx, full_columns[col_idx][data_start:])
+                # P10: 英文字段名为空时(列名 Unnamed: N), 回退用中文描述做列名
+                # P11: 修复 MapEvent 表头 5 个空列导致的 bug
+                #   原因: 第二行表头有空单元格 → _cell_str 返回 None → '' 空串
+                #         → 5 列都叫 '' 重复列名 → df[''] 返回 DataFrame 而非 Series
+                #         → 后续 .dtype 访问崩溃 → 整个 sheet 被 except 静默吞掉
+                #   修复: (a) 空串列名也回退用中文描述; (b) 仍有重复则加后缀去重
+                # P11: 修复 MapEvent 表头 5 个空列导致的 bug
+                #   原因: 第二行表头有空单元格 → _cell_str 返回 None → '' 空串
+                #         → 5 列都叫 '' 重复列名 → df[''] 返回 DataFrame 而非 Series
+                #         → 后续 .dtype 访问崩溃 → 整个 sheet 被 except 静默吞掉
+                #   修复: 直接按位置重建列名 (rename 用列名做 key, 重复列名会一起被改, 不安全)
+                new_columns: list[str] = []
+                seen_names: dict[str, int] = {}
+                for col_idx in range(len(header_row)):
+                    col_name = str(header_row[col_idx])
+                    is_empty_or_unnamed = (col_name == "") or (col_name == "nan") or ("unnamed" in col_name.lower())
+                    if is_empty_or_unnamed:
+                        # 回退 1: 用中文描述(第一行)作为列名
+                        if col_idx < len(first_row_values) and first_row_values[col_idx]:
+                            col_name = str(first_row_values[col_idx])
                         else:
-                            seen_names[col_name] = 0
-                        new_columns.append(col_name)
-                    df.columns = new_columns
-                    df = df.reset_index(drop=True)
-                    # 类型推断: header=None 读取后数值列是 object 类型,
-                    # 需转回 int64/float64 (复刻 pd.read_excel(header=N) 的推断行为, 保障除零等运算语义)
-                    # 防御: 用 .iloc[:, idx] 取 Series (df[col] 对重复列名返回 DataFrame, 已去重但保持防御)
-                    for col_idx in range(len(df.columns)):
-                        col = df.columns[col_idx]
-                        series = df.iloc[:, col_idx]
-                        if series.dtype == "object":
-                            try:
-                                df[col] = pd.to_numeric(series, errors="raise")
-                            except (ValueError, TypeError):
-                                pass  # 含非数字, 保持 object (字符串列)
-
-                    # 清洗 + dtype 优化 (与原逻辑一致)
-                    df = self._clean_dataframe(df)
-                    cleaned_columns = list(df.columns)
-                    if raw_desc_pairs:
-                        desc_map = {}
-                        for col_idx, _fname, desc in raw_desc_pairs:
-                            if col_idx < len(cleaned_columns):
-                                desc_map[cleaned_columns[col_idx]] = desc
-                        self._header_descriptions[sheet] = desc_map
-                    df = self._optimize_dtypes(df)
-                    worksheets_data[sheet] = df
-                except Exception as _sheet_err:
-                    # 兜底: 该 sheet 失败时跳过 (不影响其它 sheet)
-                    # 但不能静默吞噬 — 至少 warning 级别记录, 方便排查
-                    # (之前是 debug 级别, 导致 MapEvent 加载失败用户完全无感知)
-                    import traceback as _tb
-
-                    logger.warning(f"⚠️ 加载工作表 %s 失败, 已跳过。错误: %s\n%s", sheet, _sheet_err, _tb.format_exc())
-
-        except Exception as e:
-            logger.error(f"加载Excel数据失败: {e}")
-            return {}
-
-        return worksheets_data
+                            # 回退 2: 用列序号兜底
+                            col_name = f"col_{col_idx}"
+                    # 去重: 若列名仍重复, 加 _dup{N} 后缀
+                    if col_name in seen_names:
+                        seen_names[col_name] += 1
+                        col_name = f"{col_name}_dup{seen_names[col_name]}"
+                    else:
+                        seen_names[col_name] = 0
+                    new_columns.append(col_name)
+                # dtype=object 显式保留: 避免构造时把 Timestamp 列推断成 datetime64 (与 read_excel 切片结果一致)
+                df = pd.DataFrame(
+                    {name: pd.Series(values, dtype=values.dtype, copy=False) for name, values in zip(new_columns, columns)},
+                    columns=new_columns,
+                )
 
-    def _clean_dataframe(self, df) -> pd.DataFrame:
+                # 清洗 + dtype 优化 (与原逻辑一致)
+                sheet_col_map: dict[str, str] = {}
+                df = self._clean_dataframe(df, col_map=sheet_col_map)
+                col_maps[sheet] = sheet_col_map
+                cleaned_columns = list(df.columns)
+                if raw_desc_pairs:
+                    desc_map = {}
+                    for col_idx, _fname, desc in raw_desc_pairs:
+                        if col_idx < len(cleaned_columns):
+                            desc_map[cleaned_columns[col_idx]] = desc
+                    header_descriptions[sheet] = desc_map
+                df = self._optimize_dtypes(df)
+                worksheets_data[sheet] = df
+            except Exception as _sheet_err:
+                # 兜底: 该 sheet 失败时跳过 (不影响其它 sheet)
+                # 但不能静默吞噬 — 至少 warning 级别记录, 方便排查
+                # (之前是 debug 级别, 导致 MapEvent 加载失败用户完全无感知)
+                import traceback as _tb
+
+                logger.warning(f"⚠️ 加载工作表 %s 失败, 已跳过。错误: %s\n%s", sheet, _sheet_err, _tb.format_exc())
+
+        return worksheets_data, header_descriptions, col_maps
+
+    def _clean_dataframe(self, df, col_map: dict[str, str] | None = None) -> pd.DataFrame:
         """
         清理DataFrame数据
 
         Args:
             df: 原始DataFrame
+            col_map: 接收"原始列名->清洗列名"映射的字典(可选);
+                不传时合并到 self._original_to_clean_cols
 
         Returns:
             pd.DataFrame: 清理后的DataFrame
@@ -1000,9 +2368,12 @@ class AdvancedSQLQueryEngine:
         df = df.rename(columns=clean_columns)
 
         # 保存原始列名到清洗后列名的映射,用于SQL预处理
-        if not hasattr(self, "_original_to_clean_cols") or self._original_to_clean_cols is None:
-            self._original_to_clean_cols = {}
-        self._original_to_clean_cols.update(clean_columns)
+        if col_map is not None:
+            col_map.update(clean_columns)
+        else:
+            if not hasattr(self, "_original_to_clean_cols") or self._original_to_clean_cols is None:
+                self._original_to_clean_cols = {}
+            self._original_to_clean_cols.update(clean_columns)
 
         # 保持原始数据不做空值替换
         # pandas groupby 默认跳过 NaN 行,不需要手动处理
@@ -1109,7 +2480,7 @@ class AdvancedSQLQueryEngine:
             raise ValueError(f"CTE 嵌套深度超过限制 ({self._MAX_CTE_DEPTH})。💡 请简化查询，减少 CTE 嵌套层数，或改用子查询替代多层 CTE。")
 
         # 复制worksheets_data避免修改原始数据，逐步添加CTE结果
-        cte_data = dict(worksheets_data)
+        cte_data = worksheets_data.copy()
         for cte_expr in with_clause.expressions:
             cte_name = cte_expr.alias
             cte_query = cte_expr.this  # inner Select
@@ -2257,6 +3628,88 @@ class AdvancedSQLQueryEngine:
 
         return outer
 
+    # 分组 Top-N 提前裁剪的最大 k(每个分区逐轮取最小值, 轮数为 k)
+    _WINDOW_TOP_N_MAX = 64
+
+    def _mark_window_top_n(self, parsed_sql: exp.Expression, from_subquery) -> None:
+        """外层 WHERE 限定 FROM 子查询的 ROW_NUMBER/RANK 别名不超过常量 k 时, 在内层 SELECT 节点上记下 k
+
+        仅限内层只有这一个窗口函数、且没有 GROUP BY/聚合/DISTINCT/LIMIT 的子查询(典型的分组 Top-N 写法,
+        包括 WHERE rk <= 3 被改写出的子查询). 内层据此在计算窗口前只保留每个分区可能排进前 k 的行, 见 _window_top_n_cut.
+        """
+        inner = from_subquery.this if isinstance(from_subquery, exp.Subquery) else from_subquery
+        where_clause = parsed_sql.args.get("where")
+        if not isinstance(inner, exp.Select) or where_clause is None or parsed_sql.args.get("joins"):
+            return
+        if any(inner.args.get(key) for key in ("group", "having", "distinct", "limit", "offset")) or self._check_has_aggregate_function(inner):
+            return
+        windows = list(inner.find_all(exp.Window))
+        if len(windows) != 1 or not isinstance(windows[0].parent, exp.Alias) or windows[0].parent.parent is not inner:
+            return
+        window = windows[0]
+        if type(window.this).__name__ not in ("RowNumber", "Rank"):
+            return
+        if window.args.get("spec") is not None or window.args.get("order") is None:
+            return
+        alias = window.parent.alias
+        condition = where_clause.this.unnest()
+        bounds = []
+        for conjunct in condition.flatten() if isinstance(condition, exp.And) else [condition]:
+            conjunct = conjunct.unnest()
+            if isinstance(conjunct, exp.Between):
+                column, op, literal = conjunct.this, "<=", conjunct.args.get("high")
+            elif isinstance(conjunct, exp.In) and conjunct.args.get("query") is None:
+                literals = conjunct.expressions
+                if not literals or not all(isinstance(lit, exp.Literal) and lit.is_int for lit in literals):
+                    continue
+                column, op, literal = conjunct.this, "<=", max(literals, key=lambda lit: int(lit.this))
+            elif type(conjunct) in (exp.EQ, exp.LT, exp.LTE, exp.GT, exp.GTE):
+                op = self._BAND_OPS[type(conjunct)]
+                column, literal = conjunct.left, conjunct.right
+                if not isinstance(column, exp.Column):
+                    column, literal, op = conjunct.right, conjunct.left, self._BAND_FLIP[op]
+            else:
+                continue
+            if not (isinstance(column, exp.Column) and column.name == alias and isinstance(literal, exp.Literal) and literal.is_int):
+                continue
+            if op in ("<=", "="):
+                bounds.append(int(literal.this))
+            elif op == "<":
+                bounds.append(int(literal.this) - 1)
+        if bounds and min(bounds) >= 1:
+            inner.meta["window_top_n"] = min(bounds)
+
+    def _window_top_n_cut(self, parsed_sql: exp.Expression, df: pd.DataFrame) -> pd.DataFrame:
+        """_mark_window_top_n 标记过的查询在计算窗口前只保留每个分区中第一排序键可能排进前 k 的行
+
+        被去掉的行在完整数据上的 ROW_NUMBER/RANK 都大于 k, 会被外层 WHERE 过滤; 保留行的排名不变
+        (排在它们之前的行都被保留). 分区/排序列须为当前 DataFrame 中的普通列, 否则原样返回.
+        """
+        top_n = parsed_sql.meta.get("window_top_n") if parsed_sql.meta else None
+        if top_n is None or len(df) <= top_n or top_n > self._WINDOW_TOP_N_MAX:
+            return df
+        window = next(parsed_sql.find_all(exp.Window))
+        partition_by = window.args.get("partition_by") or []
+        first = window.args["order"].expressions[0]
+        if not all(isinstance(node, exp.Column) and node.name in df.columns for node in [*partition_by, first.this]):
+            return df
+        values = df[first.this.name]
+        # 与 _compute_window_function 一致: object 排序列按数值比较, 非数值视为 NULL; 窗口排序 NULL 在后
+        if values.dtype == object:
+            values = pd.to_numeric(values, errors="coerce")
+        ascending = not first.args.get("desc", False)
+        if not partition_by:
+            positions = _top_n_positions(values, ascending, False, top_n)
+        else:
+            keys = _sort_key_array(values, ascending, False)
+            if keys is None:
+                return df
+            codes = df.groupby([node.name for node in partition_by], sort=False, dropna=False, observed=False).ngroup().to_numpy()
+            positions = np.flatnonzero(_group_top_n_mask(keys, codes, top_n))
+        if positions is None or len(positions) == len(df):
+            return df
+        return df.iloc[positions]
+
     def _check_window_alias_hint(self, col_name: str) -> str:
         """
         检查列名是否是窗口函数别名,如果是则返回友好的错误提示.
@@ -2377,7 +3830,7 @@ class AdvancedSQLQueryEngine:
 
         if with_clause:
             # 复制worksheets_data避免修改原始数据,逐步添加CTE结果
-            cte_data = dict(worksheets_data)
+            cte_data = worksheets_data.copy()
             for cte_expr in with_clause.expressions:
                 cte_name = cte_expr.alias
                 cte_query = cte_expr.this  # inner Select
@@ -2530,71 +3983,77 @@ class AdvancedSQLQueryEngine:
         """
         计算窗口函数并将结果添加到DataFrame
         支持: ROW_NUMBER, RANK, DENSE_RANK, PERCENT_RANK, CUME_DIST
-        语法: func() OVER ([PARTITION BY col ...] ORDER BY col [ASC|DESC] ...)
+        语法: func() OVER ([PARTITION BY col ...] ORDER BY col [ASC|DESC] ... [ROWS|RANGE BETWEEN start AND end])
         """
         if not self._has_window_function(parsed_sql):
             return df
 
         df = df.copy()
 
-        # 构建SELECT别名映射(用于将聚合表达式映射到别名,如AVG(damage)->avg_dmg)
-        select_alias_map = {}
-        for select_expr in parsed_sql.expressions:
-            if isinstance(select_expr, exp.Alias):
-                alias_name = select_expr.alias
-                original = select_expr.this
-                # 将原始表达式文本作为key
-                expr_key = str(original).strip()
-                select_alias_map[expr_key] = alias_name
-
-        # 收集所有已处理的Window表达式(用于去重)
-        _processed_windows: set[int] = set()
-
-        for select_expr in parsed_sql.expressions:
-            # 跳过 SELECT *
-            if isinstance(select_expr, exp.Star):
-                continue
+        # 同一 (PARTITION BY, ORDER BY) 的窗口函数共用一次排序与分区编码(见 _shared_window_layout)
+        previous_layouts, self._window_layouts = getattr(self, "_window_layouts", None), {}
+        try:
+            # 构建SELECT别名映射(用于将聚合表达式映射到别名,如AVG(damage)->avg_dmg)
+            select_alias_map = {}
+            for select_expr in parsed_sql.expressions:
+                if isinstance(select_expr, exp.Alias):
+                    alias_name = select_expr.alias
+                    original = select_expr.this
+                    # 将原始表达式文本作为key
+                    expr_key = str(original).strip()
+                    select_alias_map[expr_key] = alias_name
+
+            # 收集所有已处理的Window表达式(用于去重)
+            _processed_windows: set[int] = set()
+
+            for select_expr in parsed_sql.expressions:
+                # 跳过 SELECT *
+                if isinstance(select_expr, exp.Star):
+                    continue
 
-            # 提取别名和原始表达式
-            if isinstance(select_expr, exp.Alias):
-                alias_name = select_expr.alias
-                original_expr = select_expr.this
-            else:
-                alias_name = None
-                original_expr = select_expr
+                # 提取别名和原始表达式
+                if isinstance(select_expr, exp.Alias):
+                    alias_name = select_expr.alias
+                    original_expr = select_expr.this
+                else:
+                    alias_name = None
+                    original_expr = select_expr
 
-            if not isinstance(original_expr, exp.Window):
-                continue
+                if not isinstance(original_expr, exp.Window):
+                    continue
 
-            # 确定列名
-            col_name = alias_name or f"_window_{len([c for c in df.columns if c.startswith('_window_')])}"
-
-            # 计算窗口函数
-            result = self._compute_window_function(original_expr, df, select_alias_map)
-            df[col_name] = result
-            _processed_windows.add(id(original_expr))
-
-        # [FIX R10-B1] 处理嵌套在标量函数中的窗口函数(如 ROUND(RANK() OVER(...), 2))
-        # SQLGlot 的 find_all 可以递归发现所有 Window 节点(包括嵌套的)
-        all_windows = list(parsed_sql.find_all(exp.Window))
-        _window_counter = len([c for c in df.columns if c.startswith("_window_")])
-        for w in all_windows:
-            if id(w) in _processed_windows:
-                continue  # 已在顶层处理过
-            _processed_windows.add(id(w))
-
-            # 为嵌套窗口生成自动别名(基于表达式文本hash确保稳定)
-            gen_col = f"_window_nested{_window_counter}"
-            _window_counter += 1
-            try:
-                result = self._compute_window_function(w, df, select_alias_map)
-                df[gen_col] = result
-                # 将此窗口节点与生成列名的映射存到实例上,供 _expr_to_series 查找
-                if not hasattr(self, "_nested_window_columns"):
-                    self._nested_window_columns = {}
-                self._nested_window_columns[id(w)] = gen_col
-            except Exception as e:
-                logger.warning(f"嵌套窗口函数计算失败: {e}, 跳过")
+                # 确定列名
+                col_name = alias_name or f"_window_{len([c for c in df.columns if c.startswith('_window_')])}"
+
+                # 计算窗口函数
+                result = self._compute_window_function(original_expr, df, select_alias_map)
+                df[col_name] = result
+                self._discard_window_layouts(col_name)
+                _processed_windows.add(id(original_expr))
+
+            # [FIX R10-B1] 处理嵌套在标量函数中的窗口函数(如 ROUND(RANK() OVER(...), 2))
+            # SQLGlot 的 find_all 可以递归发现所有 Window 节点(包括嵌套的)
+            all_windows = list(parsed_sql.find_all(exp.Window))
+            _window_counter = len([c for c in df.columns if c.startswith("_window_")])
+            for w in all_windows:
+                if id(w) in _processed_windows:
+                    continue  # 已在顶层处理过
+                _processed_windows.add(id(w))
+
+                # 为嵌套窗口生成自动别名(基于表达式文本hash确保稳定)
+                gen_col = f"_window_nested{_window_counter}"
+                _window_counter += 1
+                try:
+                    result = self._compute_window_function(w, df, select_alias_map)
+                    df[gen_col] = result
+                    # 将此窗口节点与生成列名的映射存到实例上,供 _expr_to_series 查找
+                    if not hasattr(self, "_nested_window_columns"):
+                        self._nested_window_columns = {}
+                    self._nested_window_columns[id(w)] = gen_col
+                except Exception as e:
+                    logger.warning(f"嵌套窗口函数计算失败: {e}, 跳过")
+        finally:
+            layouts, self._window_layouts = self._window_layouts, previous_layouts
 
         # 按第一个窗口函数的ORDER BY排序输出（无外部ORDER BY时的自然顺序）
         for select_expr in parsed_sql.expressions:
@@ -2615,11 +4074,19 @@ class AdvancedSQLQueryEngine:
                     for oc in sort_cols:
                         if oc in df.columns and df[oc].dtype == object:
                             df[oc] = pd.to_numeric(df[oc], errors="coerce")
-                    # 窗口函数输出排序
-                    df = df.sort_values(sort_cols, ascending=sort_asc, kind="mergesort")
+                    # 窗口函数输出排序: 无 PARTITION BY 时直接复用该窗口的排序布局
+                    layout = layouts.get(((), tuple(sort_cols), tuple(sort_asc)))
+                    if layout is not None and len(layout["perm"]) == len(df):
+                        df = df.iloc[layout["perm"]]
+                    else:
+                        df = df.sort_values(sort_cols, ascending=sort_asc, kind="mergesort")
                 break  # 只按第一个窗口函数排序
         return df
 
+    def _discard_window_layouts(self, col_name: str) -> None:
+        """窗口结果写入列 col_name 后, 丢弃以该列分区/排序的共用排序布局"""
+        self._window_layouts = {key: layout for key, layout in self._window_layouts.items() if col_name not in key[0] + key[1]}
+
     def _compute_window_function(
         self,
         window_expr: exp.Window,
@@ -2641,7 +4108,7 @@ class AdvancedSQLQueryEngine:
             window_expr.set("this", actual_func)
 
         # 支持的窗口函数类型
-        _window_agg_funcs = {"Avg", "Sum", "Count", "Min", "Max"}
+        _window_agg_funcs = {"Avg", "Sum", "Count", "Min", "Max"} | self._WINDOW_STD_FUNCS
         supported_funcs = {
             "RowNumber",
             "Rank",
@@ -2708,59 +4175,34 @@ class AdvancedSQLQueryEngine:
 
         # [FIX] 确保排序列为数值类型，避免 object 列混合 int/str 导致 sort_values 崩溃
         # 场景: 部分列INSERT产生空字符串值，查询管道将列转为object dtype
-        if order_cols:
+        object_order_cols = [oc for oc in order_cols if df[oc].dtype == object]
+        if object_order_cols:
             df = df.copy()
-            for oc in order_cols:
-                if oc in df.columns and df[oc].dtype == object:
-                    df[oc] = pd.to_numeric(df[oc], errors="coerce")
+            for oc in object_order_cols:
+                df[oc] = pd.to_numeric(df[oc], errors="coerce")
+
+        # 同一 (PARTITION BY, ORDER BY) 的窗口函数共用一次排序与分区编码, 各函数都在排序后的顺序上整列求值
+        layout = self._shared_window_layout(df, partition_cols, order_cols, ascending)
+
+        # 聚合与取值函数按 ROWS/RANGE 框架求值(排名类函数不受框架影响)
+        if func_type in self._WINDOW_FRAME_FUNCS:
+            return self._compute_window_frame(func_type, window_expr, df, layout, order_cols, ascending, select_alias_map or {})
 
         # 窗口函数分发表
         _window_dispatch = {
             "RowNumber": self._compute_row_number,
             "Rank": self._compute_rank,
             "DenseRank": self._compute_dense_rank,
+            "PercentRank": self._compute_percent_rank,
+            "CumeDist": self._compute_cume_dist,
             "Lag": self._compute_lag,
             "Lead": self._compute_lead,
-            "FirstValue": self._compute_first_value,
-            "LastValue": self._compute_last_value,
-            "NthValue": self._compute_nth_value,
             "Ntile": self._compute_ntile,
-            "PercentRank": self._compute_percent_rank,
-            "CumeDist": self._compute_cume_dist,
         }
-        handler = _window_dispatch.get(func_type)
-        if handler:
-            if func_type in (
-                "Lag",
-                "Lead",
-                "FirstValue",
-                "LastValue",
-                "NthValue",
-                "Ntile",
-            ):
-                return handler(
-                    window_expr,
-                    df,
-                    partition_cols,
-                    order_cols,
-                    ascending,
-                    select_alias_map or {},
-                )
-            return handler(df, partition_cols, order_cols, ascending)
-
-        # 窗口聚合函数: AVG/SUM/COUNT/MIN/MAX OVER (...)
-        if func_type in _window_agg_funcs:
-            return self._compute_window_aggregate(
-                func_type,
-                df,
-                partition_cols,
-                order_cols,
-                ascending,
-                window_expr,
-                select_alias_map or {},
-            )
-
-        raise ValueError(f"不支持的窗口函数: {func_type}")
+        handler = _window_dispatch[func_type]
+        if func_type in ("Lag", "Lead", "Ntile"):
+            return handler(window_expr, df, layout, select_alias_map or {})
+        return handler(df, layout)
 
     def _resolve_window_column(self, col_name: str, df_columns: list, select_alias_map: dict[str, str]) -> str:
         """解析窗口函数中的列名(支持聚合表达式->别名映射)"""
@@ -2788,523 +4230,198 @@ class AdvancedSQLQueryEngine:
 
         return col_name  # 未找到映射,返回原名
 
-    def _compute_count_window(self, window_expr: exp.Window, df: pd.DataFrame, partition_cols: list) -> pd.Series:
-        """COUNT() OVER(): 返回每个分区的总行数
-
-        支持:
-        - COUNT(*) OVER (PARTITION BY col): 计算分区内的所有行数
-        - COUNT(col) OVER (PARTITION BY col): 计算分区内col不为NULL的行数
-        """
-        # 解析COUNT函数的参数
-        count_func = window_expr.this
-        count_all = False
-        count_col = None
-        is_distinct = False
-
-        # 检查是否为COUNT(*)
-        if isinstance(count_func.this, exp.Star):
-            count_all = True
-        # 检查是否为DISTINCT
-        elif isinstance(count_func.this, exp.Distinct):
-            is_distinct = True
-            count_col = self._extract_agg_column(count_func.this.expressions[0], "COUNT(DISTINCT)")
-        else:
-            # COUNT(col)
-            count_col = self._extract_agg_column(count_func.this, "COUNT")
-
-        # 验证列存在
-        if count_col and count_col not in df.columns:
-            suggestion = self._suggest_column_name(count_col, list(df.columns))
-            raise ValueError(f"COUNT() 窗口函数中列 '{count_col}' 不存在.可用列: {list(df.columns)}.{suggestion}")
-
-        def compute_count_in_group(group):
-            """在分组内计算COUNT"""
-            if count_all:
-                # COUNT(*): 计算所有行
-                return pd.Series([len(group)] * len(group), index=group.index)
-            elif is_distinct:
-                # COUNT(DISTINCT col): 计算不同值的数量
-                unique_count = group[count_col].nunique()
-                return pd.Series([unique_count] * len(group), index=group.index)
-            else:
-                # COUNT(col): 计算非NULL值的数量
-                non_null_count = group[count_col].count()
-                return pd.Series([non_null_count] * len(group), index=group.index)
-
+    # 按 ROWS/RANGE 框架求值的窗口函数; 标准差/方差类(有 ORDER BY 时总按框架累计)
+    _WINDOW_STD_FUNCS = frozenset({"Stddev", "StddevSamp", "StddevPop", "Variance", "VariancePop"})
+    _WINDOW_FRAME_FUNCS = frozenset({"Avg", "Sum", "Count", "Min", "Max", "FirstValue", "LastValue", "NthValue"}) | _WINDOW_STD_FUNCS
+
+    def _window_aggregate_column(self, inner: exp.Expression, df: pd.DataFrame, select_alias_map: dict | None) -> str:
+        """窗口聚合函数参数对应的 DataFrame 列名(处理 JOIN 列映射与 GROUP BY 后的聚合别名)"""
+        col_name = inner.name if hasattr(inner, "name") else str(inner)
+        # JOIN列映射
+        if hasattr(self, "_join_column_mapping") and col_name not in df.columns:
+            for _, col_map in self._join_column_mapping.items():
+                if col_name in col_map and col_map[col_name] in df.columns:
+                    col_name = col_map[col_name]
+                    break
+        # [FIX R15-B1] 裸列名找不到时，尝试匹配 "table.col" 格式（与 resolve_col_name 保持一致）
+        if col_name not in df.columns:
+            for fc in df.columns:
+                if fc.endswith(f".{col_name}") or fc.endswith(f"_{col_name}"):
+                    col_name = fc
+                    break
+        # [FIX R15-B1c] GROUP BY 后原始列不存在，通过 select_alias_map 反向查找
+        # 场景: AVG(s.Quantity) OVER (...) 在 GROUP BY 后执行，s.Quantity 已被聚合为 TotalSold
+        if col_name not in df.columns and select_alias_map:
+            expr_str = str(inner).upper()
+            for orig_expr, alias in select_alias_map.items():
+                ou = orig_expr.upper()
+                # 精确匹配
+                if ou == expr_str and alias in df.columns:
+                    col_name = alias
+                    break
+                # 从聚合函数表达式中提取内部列名进行匹配
+                # 例如 orig_expr='SUM(s.Quantity)', expr_str='S.QUANTITY'
+                # re already imported at top level as _re
+
+                agg_match = re.match(r"(AVG|SUM|COUNT|MAX|MIN)\s*\(\s*(.+?)\s*\)$", ou)
+                if agg_match:
+                    agg_inner = agg_match.group(2).strip()
+                    if agg_inner == expr_str or agg_inner.endswith(expr_str) or expr_str.endswith(agg_inner):
+                        if alias in df.columns:
+                            col_name = alias
+                            break
+        return col_name
+
+    def _shared_window_layout(self, df: pd.DataFrame, partition_cols: list, order_cols: list, ascending: list) -> dict:
+        """窗口排序布局: _apply_window_functions 调用期间同一 (PARTITION BY, ORDER BY) 的窗口函数共用一份, 其他调用方单独计算"""
+        layouts = getattr(self, "_window_layouts", None)
+        if layouts is None:
+            return self._window_layout(df, partition_cols, order_cols, ascending)
+        key = (tuple(partition_cols), tuple(order_cols), tuple(ascending))
+        layout = layouts.get(key)
+        if layout is None or len(layout["perm"]) != len(df):
+            layout = layouts[key] = self._window_layout(df, partition_cols, order_cols, ascending)
+        return layout
+
+    def _window_layout(self, df: pd.DataFrame, partition_cols: list, order_cols: list, ascending: list) -> dict:
+        """窗口排序布局: 按 (分区, 排序键) 稳定排序一次, 返回排序后顺序的行位置 perm、分区号、各行所在分区的 [起, 止) 位置与排序键
+
+        NULL 排在最后(与 sort_values 默认一致); 排序键相同的行保持原顺序. 并列段与逆排列在首次用到时补充.
+        """
+        keys = []
+        for col, asc in zip(order_cols, ascending):
+            key = _sort_key_array(df[col], asc, nulls_first=False)
+            if key is None:
+                key = df[col].rank(method="dense", ascending=asc, na_option="bottom").to_numpy(dtype=np.float64)
+            keys.append(key)
         if partition_cols:
-            grouped = df.groupby(partition_cols, sort=False, dropna=False, observed=False)
-            result = grouped.apply(compute_count_in_group, include_groups=False)
-            if isinstance(result.index, pd.MultiIndex):
-                result = result.droplevel(result.index.names[:-1])
+            codes = df.groupby(partition_cols, sort=False, dropna=False, observed=True).ngroup().to_numpy()
         else:
-            # 无PARTITION BY: 全表作为一个分区
-            result = compute_count_in_group(df)
-
-        return result.astype("Int64")
+            codes = np.zeros(len(df), dtype=np.int64)
+        perm = np.lexsort([*reversed(keys), codes])
+        codes = codes[perm]
+        bounds = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1], True])
+        sizes = np.diff(bounds)
+        return {
+            "perm": perm,
+            "codes": codes,
+            "keys": [key[perm] for key in keys],
+            "part_start": np.repeat(bounds[:-1], sizes),
+            "part_end": np.repeat(bounds[1:], sizes),
+        }
 
-    def _compute_row_number(self, df: pd.DataFrame, partition_cols: list, order_cols: list, ascending: list) -> pd.Series:
-        """ROW_NUMBER: 分区内从1开始的连续编号"""
-        if not partition_cols and not order_cols:
-            return pd.Series(range(1, len(df) + 1), index=df.index, dtype=int)
+    @staticmethod
+    def _window_peers(layout: dict) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """各行所在并列段(分区内排序键全部相同的连续行)的 [起, 止) 位置与全局并列段序号(从 1 起)"""
+        if "peer_start" not in layout:
+            codes = layout["codes"]
+            new_peer = np.r_[True, codes[1:] != codes[:-1]]
+            for key in layout["keys"]:
+                new_peer[1:] |= key[1:] != key[:-1]
+            peer_starts = np.flatnonzero(new_peer)
+            sizes = np.diff(np.r_[peer_starts, len(codes)])
+            layout["peer_start"] = np.repeat(peer_starts, sizes)
+            layout["peer_end"] = np.repeat(np.r_[peer_starts[1:], len(codes)], sizes)
+            layout["peer_index"] = np.cumsum(new_peer)
+        return layout["peer_start"], layout["peer_end"], layout["peer_index"]
 
-        # 排序后用 cumcount 计算行号，避免 groupby.apply 的 pandas 版本兼容问题
-        if order_cols:
-            sorted_df = df.sort_values(order_cols, ascending=ascending)
-        else:
-            sorted_df = df
+    @staticmethod
+    def _window_unsort(ordered, layout: dict, index: pd.Index) -> pd.Series:
+        """按排序后顺序算出的结果还原为原行顺序"""
+        if "inverse" not in layout:
+            perm = layout["perm"]
+            layout["inverse"] = np.empty_like(perm)
+            layout["inverse"][perm] = np.arange(len(perm))
+        ordered = ordered if isinstance(ordered, pd.Series) else pd.Series(ordered)
+        return ordered.take(layout["inverse"]).set_axis(index)
 
-        if partition_cols:
-            result = sorted_df.groupby(partition_cols, sort=False, dropna=False, observed=False).cumcount() + 1
-        else:
-            result = pd.Series(range(1, len(sorted_df) + 1), index=sorted_df.index, dtype=int)
+    @staticmethod
+    def _window_take(df: pd.DataFrame, col_name: str, layout: dict, positions: np.ndarray, valid: np.ndarray, default=None) -> pd.Series:
+        """按排序后的位置取列值(排序后顺序), valid 为 False 的行取 default"""
+        picked = df[col_name].iloc[layout["perm"][np.where(valid, positions, 0)]].reset_index(drop=True)
+        return picked if valid.all() else picked.where(valid, default)
 
-        return result.reindex(df.index).astype("Int64")
+    def _compute_row_number(self, df: pd.DataFrame, layout: dict) -> pd.Series:
+        """ROW_NUMBER: 分区内从1开始的连续编号; 排序键相同的行按原顺序编号"""
+        rows = np.arange(len(layout["perm"]))
+        return self._window_unsort(rows - layout["part_start"] + 1, layout, df.index).astype("Int64")
 
-    def _compute_rank(self, df: pd.DataFrame, partition_cols: list, order_cols: list, ascending: list) -> pd.Series:
+    def _compute_rank(self, df: pd.DataFrame, layout: dict) -> pd.Series:
         """RANK: 相同值相同排名,下一个排名跳过(1,2,2,4)"""
-        if not order_cols:
+        if not layout["keys"]:
             raise ValueError("RANK() 窗口函数需要 ORDER BY 子句")
+        peer_start, _, _ = self._window_peers(layout)
+        return self._window_unsort(peer_start - layout["part_start"] + 1, layout, df.index).astype("Int64")
 
-        sorted_df = df.sort_values(order_cols, ascending=ascending)
-        if partition_cols:
-            result = sorted_df.groupby(partition_cols, sort=False, dropna=False, observed=False)[order_cols[0]].rank(method="min", ascending=ascending[0])
-        else:
-            result = sorted_df[order_cols[0]].rank(method="min", ascending=ascending[0])
-        return result.reindex(df.index).astype("Int64")
-
-    def _compute_dense_rank(self, df: pd.DataFrame, partition_cols: list, order_cols: list, ascending: list) -> pd.Series:
+    def _compute_dense_rank(self, df: pd.DataFrame, layout: dict) -> pd.Series:
         """DENSE_RANK: 相同值相同排名,下一个排名不跳过(1,2,2,3)"""
-        if not order_cols:
+        if not layout["keys"]:
             raise ValueError("DENSE_RANK() 窗口函数需要 ORDER BY 子句")
+        _, _, peer_index = self._window_peers(layout)
+        return self._window_unsort(peer_index - peer_index[layout["part_start"]] + 1, layout, df.index).astype("Int64")
 
-        sorted_df = df.sort_values(order_cols, ascending=ascending)
-        if partition_cols:
-            result = sorted_df.groupby(partition_cols, sort=False, observed=False)[order_cols[0]].rank(method="dense", ascending=ascending[0])
-        else:
-            result = sorted_df[order_cols[0]].rank(method="dense", ascending=ascending[0])
-        return result.reindex(df.index).astype("Int64")
-
-    def _compute_percent_rank(self, df: pd.DataFrame, partition_cols: list, order_cols: list, ascending: list) -> pd.Series:
-        """PERCENT_RANK: 百分比排名 (rank-1)/(n-1), 结果在0~1之间"""
-        if not order_cols:
-            raise ValueError("PERCENT_RANK() 窗口函数需要 ORDER BY 子句")
-
-        sorted_df = df.sort_values(order_cols, ascending=ascending) if order_cols else df
-        if partition_cols:
-            rank = sorted_df.groupby(partition_cols, sort=False, observed=False)[order_cols[0]].rank(method="min", ascending=ascending[0])
-            counts = sorted_df.groupby(partition_cols, sort=False, observed=False)[order_cols[0]].transform("count")
-            result = (rank - 1) / (counts - 1)
-            result = result.reindex(df.index).fillna(0.0)
-        else:
-            rank = sorted_df[order_cols[0]].rank(method="min", ascending=ascending[0])
-            n = len(sorted_df)
-            result = (rank - 1) / (n - 1) if n > 1 else pd.Series(0.0, index=sorted_df.index)
-            result = result.reindex(df.index)
-        return result
-
-    def _compute_cume_dist(self, df: pd.DataFrame, partition_cols: list, order_cols: list, ascending: list) -> pd.Series:
-        """CUME_DIST: 累积分布, 值<=当前值的行数/总行数"""
-        if not order_cols:
-            raise ValueError("CUME_DIST() 窗口函数需要 ORDER BY 子句")
-
-        sorted_df = df.sort_values(order_cols, ascending=ascending) if order_cols else df
-        if partition_cols:
-            rank = sorted_df.groupby(partition_cols, sort=False, observed=False)[order_cols[0]].rank(method="max", ascending=ascending[0])
-            counts = sorted_df.groupby(partition_cols, sort=False, observed=False)[order_cols[0]].transform("count")
-            result = rank / counts
-            result = result.reindex(df.index)
-        else:
-            rank = sorted_df[order_cols[0]].rank(method="max", ascending=ascending[0])
-            n = len(sorted_df)
-            result = (rank / n).reindex(df.index)
-        return result
-
-    def _compute_window_aggregate(
-        self,
-        func_type: str,
-        df: pd.DataFrame,
-        partition_cols: list,
-        order_cols: list,
-        ascending: list,
-        window_expr,
-        select_alias_map: dict = None,
-    ) -> pd.Series:
-        """窗口聚合函数: AVG/SUM/COUNT/MIN/MAX OVER (...)
-
-        无ORDER BY时计算整个分区的聚合值;
-        有ORDER BY时计算累计聚合值(running aggregate)。
-        """
-        func = window_expr.this
-        # 提取列名
-        inner = func.this
-        if isinstance(inner, exp.Star):
-            # COUNT(*) OVER (...)
-            col_name = None
-        else:
-            col_name = inner.name if hasattr(inner, "name") else str(inner)
-            # JOIN列映射
-            if hasattr(self, "_join_column_mapping") and col_name not in df.columns:
-                for _, col_map in self._join_column_mapping.items():
-                    if col_name in col_map and col_map[col_name] in df.columns:
-                        col_name = col_map[col_name]
-                        break
-            # [FIX R15-B1] 裸列名找不到时，尝试匹配 "table.col" 格式（与 resolve_col_name 保持一致）
-            if col_name not in df.columns:
-                for fc in df.columns:
-                    if fc.endswith(f".{col_name}") or fc.endswith(f"_{col_name}"):
-                        col_name = fc
-                        break
-            # [FIX R15-B1c] GROUP BY 后原始列不存在，通过 select_alias_map 反向查找
-            # 场景: AVG(s.Quantity) OVER (...) 在 GROUP BY 后执行，s.Quantity 已被聚合为 TotalSold
-            if col_name not in df.columns and select_alias_map:
-                expr_str = str(inner).upper()
-                for orig_expr, alias in select_alias_map.items():
-                    ou = orig_expr.upper()
-                    # 精确匹配
-                    if ou == expr_str and alias in df.columns:
-                        col_name = alias
-                        break
-                    # 从聚合函数表达式中提取内部列名进行匹配
-                    # 例如 orig_expr='SUM(s.Quantity)', expr_str='S.QUANTITY'
-                    # re already imported at top level as _re
-
-                    agg_match = re.match(r"(AVG|SUM|COUNT|MAX|MIN)\s*\(\s*(.+?)\s*\)$", ou)
-                    if agg_match:
-                        agg_inner = agg_match.group(2).strip()
-                        if agg_inner == expr_str or agg_inner.endswith(expr_str) or expr_str.endswith(agg_inner):
-                            if alias in df.columns:
-                                col_name = alias
-                                break
-
-        numeric_col = col_name and col_name in df.columns
-        if numeric_col and func_type != "Count":
-            series = pd.to_numeric(df[col_name], errors="coerce")
-        elif col_name is None:
-            # COUNT(*)
-            series = pd.Series(1, index=df.index)
-        else:
-            series = df[col_name]
-
-        if partition_cols:
-            grouped = series.groupby([df[c] for c in partition_cols], sort=False, observed=False)
-        else:
-            grouped = None
-
-        # 有ORDER BY → 累计聚合; 无ORDER BY → 分区整体聚合
-        if order_cols:
-            sorted_df = df.sort_values(order_cols, ascending=ascending)
-            if partition_cols:
-                sorted_group = series.reindex(sorted_df.index).groupby([df[c].reindex(sorted_df.index) for c in partition_cols], sort=False, observed=False)
-            else:
-                sorted_group = None
-
-            if func_type == "Sum":
-                result = sorted_group.cumsum() if sorted_group else series.reindex(sorted_df.index).cumsum()
-            elif func_type == "Count":
-                result = sorted_group.cumcount() + 1 if sorted_group else pd.Series(range(1, len(df) + 1), index=sorted_df.index)
-            elif func_type == "Min":
-                result = sorted_group.cummin() if sorted_group else series.reindex(sorted_df.index).cummin()
-            elif func_type == "Max":
-                result = sorted_group.cummax() if sorted_group else series.reindex(sorted_df.index).cummax()
-            elif func_type == "Avg":
-                if sorted_group:
-                    cumsum = sorted_group.cumsum()
-                    cumcount = sorted_group.cumcount() + 1
-                    result = cumsum / cumcount
-                else:
-                    s = series.reindex(sorted_df.index)
-                    result = s.cumsum() / pd.Series(range(1, len(s) + 1), index=s.index)
-            elif func_type in ("Stddev", "Std", "Variance", "Var"):
-                # 累计标准差/方差:计算整个分区的std/var并填充到每行
-                # 注意:这是简化的实现,不是数学上严格的累计std/var
-                if sorted_group:
-                    result = sorted_group.transform("std" if "Std" in func_type else "var").reindex(df.index)
-                else:
-                    result = series.agg("std" if "Std" in func_type else "var")
-                    result = pd.Series([result] * len(df), index=df.index)
-            else:
-                raise ValueError(f"不支持的窗口聚合函数: {func_type}")
-            result = result.reindex(df.index)
-        else:
-            # 无ORDER BY: 分区整体聚合
-            agg_map = {
-                "Avg": "mean",
-                "Sum": "sum",
-                "Count": "count",
-                "Min": "min",
-                "Max": "max",
-                "Stddev": "std",
-                "Std": "std",
-                "Variance": "var",
-                "Var": "var",
-            }
-            agg_func = agg_map[func_type]
-            if grouped is not None:
-                result = grouped.transform(agg_func)
-            else:
-                val = series.agg(agg_func)
-                result = pd.Series(val, index=df.index)
-
-        return result
-
-    def _compute_percent_rank(self, df: pd.DataFrame, partition_cols: list, order_cols: list, ascending: list) -> pd.Series:
-        """PERCENT_RANK: 返回行的相对排名百分比
-
-        公式: (rank - 1) / (total_rows - 1)
-        - 第一行: percent_rank = 0
-        - 最后一行: percent_rank = 1
-        - 只有一行: percent_rank = 0
-        """
-        if not order_cols:
+    def _compute_percent_rank(self, df: pd.DataFrame, layout: dict) -> pd.Series:
+        """PERCENT_RANK: 百分比排名 (rank-1)/(n-1), 结果在0~1之间; 分区只有一行时为 0"""
+        if not layout["keys"]:
             raise ValueError("PERCENT_RANK() 窗口函数需要 ORDER BY 子句")
-
-        if partition_cols:
-            grouped = df.groupby(partition_cols, sort=False, observed=False)
-        else:
-            grouped = None
-
-        def assign_percent_rank(group):
-            """为分组内的行计算百分比排名"""
-            sorted_group = group.sort_values(order_cols, ascending=ascending)
-            group_size = len(sorted_group)
-
-            if group_size == 1:
-                # 只有一行时，percent_rank = 0
-                return pd.Series([0.0], index=group.index)
-
-            # 使用RANK方法计算排名（相同值相同排名，下一个排名跳过）
-            rank_series = sorted_group[order_cols[0]].rank(method="first", ascending=ascending[0])
-            # 计算百分比排名: (rank - 1) / (n - 1)
-            percent_rank = (rank_series - 1) / (group_size - 1)
-
-            return percent_rank.reindex(group.index)
-
-        if grouped is not None:
-            result = grouped.apply(assign_percent_rank, include_groups=False)
-            if isinstance(result.index, pd.MultiIndex):
-                result = result.droplevel(result.index.names[:-1])
-        else:
-            result = assign_percent_rank(df)
-
-        return result
-
-    def _compute_cume_dist(self, df: pd.DataFrame, partition_cols: list, order_cols: list, ascending: list) -> pd.Series:
-        """CUME_DIST: 返回累积分布值
-
-        公式: number_of_rows_with_value <= current_value / total_rows
-        - 返回值范围: (0, 1]
-        - 第一行: cume_dist = 1 / n (最小值)
-        - 最后一行: cume_dist = 1 (最大值)
-        """
-        if not order_cols:
+        peer_start, _, _ = self._window_peers(layout)
+        part_start = layout["part_start"]
+        sizes = layout["part_end"] - part_start
+        result = (peer_start - part_start) / np.maximum(sizes - 1, 1)
+        return self._window_unsort(result, layout, df.index)
+
+    def _compute_cume_dist(self, df: pd.DataFrame, layout: dict) -> pd.Series:
+        """CUME_DIST: 累积分布, 排在当前行之前或与其并列的行数/分区行数"""
+        if not layout["keys"]:
             raise ValueError("CUME_DIST() 窗口函数需要 ORDER BY 子句")
+        _, peer_end, _ = self._window_peers(layout)
+        part_start = layout["part_start"]
+        result = (peer_end - part_start) / (layout["part_end"] - part_start)
+        return self._window_unsort(result, layout, df.index)
 
-        if partition_cols:
-            grouped = df.groupby(partition_cols, sort=False, observed=False)
-        else:
-            grouped = None
-
-        def assign_cume_dist(group):
-            """为分组内的行计算累积分布"""
-            sorted_group = group.sort_values(order_cols, ascending=ascending)
-            group_size = len(sorted_group)
-
-            # 计算累积分布: 对于每一行，计算小于等于当前值的行数 / 总行数
-            cume_dist = sorted_group[order_cols[0]].rank(method="max", ascending=ascending[0]) / group_size
-
-            return cume_dist.reindex(group.index)
-
-        if grouped is not None:
-            result = grouped.apply(assign_cume_dist, include_groups=False)
-            if isinstance(result.index, pd.MultiIndex):
-                result = result.droplevel(result.index.names[:-1])
-        else:
-            result = assign_cume_dist(df)
-
-        return result
-
-    def _compute_ntile(
-        self,
-        window_expr: exp.Window,
-        df: pd.DataFrame,
-        partition_cols: list,
-        order_cols: list,
-        ascending: list,
-        select_alias_map: dict,
-    ) -> pd.Series:
-        """NTILE: 将分组内的行均匀分为N个桶（桶号从1到N）"""
-        if not order_cols:
-            raise ValueError("NTILE() 窗口函数需要 ORDER BY 子句")
-
-        # 解析桶数参数
-        ntile_func = window_expr.this
-        bucket_count = 1
-        # NTILE的参数直接存储在ntile_func.this中（是一个Literal）
-        if hasattr(ntile_func, "this") and isinstance(ntile_func.this, exp.Literal):
-            bucket_count = int(ntile_func.this.this)
-        elif hasattr(ntile_func, "this"):
-            # 尝试从表达式解析整数
-            try:
-                bucket_count = int(str(ntile_func.this).strip())
-            except (ValueError, TypeError):
-                bucket_count = 1
-
-        # 验证桶数
-        if bucket_count < 1:
-            raise ValueError("NTILE() 的桶数参数必须大于等于 1")
-
-        # 分组计算NTILE
-        if partition_cols:
-            grouped = df.groupby(partition_cols, sort=False, observed=False)
-        else:
-            grouped = None
-
-        def assign_ntile_buckets(group):
-            """为分组内的行分配桶号
-
-            NTILE算法：将行均匀分配到N个桶中
-            - 每个桶分配尽可能相等的行数
-            - 行数多的桶在前面（按排序顺序）
-            - 例如：8行分成3个桶 → 桶大小为3,3,2
-            """
-            sorted_group = group.sort_values(order_cols, ascending=ascending)
-            group_size = len(sorted_group)
-
-            # 计算每个桶的行数
-            base_size = group_size // bucket_count  # 每个桶的基础行数
-            remainder = group_size % bucket_count  # 余数：前remainder个桶多一行
-
-            # 创建桶号数组
-            bucket_numbers = []
-            current_bucket = 1
-            rows_in_current_bucket = base_size + (1 if current_bucket <= remainder else 0)
-
-            for _ in range(group_size):
-                bucket_numbers.append(current_bucket)
-                rows_in_current_bucket -= 1
-                if rows_in_current_bucket == 0 and current_bucket < bucket_count:
-                    current_bucket += 1
-                    rows_in_current_bucket = base_size + (1 if current_bucket <= remainder else 0)
-
-            return pd.Series(bucket_numbers, index=sorted_group.index).reindex(group.index)
-
-        if grouped is not None:
-            result = grouped.apply(assign_ntile_buckets, include_groups=False)
-            if isinstance(result.index, pd.MultiIndex):
-                result = result.droplevel(result.index.names[:-1])
-        else:
-            result = assign_ntile_buckets(df)
-
-        return result
-
-    def _compute_lag(
-        self,
-        window_expr: exp.Window,
-        df: pd.DataFrame,
-        partition_cols: list,
-        order_cols: list,
-        ascending: list,
-        select_alias_map: dict,
-    ) -> pd.Series:
-        """LAG: 获取分区内当前行之前第N行的值"""
-        if not order_cols:
-            raise ValueError("LAG() 窗口函数需要 ORDER BY 子句")
-
-        # 解析目标列和偏移量
-        lag_func = window_expr.this
-        target_col_expr = lag_func.this
-        target_col = target_col_expr.name if hasattr(target_col_expr, "name") else str(target_col_expr)
-
-        # [FIX R15-B3] 处理内层聚合表达式: LAG(MAX(Price)) 等
-        # 当内层是聚合函数(Max/Min/Sum/Avg/Count)时，target_col可能为空
-        # 需要通过select_alias_map反向查找对应的别名列
-        if not target_col or target_col not in df.columns:
-            expr_str = str(target_col_expr).strip()
-            if expr_str in (select_alias_map or {}):
-                alias_name = select_alias_map[expr_str]
-                if alias_name in df.columns:
-                    target_col = alias_name
-            if target_col not in df.columns:
-                agg_funcs = {"Max", "Min", "Sum", "Avg", "Count"}
-                func_type = type(lag_func.this).__name__ if hasattr(lag_func, "this") else ""
-                if func_type in agg_funcs:
-                    found = False
-                    for expr_key, alias_name in (select_alias_map or {}).items():
-                        if func_type.upper() in expr_key.upper() and alias_name in df.columns:
-                            target_col = alias_name
-                            found = True
-                            break
-                    # [FIX R15-B3b] 递归提取内层AST节点直到找到Column节点
-                    if not found:
-                        node = lag_func.this
-                        while hasattr(node, "this") and not isinstance(node, exp.Column):
-                            node = node.this
-                        if isinstance(node, exp.Column) and node.name and node.name in df.columns:
-                            target_col = node.name
-
-        # 解析偏移量参数（默认为1）
-        offset = 1
-        if hasattr(lag_func, "args") and "offset" in lag_func.args:
-            offset_arg = lag_func.args["offset"]
-            if offset_arg:
-                offset = int(offset_arg.this) if hasattr(offset_arg, "this") else 1
-
-        # 解析默认值参数（可选）
-        default_value = None
-        if hasattr(lag_func, "args") and "default" in lag_func.args:
-            default_arg = lag_func.args["default"]
-            if default_arg:
-                raw = default_arg.this if hasattr(default_arg, "this") else None
-                if raw is not None:
-                    try:
-                        default_value = float(raw) if "." in str(raw) else int(raw)
-                    except (ValueError, TypeError):
-                        default_value = raw
+    def _compute_ntile(self, window_expr: exp.Window, df: pd.DataFrame, layout: dict, select_alias_map: dict) -> pd.Series:
+        """NTILE: 将分组内的行均匀分为N个桶（桶号从1到N）
 
-        # 验证目标列存在
-        if target_col not in df.columns:
-            suggestion = self._suggest_column_name(target_col, list(df.columns))
-            raise ValueError(f"LAG() 函数中列 '{target_col}' 不存在.可用列: {list(df.columns)}.{suggestion}")
+        行数多的桶在前面, 例如 8 行分成 3 个桶 → 桶大小为 3,3,2.
+        """
+        if not layout["keys"]:
+            raise ValueError("NTILE() 窗口函数需要 ORDER BY 子句")
 
-        # 分组计算LAG
-        if partition_cols:
-            # [FIX R15-B2] 推断目标列的dtype，避免字符串列赋值到float Series报错
-            target_dtype = df[target_col].dtype if target_col in df.columns else object
-            result = pd.Series(None, index=df.index, dtype=target_dtype)
-            for _, group in df.groupby(partition_cols, sort=False, observed=False):
-                sorted_group = group.sort_values(order_cols, ascending=ascending)
-                lagged = sorted_group[target_col].shift(periods=offset)
-                if default_value is not None:
-                    lagged = lagged.fillna(default_value)
-                result.loc[group.index] = lagged.reindex(group.index).values
-        else:
-            sorted_df = df.sort_values(order_cols, ascending=ascending)
-            lagged = sorted_df[target_col].shift(periods=offset)
-            if default_value is not None:
-                lagged = lagged.fillna(default_value)
-            result = lagged.reindex(df.index)
+        # 解析桶数参数
+        ntile_func = window_expr.this
+        bucket_count = 1
+        # NTILE的参数直接存储在ntile_func.this中（是一个Literal）
+        if hasattr(ntile_func, "this") and isinstance(ntile_func.this, exp.Literal):
+            bucket_count = int(ntile_func.this.this)
+        elif hasattr(ntile_func, "this"):
+            # 尝试从表达式解析整数
+            try:
+                bucket_count = int(str(ntile_func.this).strip())
+            except (ValueError, TypeError):
+                bucket_count = 1
 
-        return result
+        # 验证桶数
+        if bucket_count < 1:
+            raise ValueError("NTILE() 的桶数参数必须大于等于 1")
 
-    def _compute_lead(
-        self,
-        window_expr: exp.Window,
-        df: pd.DataFrame,
-        partition_cols: list,
-        order_cols: list,
-        ascending: list,
-        select_alias_map: dict,
-    ) -> pd.Series:
-        """LEAD: 获取分区内当前行之后第N行的值"""
-        if not order_cols:
-            raise ValueError("LEAD() 窗口函数需要 ORDER BY 子句")
+        part_start = layout["part_start"]
+        position = np.arange(len(part_start)) - part_start
+        base_size, remainder = np.divmod(layout["part_end"] - part_start, bucket_count)
+        # 前 remainder 个桶各 base_size+1 行, 之后的桶各 base_size 行
+        large_rows = remainder * (base_size + 1)
+        buckets = np.where(
+            position < large_rows,
+            position // (base_size + 1),
+            remainder + (position - large_rows) // np.maximum(base_size, 1),
+        )
+        return self._window_unsort(buckets + 1, layout, df.index)
 
-        # 解析目标列和偏移量
-        lead_func = window_expr.this
-        target_col_expr = lead_func.this
+    def _window_shift_target(self, shift_func, df: pd.DataFrame, select_alias_map: dict) -> tuple[str, int, object]:
+        """解析 LAG/LEAD 的目标列、偏移量(默认 1)与默认值"""
+        target_col_expr = shift_func.this
         target_col = target_col_expr.name if hasattr(target_col_expr, "name") else str(target_col_expr)
 
-        # [FIX R15-B3] 处理内层聚合表达式: LEAD(MAX(Price)) 等
+        # [FIX R15-B3] 处理内层聚合表达式: LAG(MAX(Price)) 等
         # 当内层是聚合函数(Max/Min/Sum/Avg/Count)时，target_col可能为空
         # 需要通过select_alias_map反向查找对应的别名列
         if not target_col or target_col not in df.columns:
@@ -3317,7 +4434,7 @@ class AdvancedSQLQueryEngine:
             # 如果还是找不到，尝试匹配包含聚合函数名的列
             if target_col not in df.columns:
                 agg_funcs = {"Max", "Min", "Sum", "Avg", "Count"}
-                func_type = type(lead_func.this).__name__ if hasattr(lead_func, "this") else ""
+                func_type = type(shift_func.this).__name__ if hasattr(shift_func, "this") else ""
                 if func_type in agg_funcs:
                     # 查找select_alias_map中引用了此聚合的别名
                     found = False
@@ -3329,7 +4446,7 @@ class AdvancedSQLQueryEngine:
                     # [FIX R15-B3b] 如果alias_map中也没有有用的映射，
                     # 递归提取内层AST节点直到找到Column节点
                     if not found:
-                        node = lead_func.this
+                        node = shift_func.this
                         while hasattr(node, "this") and not isinstance(node, exp.Column):
                             node = node.this
                         if isinstance(node, exp.Column) and node.name and node.name in df.columns:
@@ -3337,152 +4454,215 @@ class AdvancedSQLQueryEngine:
 
         # 解析偏移量参数（默认为1）
         offset = 1
-        if hasattr(lead_func, "args") and "offset" in lead_func.args:
-            offset_arg = lead_func.args["offset"]
+        if hasattr(shift_func, "args") and "offset" in shift_func.args:
+            offset_arg = shift_func.args["offset"]
             if offset_arg:
                 offset = int(offset_arg.this) if hasattr(offset_arg, "this") else 1
 
         # 解析默认值参数（可选）
         default_value = None
-        if hasattr(lead_func, "args") and "default" in lead_func.args:
-            default_arg = lead_func.args["default"]
-            if default_arg:
-                raw = default_arg.this if hasattr(default_arg, "this") else None
-                if raw is not None:
-                    try:
-                        default_value = float(raw) if "." in str(raw) else int(raw)
-                    except (ValueError, TypeError):
-                        default_value = raw
+        if hasattr(shift_func, "args") and "default" in shift_func.args:
+            default_arg = shift_func.args["default"]
+            if isinstance(default_arg, exp.Literal):
+                default_value = self._parse_literal_value(default_arg)
+            elif isinstance(default_arg, exp.Neg) and isinstance(default_arg.this, exp.Literal) and not default_arg.this.is_string:
+                # 负数默认值: LAG(x, 1, -1)
+                default_value = -self._parse_literal_value(default_arg.this)
 
         # 验证目标列存在
         if target_col not in df.columns:
+            name = shift_func.sql_name()
             suggestion = self._suggest_column_name(target_col, list(df.columns))
-            raise ValueError(f"LEAD() 函数中列 '{target_col}' 不存在.可用列: {list(df.columns)}.{suggestion}")
-
-        # 分组计算LEAD
-        if partition_cols:
-            # [FIX R15-B2] 推断目标列的dtype，避免字符串列赋值到float Series报错
-            target_dtype = df[target_col].dtype if target_col in df.columns else object
-            result = pd.Series(None, index=df.index, dtype=target_dtype)
-            for _, group in df.groupby(partition_cols, sort=False, observed=False):
-                sorted_group = group.sort_values(order_cols, ascending=ascending)
-                led = sorted_group[target_col].shift(periods=-offset)
-                if default_value is not None:
-                    led = led.fillna(default_value)
-                result.loc[group.index] = led.reindex(group.index).values
-        else:
-            sorted_df = df.sort_values(order_cols, ascending=ascending)
-            led = sorted_df[target_col].shift(periods=-offset)
-            if default_value is not None:
-                led = led.fillna(default_value)
-            result = led.reindex(df.index)
-
-        return result
-
-    def _compute_first_value(
-        self,
-        window_expr: exp.Window,
-        df: pd.DataFrame,
-        partition_cols: list,
-        order_cols: list,
-        ascending: list,
-        select_alias_map: dict,
-    ) -> pd.Series:
-        """FIRST_VALUE: 获取分区内排序后第一行的值"""
-        if not order_cols:
-            raise ValueError("FIRST_VALUE() 窗口函数需要 ORDER BY 子句")
-
-        first_value_func = window_expr.this
-        target_col_expr = first_value_func.this
-        target_col = target_col_expr.name if hasattr(target_col_expr, "name") else str(target_col_expr)
-
-        if target_col not in df.columns:
-            suggestion = self._suggest_column_name(target_col, list(df.columns))
-            raise ValueError(f"FIRST_VALUE() 函数中列 '{target_col}' 不存在.可用列: {list(df.columns)}.{suggestion}")
-
-        result = pd.Series(None, index=df.index, dtype=df[target_col].dtype)
-        if partition_cols:
-            for _, group in df.groupby(partition_cols, sort=False, observed=False):
-                sorted_group = group.sort_values(order_cols, ascending=ascending)
-                first_val = sorted_group[target_col].iloc[0] if len(sorted_group) > 0 else None
-                result.loc[group.index] = first_val
-        else:
-            sorted_df = df.sort_values(order_cols, ascending=ascending)
-            first_val = sorted_df[target_col].iloc[0] if len(sorted_df) > 0 else None
-            result[:] = first_val
-
-        return result
-
-    def _compute_last_value(
-        self,
-        window_expr: exp.Window,
-        df: pd.DataFrame,
-        partition_cols: list,
-        order_cols: list,
-        ascending: list,
-        select_alias_map: dict,
-    ) -> pd.Series:
-        """LAST_VALUE: 获取分区内排序后最后一行的值"""
-        if not order_cols:
-            raise ValueError("LAST_VALUE() 窗口函数需要 ORDER BY 子句")
-
-        last_value_func = window_expr.this
-        target_col_expr = last_value_func.this
-        target_col = target_col_expr.name if hasattr(target_col_expr, "name") else str(target_col_expr)
-
-        if target_col not in df.columns:
-            suggestion = self._suggest_column_name(target_col, list(df.columns))
-            raise ValueError(f"LAST_VALUE() 函数中列 '{target_col}' 不存在.可用列: {list(df.columns)}.{suggestion}")
-
-        result = pd.Series(None, index=df.index, dtype=df[target_col].dtype)
-        if partition_cols:
-            for _, group in df.groupby(partition_cols, sort=False, observed=False):
-                sorted_group = group.sort_values(order_cols, ascending=ascending)
-                last_val = sorted_group[target_col].iloc[-1] if len(sorted_group) > 0 else None
-                result.loc[group.index] = last_val
-        else:
-            sorted_df = df.sort_values(order_cols, ascending=ascending)
-            last_val = sorted_df[target_col].iloc[-1] if len(sorted_df) > 0 else None
-            result[:] = last_val
+            raise ValueError(f"{name}() 函数中列 '{target_col}' 不存在.可用列: {list(df.columns)}.{suggestion}")
+        return target_col, offset, default_value
 
-        return result
+    def _compute_lag(self, window_expr: exp.Window, df: pd.DataFrame, layout: dict, select_alias_map: dict) -> pd.Series:
+        """LAG: 获取分区内当前行之前第N行的值, 超出分区时取默认值"""
+        if not layout["keys"]:
+            raise ValueError("LAG() 窗口函数需要 ORDER BY 子句")
+        target_col, offset, default_value = self._window_shift_target(window_expr.this, df, select_alias_map)
+        positions = np.arange(len(layout["perm"])) - offset
+        valid = (positions >= layout["part_start"]) & (positions < layout["part_end"])
+        return self._window_unsort(self._window_take(df, target_col, layout, positions, valid, default_value), layout, df.index)
+
+    def _compute_lead(self, window_expr: exp.Window, df: pd.DataFrame, layout: dict, select_alias_map: dict) -> pd.Series:
+        """LEAD: 获取分区内当前行之后第N行的值, 超出分区时取默认值"""
+        if not layout["keys"]:
+            raise ValueError("LEAD() 窗口函数需要 ORDER BY 子句")
+        target_col, offset, default_value = self._window_shift_target(window_expr.this, df, select_alias_map)
+        positions = np.arange(len(layout["perm"])) + offset
+        valid = (positions >= layout["part_start"]) & (positions < layout["part_end"])
+        return self._window_unsort(self._window_take(df, target_col, layout, positions, valid, default_value), layout, df.index)
 
-    def _compute_nth_value(
+    @staticmethod
+    def _frame_boundary(value, side: str | None) -> tuple[str, float]:
+        """框架边界解析为 (类型, 有符号偏移): UNBOUNDED / CURRENT / OFFSET, PRECEDING 为负"""
+        sign = -1 if (side or "").upper() == "PRECEDING" else 1
+        if isinstance(value, str) and value.upper() == "CURRENT ROW":
+            return "CURRENT", 0
+        if isinstance(value, str) and value.upper() == "UNBOUNDED":
+            return "UNBOUNDED", sign
+        if isinstance(value, exp.Literal) and not value.is_string:
+            offset = float(value.this)
+            if offset < 0:
+                raise ValueError(f"窗口框架偏移量不能为负数: {value.this}")
+            return "OFFSET", sign * offset
+        raise ValueError(f"不支持的窗口框架边界: {value} {side or ''}。💡 支持 UNBOUNDED PRECEDING/FOLLOWING、CURRENT ROW、N PRECEDING/FOLLOWING(N 为数值常量)")
+
+    def _window_frame_bounds(self, spec: exp.WindowSpec, layout: dict, df: pd.DataFrame, order_cols: list, ascending: list) -> tuple[np.ndarray, np.ndarray]:
+        """各行框架在排序后顺序中的 [lo, hi) 位置
+
+        ROWS 按行偏移; RANGE 按排序键取值偏移(CURRENT ROW 含全部并列行), 数值偏移要求 ORDER BY 为单个数值列.
+        边界裁到本分区内, 起点在终点之后的框架为空.
+        """
+        kind = (spec.args.get("kind") or "ROWS").upper()
+        if kind not in ("ROWS", "RANGE"):
+            raise ValueError(f"不支持的窗口框架类型: {kind}。💡 支持 ROWS 与 RANGE")
+        start = self._frame_boundary(spec.args.get("start"), spec.args.get("start_side"))
+        end = self._frame_boundary(spec.args.get("end"), spec.args.get("end_side")) if spec.args.get("end") is not None else ("CURRENT", 0)
+        if start == ("UNBOUNDED", 1) or end == ("UNBOUNDED", -1):
+            raise ValueError("窗口框架起点不能为 UNBOUNDED FOLLOWING, 终点不能为 UNBOUNDED PRECEDING")
+
+        codes, part_start, part_end = layout["codes"], layout["part_start"], layout["part_end"]
+        rows = np.arange(len(codes))
+        range_key = None
+
+        def position(boundary: tuple[str, float], is_start: bool) -> np.ndarray:
+            """边界在排序后顺序中的位置(未裁到分区内): 起点取首个框架内行, 终点取框架后一行"""
+            nonlocal range_key
+            boundary_type, offset = boundary
+            if boundary_type == "UNBOUNDED":
+                return part_start if is_start else part_end
+            if kind == "ROWS":
+                if offset != int(offset):
+                    raise ValueError(f"ROWS 框架偏移量必须为整数: {abs(offset)}")
+                return rows + int(offset) + (0 if is_start else 1)
+            if boundary_type == "CURRENT":
+                peer_start, peer_end, _ = self._window_peers(layout)
+                return peer_start if is_start else peer_end
+            if range_key is None:
+                if len(order_cols) != 1:
+                    raise ValueError("RANGE 偏移框架要求窗口 ORDER BY 只有一列")
+                values = df[order_cols[0]]
+                if pd.api.types.is_bool_dtype(values.dtype) or not pd.api.types.is_numeric_dtype(values.dtype):
+                    raise ValueError(f"RANGE 偏移框架要求 ORDER BY 列 '{order_cols[0]}' 为数值列")
+                # 降序时取负, 分区内键始终升序, PRECEDING 即取值更小的方向
+                range_key = values.to_numpy(dtype=np.float64, na_value=np.nan)[layout["perm"]]
+                if not ascending[0]:
+                    range_key = -range_key
+            return _frame_search(codes, range_key, range_key + offset, "left" if is_start else "right")
+
+        lo = np.clip(position(start, True), part_start, part_end)
+        hi = np.clip(position(end, False), part_start, part_end)
+        return lo, np.maximum(hi, lo)
+
+    def _compute_window_frame(
         self,
+        func_type: str,
         window_expr: exp.Window,
         df: pd.DataFrame,
-        partition_cols: list,
+        layout: dict,
         order_cols: list,
         ascending: list,
         select_alias_map: dict,
     ) -> pd.Series:
-        """NTH_VALUE: 获取分区内排序后第N行的值"""
-        if not order_cols:
-            raise ValueError("NTH_VALUE() 窗口函数需要 ORDER BY 子句")
-
-        nth_func = window_expr.this
-        target_col_expr = nth_func.this
-        target_col = target_col_expr.name if hasattr(target_col_expr, "name") else str(target_col_expr)
-
-        # 解析 N 参数
-        nth_expr = nth_func.args.get("offset") or (nth_func.expressions[1] if len(nth_func.expressions) > 1 else None)
-        n = int(nth_expr.this) if nth_expr and hasattr(nth_expr, "this") else 1
-
-        if target_col not in df.columns:
-            raise ValueError(f"NTH_VALUE() 函数中列 '{target_col}' 不存在.可用列: {list(df.columns)}")
+        """窗口聚合/取值函数按 ROWS/RANGE 框架求值
 
-        result = pd.Series(None, index=df.index, dtype=df[target_col].dtype)
-        if partition_cols:
-            for _, group in df.groupby(partition_cols, sort=False, observed=False):
-                sorted_group = group.sort_values(order_cols, ascending=ascending)
-                nth_val = sorted_group[target_col].iloc[n - 1] if n <= len(sorted_group) else None
-                result.loc[group.index] = nth_val
-        else:
-            sorted_df = df.sort_values(order_cols, ascending=ascending)
-            nth_val = sorted_df[target_col].iloc[n - 1] if n <= len(sorted_df) else None
-            result[:] = nth_val
-
-        return result
+        在窗口排序布局上求出每行框架的 [lo, hi) 位置: SUM/COUNT/AVG/STDDEV/VARIANCE 窄框架直接相加、宽框架取分区内前缀和之差,
+        MIN/MAX 用稀疏表, FIRST_VALUE/LAST_VALUE/NTH_VALUE 按位置取值, 均为整列运算. 空框架(或框架内全为 NULL)结果为 NULL.
+        未写框架时: 聚合函数有 ORDER BY 从分区起点累计到当前行(含并列行, 即 SQL 默认的 RANGE 框架)、无 ORDER BY 取整个分区; 取值函数取整个分区.
+        """
+        func = window_expr.this
+        name = func.sql_name() if hasattr(func, "sql_name") else func_type.upper()
+        value_func = func_type in ("FirstValue", "LastValue", "NthValue")
+        spec = window_expr.args.get("spec")
+        if spec is None and value_func and not layout["keys"]:
+            raise ValueError(f"{name}() 窗口函数需要 ORDER BY 子句")
+        if len(df) == 0:
+            return pd.Series(index=df.index, dtype=np.float64)
+        distinct = isinstance(func.this, exp.Distinct)
+        if distinct and spec is not None:
+            raise ValueError(f"{name}(DISTINCT ...) 窗口函数不支持 ROWS/RANGE 框架")
+        if spec is None:
+            running = layout["keys"] and not value_func
+            spec = exp.WindowSpec(kind="RANGE", start="UNBOUNDED", start_side="PRECEDING", end="CURRENT ROW" if running else "UNBOUNDED", end_side=None if running else "FOLLOWING")
+        lo, hi = self._window_frame_bounds(spec, layout, df, order_cols, ascending)
+        perm = layout["perm"]
+
+        if value_func:
+            target = func.this
+            col_name = target.name if hasattr(target, "name") else str(target)
+            if col_name not in df.columns:
+                suggestion = self._suggest_column_name(col_name, list(df.columns))
+                raise ValueError(f"{name}() 函数中列 '{col_name}' 不存在.可用列: {list(df.columns)}.{suggestion}")
+            if func_type == "FirstValue":
+                positions = lo
+            elif func_type == "LastValue":
+                positions = hi - 1
+            else:
+                nth_expr = func.args.get("offset") or (func.expressions[1] if len(func.expressions) > 1 else None)
+                positions = lo + (int(nth_expr.this) if nth_expr is not None and hasattr(nth_expr, "this") else 1) - 1
+            ordered = self._window_take(df, col_name, layout, positions, (positions >= lo) & (positions < hi))
+            return self._window_unsort(ordered, layout, df.index)
+
+        inner = func.this.expressions[0] if distinct else func.this
+        col_name = None if isinstance(inner, exp.Star) else self._window_aggregate_column(inner, df, select_alias_map)
+        if col_name is not None and col_name not in df.columns:
+            suggestion = self._suggest_column_name(col_name, list(df.columns))
+            raise ValueError(f"{name}() 窗口函数中列 '{col_name}' 不存在.可用列: {list(df.columns)}.{suggestion}")
+
+        def frame_total(values: np.ndarray) -> np.ndarray:
+            """各行框架 [lo, hi) 内 values 之和"""
+            return _frame_sum(values, lo, hi, layout["codes"], layout["part_start"])
+
+        if col_name is None:
+            return self._window_unsort(hi - lo, layout, df.index)
+        present = df[col_name].notna().to_numpy()[perm]
+        if distinct:
+            # 默认框架都从分区起点开始, 只计每个值在分区内首次出现的行
+            present &= ~pd.DataFrame({"code": layout["codes"], "value": df[col_name].iloc[perm].to_numpy()}).duplicated().to_numpy()
+        if func_type == "Count":
+            return self._window_unsort(frame_total(present.astype(np.int64)), layout, df.index)
+
+        source = pd.to_numeric(df[col_name], errors="coerce")
+        values = source.to_numpy(dtype=np.float64, na_value=np.nan)[perm]
+        present &= ~np.isnan(values)
+        values = np.where(present, values, np.nan)
+        counts = frame_total(present.astype(np.int64))
+        integral = pd.api.types.is_integer_dtype(source.dtype)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if func_type in ("Min", "Max"):
+                result = _frame_extreme(values, lo, hi, np.fmin if func_type == "Min" else np.fmax)
+            elif func_type == "Sum" and integral:
+                result = frame_total(np.where(present, source.to_numpy(dtype=np.int64, na_value=0)[perm], 0))
+            elif func_type in ("Sum", "Avg"):
+                sums = frame_total(np.where(present, values, 0.0))
+                # 框架内非空值全部相等时直接取该值(SUM 为该值 × 行数), 不带逐项相加的舍入误差
+                compact = values[present]
+                before = np.r_[0, np.cumsum(present)]
+                first, last = before[lo], before[hi] - 1
+                runs = np.r_[0, np.cumsum(compact[1:] != compact[:-1])]
+                uniform = np.flatnonzero((counts > 0) & (runs[np.minimum(first, len(compact) - 1)] == runs[np.maximum(last, 0)]))
+                if func_type == "Avg":
+                    result = sums / counts
+                    result[uniform] = compact[first[uniform]]
+                else:
+                    result = np.where(counts > 0, sums, np.nan)
+                    result[uniform] = compact[first[uniform]] * counts[uniform]
+            else:
+                # 以均值平移后再求平方和, 减小前缀和相减的精度损失
+                shifted = np.where(present, values - (values[present].mean() if present.any() else 0.0), 0.0)
+                sums, squares = frame_total(shifted), frame_total(shifted * shifted)
+                ddof = 0 if func_type.endswith("Pop") else 1
+                deviations = squares - sums * sums / counts
+                # 相对平方和低于浮点精度的差值(框架内各值相等)视为 0
+                result = np.where(deviations > squares * 1e-12, deviations, 0.0) / (counts - ddof)
+                result = np.where(counts > ddof, result, np.nan)
+                if func_type.startswith("Stddev"):
+                    result = np.sqrt(result)
+        if integral and func_type in ("Sum", "Min", "Max"):
+            return self._window_unsort(pd.Series(result).astype("Int64").mask(counts == 0), layout, df.index)
+        return self._window_unsort(result, layout, df.index)
 
     # CTE 最大嵌套深度限制（防止恶意/意外深层递归导致 StackOverflow）
     _MAX_CTE_DEPTH = 10
@@ -3519,7 +4699,7 @@ class AdvancedSQLQueryEngine:
         with_clause = parsed_sql.args.get(_with_key)
         if with_clause:
             # 复制worksheets_data避免修改原始数据,逐步添加CTE结果
-            cte_data = dict(worksheets_data)
+            cte_data = worksheets_data.copy()
             for cte_expr in with_clause.expressions:
                 cte_name = cte_expr.alias
                 cte_query = cte_expr.this  # inner Select
@@ -3546,6 +4726,7 @@ class AdvancedSQLQueryEngine:
 
         # 如果FROM是子查询,先执行子查询并将结果注入effective_data
         if from_subquery is not None:
+            self._mark_window_top_n(parsed_sql, from_subquery)
             try:
                 sub_result = self._execute_subquery(from_subquery, effective_data)
                 effective_data[from_table] = sub_result
@@ -3568,7 +4749,14 @@ class AdvancedSQLQueryEngine:
                 },
             )
 
-        base_df = effective_data[from_table].copy()
+        # 投影下推: 单表查询只物化SQL引用到的列, 其余情况取CoW视图, 不再整表深拷贝缓存中的sheet
+        source_df = effective_data[from_table]
+        projected_columns = None if parsed_sql.args.get("joins") else self._projected_columns(parsed_sql, source_df, from_table)
+        if projected_columns is not None:
+            # 浅拷贝清除 df[list] 的 SettingWithCopy 标记
+            base_df = source_df[projected_columns].copy(deep=False)
+        else:
+            base_df = _frame_view(source_df)
 
         # 添加行号虚拟列 _ROW_NUMBER_ (SELECT和UPDATE通用)
         if "_ROW_NUMBER_" not in base_df.columns:
@@ -3600,18 +4788,18 @@ class AdvancedSQLQueryEngine:
                     self._table_aliases[alias.alias] = parent_table
                     self._table_aliases[parent_table] = parent_table
 
+        # 保存当前工作表数据供子查询(含 LATERAL)使用
+        self._current_worksheets = effective_data
+
         # 应用JOIN子句
         joins = parsed_sql.args.get("joins")
         if joins:
-            base_df = self._apply_join_clause(joins, base_df, effective_data, from_table)
+            base_df = self._apply_join_clause(joins, base_df, effective_data, from_table, parsed_sql.args.get("where"))
 
         # 应用WHERE条件
-        # 保存WHERE前的DataFrame,用于空结果智能建议
-        base_df_before_where = base_df.copy()
-        self._df_before_where = base_df_before_where
-        # 保存当前工作表数据供子查询使用
-        self._current_worksheets = effective_data
-        base_df = self._apply_where_clause(parsed_sql, base_df)
+        # 保存WHERE前的DataFrame,用于空结果智能建议(浅拷贝, 只在结果为空时才读取)
+        self._df_before_where = base_df.copy(deep=False)
+        base_df = self._apply_where_clause(parsed_sql, base_df, None if joins else (from_table, source_df))
 
         # 检查是否有聚合函数
         has_aggregate = self._check_has_aggregate_function(parsed_sql)
@@ -3638,8 +4826,8 @@ class AdvancedSQLQueryEngine:
             # 应用HAVING条件
             has_having = parsed_sql.args.get("having") is not None
             if has_having:
-                # 保存HAVING前的DataFrame,用于HAVING空结果建议
-                self._df_before_having = base_df.copy()
+                # 保存HAVING前的DataFrame,用于HAVING空结果建议(浅拷贝: HAVING向base_df追加的临时列不进入快照)
+                self._df_before_having = base_df.copy(deep=False)
                 base_df = self._apply_having_clause(parsed_sql, base_df)
         else:
             has_having = False
@@ -3648,33 +4836,39 @@ class AdvancedSQLQueryEngine:
         # 窗口函数在GROUP BY/HAVING之后,ORDER BY/SELECT之前计算
         # [FIX R14-B1] 如果已在GROUP BY前预计算过，则跳过
         if not _precomputed_windows:
+            if not has_group_by:
+                base_df = self._window_top_n_cut(parsed_sql, base_df)
             base_df = self._apply_window_functions(parsed_sql, base_df)
 
+        # R51-opt: LIMIT/OFFSET 优化 — 合并操作 + 早返回 + 边界检查
+        offset_value = self._extract_int_value(parsed_sql.args.get("offset"))
+        limit_value = self._extract_int_value(parsed_sql.args.get("limit"))
+        if limit is not None and limit_value is None:
+            limit_value = limit
+        # ORDER BY 之后只有逐行的 SELECT 表达式和 LIMIT/OFFSET 时, 排序只需排出前 OFFSET+LIMIT 行(DISTINCT 会去掉行, 不适用)
+        top_n = None
+        if limit_value is not None and limit_value > 0 and not parsed_sql.args.get("distinct"):
+            top_n = limit_value + max(offset_value or 0, 0)
+
         if parsed_sql.args.get("group") or has_aggregate:
             # ORDER BY(聚合查询:在GROUP BY之后)
             # 提取SELECT别名,支持ORDER BY引用聚合结果列的别名
             select_aliases = self._extract_select_aliases(parsed_sql)
             if parsed_sql.args.get("order"):
-                base_df = self._apply_order_by(parsed_sql, base_df, select_aliases=select_aliases)
+                base_df = self._apply_order_by(parsed_sql, base_df, select_aliases=select_aliases, top_n=top_n)
         else:
             # 非聚合查询:提取SELECT别名,然后ORDER BY(支持引用别名和原始列),最后SELECT
             select_aliases = self._extract_select_aliases(parsed_sql)
             if parsed_sql.args.get("order"):
-                base_df = self._apply_order_by(parsed_sql, base_df, select_aliases=select_aliases)
+                base_df = self._apply_order_by(parsed_sql, base_df, select_aliases=select_aliases, top_n=top_n)
 
             # 应用SELECT表达式(裁剪列,计算字段,别名)
             base_df = self._apply_select_expressions(parsed_sql, base_df)
 
-        # R51-opt: LIMIT/OFFSET 优化 — 合并操作 + 早返回 + 边界检查
-        offset_value = self._extract_int_value(parsed_sql.args.get("offset"))
         # R48-fix: SELECT DISTINCT 必须在 LIMIT/OFFSET 之前应用(SQL标准执行顺序)
         if parsed_sql.args.get("distinct"):
             base_df = base_df.drop_duplicates()
 
-        limit_value = self._extract_int_value(parsed_sql.args.get("limit"))
-        if limit is not None and limit_value is None:
-            limit_value = limit
-
         # 早返回: LIMIT 0 → 空结果（跳过后续切片）
         if limit_value is not None and limit_value <= 0:
             return base_df.iloc[0:0]
@@ -3698,6 +4892,44 @@ class AdvancedSQLQueryEngine:
 
         return base_df
 
+    def _projected_columns(self, parsed_sql: exp.Expression, df: pd.DataFrame, from_table: str) -> list[str] | None:
+        """
+        投影下推: 收集SQL(含子查询)引用到的FROM表列, 按原列顺序返回.
+
+        列名按执行阶段的规则匹配(精确/大小写不敏感/Name(备注)短名前缀), 匹配到的全部保留.
+        返回 None 表示需要整表: 含 SELECT * / t.*、列名不唯一、没有引用任何列,
+        或存在无法归属的未限定列名(保留整表, 列不存在时的可用列与相似列建议不受影响).
+        """
+        if not df.columns.is_unique:
+            return None
+        for star in parsed_sql.find_all(exp.Star):
+            if not isinstance(star.parent, exp.Count):
+                return None
+
+        lowered = [(col, str(col).lower()) for col in df.columns]
+        aliases = {node.alias for node in parsed_sql.find_all(exp.Alias, exp.TableAlias) if node.alias}
+        from_clause = parsed_sql.args.get("from") or parsed_sql.args.get("from_")
+        base_qualifiers = {from_table}
+        if from_clause is not None and from_clause.this.alias:
+            base_qualifiers.add(from_clause.this.alias)
+        col_map = self._original_to_clean_cols or {}
+        needed: set = set()
+        for node in parsed_sql.find_all(exp.Column, exp.Var):
+            name = node.name
+            if not name:
+                continue
+            candidates = {name.lower(), str(col_map.get(name, name)).lower()}
+            matched = [col for col, col_lower in lowered if any(col_lower == c or col_lower.startswith(c + "(") for c in candidates)]
+            if matched:
+                needed.update(matched)
+            elif isinstance(node, exp.Column) and name != "_ROW_NUMBER_":
+                # 限定名指向FROM表却匹配不到, 或无法归属的未限定列: 整表保留
+                if (node.table in base_qualifiers) if node.table else name not in aliases:
+                    return None
+        if not needed:
+            return None
+        return [col for col in df.columns if col in needed]
+
     @staticmethod
     def _extract_int_value(clause) -> int | None:
         """从SQL子句中提取整数值(LIMIT/OFFSET等)"""
@@ -3947,14 +5179,13 @@ class AdvancedSQLQueryEngine:
                     result_data[alias_name] = pd.Series([val] * len(df), index=df.index)
 
                 elif isinstance(original_expr, exp.Subquery):
-                    # 标量子查询(如 SELECT (SELECT MAX(col) FROM t))
+                    # 标量子查询(如 SELECT (SELECT MAX(col) FROM t)); 等值关联子查询去关联后整列求值
                     try:
-                        sub_result = self._execute_subquery(original_expr, self._current_worksheets)
-                        if len(sub_result) > 0 and len(sub_result.columns) > 0:
-                            scalar_val = sub_result.iloc[0, 0]
-                            result_data[alias_name] = pd.Series([scalar_val] * len(df), index=df.index)
+                        scalar_val = self._scalar_subquery_operand(original_expr, df)
+                        if isinstance(scalar_val, pd.Series):
+                            result_data[alias_name] = scalar_val
                         else:
-                            result_data[alias_name] = pd.Series([None] * len(df), index=df.index)
+                            result_data[alias_name] = pd.Series([scalar_val] * len(df), index=df.index)
                     except Exception as sub_e:
                         raise ValueError(f"标量子查询执行失败: {sub_e}")
 
@@ -4106,6 +5337,7 @@ class AdvancedSQLQueryEngine:
             exp.Any,
             exp.Anonymous,
             exp.Round,  # 标量数值函数
+            exp.RegexpLike,  # REGEXP/RLIKE: df.query 无对应写法
             # Fix(R46): exp.Cast 已从此列表移除
             # CAST 现在在 _sql_condition_to_pandas 中通过预计算临时列支持,无需走逐行过滤
         }
@@ -4227,6 +5459,13 @@ class AdvancedSQLQueryEngine:
             if not hasattr(self, "_worksheets_data"):
                 raise ValueError("子查询执行失败: 缺少工作表数据上下文")
 
+            # 等值关联子查询去关联为一次分组查询, 按外层行对齐返回
+            if getattr(self, "_current_worksheets", None) and self._subquery_is_correlated(expr):
+                try:
+                    return pd.to_numeric(self._scalar_subquery_operand(expr, df), errors="coerce")
+                except _NotVectorizable:
+                    pass
+
             # 执行子查询
             subquery_df = self._execute_subquery(expr, self._worksheets_data)
 
@@ -4325,6 +5564,9 @@ class AdvancedSQLQueryEngine:
         # 但 RANK() OVER (...) 不是 GROUP BY 意义上的聚合
         if isinstance(expr, exp.Window):
             return None
+        # 标量子查询内的聚合由子查询自身处理, 不属于外层(如 id * 10 + (SELECT SUM(x) FROM t))
+        if isinstance(expr, (exp.Subquery, exp.Select)):
+            return None
         # 递归检查子节点: this 和 expression (二元操作数)
         for child_attr in ("this", "expression"):
             child = getattr(expr, child_attr, None)
@@ -4873,16 +6115,17 @@ class AdvancedSQLQueryEngine:
         # 如果没有明确的FROM子句,返回第一个表名
         raise ValueError("无法确定FROM子句中的表名")
 
-    def _apply_join_clause(self, joins, left_df, worksheets_data=None, left_table=None) -> pd.DataFrame:
+    def _apply_join_clause(self, joins, left_df, worksheets_data=None, left_table=None, where=None) -> pd.DataFrame:
         """
         应用JOIN子句,支持INNER/LEFT/RIGHT/FULL/CROSS JOIN
-        性能优化:使用索引优化和智能JOIN策略
+        性能优化:WHERE中只引用单个内连接表的条件先过滤该表; 星型内连接按估算扇出重排顺序
 
         Args:
             joins: sqlglot joins列表
             left_df: 左表DataFrame
             worksheets_data: 所有工作表数据
             left_table: 左表名
+            where: 外层WHERE子句(可选, 用于条件下推; JOIN后仍完整求值)
 
         Returns:
             pd.DataFrame: JOIN后的DataFrame
@@ -4890,26 +6133,27 @@ class AdvancedSQLQueryEngine:
         if isinstance(joins, exp.Join):
             joins = [joins]
 
-        # 性能优化:检查数据大小,决定是否使用索引优化
-        left_size = len(left_df)
-        total_memory_mb = left_size * len(left_df.columns) * 8 / (1024 * 1024)  # 估算内存使用
-
         # 初始化JOIN列映射(用于别名解析)
         self._join_column_mapping = {}
 
-        result_df = left_df
-
+        right_aliases = {right[1] for right in map(self._join_right_table, joins) if right is not None}
+        left_aliases = ({left_table} | {alias for alias, real_name in self._table_aliases.items() if real_name == left_table}) - right_aliases - {""}
+        pushed = self._join_pushdown_predicates(where, joins, left_aliases)
+        left_df = self._prefilter_join_input(left_df, [cond for alias in left_aliases for cond in pushed.pop(alias, [])])
+        prefiltered = {}  # {右表别名: 下推过滤后的DataFrame}
         for join in joins:
-            # 解析JOIN类型
-            join_side = str(join.side).upper() if join.side else None
-            join_kind_name = str(join.kind).upper() if join.kind else None
-            join_kind = self._JOIN_KIND_MAP.get((join_side, join_kind_name), "inner")
+            right = self._join_right_table(join)
+            if right is not None and right[1] in pushed and right[0] in (worksheets_data or {}):
+                prefiltered[right[1]] = self._prefilter_join_input(worksheets_data[right[0]], pushed[right[1]])
+        ordered_joins = self._plan_join_order(joins, left_df, worksheets_data or {}, left_aliases, prefiltered)
+        added_columns = {}  # {id(join): 该JOIN新增的列}, 重排后按原文顺序恢复列布局
+
+        result_df = left_df
 
-            # Fix(R13): 逗号风格隐式 CROSS JOIN (FROM table1, table2)
-            # sqlglot 将逗号解析为无 kind 无 ON 的 Join 节点,应视为笛卡尔积
+        for join in ordered_joins:
+            columns_before = set(result_df.columns)
+            join_kind = self._join_kind(join)
             on_clause = join.args.get("on")
-            if not join_kind_name and not on_clause and not join_side:
-                join_kind = "cross"
 
             # 解析右表
             right_table_expr = join.this
@@ -4929,6 +6173,7 @@ class AdvancedSQLQueryEngine:
             # Fix(R7-F3): Support subquery as JOIN right table
             # e.g., FROM (SELECT ...) a CROSS JOIN (SELECT ...) b
             _r7_right_from_subquery = False
+            right_source = None  # 右表为缓存中的sheet时记录原DataFrame, 用于复用JOIN索引
             if isinstance(right_table_expr, (exp.Subquery, exp.Select)):
                 _r7_right_from_subquery = True
                 right_alias = getattr(right_table_expr, "alias", None) or "_joined_subquery"
@@ -4977,17 +6222,13 @@ class AdvancedSQLQueryEngine:
                 # 检查右表是否存在,如果不存在尝试从同文件加载其他sheet
                 if right_table not in worksheets_data:
                     # 尝试从同文件加载该sheet
-                    if self._current_file_path and hasattr(self, "_load_excel_data"):
+                    if self._current_file_path:
                         try:
-                            # 加载指定sheet的数据
-                            additional_sheets = self._load_excel_data(self._current_file_path, right_table)
-                            if right_table in additional_sheets:
+                            # 加载指定sheet的数据(走sheet级缓存,并合并表头描述/列名映射)
+                            additional_df = self._load_pending_sheet(self._current_file_path, right_table)
+                            if additional_df is not None:
                                 # 将加载的sheet添加到worksheets_data
-                                worksheets_data[right_table] = additional_sheets[right_table]
-                                # 同时更新列名映射
-                                if not hasattr(self, "_additional_loaded_sheets"):
-                                    self._additional_loaded_sheets = {}
-                                self._additional_loaded_sheets[right_table] = additional_sheets[right_table]
+                                worksheets_data[right_table] = additional_df
                         except Exception:
                             pass  # 加载失败,继续抛出原错误
 
@@ -5015,10 +6256,15 @@ class AdvancedSQLQueryEngine:
                             },
                         )
 
-                right_df = worksheets_data[right_table].copy()
+                right_source = worksheets_data[right_table]
+                if right_alias in prefiltered:
+                    # WHERE 条件已下推过滤的右表不再是缓存中的原表, 不复用JOIN索引
+                    right_source = None
+                    right_df = _frame_view(prefiltered[right_alias])
+                else:
+                    right_df = _frame_view(right_source)
 
             # 解析ON条件(CROSS JOIN不需要ON)
-            on_clause = join.args.get("on")
             left_on_col = None
             right_on_col = None
             actual_right_on = None
@@ -5029,7 +6275,6 @@ class AdvancedSQLQueryEngine:
             # 和 L5572 的 merge(left_on=...) 均因找不到列而报 KeyError。
             # pandas merge 内部已使用 hash join 算法优化，此 set_index 优化
             # 不仅冗余且引入回归 bug，故整体移除。
-            # 保留 total_memory_mb 变量供其他逻辑使用（如非等值连接策略选择）
 
             if join_kind == "cross":
                 # CROSS JOIN: 笛卡尔积,不需要ON条件
@@ -5082,7 +6327,7 @@ class AdvancedSQLQueryEngine:
 
             # 执行JOIN
             # 为右表列添加别名前缀避免冲突
-            right_df_renamed = right_df.copy()
+            right_df_renamed = _frame_view(right_df)
             col_mapping = {}
             for col in right_df_renamed.columns:
                 if col in result_df.columns and (left_on_col is None or col != left_on_col):
@@ -5119,7 +6364,7 @@ class AdvancedSQLQueryEngine:
                 # CROSS JOIN: 笛卡尔积(无需ON列)
                 # 先临时移除冲突列名,合并后再恢复
                 temp_col_mapping = {}
-                right_df_for_cross = right_df_renamed.copy()
+                right_df_for_cross = _frame_view(right_df_renamed)
 
                 for col in right_df_for_cross.columns:
                     if col in result_df.columns:
@@ -5127,215 +6372,495 @@ class AdvancedSQLQueryEngine:
                         temp_col_mapping[col] = temp_col
                         right_df_for_cross = right_df_for_cross.rename(columns={col: temp_col})
 
+                self._check_cross_join_size(len(result_df), len(right_df_for_cross))
                 result_df = result_df.merge(right_df_for_cross, how="cross")
 
                 # 恢复原始列名
                 for old_col, new_col in temp_col_mapping.items():
                     result_df = result_df.rename(columns={new_col: old_col})
-            elif non_equi_cond is not None:
-                # [R53优化] 非等值连接: 检查是否有可用的等值join key + 额外过滤器
-                pending_filters = getattr(self, "_pending_join_filters", None)
-                if left_on_col and right_on_col and pending_filters:
-                    # 复合条件路径：先等值JOIN（快速pandas merge），再对缩小后的结果集施加非等值过滤
-                    # 这比 cross join + filter 快几个数量级
-                    result_df = result_df.merge(
-                        right_df_renamed,
-                        left_on=left_on_col,
-                        right_on=actual_right_on,
-                        how=join_kind,
-                    )
-                    # 对等值JOIN结果施加额外的非等值过滤条件
-                    for filter_cond in pending_filters:
-                        result_df = self._apply_row_filter(filter_cond, result_df)
-                    self._pending_join_filters = None  # 清理
-                else:
-                    # [R53优化] 纯非等值连接: 尝试排序归并优化
-                    sorted_result = self._try_sorted_non_equi_join(
+            elif non_equi_cond is not None or getattr(self, "_pending_join_filters", None):
+                # 区间/非等值条件(可混合等值条件): 排序 + searchsorted 的 band join
+                band_result = self._try_band_join(result_df, right_df_renamed, on_clause, right_alias, join_kind)
+                pending_filters = self._pending_join_filters
+                self._pending_join_filters = None
+                if band_result is not None:
+                    result_df = band_result
+                elif left_on_col and right_on_col and pending_filters:
+                    # [R53优化] 复合条件路径：先等值JOIN（快速pandas merge），再对缩小后的结果集施加非等值过滤
+                    right_filtered, pending_filters = self._prefilter_join_right(right_df, right_df_renamed, pending_filters, right_alias, join_kind)
+                    source = right_source if right_filtered is right_df_renamed else None
+                    result_df = self._join_with_on_filters(
                         result_df,
-                        right_df_renamed,
-                        non_equi_cond,
-                        left_table,
-                        right_table,
-                        right_alias,
+                        right_filtered,
+                        pending_filters,
                         join_kind,
+                        lambda left, right: self._hash_join(left, right, left_on_col, actual_right_on, "inner", source, right_table, right_on_col),
                     )
-                    if sorted_result is not None:
-                        result_df = sorted_result
-                    else:
-                        # 回退到 cross join + row filter
-                        result_df = result_df.merge(right_df_renamed, how="cross")
-                        result_df = self._apply_row_filter(non_equi_cond, result_df)
+                else:
+                    # 回退到 cross join + row filter
+                    conditions = [cond.unnest() for cond in non_equi_cond.flatten()] if isinstance(non_equi_cond, exp.And) else [non_equi_cond]
+                    right_filtered, conditions = self._prefilter_join_right(right_df, right_df_renamed, conditions, right_alias, join_kind)
+                    self._check_cross_join_size(len(result_df), len(right_filtered))
+                    result_df = self._join_with_on_filters(result_df, right_filtered, conditions, join_kind, lambda left, right: left.merge(right, how="cross"))
             else:
-                result_df = result_df.merge(
-                    right_df_renamed,
-                    left_on=left_on_col,
-                    right_on=actual_right_on,
-                    how=join_kind,
-                )
+                result_df = self._hash_join(result_df, right_df_renamed, left_on_col, actual_right_on, join_kind, right_source, right_table, right_on_col)
 
             # 合并后删除重复的ON列(右表侧)
             # Fix(C2): 链式JOIN中,右表的ON列可能被后续JOIN引用(如三表JOIN的第二/三个ON条件)
             # 因此不再自动删除右表ON列;SELECT阶段会只选取需要的列,多余列不影响正确性
             # 仅当左右ON列名完全相同时,pandas merge已自动合并为单列,无需处理
+            added_columns[id(join)] = [col for col in result_df.columns if col not in columns_before]
+
+        if ordered_joins is not joins:
+            # 重排后恢复按原文JOIN顺序的列布局(SELECT * 输出不受执行顺序影响)
+            layout = [col for col in left_df.columns if col in result_df.columns]
+            for join in joins:
+                layout.extend(added_columns[id(join)])
+            result_df = result_df[layout]
 
         return result_df
 
-    def _try_sorted_non_equi_join(self, left_df, right_df, non_equi_cond, left_table, right_table, right_alias, join_kind):
+    @classmethod
+    def _join_kind(cls, join: exp.Join) -> str:
+        """JOIN 类型: inner/left/right/outer/cross"""
+        join_side = str(join.side).upper() if join.side else None
+        join_kind_name = str(join.kind).upper() if join.kind else None
+        # Fix(R13): 逗号风格隐式 CROSS JOIN (FROM table1, table2)
+        # sqlglot 将逗号解析为无 kind 无 ON 的 Join 节点,应视为笛卡尔积
+        if not join_kind_name and not join.args.get("on") and not join_side:
+            return "cross"
+        return cls._JOIN_KIND_MAP.get((join_side, join_kind_name), "inner")
+
+    @staticmethod
+    def _join_right_table(join: exp.Join) -> tuple[str, str] | None:
+        """JOIN 右侧为普通表时返回 (表名, 别名), 子查询/LATERAL 返回 None"""
+        if not isinstance(join.this, exp.Table):
+            return None
+        return join.this.name, join.this.alias or join.this.name
+
+    def _join_pushdown_predicates(self, where, joins, left_aliases: set) -> dict[str, list]:
+        """WHERE 中可下推到 JOIN 之前的 AND 条件, 按表别名分组
+
+        只下推全部列都限定为同一张表、且该表不会被外连接补 NULL 的条件(FROM 表及 INNER/CROSS JOIN 的普通表;
+        存在 RIGHT/FULL JOIN 时不下推). 含子查询/聚合/窗口函数的条件不下推. 下推只是提前过滤, JOIN 后仍完整求值 WHERE.
         """
-        [R53优化] 对基于排序的非等值连接使用归并算法，避免 O(n*m) 的笛卡尔积。
+        if where is None:
+            return {}
+        targets = set(left_aliases)
+        for join in joins:
+            kind = self._join_kind(join)
+            if kind in ("right", "outer"):
+                return {}
+            right = self._join_right_table(join)
+            if right is not None and kind in ("inner", "cross"):
+                targets.add(right[1])
+        pushed: dict[str, list] = {}
+        for conjunct in where.this.flatten() if isinstance(where.this, exp.And) else [where.this]:
+            conjunct = conjunct.unnest()
+            if conjunct.find(exp.Subquery, exp.Select, exp.Exists, exp.AggFunc, exp.Window) is not None:
+                continue
+            qualifiers = {col.table for col in conjunct.find_all(exp.Column)}
+            if len(qualifiers) == 1 and next(iter(qualifiers)) in targets:
+                pushed.setdefault(next(iter(qualifiers)), []).append(conjunct)
+        return pushed
+
+    def _prefilter_join_input(self, df: pd.DataFrame, conditions: list) -> pd.DataFrame:
+        """用下推的单表条件过滤 JOIN 输入; 无法整列求值的条件跳过(留给 JOIN 后的 WHERE)"""
+        for condition in conditions:
+            unqualified = condition.copy()
+            for col in unqualified.find_all(exp.Column):
+                col.set("table", None)
+            try:
+                mask = self._where_mask(unqualified, df)
+            except Exception as e:
+                logger.debug("JOIN前条件下推跳过(%s): %s", e, condition)
+                continue
+            df = df[mask.to_numpy(dtype=bool, na_value=False)]
+        return df
 
-        支持的单条件模式（两侧都是简单列引用）：
-          a.col < b.col, a.col <= b.col, a.col > b.col, a.col >= b.col
+    def _plan_join_order(self, joins, left_df, worksheets_data, left_aliases: set, prefiltered: dict) -> list:
+        """星型内连接(每个 ON 都是 FROM 表列 = 右表列)按估算扇出从小到大重排, 其他形式保持原文顺序
+
+        扇出 = 右表行数 / max(左键去重数, 右键去重数), 即每个左表行平均匹配的右表行数; 选择性强的 JOIN 先做,
+        中间结果最小. 各右表除 FROM 表已有列之外的列名须互不重叠, 保证重排后列的重命名规则与原顺序一致.
+        """
+        if len(joins) < 2:
+            return joins
+        planned = []
+        seen_columns: set = set()
+        for position, join in enumerate(joins):
+            right = self._join_right_table(join)
+            on = join.args.get("on")
+            if right is None or self._join_kind(join) != "inner" or not isinstance(on, exp.EQ):
+                return joins
+            table, alias = right
+            if not (isinstance(on.left, exp.Column) and isinstance(on.right, exp.Column)):
+                return joins
+            if on.left.table == alias and on.right.table in left_aliases:
+                right_key, left_key = on.left, on.right
+            elif on.right.table == alias and on.left.table in left_aliases:
+                right_key, left_key = on.right, on.left
+            else:
+                return joins
+            frame = prefiltered.get(alias)
+            if frame is None:
+                if table not in worksheets_data:
+                    return joins
+                frame = worksheets_data[table]
+            own_columns = set(frame.columns) - set(left_df.columns)
+            if own_columns & seen_columns:
+                return joins
+            seen_columns |= own_columns
+            left_name, right_name = self._find_column_name(left_key.name, left_df), self._find_column_name(right_key.name, frame)
+            if left_name is None or right_name is None:
+                return joins
+            # 缓存中的 sheet 取统计目录里的近似去重数, 不必每次规划都扫描右表键列
+            sheet_key = self._cached_sheet_key(table, frame)
+            right_distinct = self._column_stats(sheet_key, frame, right_name)["distinct"] if sheet_key else frame[right_name].nunique()
+            distinct = max(left_df[left_name].nunique(), right_distinct, 1)
+            planned.append((len(frame) / distinct, position, join))
+        ordered = [join for _, _, join in sorted(planned, key=lambda item: item[:2])]
+        return joins if ordered == list(joins) else ordered
+
+    def _prefilter_join_right(self, right_df, right_renamed, conditions: list, right_alias: str, join_kind: str):
+        """INNER/LEFT JOIN 中只引用右表列的 ON 条件先过滤右表; 返回 (过滤后的右表, 剩余条件)
+
+        右表不是保留侧, 不满足这类条件的右表行不可能匹配. 无法整列求值的条件留给 JOIN 后逐行过滤.
+        """
+        if join_kind not in ("inner", "left"):
+            return right_renamed, conditions
+        remaining = []
+        for condition in conditions:
+            columns = list(condition.find_all(exp.Column))
+            if not columns or any(col.table != right_alias for col in columns) or condition.find(exp.Subquery, exp.Select, exp.Exists) is not None:
+                remaining.append(condition)
+                continue
+            unqualified = condition.copy()
+            for col in unqualified.find_all(exp.Column):
+                col.set("table", None)
+            try:
+                mask = self._where_mask(unqualified, right_df)
+            except Exception as e:
+                logger.debug("JOIN ON右表条件预过滤跳过(%s): %s", e, condition)
+                remaining.append(condition)
+                continue
+            keep = mask.to_numpy(dtype=bool, na_value=False)
+            right_df, right_renamed = right_df[keep], right_renamed[keep]
+        return right_renamed, remaining
 
-        算法：双指针归并，O(n log n + m log m + n + m)
-        不支持时返回 None，调用方回退到 cross+filter。
+    def _join_with_on_filters(self, left_df, right_df, conditions: list, join_kind: str, inner_join) -> pd.DataFrame:
         """
-        # 仅支持单条件比较（GT/GTE/LT/LTE/NEQ）
-        if not isinstance(non_equi_cond, (exp.GT, exp.GTE, exp.LT, exp.LTE)):
-            return None  # NEQ 或复合条件不适用
+        ON 中连接键之外的条件只作用于匹配行对: inner_join(left, right) 求出候选行对并按条件过滤,
+        LEFT/RIGHT/FULL JOIN 再补回没有留下任何匹配的保留侧行(另一侧列为 NULL). 行序与 pd.merge 一致.
+        """
+        if join_kind == "inner":
+            result = inner_join(left_df, right_df)
+            for condition in conditions:
+                if len(result):
+                    result = self._apply_row_filter(condition, result)
+            return result
 
-        left_expr = non_equi_cond.left
-        right_expr = non_equi_cond.right
+        left_tag, right_tag = "__join_left_pos__", "__join_right_pos__"
+        matched = inner_join(left_df.assign(**{left_tag: np.arange(len(left_df))}), right_df.assign(**{right_tag: np.arange(len(right_df))}))
+        for condition in conditions:
+            if len(matched):
+                matched = self._apply_row_filter(condition, matched)
+        parts = [matched]
+        if join_kind in ("left", "outer"):
+            unmatched = ~np.isin(np.arange(len(left_df)), matched[left_tag].to_numpy())
+            parts.append(left_df[unmatched].assign(**{left_tag: np.flatnonzero(unmatched)}))
+        if join_kind in ("right", "outer"):
+            unmatched = ~np.isin(np.arange(len(right_df)), matched[right_tag].to_numpy())
+            # FULL JOIN 中只有右表的行排在最后
+            order = np.flatnonzero(unmatched) + (len(left_df) if join_kind == "outer" else 0)
+            parts.append(right_df[unmatched].assign(**{left_tag if join_kind == "outer" else right_tag: order}))
+        sort_tag = right_tag if join_kind == "right" else left_tag
+        result = pd.concat([part for part in parts if len(part)] or [matched], ignore_index=True)
+        result = result.sort_values(sort_tag, kind="stable", ignore_index=True)
+        return result.reindex(columns=matched.columns.drop([left_tag, right_tag]))
+
+    def _check_cross_join_size(self, left_rows: int, right_rows: int) -> None:
+        """笛卡尔积行数超过 MAX_CROSS_JOIN_ROWS 时在分配内存前拒绝执行"""
+        if left_rows * right_rows > MAX_CROSS_JOIN_ROWS:
+            raise StructuredSQLError(
+                "join_error",
+                f"CROSS JOIN 结果将有 {left_rows} × {right_rows} = {left_rows * right_rows} 行, 超过上限 {MAX_CROSS_JOIN_ROWS}",
+                hint="请为JOIN添加ON等值条件, 或先用WHERE缩小参与连接的表.",
+                context={"left_rows": left_rows, "right_rows": right_rows, "max_rows": MAX_CROSS_JOIN_ROWS},
+            )
 
-        # 两边都必须是简单列引用
-        if not (isinstance(left_expr, exp.Column) and isinstance(right_expr, exp.Column)):
-            return None
+    def _hash_join(self, left_df, right_df, left_on, right_on, how, right_source, right_table, right_key) -> pd.DataFrame:
+        """等值JOIN: 右表为缓存中的sheet时用缓存的构建侧哈希索引探测, 否则(或类型不适用时)使用 pd.merge
 
-        left_col_name = left_expr.name
-        right_col_name = right_expr.name
-        left_tbl = getattr(left_expr, "table", None)
-        right_tbl = getattr(right_expr, "table", None)
+        结果(行序、列、NULL键匹配、LEFT JOIN补空后的dtype)与 pd.merge 一致.
+        """
+        index = None
+        if how in ("inner", "left") and right_source is not None and self._join_keys_indexable(left_df[left_on], right_df[right_on]) and not set(left_df.columns) & set(right_df.columns):
+            sheet_key = self._cached_sheet_key(right_table, right_source)
+            if sheet_key is not None:
+                index = self._column_hash_index(sheet_key, right_source, right_key)
+        if index is None:
+            return left_df.merge(right_df, left_on=left_on, right_on=right_on, how=how)
+
+        left_pos, right_pos = _probe_join_index(index, left_df[left_on], how)
+        left_part = left_df.take(left_pos).reset_index(drop=True)
+        if how == "left" and (right_pos < 0).any():
+            right_part = right_df.reset_index(drop=True).reindex(right_pos).reset_index(drop=True)
+        else:
+            right_part = right_df.take(right_pos).reset_index(drop=True)
+        return pd.concat([left_part, right_part], axis=1)
 
-        # 确定左右列归属
-        if left_tbl:
-            resolved_left_tbl = self._table_aliases.get(left_tbl, left_tbl)
-            if resolved_left_tbl == right_table or left_tbl == right_alias:
-                # 左表达式实际引用右表列 → 交换
-                left_col_name, right_col_name = right_col_name, left_col_name
-                # 翻转比较符
-                op_type = type(non_equi_cond)
-                op_map = {exp.LT: exp.GT, exp.GT: exp.LT, exp.LTE: exp.GTE, exp.GTE: exp.LTE}
-                non_equi_cond = op_map.get(op_type, op_type)(this=non_equi_cond.this, expression=non_equi_cond.expression, comments=non_equi_cond.comments)
-        elif right_tbl:
-            resolved_right_tbl = self._table_aliases.get(right_tbl, right_tbl)
-            if resolved_right_tbl == left_table:
-                # 右表达式引用左表列 → 交换
-                left_col_name, right_col_name = right_col_name, left_col_name
-                op_type = type(non_equi_cond)
-                op_map = {exp.LT: exp.GT, exp.GT: exp.LT, exp.LTE: exp.GTE, exp.GTE: exp.LTE}
-                non_equi_cond = op_map.get(op_type, op_type)(this=non_equi_cond.this, expression=non_equi_cond.expression, comments=non_equi_cond.comments)
-
-        # 验证列存在（右表可能已被重命名为 alias.col 格式）
-        _right_col_candidates = [right_col_name]
-        if right_col_name not in right_df.columns:
-            # 尝试别名前缀格式（_apply_join_clause 中 right_df_renamed 的命名规则）
-            _right_col_candidates.append(f"{right_alias}.{right_col_name}")
-        _actual_right_col = None
-        for rc in _right_col_candidates:
-            if rc in right_df.columns:
-                _actual_right_col = rc
-                break
+    @staticmethod
+    def _join_keys_indexable(left_keys: pd.Series, right_keys: pd.Series) -> bool:
+        """两侧键同为数值或同为字符串/object 时可走哈希索引; 其他组合交给 pd.merge(含其类型不兼容报错)"""
 
-        if left_col_name not in left_df.columns or _actual_right_col is None:
+        def kind(keys):
+            """键列类别: "number" / "object", 不能走哈希索引的类型为 None"""
+            if pd.api.types.is_bool_dtype(keys.dtype):
+                return None
+            if pd.api.types.is_numeric_dtype(keys.dtype):
+                return "number"
+            if keys.dtype == object or pd.api.types.is_string_dtype(keys.dtype):
+                return "object"
             return None
 
-        # 提取排序列数据
-        left_keys = left_df[left_col_name].values
-        right_keys = right_df[_actual_right_col].values
+        return kind(left_keys) is not None and kind(left_keys) == kind(right_keys)
+
+    def _cached_sheet_key(self, table: str, frame: pd.DataFrame, file_path: str | None = None) -> str | None:
+        """frame 是 DataFrame 缓存中该文件 table 的 sheet 对象本身时返回缓存键; CTE/子查询结果/跨文件表等返回 None"""
+        sheet_key = f"{file_path or self._current_file_path}|{table}"
+        entry = dict.get(self._df_cache, sheet_key)
+        if entry is not None and entry[1].get(table) is frame:
+            return sheet_key
+        return None
+
+    def _column_hash_index(self, sheet_key: str, frame: pd.DataFrame, column: str) -> tuple[pd.Index, np.ndarray, np.ndarray]:
+        """取缓存的列哈希索引, 未命中时构建并缓存; 随 DataFrame 缓存条目淘汰/刷新失效"""
+        index = self._join_index_cache.lookup_frame((sheet_key, column), frame)
+        if index is None:
+            index = _build_join_index(frame[column])
+            self._join_index_cache.store((sheet_key, column), (frame, index))
+        return index
+
+    def _column_stats(self, sheet_key: str | None, frame: pd.DataFrame, column: str) -> dict[str, Any]:
+        """取列统计目录, 未命中时计算并缓存; sheet_key 为 None(frame 不在 DataFrame 缓存中)时只计算不缓存"""
+        if sheet_key is None:
+            return _compute_column_stats(frame[column], ZONE_MAP_BLOCK_ROWS)
+        stats = self._column_stats_cache.lookup_frame((sheet_key, column), frame)
+        if stats is None:
+            stats = _compute_column_stats(frame[column], ZONE_MAP_BLOCK_ROWS)
+            self._column_stats_cache.store((sheet_key, column), (frame, stats))
+        return stats
+
+    def _prebuild_key_index(self, sheet_key: str, frame: pd.DataFrame, dual_header: bool) -> None:
+        """sheet 载入缓存时为首列 ID 列预建哈希索引, 首次 WHERE ID = … 即可直接点查"""
+        if len(frame) < POINT_INDEX_MIN_ROWS or frame.columns.empty:
+            return
+        column = frame.columns[0]
+        if (dual_header or _ID_COLUMN_RE.match(str(column))) and self._point_indexable(frame[column]):
+            self._column_hash_index(sheet_key, frame, column)
 
-        # 数值/日期类型才能排序比较 — 统一转 float64 避免类型混用
-        import numpy as np
+    @staticmethod
+    def _point_indexable(values: pd.Series) -> bool:
+        """哈希等值与 WHERE 等值比较语义一致的列: 数值(不含布尔)、字符串与 object 列"""
+        if pd.api.types.is_bool_dtype(values.dtype):
+            return False
+        return pd.api.types.is_numeric_dtype(values.dtype) or values.dtype == object or pd.api.types.is_string_dtype(values.dtype)
 
+    def _point_lookup_keys(self, condition: exp.Expression, df: pd.DataFrame) -> tuple[str, list] | None:
+        """列 = 常量 / 列 IN (常量…) → (列名, 非 NULL 常量列表); 其他条件返回 None"""
+        if isinstance(condition, exp.EQ):
+            column, literals = condition.left, [condition.right]
+            if not isinstance(column, exp.Column):
+                column, literals = condition.right, [condition.left]
+        elif isinstance(condition, exp.In) and condition.args.get("query") is None:
+            column, literals = condition.this, condition.expressions
+        else:
+            return None
+        if not isinstance(column, exp.Column) or not all(
+            isinstance(literal, (exp.Literal, exp.Null)) or (isinstance(literal, exp.Neg) and isinstance(literal.this, exp.Literal)) for literal in literals
+        ):
+            return None
         try:
-            left_keys = pd.to_numeric(left_keys, errors="coerce").astype(np.float64)
-            right_keys = pd.to_numeric(right_keys, errors="coerce").astype(np.float64)
-            # NaN 值无法参与排序比较，回退
-            if np.any(np.isnan(left_keys)) or np.any(np.isnan(right_keys)):
+            column_name = self._expression_to_column_reference(column, df)[1:-1]
+        except Exception:
+            return None
+        return column_name, [value for value in (self._where_operand(literal, df) for literal in literals) if value is not None]
+
+    def _range_bounds(self, condition: exp.Expression, df: pd.DataFrame) -> tuple[str, float, float] | None:
+        """列 比较 数值常量 / 列 BETWEEN 数值常量 AND 数值常量 → (列名, 下界, 上界); 其他条件返回 None
+
+        区间一律按闭区间给出(严格比较放宽为非严格), 无界一侧为 ±inf, 只用于判断哪些行不可能满足条件.
+        """
+        if isinstance(condition, exp.Between) and not condition.args.get("symmetric"):
+            column, limits = condition.this, [(">=", condition.args.get("low")), ("<=", condition.args.get("high"))]
+        elif type(condition) in self._BAND_OPS:
+            op, column, literal = self._BAND_OPS[type(condition)], condition.left, condition.right
+            if not isinstance(column, exp.Column):
+                op, column, literal = self._BAND_FLIP[op], condition.right, condition.left
+            limits = [(op, literal)]
+        else:
+            return None
+        if not isinstance(column, exp.Column):
+            return None
+        low, high = -np.inf, np.inf
+        for op, literal in limits:
+            if not (isinstance(literal, exp.Literal) or (isinstance(literal, exp.Neg) and isinstance(literal.this, exp.Literal))):
                 return None
-        except (ValueError, TypeError):
+            value = self._where_operand(literal, df)
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value != value:
+                return None
+            if op in ("=", ">", ">="):
+                low = max(low, float(value))
+            if op in ("=", "<", "<="):
+                high = min(high, float(value))
+        try:
+            return self._expression_to_column_reference(column, df)[1:-1], low, high
+        except Exception:
             return None
 
-        # 排序索引
-        left_order = np.argsort(left_keys, kind="mergesort")
-        right_order = np.argsort(right_keys, kind="mergesort")
-
-        left_sorted = left_keys[left_order]
-        right_sorted = right_keys[right_order]
-
-        # 根据比较符确定匹配逻辑
-        op_type = type(non_equi_cond)
-
-        # 收集匹配的 (left_idx, right_idx) 对
-        matched_pairs = []
-        r = 0  # 右指针
-
-        if op_type == exp.LT:  # left < right
-            # 对于每个左值，找所有右值 > 左值
-            for i in range(len(left_sorted)):
-                val = left_sorted[i]
-                # 移动 r 到第一个 > val 的位置
-                while r < len(right_sorted) and not (right_sorted[r] > val):
-                    r += 1
-                # 从 r 到末尾都满足
-                for j in range(r, len(right_sorted)):
-                    matched_pairs.append((left_order[i], right_order[j]))
-
-        elif op_type == exp.LTE:  # left <= right
-            for i in range(len(left_sorted)):
-                val = left_sorted[i]
-                while r < len(right_sorted) and right_sorted[r] < val:
-                    r += 1
-                for j in range(r, len(right_sorted)):
-                    matched_pairs.append((left_order[i], right_order[j]))
-
-        elif op_type == exp.GT:  # left > right
-            # 反向：对于每个左值，找所有右值 < 左值
-            for i in range(len(left_sorted)):
-                val = left_sorted[i]
-                while r < len(right_sorted) and right_sorted[r] < val:
-                    r += 1
-                # 0..r-1 都满足 < val
-                for j in range(r):
-                    matched_pairs.append((left_order[i], right_order[j]))
-
-        elif op_type == exp.GTE:  # left >= right
-            # 左值 >= 右值：推进 r 到第一个 > val 的位置，则 [0, r) 都满足 <= val
-            for i in range(len(left_sorted)):
-                val = left_sorted[i]
-                while r < len(right_sorted) and right_sorted[r] <= val:
-                    r += 1
-                for j in range(r):
-                    matched_pairs.append((left_order[i], right_order[j]))
-
-        if not matched_pairs:
-            # 空 JOIN 结果：返回左表结构（0行）
-            return pd.DataFrame(columns=list(left_df.columns) + list(right_df.columns))
-
-        # 构建结果 DataFrame（避免笛卡尔积）
-        left_indices = [p[0] for p in matched_pairs]
-        right_indices = [p[1] for p in matched_pairs]
-
-        left_part = left_df.iloc[left_indices].reset_index(drop=True)
-        right_part = right_df.iloc[right_indices].reset_index(drop=True)
-        result = pd.concat([left_part, right_part], axis=1)
+    def _zone_candidates(self, conjuncts: list[exp.Expression], df: pd.DataFrame, sheet_key: str, source: pd.DataFrame) -> np.ndarray | None:
+        """数值列的范围/等值条件按列分块最值(zone map)跳过不可能命中的块, 返回候选行位置(升序); 无块可跳过时返回 None
 
-        # LEFT JOIN: 补充左表未匹配行
-        if join_kind in ("left", "outer"):
-            matched_left = set(left_indices)
-            unmatched_left = [i for i in range(len(left_df)) if i not in matched_left]
-            if unmatched_left:
-                left_unmatched = left_df.iloc[unmatched_left].reset_index(drop=True)
-                right_null = pd.DataFrame([[None] * len(right_df.columns)] * len(unmatched_left), columns=right_df.columns)
-                result = pd.concat(
-                    [
-                        result,
-                        pd.concat([left_unmatched, right_null], axis=1),
-                    ],
-                    ignore_index=True,
-                )
+        同一列的多个条件先合并为一个区间; 条件区间与列的取值范围不相交(如 等级 > 1000 而最大等级为 99)时返回空数组.
+        """
+        ranges: dict[str, tuple[float, float]] = {}
+        for conjunct in conjuncts:
+            bounds = self._range_bounds(conjunct, df)
+            if bounds is None or bounds[0] not in source.columns:
+                continue
+            column, low, high = bounds
+            values = source[column]
+            if pd.api.types.is_bool_dtype(values.dtype) or not pd.api.types.is_numeric_dtype(values.dtype):
+                continue
+            known_low, known_high = ranges.get(column, (-np.inf, np.inf))
+            ranges[column] = (max(low, known_low), min(high, known_high))
+        keep, block_rows = None, None
+        for column, (low, high) in ranges.items():
+            stats = self._column_stats(sheet_key, source, column)
+            if block_rows is not None and stats["block_rows"] != block_rows:
+                continue
+            mins, maxs = stats["zones"]
+            block_keep = (maxs >= low) & (mins <= high)
+            keep, block_rows = (block_keep if keep is None else keep & block_keep), stats["block_rows"]
+        if keep is None or keep.all():
+            return None
+        return np.flatnonzero(np.repeat(keep, block_rows)[: len(source)])
+
+    def _index_candidates(self, condition: exp.Expression, df: pd.DataFrame, table: str, source: pd.DataFrame, file_path: str | None = None) -> pd.DataFrame:
+        """WHERE 顶层 AND 中的条件可经列索引定位时取候选行, 否则原样返回 df
+
+        行数达到 POINT_INDEX_MIN_ROWS 时 列 = 常量 / 列 IN (常量…) 经列哈希索引点查; 行数超过一块
+        ZONE_MAP_BLOCK_ROWS 时数值列的范围/等值条件经分块最值跳过不可能命中的块.
+        df 须与缓存中的 sheet(source)逐行对齐. 候选行(保持原行序与索引标签)包含满足该条件的全部行,
+        调用方仍在候选行上求值完整 WHERE; 多个可用条件取候选最少的一个. 数值列只接受数值常量.
+        """
+        point, zoned = len(source) >= POINT_INDEX_MIN_ROWS, len(source) > ZONE_MAP_BLOCK_ROWS
+        if not (point or zoned) or len(df) != len(source):
+            return df
+        sheet_key = self._cached_sheet_key(table, source, file_path)
+        if sheet_key is None:
+            return df
+        condition = condition.unnest()
+        conjuncts = [conjunct.unnest() for conjunct in (condition.flatten() if isinstance(condition, exp.And) else [condition])]
+        best = self._zone_candidates(conjuncts, df, sheet_key, source) if zoned else None
+        for conjunct in conjuncts if point else []:
+            lookup = self._point_lookup_keys(conjunct, df)
+            if lookup is None or lookup[0] not in source.columns:
+                continue
+            column, values = lookup
+            keys = source[column]
+            if not self._point_indexable(keys):
+                continue
+            if pd.api.types.is_numeric_dtype(keys.dtype) and not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+                continue
+            try:
+                positions = _lookup_join_index(self._column_hash_index(sheet_key, source, column), values) if values else np.empty(0, dtype=np.intp)
+            except (TypeError, ValueError):
+                continue
+            if best is None or len(positions) < len(best):
+                best = positions
+        return df if best is None else df.iloc[best]
+
+    _BAND_OPS = {exp.EQ: "=", exp.GT: ">", exp.GTE: ">=", exp.LT: "<", exp.LTE: "<="}
+    _BAND_FLIP = {"=": "=", ">": "<", ">=": "<=", "<": ">", "<=": ">="}
+
+    def _try_band_join(self, left_df, right_df, on_clause, right_alias, join_kind):
+        """
+        区间(band)JOIN: ON 中的 BETWEEN 与 </<=/>/>= 列比较(可混合等值条件)按排序 + searchsorted 输出匹配行对,
+        避免 O(n*m) 的笛卡尔积. 等值条件先按键分区, 区间条件在分区内求匹配.
+
+        其余条件(如 <>、OR)在 INNER JOIN 结果上逐行过滤; LEFT JOIN 含此类条件、RIGHT/FULL JOIN、
+        无区间条件或比较列不是数值/日期时返回 None, 调用方回退到等值JOIN+过滤或 cross+filter.
+        """
+        if join_kind not in ("inner", "left"):
+            return None
+        conjuncts = []
+        for cond in on_clause.flatten() if isinstance(on_clause, exp.And) else [on_clause]:
+            cond = cond.unnest()
+            if isinstance(cond, exp.Between):
+                conjuncts.append(exp.GTE(this=cond.this, expression=cond.args["low"]))
+                conjuncts.append(exp.LTE(this=cond.this, expression=cond.args["high"]))
+            else:
+                conjuncts.append(cond)
+
+        equalities, ranges, residual = [], [], []
+        for cond in conjuncts:
+            op = self._BAND_OPS.get(type(cond))
+            if op is not None and isinstance(cond.left, exp.Column) and isinstance(cond.right, exp.Column):
+                first = self._band_join_column(cond.left, left_df, right_df, right_alias)
+                second = self._band_join_column(cond.right, left_df, right_df, right_alias)
+                if first and second and {first[0], second[0]} == {"left", "right"}:
+                    if first[0] == "right":
+                        first, second, op = second, first, self._BAND_FLIP[op]
+                    if op == "=":
+                        equalities.append((first[1], second[1]))
+                    else:
+                        ranges.append((first[1], op, second[1]))
+                    continue
+            residual.append(cond)
+        if not ranges or (residual and join_kind == "left"):
+            return None
+
+        range_values = []
+        for left_col, op, right_col in ranges:
+            left_values, right_values = _band_values(left_df[left_col]), _band_values(right_df[right_col])
+            if left_values is None or right_values is None or left_values[0] != right_values[0]:
+                return None
+            range_values.append((left_values[1], op, right_values[1]))
+        left_pos, right_pos = _band_join_positions(
+            [left_df[left_col] for left_col, _ in equalities],
+            [right_df[right_col] for _, right_col in equalities],
+            range_values,
+            join_kind,
+        )
 
+        left_part = left_df.take(left_pos).reset_index(drop=True)
+        if (right_pos < 0).any():
+            right_part = right_df.reset_index(drop=True).reindex(right_pos).reset_index(drop=True)
+        else:
+            right_part = right_df.take(right_pos).reset_index(drop=True)
+        result = pd.concat([left_part, right_part], axis=1)
+        for cond in residual:
+            result = self._apply_row_filter(cond, result)
         return result
 
+    def _band_join_column(self, column: exp.Column, left_df, right_df, right_alias) -> tuple[str, str] | None:
+        """区间JOIN条件中的列归属: ("left"|"right", 实际列名); 无法唯一确定时返回 None"""
+        name, table = column.name, column.table
+        if table == right_alias:
+            matches = [col for col in (f"{right_alias}.{name}", name) if col in right_df.columns]
+            return ("right", matches[0]) if matches else None
+        if table:
+            renamed = self._join_column_mapping.get(table, {}).get(name)
+            if renamed in left_df.columns:
+                return "left", renamed
+            return ("left", name) if name in left_df.columns else None
+        in_left, in_right = name in left_df.columns, name in right_df.columns
+        if in_left != in_right:
+            return ("left", name) if in_left else ("right", name)
+        return None
+
     def _parse_join_on_condition(self, on_clause, left_table: str, right_table: str, right_alias: str):
         """
         解析JOIN ON条件
@@ -5345,44 +6870,25 @@ class AdvancedSQLQueryEngine:
         [R53优化] 复合AND条件返回 (left_col, right_col, [extra_conditions])
                   支持等值+非等值混合条件，先做equi-join再filter
         """
+        self._pending_join_filters = None
         # 非等值连接: 返回条件用于cross+filter
-        if isinstance(on_clause, (exp.GT, exp.GTE, exp.LT, exp.LTE, exp.NEQ)):
+        if isinstance(on_clause, (exp.GT, exp.GTE, exp.LT, exp.LTE, exp.NEQ, exp.Between)):
             return (None, None, on_clause)
 
         if isinstance(on_clause, exp.EQ):
             left_expr = on_clause.left
             right_expr = on_clause.right
         elif isinstance(on_clause, exp.And):
-            # [R53] 增强版：从AND中提取所有条件
-            # 分离等值条件和非等值条件
-            eq_conditions = list(on_clause.find_all(exp.EQ))
-            non_eq_conditions = []
-            # 遍历AND的直接子节点（不递归进嵌套AND）
-            for child in (on_clause.left, on_clause.right):
-                if isinstance(child, (exp.GT, exp.GTE, exp.LT, exp.LTE, exp.NEQ)):
-                    non_eq_conditions.append(child)
-                elif isinstance(child, exp.And):
-                    # 嵌套AND：递归提取
-                    for sub_child in child.find_all((exp.GT, exp.GTE, exp.LT, exp.LTE, exp.NEQ)):
-                        non_eq_conditions.append(sub_child)
-
+            # [R53] 增强版：AND 的各个条件中取第一个列 = 列作为 join key, 其余条件(等值/非等值)JOIN后再过滤
+            conjuncts = [cond.unnest() for cond in on_clause.flatten()]
+            eq_conditions = [cond for cond in conjuncts if isinstance(cond, exp.EQ) and isinstance(cond.left, exp.Column) and isinstance(cond.right, exp.Column)]
             if not eq_conditions:
-                # 没有等值条件，全部是非等值
-                if len(non_eq_conditions) == 1:
-                    return (None, None, non_eq_conditions[0])
-                else:
-                    # 多个非等值条件：保留原始AND节点给_apply_row_filter
-                    return (None, None, on_clause)
+                # 没有等值条件：保留原始AND节点给 band join / _apply_row_filter
+                return (None, None, on_clause)
 
-            # 取第一个等值条件作为join key
             left_expr = eq_conditions[0].left
             right_expr = eq_conditions[0].right
-
-            # 如果有额外的非等值条件，暂存到实例变量供后续使用
-            if non_eq_conditions:
-                self._pending_join_filters = non_eq_conditions
-            else:
-                self._pending_join_filters = None
+            self._pending_join_filters = [cond for cond in conjuncts if cond is not eq_conditions[0]]
         else:
             raise ValueError("JOIN ON条件格式不支持,请使用等值连接: ON a.id = b.id")
 
@@ -5419,7 +6925,8 @@ class AdvancedSQLQueryEngine:
         执行LATERAL JOIN: 对左表每行执行关联子查询，合并结果。
 
         LATERAL子查询可以引用左表的列（通过别名.列名）。
-        策略：将子查询中引用左表的列替换为当前行的字面值，逐行执行。
+        策略：等值关联的子查询对内表批量执行一次再哈希连接回左表；
+        其他形式将子查询中引用左表的列替换为当前行的字面值，逐行执行。
 
         Args:
             join: sqlglot Join节点
@@ -5430,32 +6937,98 @@ class AdvancedSQLQueryEngine:
             join_kind: JOIN类型(inner/left/cross)
 
         Returns:
-            pd.DataFrame: JOIN后的结果
+            pd.DataFrame: JOIN后的结果
+        """
+        subquery_expr = lateral_node.this  # exp.Subquery
+        lateral_alias = lateral_node.alias or "_lateral"
+
+        # ON条件
+        on_clause = join.args.get("on")
+        inner_select = subquery_expr.this if isinstance(subquery_expr, exp.Subquery) else subquery_expr
+
+        # 优化：等值关联按连接键批量执行（避免逐行执行子查询）
+        result_df = self._apply_lateral_batched(inner_select, left_df, lateral_alias, join_kind)
+        if result_df is None:
+            result_df = self._apply_lateral_per_row(inner_select, left_df, worksheets_data, left_table, lateral_alias, join_kind)
+
+        if on_clause is not None and not (isinstance(on_clause, exp.Boolean) and on_clause.this):
+            result_df = self._apply_row_filter(on_clause, result_df)
+
+        return result_df
+
+    def _apply_lateral_batched(self, inner_select, left_df, lateral_alias, join_kind):
+        """LATERAL 批量执行: 内层查询去关联后对内表只执行一次, 按连接键哈希连接回左表
+
+        ORDER BY + LIMIT/OFFSET 在内表按连接键分组后取组内行号区间(每组 Top-N);
+        全为聚合的选择列按连接键 GROUP BY, 无匹配的左表行仍得到一行(COUNT 为 0, 其余为 NULL).
+
+        Returns:
+            JOIN 后的 DataFrame, 或 None(非等值关联等形式, 调用方逐行执行)
         """
-        subquery_expr = lateral_node.this  # exp.Subquery
-        lateral_alias = lateral_node.alias or "_lateral"
+        if not getattr(self, "_current_worksheets", None):
+            return None
+        try:
+            plan = self._decorrelate_subquery(inner_select, left_df, mode="lateral")
+            if plan is None:
+                # 非关联子查询: 执行一次, 以常量键与左表做笛卡尔积
+                inner = self._run_nested_subquery(inner_select).assign(_key0=0)
+                keys = [pd.Series(0, index=left_df.index)]
+                limit = offset = None
+            else:
+                outer_keys, key_select = plan
+                limit, offset = (self._lateral_paging_value(inner_select.args.get(arg)) for arg in ("limit", "offset"))
+                keys = [self._broadcast_operand(self._where_operand(key, left_df), left_df) for key in outer_keys]
+                inner = self._run_nested_subquery(key_select)
+            key_cols = [f"_key{i}" for i in range(len(keys))]
+            value_cols = [c for c in inner.columns if c not in key_cols]
+            inner = inner.dropna(subset=key_cols)
+            if limit is not None or offset:
+                rank = inner.groupby(key_cols, sort=False).cumcount()
+                keep = rank >= (offset or 0)
+                if limit is not None:
+                    keep &= rank < (offset or 0) + limit
+                inner = inner[keep.to_numpy()]
+            aggregated = plan is not None and inner_select.expressions[0].find(exp.AggFunc) is not None
+            right = inner.rename(columns={c: f"{lateral_alias}.{c}" for c in value_cols})
+            left = left_df.assign(**{col: key.to_numpy() for col, key in zip(key_cols, keys)})
+            how = "left" if join_kind == "left" or aggregated else "inner"
+            result_df = left.merge(right, how=how, on=key_cols, sort=False).drop(columns=key_cols)
+        except Exception as e:
+            logger.debug("LATERAL 子查询无法批量执行(%s), 回退逐行执行: %s", e, inner_select)
+            return None
 
-        # ON条件
-        on_clause = join.args.get("on")
+        if aggregated:
+            for select_expr, col in zip(inner_select.expressions, value_cols):
+                if isinstance(select_expr.unalias(), exp.Count):
+                    name = f"{lateral_alias}.{col}"
+                    result_df[name] = result_df[name].fillna(0).astype("int64")
+        return result_df
+
+    @staticmethod
+    def _lateral_paging_value(node) -> int | None:
+        """LATERAL 子查询的 LIMIT/OFFSET 取值; 非整数字面量时抛 _NotVectorizable"""
+        if node is None:
+            return None
+        value = node.args.get("expression")
+        if not (isinstance(value, exp.Literal) and value.is_int):
+            raise _NotVectorizable(f"LIMIT/OFFSET 不是整数常量: {node}")
+        return int(value.name)
 
+    def _apply_lateral_per_row(self, inner_select, left_df, worksheets_data, left_table, lateral_alias, join_kind):
+        """LATERAL 逐行执行: 对左表每行替换关联列后执行一次子查询"""
         # 收集子查询中引用左表的列 (如 p.ColName)
         # left_table可能是表名(Players)或别名(p)，需要收集所有可能的引用方式
         left_aliases = {left_table}
         for alias, real_name in self._table_aliases.items():
             if real_name == left_table:
                 left_aliases.add(alias)
-        inner_select = subquery_expr.this if isinstance(subquery_expr, exp.Subquery) else subquery_expr
         # correlated_refs: {(table_alias, col_name)}
         correlated_refs = {}
         for col in inner_select.find_all(exp.Column):
             if col.table in left_aliases and col.name in left_df.columns:
                 correlated_refs[(col.table, col.name)] = True
 
-        # 优化：尝试pandas原生执行（避免逐行parse_one开销）
-        lateral_results = self._apply_lateral_pandas(inner_select, left_df, correlated_refs, worksheets_data, lateral_alias)
-        if lateral_results is None:
-            # 降级：逐行SQL解析执行
-            lateral_results = self._apply_lateral_sql_fallback(inner_select, left_df, correlated_refs, worksheets_data)
+        lateral_results = self._apply_lateral_sql_fallback(inner_select, left_df, correlated_refs, worksheets_data)
 
         # 构建结果
         # 推断LATERAL列名
@@ -5478,7 +7051,8 @@ class AdvancedSQLQueryEngine:
                         col_name = f"{lateral_alias}.{col}"
                         combined[col_name] = lr[col]
                     all_rows.append(combined)
-            elif join_kind in ("left", "cross"):
+            elif join_kind == "left":
+                # CROSS/INNER JOIN LATERAL 子查询无结果时不输出该行
                 combined = dict(row)
                 if sample_lateral is not None:
                     for col in sample_lateral.columns:
@@ -5489,264 +7063,7 @@ class AdvancedSQLQueryEngine:
         if not all_rows:
             return left_df.iloc[0:0]
 
-        result_df = pd.DataFrame(all_rows)
-
-        if on_clause is not None:
-            result_df = self._apply_row_filter(on_clause, result_df)
-
-        return result_df
-
-    def _apply_lateral_pandas(self, inner_select, left_df, correlated_refs, worksheets_data, lateral_alias):
-        """优化LATERAL执行：用pandas原生操作替代逐行SQL解析。
-
-        支持的模式:
-        - SELECT agg_fn(col) FROM table WHERE alias.col = val [ORDER BY ... LIMIT n]
-        - SELECT col FROM table WHERE alias.col = val [ORDER BY ... LIMIT n]
-
-        Returns:
-            list[df|None] 或 None(无法优化时降级)
-        """
-        from_ = inner_select.args.get("from")
-        if not from_:
-            return None
-
-        # 1. 解析FROM表名
-        from_table = from_.this
-        table_name = from_table.name if hasattr(from_table, "name") else str(from_table)
-        # 匹配工作表名（不区分大小写）
-        sheet_name = None
-        for s in worksheets_data:
-            if s == table_name or s.lower() == table_name.lower():
-                sheet_name = s
-                break
-        if sheet_name is None:
-            return None
-
-        right_df = worksheets_data[sheet_name]
-
-        # 2. 解析WHERE中的关联条件: 必须是 alias.col = alias.col 形式
-        where_clause = inner_select.args.get("where")
-        if not where_clause:
-            return None
-
-        # 提取WHERE中的等值关联条件
-        where_expr = where_clause.this
-        lateral_col_map = {}  # {right_col_name: left_col_name}
-        remaining_conditions = []
-
-        if isinstance(where_expr, exp.EQ):
-            left_cond, right_cond = where_expr.this, where_expr.expression
-            if self._extract_correlated_eq(
-                left_cond,
-                right_cond,
-                left_df.columns,
-                correlated_refs,
-                right_df,
-                lateral_col_map,
-            ):
-                pass
-            elif self._extract_correlated_eq(
-                right_cond,
-                left_cond,
-                left_df.columns,
-                correlated_refs,
-                right_df,
-                lateral_col_map,
-            ):
-                pass
-            else:
-                return None  # 无法识别的WHERE条件
-        elif isinstance(where_expr, exp.And):
-            # 处理AND连接的多个条件
-            for child in [where_expr.this, where_expr.expression]:
-                if isinstance(child, exp.EQ):
-                    l, r = child.this, child.expression
-                    if not self._extract_correlated_eq(
-                        l,
-                        r,
-                        left_df.columns,
-                        correlated_refs,
-                        right_df,
-                        lateral_col_map,
-                    ):
-                        if not self._extract_correlated_eq(
-                            r,
-                            l,
-                            left_df.columns,
-                            correlated_refs,
-                            right_df,
-                            lateral_col_map,
-                        ):
-                            return None
-                else:
-                    return None
-        else:
-            return None
-
-        if not lateral_col_map:
-            return None
-
-        # 3. 解析SELECT列和聚合
-        select_exprs = inner_select.args.get("expressions", [])
-        agg_info = self._parse_lateral_select(select_exprs, right_df.columns)
-        if agg_info is None:
-            return None
-
-        # 4. 解析ORDER BY + LIMIT
-        order_col = None
-        order_desc = False
-        limit_n = None
-
-        order_by = inner_select.args.get("order")
-        if order_by:
-            for ordered in order_by.expressions:
-                order_col_expr = ordered.this
-                if hasattr(order_col_expr, "name"):
-                    order_col = order_col_expr.name
-                    desc_str = str(ordered.args.get("desc", "")).lower()
-                    order_desc = desc_str == "true" or ordered.desc
-
-        limit_expr = inner_select.args.get("limit")
-        if limit_expr:
-            try:
-                limit_n = int(limit_expr.this.name if hasattr(limit_expr.this, "name") else str(limit_expr.this))
-            except (ValueError, AttributeError):
-                pass
-
-        # 5. 批量执行：预分组右表数据
-        # lateral_col_map: {right_col: left_col}
-        # 按 right_df 的关联列分组
-        right_group_cols = list(lateral_col_map.keys())
-        left_group_cols = list(lateral_col_map.values())
-
-        right_grouped = right_df.groupby(right_group_cols, observed=False)
-
-        # 6. 对每个left行查找对应的right分组并计算结果
-        results = []
-        for idx, row in left_df.iterrows():
-            # 构建查找key
-            try:
-                key = tuple(row[c] for c in left_group_cols)
-                if len(key) == 1:
-                    key = key[0]
-                group = right_grouped.get_group(key)
-            except (KeyError, ValueError):
-                results.append(None)
-                continue
-
-            # 应用ORDER BY
-            if order_col and order_col in group.columns:
-                group = group.sort_values(order_col, ascending=not order_desc)
-            # 应用LIMIT
-            if limit_n is not None:
-                group = group.head(limit_n)
-
-            if agg_info["type"] == "raw":
-                # SELECT col [AS alias] FROM ... (无聚合)
-                col_pairs = agg_info["columns"]
-                source_cols = [c[0] for c in col_pairs]
-                alias_map = {c[0]: c[1] for c in col_pairs if c[0] != c[1]}
-                result_df = group[source_cols].reset_index(drop=True)
-                if alias_map:
-                    result_df = result_df.rename(columns=alias_map)
-            elif agg_info["type"] == "agg":
-                # SELECT agg_fn(col) FROM ...
-                row_result = {}
-                for alias, (fn, col) in agg_info["aggs"].items():
-                    if fn == "max":
-                        row_result[alias] = group[col].max()
-                    elif fn == "min":
-                        row_result[alias] = group[col].min()
-                    elif fn == "sum":
-                        row_result[alias] = group[col].sum()
-                    elif fn == "avg":
-                        row_result[alias] = group[col].mean()
-                    elif fn == "count":
-                        row_result[alias] = group[col].count()
-                    else:
-                        return None  # 不支持的聚合函数
-                result_df = pd.DataFrame([row_result])
-            else:
-                return None
-
-            results.append(result_df if len(result_df) > 0 else None)
-
-        return results
-
-    def _extract_correlated_eq(
-        self,
-        left_cond,
-        right_cond,
-        left_cols,
-        correlated_refs,
-        right_df,
-        lateral_col_map,
-    ):
-        """尝试从等值条件中提取关联映射。
-
-        检查 left_cond 是否是关联引用(alias.col), right_cond 是否是右表列。
-        如果匹配，将映射添加到 lateral_col_map。
-
-        Returns:
-            bool: 是否成功提取
-        """
-        if not isinstance(left_cond, exp.Column) or not isinstance(right_cond, exp.Column):
-            return False
-
-        # left_cond 应该是关联引用 (alias.col where alias refers to left table)
-        if left_cond.table and (left_cond.table, left_cond.name) in correlated_refs:
-            # right_cond 应该是右表列
-            if right_cond.name in right_df.columns:
-                lateral_col_map[right_cond.name] = left_cond.name
-                return True
-        return False
-
-    def _parse_lateral_select(self, select_exprs, right_cols):
-        """解析LATERAL子查询的SELECT部分。
-
-        Returns:
-            dict: {'type': 'raw'|'agg', 'columns': [(col_name, alias)], 'aggs': {alias: (fn, col)}}
-            或 None(无法解析)
-        """
-        if not select_exprs:
-            return None
-
-        has_agg = False
-        raw_cols = []  # [(source_col_name, output_alias)]
-        aggs = {}
-
-        for expr in select_exprs:
-            # 处理 AS 别名: Alias(this=Column('Score'), alias='top')
-            inner_expr = expr.this if isinstance(expr, exp.Alias) else expr
-            alias = expr.alias if isinstance(expr, exp.Alias) else None
-
-            # 检查是否是聚合函数
-            if isinstance(inner_expr, (exp.Max, exp.Min, exp.Sum, exp.Avg, exp.Count)):
-                agg_fn = type(inner_expr).__name__.lower()
-                agg_inner = inner_expr.this
-                agg_col = agg_inner.name if hasattr(agg_inner, "name") else None
-                alias = alias or f"{agg_fn}({agg_col})"
-                if agg_col:
-                    aggs[alias] = (agg_fn, agg_col)
-                    has_agg = True
-                else:
-                    return None
-            elif isinstance(inner_expr, exp.Column):
-                col_name = inner_expr.name
-                if col_name in right_cols:
-                    raw_cols.append((col_name, alias or col_name))
-                else:
-                    return None
-            elif isinstance(inner_expr, exp.Star):
-                for c in right_cols:
-                    raw_cols.append((c, c))
-            else:
-                return None  # 不支持的表达式
-
-        if has_agg:
-            return {"type": "agg", "aggs": aggs}
-        else:
-            return {"type": "raw", "columns": raw_cols}
+        return pd.DataFrame(all_rows)
 
     def _apply_lateral_sql_fallback(self, inner_select, left_df, correlated_refs, worksheets_data):
         """LATERAL降级路径：逐行SQL解析执行（慢但通用）"""
@@ -5809,8 +7126,11 @@ class AdvancedSQLQueryEngine:
                 df.rename(columns={temp_col: alias_name}, inplace=True)
                 getattr(self, "_pending_tmp_cols", []).append(alias_name)
 
-    def _apply_where_clause(self, parsed_sql: exp.Expression, df) -> pd.DataFrame:
-        """应用WHERE条件"""
+    def _apply_where_clause(self, parsed_sql: exp.Expression, df, index_source: tuple[str, pd.DataFrame] | None = None) -> pd.DataFrame:
+        """应用WHERE条件
+
+        index_source 为 (表名, 缓存中的 sheet) 且 df 与其逐行对齐时, 等值/IN 条件先经列哈希索引缩小到候选行.
+        """
         where_clause = parsed_sql.args.get("where")
         if not where_clause:
             return df
@@ -5819,12 +7139,37 @@ class AdvancedSQLQueryEngine:
         # SQLite 支持此行为，ExcelMCP 对齐
         self._pending_tmp_cols = []
         self._materialize_select_aliases_for_where(parsed_sql, df)
+        where_expr = where_clause.this
+        if index_source is not None and not self._pending_tmp_cols:
+            df = self._index_candidates(where_expr, df, *index_source)
+
+        # 优先把条件树直接编译为整列布尔掩码; 含 EXISTS/ALL/ANY 等结构时依次回退到 df.query 和逐行过滤
+        try:
+            mask = self._where_mask(where_expr, df)
+        except _ScalarSubqueryRowsError:
+            raise
+        except _NotVectorizable as e:
+            logger.debug("WHERE条件无法向量化(%s),回退: %s", e, where_expr)
+            mask = None
+        except Exception as e:
+            logger.debug("WHERE条件向量化求值失败(%s),回退: %s", e, where_expr)
+            mask = None
+        if mask is not None:
+            self._record_where_path("vectorized")
+            result_df = df[mask.to_numpy(dtype=bool, na_value=False)]
+            for tc in self._pending_tmp_cols:
+                if tc in df.columns:
+                    del df[tc]
+                if tc in result_df.columns:
+                    del result_df[tc]
+            self._pending_tmp_cols = []
+            return result_df
 
         # 如果WHERE包含复杂表达式(pandas query不支持的类型),直接使用逐行过滤
-        where_expr = where_clause.this
         has_complex = any(where_expr.find(t) is not None for t in self._COMPLEX_EXPR_TYPES)
 
         if has_complex:
+            self._record_where_path("row")
             return self._apply_row_filter(where_expr, df)
 
         # 将SQLGlot表达式转换为pandas查询条件
@@ -5843,16 +7188,25 @@ class AdvancedSQLQueryEngine:
                     if tc in result_df.columns:
                         del result_df[tc]
                 self._pending_tmp_cols = []
-                return result_df.copy()
+                self._record_where_path("query")
+                return _frame_view(result_df)
             except Exception:
                 # 如果查询失败,尝试逐行过滤
                 # 同时清理可能已添加的临时列
                 self._cleanup_tmp_columns(df)
+                self._record_where_path("row")
                 return self._apply_row_filter(where_clause.this, df)
 
         logger.warning("WHERE条件转换为pandas表达式失败,回退到逐行过滤: %s", where_expr)
+        self._record_where_path("row")
         return self._apply_row_filter(where_expr, df)
 
+    def _record_where_path(self, path: str):
+        """记录本次WHERE求值所走的路径(vectorized/query/row), 汇总到 query_info["where_path"]"""
+        paths = getattr(self, "_where_paths", None)
+        if paths is not None:
+            paths.append(path)
+
     def _cleanup_tmp_columns(self, df):
         """清理WHERE处理过程中添加的临时列 (R52 refactor)"""
         tmp_cols = getattr(self, "_pending_tmp_cols", [])
@@ -5861,6 +7215,457 @@ class AdvancedSQLQueryEngine:
                 del df[tc]
         self._pending_tmp_cols = []
 
+    # ===== WHERE 向量化编译 =====
+    # 条件树直接编译为整列三值布尔数组(pandas 可空布尔: True/False/NA=UNKNOWN),
+    # 不再拼接 df.query 字符串, 也不经过逐行 apply. 语义:
+    # - 比较/LIKE/REGEXP/IN/BETWEEN 任一操作数为 NULL 时结果为 UNKNOWN, NOT UNKNOWN 仍为 UNKNOWN, WHERE 只保留 TRUE
+    # - IS NULL 同时匹配 NaN 和空字符串(Excel 空单元格), LIKE/REGEXP 不区分大小写
+    # - 混合类型列无法整列比较时逐元素比较, 大小比较先按数值比较(同逐行过滤)
+    _WHERE_CMP_OPS = {
+        exp.EQ: operator.eq,
+        exp.NEQ: operator.ne,
+        exp.GT: operator.gt,
+        exp.GTE: operator.ge,
+        exp.LT: operator.lt,
+        exp.LTE: operator.le,
+    }
+
+    def _where_mask(self, condition: exp.Expression, df) -> pd.arrays.BooleanArray:
+        """把WHERE条件编译为与 df 行对齐的三值布尔数组, 无法向量化时抛 _NotVectorizable"""
+        n = len(df)
+        if isinstance(condition, exp.Paren):
+            return self._where_mask(condition.this, df)
+        if isinstance(condition, exp.And):
+            return self._where_mask(condition.left, df) & self._where_mask(condition.right, df)
+        if isinstance(condition, exp.Or):
+            return self._where_mask(condition.left, df) | self._where_mask(condition.right, df)
+        if isinstance(condition, exp.Not):
+            return ~self._where_mask(condition.this, df)
+        if isinstance(condition, exp.Boolean):
+            return _kleene(np.full(n, bool(condition.this)))
+
+        op_type = type(condition)
+        if op_type in self._WHERE_CMP_OPS:
+            if isinstance(condition.left, (exp.All, exp.Any)) or isinstance(condition.right, (exp.All, exp.Any)):
+                raise _NotVectorizable("ALL/ANY 子查询")
+            return self._compare_operands(op_type, self._where_operand(condition.left, df), self._where_operand(condition.right, df), df)
+
+        if isinstance(condition, exp.Is):
+            if not isinstance(condition.expression, exp.Null):
+                raise _NotVectorizable("IS TRUE/FALSE")
+            value = self._where_operand(condition.this, df)
+            if isinstance(value, pd.Series):
+                return _kleene((value.isna() | value.eq("")).to_numpy(dtype=bool, na_value=True))
+            return _kleene(np.full(n, value is None or value == ""))
+
+        if isinstance(condition, exp.Between):
+            value = self._where_operand(condition.this, df)
+            low = self._where_operand(condition.args["low"], df)
+            high = self._where_operand(condition.args["high"], df)
+            return self._compare_operands(exp.GTE, value, low, df) & self._compare_operands(exp.LTE, value, high, df)
+
+        if isinstance(condition, exp.In):
+            return self._where_in_mask(condition, df)
+
+        if isinstance(condition, (exp.Like, exp.ILike)):
+            pattern = self._where_operand(condition.expression, df)
+            if isinstance(pattern, pd.Series):
+                raise _NotVectorizable("LIKE 模式来自列")
+            value = self._where_operand(condition.this, df)
+            if pattern is None:
+                return _kleene(np.zeros(n, dtype=bool), np.ones(n, dtype=bool))
+            return self._match_strings(value, re.compile(self._like_to_regex(pattern), re.IGNORECASE | re.DOTALL), df, full=True)
+
+        if isinstance(condition, exp.RegexpLike):
+            pattern = self._where_operand(condition.expression, df)
+            if isinstance(pattern, pd.Series):
+                raise _NotVectorizable("REGEXP 模式来自列")
+            value = self._where_operand(condition.this, df)
+            if pattern is None:
+                return _kleene(np.zeros(n, dtype=bool), np.ones(n, dtype=bool))
+            return self._match_strings(value, self._compile_regexp(pattern), df, full=False)
+
+        if isinstance(condition, exp.Exists):
+            return self._where_exists_mask(condition, df)
+
+        raise _NotVectorizable(type(condition).__name__)
+
+    def _where_operand(self, expr: exp.Expression, df):
+        """求WHERE操作数: 返回与 df 行对齐的 Series, 或常量/非关联标量子查询得到的标量(None 表示 NULL)"""
+        if isinstance(expr, exp.Paren):
+            return self._where_operand(expr.this, df)
+        if isinstance(expr, exp.Column):
+            return df[self._expression_to_column_reference(expr, df)[1:-1]]
+        if isinstance(expr, exp.Literal):
+            return self._parse_literal_value(expr)
+        if isinstance(expr, exp.Null):
+            return None
+        if isinstance(expr, exp.Boolean):
+            # 与 Excel 整数存储比较兼容: TRUE/FALSE → 1/0
+            return int(expr.this)
+        if isinstance(expr, exp.Neg):
+            inner = self._where_operand(expr.this, df)
+            if isinstance(inner, pd.Series):
+                return -pd.to_numeric(inner, errors="coerce")
+            return None if inner is None else -inner
+        if isinstance(expr, exp.Subquery):
+            return self._scalar_subquery_operand(expr, df)
+        if isinstance(expr, exp.Case):
+            return self._where_case(expr, df)
+        if isinstance(expr, exp.Coalesce):
+            # 与 _evaluate_coalesce_vectorized 一致: 空字符串视为 NULL
+            result = None
+            for arg in [expr.this, *expr.expressions]:
+                value = self._broadcast_operand(self._where_operand(arg, df), df).astype(object)
+                value = value.mask(value.eq(""))
+                result = value if result is None else result.combine_first(value)
+            return result.infer_objects()
+        if isinstance(expr, exp.Nullif):
+            value = self._broadcast_operand(self._where_operand(expr.this, df), df)
+            equal = self._compare_operands(exp.EQ, value, self._where_operand(expr.expression, df), df)
+            return value.mask(equal.to_numpy(dtype=bool, na_value=False))
+        if isinstance(expr, exp.Cast):
+            # 内部表达式按WHERE规则解析列名, 类型转换复用 SELECT 的 CAST 实现
+            inner = pd.DataFrame({"_cast_value": self._broadcast_operand(self._where_operand(expr.this, df), df)}, index=df.index)
+            cast = exp.Cast(this=exp.column("_cast_value"), to=expr.args.get("to"))
+            return self._align_to_frame(self._evaluate_cast_expression(cast, inner), df)
+        if expr.find(exp.Subquery, exp.Select, exp.AggFunc, exp.Window, exp.Exists) is not None:
+            raise _NotVectorizable(f"{type(expr).__name__} 内含子查询/聚合/窗口函数")
+
+        # 函数/算术表达式: 先把列引用替换为实际列名(表别名、JOIN 后缀、大小写), 再交给现有向量化求值
+        resolved = expr.transform(lambda node: exp.column(self._expression_to_column_reference(node, df)[1:-1], quoted=True) if isinstance(node, exp.Column) else node)
+        if isinstance(resolved, tuple(self._MATH_BINARY_OPS)):
+            value = self._evaluate_math_expression(resolved, df)
+        else:
+            value = self._expr_to_series(resolved, df)
+        return self._align_to_frame(value, df)
+
+    @staticmethod
+    def _broadcast_operand(value, df) -> pd.Series:
+        """标量操作数展开为与 df 行对齐的 Series"""
+        if isinstance(value, pd.Series):
+            return value
+        return pd.Series([value] * len(df), index=df.index, dtype=object)
+
+    @staticmethod
+    def _align_to_frame(value, df):
+        """部分求值函数返回默认 RangeIndex 的 Series, 按位置对齐到 df 的索引"""
+        if isinstance(value, pd.Series) and not value.index.equals(df.index):
+            if len(value) != len(df):
+                raise _NotVectorizable("表达式结果行数与数据不一致")
+            return value.set_axis(df.index)
+        if isinstance(value, (np.generic,)):
+            return value.item()
+        return value
+
+    @staticmethod
+    def _operand_isna(value, n: int) -> np.ndarray:
+        if isinstance(value, pd.Series):
+            return value.isna().to_numpy(dtype=bool)
+        return np.full(n, value is None or (isinstance(value, float) and math.isnan(value)))
+
+    def _compare_operands(self, op_type, left, right, df) -> pd.arrays.BooleanArray:
+        """整列比较两个操作数; 任一侧为 NULL 的行为 UNKNOWN"""
+        n = len(df)
+        unknown = self._operand_isna(left, n) | self._operand_isna(right, n)
+        if unknown.all():
+            return _kleene(np.zeros(n, dtype=bool), unknown)
+        op = self._WHERE_CMP_OPS[op_type]
+        if not isinstance(left, pd.Series) and not isinstance(right, pd.Series):
+            try:
+                result = bool(op(left, right))
+            except (TypeError, ValueError):
+                result = bool(self._COMPARISON_OPS[op_type](left, right))
+            return _kleene(np.full(n, result), unknown)
+        try:
+            values = op(left, right)
+            values = np.asarray(values.to_numpy(dtype=bool, na_value=False) if isinstance(values, pd.Series) else values, dtype=bool)
+        except (TypeError, ValueError):
+            # 混合类型列(如数字和文本混存)无法整列比较: 逐元素比较, 大小比较按数值(同逐行过滤)
+            pair_op = self._COMPARISON_OPS[op_type]
+            left_values = self._broadcast_operand(left, df).to_numpy(dtype=object)
+            right_values = self._broadcast_operand(right, df).to_numpy(dtype=object)
+            values = np.zeros(n, dtype=bool)
+            for i in np.flatnonzero(~unknown):
+                try:
+                    values[i] = bool(pair_op(left_values[i], right_values[i]))
+                except (TypeError, ValueError):
+                    pass
+        return _kleene(values, unknown)
+
+    def _where_in_mask(self, condition: exp.In, df) -> pd.arrays.BooleanArray:
+        """IN (值列表 / 子查询): 左侧为 NULL 或未命中且候选含 NULL 时为 UNKNOWN"""
+        n = len(df)
+        value = self._where_operand(condition.this, df)
+        subquery = condition.args.get("query")
+        if subquery is None and condition.expressions and isinstance(condition.expressions[0], (exp.Subquery, exp.Select)):
+            subquery = condition.expressions[0]
+        if subquery is not None:
+            if not getattr(self, "_current_worksheets", None):
+                raise _NotVectorizable("缺少子查询上下文")
+            select = subquery.this if isinstance(subquery, exp.Subquery) else subquery
+            plan = self._decorrelate_subquery(select, df, mode="in")
+            if plan is not None:
+                return self._correlated_in_mask(value, *plan, df)
+            sub_result = self._run_nested_subquery(subquery)
+            candidates = sub_result.iloc[:, 0] if len(sub_result.columns) > 0 else pd.Series([], dtype=object)
+        else:
+            operands = [self._where_operand(e, df) for e in condition.expressions]
+            if any(isinstance(o, pd.Series) for o in operands):
+                # 列表中含列/表达式: 逐项等值比较后按三值逻辑 OR
+                return functools.reduce(operator.or_, (self._compare_operands(exp.EQ, value, o, df) for o in operands))
+            candidates = pd.Series(operands, dtype=object)
+
+        has_null = bool(candidates.isna().any())
+        members = candidates.dropna().unique()
+        if len(members) == 0 and not has_null:
+            # 空集合: IN 恒为 FALSE(左侧为 NULL 也一样)
+            return _kleene(np.zeros(n, dtype=bool))
+        matched = self._broadcast_operand(value, df).isin(members).to_numpy(dtype=bool)
+        unknown = self._operand_isna(value, n) | (~matched & has_null)
+        return _kleene(matched, unknown)
+
+    def _match_strings(self, value, pattern: re.Pattern, df, full: bool) -> pd.arrays.BooleanArray:
+        """LIKE(整串匹配)/REGEXP(子串搜索): 非字符串值按 str() 参与匹配, NULL 为 UNKNOWN"""
+        series = self._broadcast_operand(value, df)
+        unknown = series.isna().to_numpy(dtype=bool)
+        text = series.astype(str)
+        matched = text.str.fullmatch(pattern, na=False) if full else text.str.contains(pattern, regex=True, na=False)
+        return _kleene(matched.to_numpy(dtype=bool), unknown)
+
+    @staticmethod
+    def _compile_regexp(pattern) -> re.Pattern:
+        """REGEXP/RLIKE 模式: 与 MySQL 默认排序规则一致不区分大小写; 限制长度防止 ReDoS"""
+        pattern = str(pattern)
+        if len(pattern) > 256:
+            raise ValueError(f"REGEXP 模式过长({len(pattern)}字符), 最大支持256字符")
+        try:
+            return re.compile(pattern, re.IGNORECASE)
+        except re.error as e:
+            raise ValueError(f"REGEXP 模式无效: {pattern} ({e})")
+
+    def _where_case(self, case_expr: exp.Case, df) -> pd.Series:
+        """CASE WHEN 整列求值: 从最后一个分支向前覆盖, 每行取第一个条件为 TRUE 的分支"""
+        subject = case_expr.args.get("this")
+        base = self._where_operand(subject, df) if subject is not None else None
+        default = case_expr.args.get("default")
+        result = self._broadcast_operand(self._where_operand(default, df) if default is not None else None, df).astype(object)
+        for if_clause in reversed(case_expr.args.get("ifs", [])):
+            if subject is not None:
+                matched = self._compare_operands(exp.EQ, base, self._where_operand(if_clause.this, df), df)
+            else:
+                matched = self._where_mask(if_clause.this, df)
+            then = self._broadcast_operand(self._where_operand(if_clause.args.get("true"), df), df).astype(object)
+            result = then.where(matched.to_numpy(dtype=bool, na_value=False), result)
+        return result.infer_objects()
+
+    def _scalar_subquery_operand(self, subquery: exp.Expression, df):
+        """标量子查询: 非关联的只执行一次返回标量; 等值关联的去关联为按连接键分组的一次内表查询 + 哈希左连接, 返回与 df 对齐的 Series
+
+        无匹配行时为 NULL(顶层 COUNT 为 0); 非聚合子查询对某外层行匹配多行时抛 _ScalarSubqueryRowsError.
+        其他关联形式抛 _NotVectorizable.
+        """
+        if not getattr(self, "_current_worksheets", None):
+            raise _NotVectorizable("缺少子查询上下文")
+        select = subquery.this if isinstance(subquery, exp.Subquery) else subquery
+        plan = self._decorrelate_subquery(select, df, mode="scalar")
+        if plan is None:
+            if self._subquery_is_correlated(select):
+                raise _NotVectorizable("关联标量子查询")
+            sub_result = self._run_nested_subquery(subquery)
+            if len(sub_result) == 0 or len(sub_result.columns) == 0:
+                return None
+            value = sub_result.iloc[0, 0]
+            if pd.isna(value):
+                return None
+            return value.item() if isinstance(value, np.generic) else value
+
+        outer_keys, key_select = plan
+        keys = [self._broadcast_operand(self._where_operand(key, df), df) for key in outer_keys]
+        inner = self._run_nested_subquery(key_select)
+        inner = inner[inner.iloc[:, :-1].notna().all(axis=1).to_numpy()]
+        values = inner.iloc[:, -1].reset_index(drop=True)
+        if len(keys) == 1:
+            inner_index, outer_index = pd.Index(inner.iloc[:, 0]), pd.Index(keys[0])
+        else:
+            inner_index, outer_index = pd.MultiIndex.from_frame(inner.iloc[:, :-1]), pd.MultiIndex.from_arrays(keys)
+        duplicated = inner_index.duplicated()
+        if duplicated.any():
+            if outer_index.isin(inner_index[duplicated]).any():
+                raise _ScalarSubqueryRowsError(f"标量子查询返回了多行数据,无法作为标量值使用: {subquery}")
+            inner_index, values = inner_index[~duplicated], values[~duplicated].reset_index(drop=True)
+        positions = inner_index.get_indexer(outer_index)
+        outer_null = np.zeros(len(df), dtype=bool)
+        for key in keys:
+            outer_null |= key.isna().to_numpy(dtype=bool)
+        positions[outer_null] = -1
+        result = values.reindex(positions).set_axis(df.index)
+        if isinstance(select.expressions[0].unalias(), exp.Count):
+            return result.fillna(0).astype("int64")
+        return result
+
+    @staticmethod
+    def _subquery_is_correlated(subquery: exp.Expression) -> bool:
+        """子查询是否引用外层表: 存在列限定符不是子查询内任何表别名(无别名时为表名)/派生表别名"""
+        inner = {table.alias or table.name for table in subquery.find_all(exp.Table)}
+        inner |= {sub.alias for sub in subquery.find_all(exp.Subquery) if sub.alias}
+        return any(col.table and col.table not in inner for col in subquery.find_all(exp.Column))
+
+    # 在外层查询求值期间执行子查询会改写这些按查询状态, 执行后需恢复
+    _NESTED_SUBQUERY_STATE = ("_table_aliases", "_join_column_mapping", "_current_worksheets", "_worksheets_data", "_df_before_where")
+
+    def _run_nested_subquery(self, subquery: exp.Expression) -> pd.DataFrame:
+        """执行外层查询 WHERE/SELECT 中的子查询, 前后保存/恢复外层查询的表别名、工作表等上下文"""
+        missing = object()
+        saved = {name: getattr(self, name, missing) for name in self._NESTED_SUBQUERY_STATE}
+        worksheets = self._current_worksheets
+        try:
+            return self._execute_subquery(subquery, worksheets)
+        finally:
+            for name, value in saved.items():
+                if value is missing:
+                    if hasattr(self, name):
+                        delattr(self, name)
+                else:
+                    setattr(self, name, value)
+
+    def _where_exists_mask(self, condition: exp.Exists, df) -> pd.arrays.BooleanArray:
+        """EXISTS: 非关联子查询只执行一次; 等值关联子查询改写为对内表的一次哈希半连接(NOT EXISTS 取反即反连接)"""
+        if not getattr(self, "_current_worksheets", None):
+            raise _NotVectorizable("缺少子查询上下文")
+        select = condition.this.this if isinstance(condition.this, exp.Subquery) else condition.this
+        plan = self._decorrelate_subquery(select, df)
+        if plan is None:
+            return _kleene(np.full(len(df), len(self._run_nested_subquery(select)) > 0))
+        outer_keys, key_select = plan
+        return _kleene(self._semi_join_mask([self._where_operand(key, df) for key in outer_keys], self._run_nested_subquery(key_select), df))
+
+    def _correlated_in_mask(self, value, outer_keys: list, key_select: exp.Select, df) -> pd.arrays.BooleanArray:
+        """关联 IN 子查询: 键查询最后一列为子查询的选择列, 按关联键分组后做半连接
+
+        三值语义与 IN 列表一致: 分组为空时为 FALSE; 未命中且(左侧为 NULL 或分组含 NULL)时为 UNKNOWN.
+        """
+        keys = [self._where_operand(key, df) for key in outer_keys]
+        inner = self._run_nested_subquery(key_select)
+        corr, selected = inner.iloc[:, :-1], inner.iloc[:, -1]
+        in_group = self._semi_join_mask(keys, corr, df)
+        matched = self._semi_join_mask([*keys, value], inner[selected.notna().to_numpy()], df)
+        group_has_null = self._semi_join_mask(keys, corr[selected.isna().to_numpy()], df)
+        unknown = in_group & ~matched & (self._operand_isna(value, len(df)) | group_has_null)
+        return _kleene(matched, unknown)
+
+    def _semi_join_mask(self, outer_keys: list, inner_keys: pd.DataFrame, df) -> np.ndarray:
+        """哈希半连接: 外层每行的键组合是否出现在内表键集合中; 任一键为 NULL 的行不匹配"""
+        outer_keys = [self._broadcast_operand(key, df) for key in outer_keys]
+        inner_keys = inner_keys.dropna()
+        outer_null = np.zeros(len(df), dtype=bool)
+        for key in outer_keys:
+            outer_null |= key.isna().to_numpy(dtype=bool)
+        if inner_keys.empty:
+            return np.zeros(len(df), dtype=bool)
+        if len(outer_keys) == 1:
+            matched = outer_keys[0].isin(inner_keys.iloc[:, 0].unique()).to_numpy(dtype=bool)
+        else:
+            matched = pd.MultiIndex.from_arrays(outer_keys).isin(pd.MultiIndex.from_frame(inner_keys.drop_duplicates()))
+        return matched & ~outer_null
+
+    def _decorrelate_subquery(self, select: exp.Expression, df, mode: str = "exists") -> tuple[list, exp.Select] | None:
+        """把等值关联子查询拆成 (外层键表达式列表, 内表键查询); 非关联子查询返回 None
+
+        内层 WHERE 按 AND 拆分: 只引用内表的条件留在键查询中(整体只执行一次), 形如
+        内表表达式 = 外层表达式 的条件成为连接键; 外层引用出现在其他位置时抛 _NotVectorizable, 回退逐行求值.
+        mode: "exists" 键查询只含连接键; "in" 末尾追加子查询的选择列;
+        "scalar" 末尾追加标量值列, 选择列为聚合时按连接键 GROUP BY(每组一行);
+        "lateral" 连接键后保留全部选择列(及 ORDER BY, LIMIT/OFFSET 由调用方按组应用), 全为聚合时按连接键 GROUP BY.
+        """
+        from_node = select.args.get("from") if isinstance(select, exp.Select) else None
+        if from_node is None or not isinstance(from_node.this, exp.Table) or select.args.get("joins"):
+            if self._subquery_is_correlated(select):
+                raise _NotVectorizable("关联子查询含 JOIN/派生表/集合运算")
+            return None
+        table = from_node.this
+        if table.name not in self._current_worksheets:
+            raise _NotVectorizable(f"子查询表 '{table.name}' 不在当前工作表中")
+        inner_df = self._current_worksheets[table.name]
+        inner_ids = {table.alias or table.name}
+
+        def is_outer(col: exp.Column) -> bool:
+            """列是否引用外层查询(限定名不属于内表, 或未限定且只在外层存在)"""
+            if col.table:
+                return col.table not in inner_ids
+            if self._find_column_name(col.name, inner_df):
+                return False
+            try:
+                self._expression_to_column_reference(col, df)
+                return True
+            except ValueError:
+                return False
+
+        def refs(node: exp.Expression) -> tuple[bool, bool]:
+            """(是否引用内表列, 是否引用外层列)"""
+            flags = [is_outer(col) for col in node.find_all(exp.Column)]
+            return (not all(flags), any(flags))
+
+        if not refs(select)[1]:
+            return None
+        paging = ("limit", "offset") if mode != "lateral" else ()
+        if any(select.args.get(arg) for arg in ("group", "having", "with", "with_", "laterals", *paging)):
+            raise _NotVectorizable("关联子查询含 GROUP BY/HAVING/LIMIT/CTE")
+        if mode in ("in", "scalar") and len(select.expressions) != 1:
+            raise _NotVectorizable("IN/标量子查询须只有一列")
+        aggregated = mode in ("scalar", "lateral") and any(e.find(exp.AggFunc) is not None for e in select.expressions)
+        if aggregated:
+            for e in select.expressions:
+                if e.find(exp.AggFunc) is None:
+                    raise _NotVectorizable("关联子查询的选择列混合聚合与非聚合表达式")
+                if e.unalias().find(exp.Count) not in (None, e.unalias()):
+                    # 无匹配行时 COUNT 为 0 而非 NULL, 只支持 COUNT 位于顶层
+                    raise _NotVectorizable("COUNT 嵌套在标量子查询表达式中")
+            if any(select.args.get(arg) for arg in ("order", "limit", "offset")):
+                raise _NotVectorizable("聚合 LATERAL 子查询含 ORDER BY/LIMIT")
+        if select.args.get("distinct") and mode in ("scalar", "lateral"):
+            raise _NotVectorizable("关联标量/LATERAL 子查询含 DISTINCT")
+        for e in select.expressions:
+            if e.find(exp.Window) is not None or refs(e)[1] or (e.find(exp.AggFunc) is not None and not aggregated):
+                raise _NotVectorizable("关联子查询的选择列含窗口函数/聚合或外层引用")
+        where = select.args.get("where")
+        if where is None or where.find(exp.Subquery, exp.Exists) is not None:
+            raise _NotVectorizable("关联条件不在 WHERE 中或含嵌套子查询")
+
+        outer_keys, inner_keys, local = [], [], []
+        for conjunct in where.this.flatten() if isinstance(where.this, exp.And) else [where.this]:
+            conjunct = conjunct.unnest()
+            uses_inner, uses_outer = refs(conjunct)
+            if not uses_outer:
+                local.append(conjunct)
+                continue
+            if not isinstance(conjunct, exp.EQ):
+                raise _NotVectorizable(f"非等值关联条件: {conjunct}")
+            left, right = refs(conjunct.left), refs(conjunct.right)
+            if left == (True, False) and right == (False, True):
+                inner_side, outer_side = conjunct.left, conjunct.right
+            elif left == (False, True) and right == (True, False):
+                inner_side, outer_side = conjunct.right, conjunct.left
+            else:
+                raise _NotVectorizable(f"关联条件两侧须分别只引用内表和外层: {conjunct}")
+            outer_keys.append(outer_side)
+            inner_keys.append(inner_side)
+
+        key_columns = [exp.alias_(key.unalias().copy(), f"_key{i}") for i, key in enumerate(inner_keys)]
+        if mode == "lateral":
+            # 选择列保持原输出列名(未起别名的列引用去掉表限定)
+            key_columns += [exp.alias_(e.copy(), e.name) if isinstance(e, exp.Column) else e.copy() for e in select.expressions]
+        elif mode != "exists":
+            key_columns.append(exp.alias_(select.expressions[0].unalias().copy(), f"_key{len(inner_keys)}"))
+        key_select = exp.select(*key_columns).from_(table.copy())
+        if local:
+            key_select = key_select.where(exp.and_(*(c.copy() for c in local)))
+        if aggregated:
+            key_select = key_select.group_by(*(key.copy() for key in inner_keys))
+        if mode == "lateral" and select.args.get("order"):
+            key_select.set("order", select.args["order"].copy())
+        return outer_keys, key_select
+
     @staticmethod
     def _like_to_regex(value_str: str) -> str:
         """将SQL LIKE模式转换为pandas regex模式(%->.*  _->.)
@@ -6449,6 +8254,12 @@ class AdvancedSQLQueryEngine:
                 regex = self._like_to_regex(pattern)
                 return bool(re.match(regex, val, re.IGNORECASE))
 
+            elif isinstance(condition, exp.RegexpLike):
+                val = self._get_row_value(condition.this, row)
+                if val is None or pd.isna(val):
+                    return False
+                return bool(self._compile_regexp(self._get_row_value(condition.expression, row)).search(str(val)))
+
             elif isinstance(condition, exp.In):
                 val = self._get_row_value(condition.this, row)
                 # Fix(R13): 支持 IN (SELECT ...) 子查询形式
@@ -7020,12 +8831,13 @@ class AdvancedSQLQueryEngine:
                     df[alias_name] = self._evaluate_coalesce_vectorized(expr, df)
             elif isinstance(expr, exp.Subquery) and alias_name not in df.columns:
                 try:
-                    sub_result = self._execute_subquery(expr, self._current_worksheets)
-                    if len(sub_result) > 0 and len(sub_result.columns) > 0:
-                        scalar_val = sub_result.iloc[0, 0]
-                        df[alias_name] = pd.Series([scalar_val] * len(df), index=df.index)
+                    scalar_val = self._scalar_subquery_operand(expr, df)
+                    if isinstance(scalar_val, pd.Series):
+                        df[alias_name] = scalar_val
                     else:
-                        df[alias_name] = pd.Series([None] * len(df), index=df.index)
+                        df[alias_name] = pd.Series([scalar_val] * len(df), index=df.index)
+                except _ScalarSubqueryRowsError:
+                    raise
                 except Exception:
                     df[alias_name] = pd.Series([None] * len(df), index=df.index)
 
@@ -8389,13 +10201,15 @@ class AdvancedSQLQueryEngine:
         """
         return self._compute_temp_column(expr, df, "__order_expr")
 
-    def _apply_order_by(self, parsed_sql: exp.Expression, df, select_aliases=None) -> pd.DataFrame:
-        """应用ORDER BY排序
+    def _apply_order_by(self, parsed_sql: exp.Expression, df, select_aliases=None, top_n: int | None = None) -> pd.DataFrame:
+        """应用ORDER BY排序(稳定排序, 排序键相同的行保持原顺序)
 
         Args:
             parsed_sql: 解析后的SQL表达式
             df: 数据DataFrame
             select_aliases: SELECT子句的别名映射(允许ORDER BY引用别名)
+            top_n: 调用方只取排序后的前 top_n 行(LIMIT + OFFSET)时传入. 远小于行数时先按第一排序键
+                取出可能排进前 top_n 的候选行, 只对候选行排序; 返回的前 top_n 行与整表排序一致
         """
         order_clause = parsed_sql.args.get("order")
         if not order_clause:
@@ -8473,7 +10287,8 @@ class AdvancedSQLQueryEngine:
             # Fix: 智能混合类型排序 — 优先数值排序，非数值值排末尾
             temp_sort_cols = []
             for col in sort_columns:
-                if col in df.columns:
+                # 只有 object 列可能同时含数值和字符串
+                if col in df.columns and df[col].dtype == object:
                     col_data = df[col]
                     has_numbers = False
                     has_strings = False
@@ -8516,7 +10331,12 @@ class AdvancedSQLQueryEngine:
                     na_pos = "last"
                 elif "NULLS FIRST" in oe_str:
                     na_pos = "first"
-            sorted_df = df.sort_values(by=sort_columns, ascending=ascending, na_position=na_pos)
+            # Top-N: O(n) 选出候选行(含与第 top_n 位并列的行)后只排序候选行, 不再整表排序
+            if top_n is not None and 0 < top_n <= len(df) // 4:
+                positions = _top_n_positions(df[sort_columns[0]], ascending[0], na_pos == "first", top_n)
+                if positions is not None and len(positions) < len(df):
+                    df = df.iloc[positions]
+            sorted_df = df.sort_values(by=sort_columns, ascending=ascending, na_position=na_pos, kind="stable")
 
             return sorted_df
 
@@ -8827,13 +10647,14 @@ class AdvancedSQLQueryEngine:
 
         return "string"
 
-    def _validate_value_type(self, value: Any, df: pd.DataFrame, col_name: str) -> str | None:
+    def _validate_value_type(self, value: Any, df: pd.DataFrame, col_name: str, col_type: str | None = None) -> str | None:
         """校验值是否与目标列的数据类型兼容.
 
         Args:
             value: 待写入的值
             df: 目标DataFrame
             col_name: 目标列名
+            col_type: 已检测的列类型类别(批量校验同一列时复用,省略则现场检测)
 
         Returns:
             None 表示校验通过,否则返回错误信息字符串
@@ -8842,7 +10663,8 @@ class AdvancedSQLQueryEngine:
         if value is None or value == "":
             return None
 
-        col_type = self._get_column_type_category(df, col_name)
+        if col_type is None:
+            col_type = self._get_column_type_category(df, col_name)
 
         # 空列无法推断类型,放行
         if col_type == "empty":
@@ -8881,6 +10703,34 @@ class AdvancedSQLQueryEngine:
 
         return None
 
+    def _first_invalid_insert_value(self, frame: pd.DataFrame, df: pd.DataFrame) -> tuple[int, int, str] | None:
+        """按列校验待插入的行, 返回行优先顺序下第一个不合法值的 (行位置, 列位置, 错误信息)
+
+        每列只检测一次类型类别; 数值dtype的列整列检查有限性, NaN 视为 NULL(写为空单元格).
+        """
+        first = None
+        for col_pos, col_name in enumerate(frame.columns):
+            col_type = self._get_column_type_category(df, col_name)
+            # 非数值列接受任意值
+            if col_type != "numeric":
+                continue
+            values = frame.iloc[:, col_pos]
+            if values.dtype.kind in "iufb":
+                numbers = values.to_numpy(dtype=np.float64)
+                with np.errstate(invalid="ignore"):
+                    bad = np.flatnonzero(np.isinf(numbers) | (np.abs(numbers) > 1e308))
+                row_pos = int(bad[0]) if len(bad) else None
+                values = values.astype(object)
+            else:
+                values = values.astype(object).where(values.notna(), None)
+                row_pos = next(
+                    (pos for pos, value in enumerate(values.tolist()) if self._validate_value_type(value, df, col_name, col_type)),
+                    None,
+                )
+            if row_pos is not None and (first is None or (row_pos, col_pos) < first[:2]):
+                first = (row_pos, col_pos, self._validate_value_type(values.iloc[row_pos], df, col_name, col_type))
+        return first
+
     def _verify_streaming_write(self, file_path: str, sheet_name: str, changes: list, en_to_cn_map: dict = None) -> dict[str, Any]:
         """验证流式写入是否实际生效
 
@@ -8998,6 +10848,7 @@ class AdvancedSQLQueryEngine:
             Dict: 更新结果,包含success/message/affected_rows/changes/verification等字段
         """
         start_time = time.time()
+        file_path = os.path.abspath(file_path)
 
         # 验证文件
         if not os.path.exists(file_path):
@@ -9127,18 +10978,21 @@ class AdvancedSQLQueryEngine:
                     # 重新解析WHERE（窗口函数已被替换为临时列引用）
                     where_clause = parsed.args.get("where")
                     where_expr = where_clause.this
-                condition_str = self._sql_condition_to_pandas(where_clause.this, df)
+                    candidates = df
+                else:
+                    candidates = self._index_candidates(where_expr, df, matched_sheet, worksheets_data[matched_sheet], file_path)
+                condition_str = self._sql_condition_to_pandas(where_clause.this, candidates)
                 if condition_str:
                     try:
-                        filtered_df = df.query(condition_str)
+                        filtered_df = candidates.query(condition_str)
                     except Exception:
-                        filtered_df = self._apply_row_filter(where_clause.this, df)
+                        filtered_df = self._apply_row_filter(where_clause.this, candidates)
                 else:
                     logger.warning(
                         "UPDATE WHERE条件转换为pandas表达式失败,回退到逐行过滤: %s",
                         where_clause.this,
                     )
-                    filtered_df = self._apply_row_filter(where_clause.this, df)
+                    filtered_df = self._apply_row_filter(where_clause.this, candidates)
             else:
                 filtered_df = df
 
@@ -9167,8 +11021,20 @@ class AdvancedSQLQueryEngine:
             affected_indices = filtered_df.index.tolist()
             changes = []
 
-            # 应用SET操作
-            for col_name, value_expr in set_operations:
+            # 应用SET操作: 整列向量化求值, 不支持的表达式回退逐行求值
+            for position, (col_name, value_expr) in enumerate(set_operations):
+                # 后续SET引用本列(或再次SET本列)时才需要把新值写回df, 供链式SET(如SET A=999, B=A+1)读取
+                keep_state = any(target == col_name or any(col.name == col_name for col in expr.find_all(exp.Column)) for target, expr in set_operations[position + 1 :])
+                try:
+                    column_changes, type_err = self._apply_update_set_vectorized(df, col_name, value_expr, affected_indices, keep_state)
+                except _NotVectorizable as e:
+                    logger.debug("UPDATE SET 回退逐行求值(%s): %s", e, value_expr)
+                else:
+                    if type_err:
+                        return self._update_error(type_err)
+                    changes.extend(column_changes)
+                    continue
+
                 for idx in affected_indices:
                     old_val = df.at[idx, col_name]
                     new_val = self._evaluate_update_expression(value_expr, df, idx)
@@ -9178,17 +11044,7 @@ class AdvancedSQLQueryEngine:
                     if type_err:
                         return self._update_error(type_err)
 
-                    # 类型兼容性:数值类型可互通(含numpy整数/浮点,避免uint8溢出),其他类型尝试转为旧值类型
-                    # [FIX R54] NULL/None 值跳过类型强制转换 — 避免 None 被旧值类型转换(如 int(None) 异常后 fallback 到 0)
-                    if new_val is not None and old_val != "" and new_val != "" and type(old_val) != type(new_val):
-                        if isinstance(old_val, (int, float, np.integer, np.floating)) and isinstance(new_val, (int, float, np.integer, np.floating)):
-                            pass  # 数值互通:不转换(P0-fix: numpy数值类型不走type转换避免溢出)
-                        else:
-                            try:
-                                new_val = type(old_val)(new_val)
-                            except (ValueError, TypeError):
-                                pass
-
+                    new_val = self._coerce_update_value(old_val, new_val)
                     if old_val != new_val:
                         changes.append(
                             {
@@ -9198,17 +11054,7 @@ class AdvancedSQLQueryEngine:
                                 "new_value": self._serialize_update_value(new_val),
                             }
                         )
-                    # P0-fix: df.at赋值可能因numpy小dtype(uint8)溢出而截断或报错
-                    # 此赋值仅用于链式SET(如SET A=999, B=A+1)的中间状态,实际写Excel走changes列表
-                    # 故跳过溢出赋值不影响最终正确性
-                    import warnings as _w
-
-                    with _w.catch_warnings():
-                        _w.filterwarnings("ignore", message="Setting an item of incompatible dtype")
-                        try:
-                            df.at[idx, col_name] = new_val
-                        except (ValueError, TypeError, OverflowError):
-                            pass  # 值超出DataFrame列dtype范围,跳过中间状态更新
+                    self._set_update_cell(df, idx, col_name, new_val)
 
             if not changes:
                 elapsed = (time.time() - start_time) * 1000
@@ -9262,6 +11108,7 @@ class AdvancedSQLQueryEngine:
     ) -> dict[str, Any]:
         """执行INSERT语句"""
         start_time = time.time()
+        file_path = os.path.abspath(file_path)
 
         if not os.path.exists(file_path):
             return {"success": False, "message": f"文件不存在: {file_path}"}
@@ -9356,58 +11203,92 @@ class AdvancedSQLQueryEngine:
                         "message": f"列 '{col}' 不存在.可用: {list(df.columns)}",
                     }
 
-            # 提取VALUES
-            values_node = parsed.expression
-            if not isinstance(values_node, (exp.Values, exp.Select)):
-                return {
-                    "success": False,
-                    "message": "VALUES格式不支持,请使用 INSERT INTO ... VALUES (...)",
-                }
+            # 重复列会让按列名构造的行数据静默丢值
+            duplicated = next((col for i, col in enumerate(col_names) if col in col_names[:i]), None)
+            if duplicated is not None:
+                return {"success": False, "message": f"列 '{duplicated}' 重复指定", "affected_rows": 0}
 
-            if isinstance(values_node, exp.Select):
+            # 提取VALUES / SELECT
+            values_node = parsed.expression
+            if not isinstance(values_node, (exp.Values, exp.Select, exp.Union)):
                 return {
                     "success": False,
-                    "message": "INSERT ... SELECT 暂不支持,请使用VALUES",
+                    "message": "VALUES格式不支持,请使用 INSERT INTO ... VALUES (...) 或 INSERT INTO ... SELECT ...",
                 }
 
-            rows = []
-            for tuple_expr in values_node.expressions:
-                if not isinstance(tuple_expr, exp.Tuple):
-                    continue
-                row = {}
-                for i, val_expr in enumerate(tuple_expr.expressions):
-                    if i >= len(col_names):
-                        break
-                    val = self._eval_insert_value(val_expr)
-                    # Fix: P2-type-check — INSERT写入前校验值类型是否与目标列匹配
-                    type_err = self._validate_value_type(val, df, col_names[i])
-                    if type_err:
-                        return {"success": False, "message": type_err, "affected_rows": 0}
-                    row[col_names[i]] = val
-                # Fix: 检查VALUES值数量与列数量是否匹配，防止静默截断导致数据不完整
-                if len(row) != len(col_names):
+            # 新行整体构造为一个DataFrame后按列校验, 再一次性追加写入
+            from_select = not isinstance(values_node, exp.Values)
+            if from_select:
+                self._current_file_path = file_path
+                try:
+                    frame = self._execute_subquery(values_node, worksheets_data)
+                except Exception as e:
+                    return {"success": False, "message": f"INSERT ... SELECT 查询执行失败: {e}", "affected_rows": 0}
+                frame = frame.drop(columns=["_ROW_NUMBER_"], errors="ignore")
+                # 结果中自动附带的 GROUP BY 键列不属于 SELECT 列表
+                if isinstance(values_node, exp.Select) and not any(isinstance(e, exp.Star) for e in values_node.expressions):
+                    frame = frame.iloc[:, : len(values_node.expressions)]
+                if frame.shape[1] != len(col_names):
                     return {
                         "success": False,
-                        "message": f"VALUES 值数量({len(row)})与列数量({len(col_names)})不匹配。请确保每个 VALUES 元组包含 {len(col_names)} 个值",
+                        "message": f"SELECT 返回列数({frame.shape[1]})与插入列数量({len(col_names)})不匹配。请让 SELECT 按目标列顺序返回 {len(col_names)} 列",
                         "affected_rows": 0,
                     }
-                rows.append(row)
+                if len(frame) > MAX_INSERT_SELECT_ROWS:
+                    return {
+                        "success": False,
+                        "message": f"INSERT ... SELECT 插入行数({len(frame)})超过限制({MAX_INSERT_SELECT_ROWS})。请用 WHERE/LIMIT 分批插入",
+                        "affected_rows": 0,
+                    }
+                # SELECT 结果按位置对应目标列
+                frame = frame.set_axis(col_names, axis=1).reset_index(drop=True)
+                short_row = None
+            else:
+                frame, short_row = self._insert_frame_from_values(values_node, col_names)
+
+            # Fix: P2-type-check — INSERT写入前校验值类型是否与目标列匹配(按行优先顺序报告第一个错误)
+            invalid = self._first_invalid_insert_value(frame, df)
+            if invalid is not None and (short_row is None or invalid[0] <= short_row[0]):
+                return {"success": False, "message": invalid[2], "affected_rows": 0}
+            # Fix: 检查VALUES值数量与列数量是否匹配，防止静默截断导致数据不完整
+            if short_row is not None:
+                return {
+                    "success": False,
+                    "message": f"VALUES 值数量({short_row[1]})与列数量({len(col_names)})不匹配。请确保每个 VALUES 元组包含 {len(col_names)} 个值",
+                    "affected_rows": 0,
+                }
 
-            if not rows:
+            if from_select and frame.empty:
+                elapsed = (time.time() - start_time) * 1000
+                return {
+                    "success": True,
+                    "message": "SELECT 未返回数据,未插入任何行",
+                    "affected_rows": 0,
+                    "execution_time_ms": round(elapsed, 1),
+                }
+            if frame.empty:
                 return {"success": False, "message": "没有数据可插入"}
 
             # Fix(P1-04): INSERT 批量大小限制，防止意外的大批量插入导致性能问题
             _MAX_INSERT_BATCH_SIZE = 5000
-            if len(rows) > _MAX_INSERT_BATCH_SIZE:
+            if not from_select and len(frame) > _MAX_INSERT_BATCH_SIZE:
                 return {
                     "success": False,
-                    "message": f"INSERT 批量插入行数({len(rows)})超过限制({_MAX_INSERT_BATCH_SIZE})。请分批插入，每批不超过 {_MAX_INSERT_BATCH_SIZE} 行",
+                    "message": f"INSERT 批量插入行数({len(frame)})超过限制({_MAX_INSERT_BATCH_SIZE})。请分批插入，每批不超过 {_MAX_INSERT_BATCH_SIZE} 行",
                     "affected_rows": 0,
                 }
 
+            # 布尔目标列: SELECT 结果中的 1/0 写回 TRUE/FALSE
+            if from_select:
+                for col_name in self._bool_insert_columns(file_path, matched_sheet, frame, df):
+                    frame[col_name] = [bool(v) if isinstance(v, (int, float, np.integer, np.floating)) and v in (0, 1) else v for v in frame[col_name].tolist()]
+
+            # NaN(SELECT结果中的NULL)写为空单元格
+            rows = frame.astype(object).where(frame.notna(), None).to_dict("records")
+
             if dry_run:
                 elapsed = (time.time() - start_time) * 1000
-                return {
+                preview = {
                     "success": True,
                     "message": f"[预览] 将插入 {len(rows)} 行",
                     "affected_rows": len(rows),
@@ -9415,6 +11296,11 @@ class AdvancedSQLQueryEngine:
                     "dry_run": True,
                     "execution_time_ms": round(elapsed, 1),
                 }
+                # INSERT ... SELECT 可能有数万行, 预览只返回前 MAX_RESULT_ROWS 行
+                if len(rows) > MAX_RESULT_ROWS:
+                    preview["data"] = rows[:MAX_RESULT_ROWS]
+                    preview["truncated"] = True
+                return preview
 
             # 写入Excel
             try:
@@ -9422,7 +11308,15 @@ class AdvancedSQLQueryEngine:
                 with self._get_write_lock(file_path):
                     from .excel_operations import ExcelOperations
 
-                    result = ExcelOperations.batch_insert_rows(file_path, matched_sheet, rows, streaming=True)
+                    try:
+                        if len(rows) > _MANAGER_INSERT_LIMIT and StreamingWriter.is_available():
+                            # 超出 batch_insert_rows 单次上限的 INSERT ... SELECT: 直接一次流式追加全部行
+                            ok, message, _ = StreamingWriter.batch_insert_rows(file_path, matched_sheet, rows)
+                            result = {"success": ok, "message": message}
+                        else:
+                            result = ExcelOperations.batch_insert_rows(file_path, matched_sheet, rows, streaming=True)
+                    finally:
+                        self._invalidate_file_caches(file_path)
                     elapsed = (time.time() - start_time) * 1000
                     if result.get("success"):
                         return {
@@ -9447,6 +11341,63 @@ class AdvancedSQLQueryEngine:
                     "execution_time_ms": round(elapsed, 1),
                 }
 
+    def _bool_insert_columns(self, file_path: str, sheet_name: str, frame: pd.DataFrame, df: pd.DataFrame) -> list[str]:
+        """待插入列中目标列为布尔列(TRUE/FALSE 单元格)的列名
+
+        无空值的布尔列加载为 bool dtype; 含空单元格时与 read_excel 一致加载为 0/1 浮点列,
+        只有这种列回读工作表单元格确认: 数据单元格(不计表头文字)全为布尔值才算布尔列.
+        """
+        bool_columns, candidates = [], []
+        for col_name in frame.columns:
+            if col_name not in df.columns:
+                continue
+            target = df[col_name]
+            if pd.api.types.is_bool_dtype(target.dtype):
+                bool_columns.append(col_name)
+            elif target.dtype.kind == "f" and target.isna().any() and target.notna().any() and target.dropna().isin((0, 1)).all():
+                candidates.append(col_name)
+        if not candidates:
+            return bool_columns
+        try:
+            from python_calamine import CalamineWorkbook
+
+            rows = CalamineWorkbook.from_path(file_path).get_sheet_by_name(sheet_name).to_python()
+        except Exception as e:
+            logger.debug("读取布尔列单元格失败(%s): %s", sheet_name, e)
+            return bool_columns
+        positions = {}
+        for header in rows[:2]:
+            for position, cell in enumerate(header):
+                if cell is not None:
+                    positions.setdefault(str(cell).strip(), position)
+        for col_name in candidates:
+            position = positions.get(str(col_name).strip())
+            if position is None:
+                continue
+            cells = [row[position] for row in rows[1:] if position < len(row) and row[position] is not None and not isinstance(row[position], str)]
+            if cells and all(isinstance(cell, bool) for cell in cells):
+                bool_columns.append(col_name)
+        return bool_columns
+
+    def _insert_frame_from_values(self, values_node: exp.Values, col_names: list) -> tuple[pd.DataFrame, tuple[int, int] | None]:
+        """VALUES 元组 → 待插入行DataFrame(object列)
+
+        多出的值忽略; 遇到值数量不足的元组即停止, 返回其 (行位置, 值数量), 前面的行照常校验.
+        """
+        width = len(col_names)
+        records = []
+        short_row = None
+        for tuple_expr in values_node.expressions:
+            if not isinstance(tuple_expr, exp.Tuple):
+                continue
+            values = [self._eval_insert_value(val_expr) for val_expr in tuple_expr.expressions[:width]]
+            if len(values) < width:
+                short_row = (len(records), len(values))
+                records.append(values + [None] * (width - len(values)))
+                break
+            records.append(values)
+        return pd.DataFrame(records, columns=col_names, dtype=object), short_row
+
     def _eval_insert_value(self, val_expr) -> Any:
         """将sqlglot表达式转为Python值"""
         if isinstance(val_expr, exp.Literal):
@@ -9480,6 +11431,7 @@ class AdvancedSQLQueryEngine:
     ) -> dict[str, Any]:
         """执行DELETE语句"""
         start_time = time.time()
+        file_path = os.path.abspath(file_path)
 
         if not os.path.exists(file_path):
             return {"success": False, "message": f"文件不存在: {file_path}"}
@@ -9555,14 +11507,15 @@ class AdvancedSQLQueryEngine:
                     cn_map[cn_desc] = en_col
 
             # WHERE过滤（复用UPDATE的逻辑）
+            candidates = self._index_candidates(where_clause.this, df, matched_sheet, worksheets_data[matched_sheet], file_path)
             try:
-                condition_str = self._sql_condition_to_pandas(where_clause.this, df)
+                condition_str = self._sql_condition_to_pandas(where_clause.this, candidates)
                 if condition_str:
-                    filtered_df = df.query(condition_str)
+                    filtered_df = candidates.query(condition_str)
                 else:
-                    filtered_df = self._apply_row_filter(where_clause.this, df)
+                    filtered_df = self._apply_row_filter(where_clause.this, candidates)
             except Exception:
-                filtered_df = self._apply_row_filter(where_clause.this, df)
+                filtered_df = self._apply_row_filter(where_clause.this, candidates)
 
             if filtered_df.empty:
                 elapsed = (time.time() - start_time) * 1000
@@ -9596,7 +11549,10 @@ class AdvancedSQLQueryEngine:
                 with self._get_write_lock(file_path):
                     from .excel_operations import ExcelOperations
 
-                    result = ExcelOperations.batch_delete_rows(file_path, matched_sheet, excel_row_numbers, streaming=True)
+                    try:
+                        result = ExcelOperations.batch_delete_rows(file_path, matched_sheet, excel_row_numbers, streaming=True)
+                    finally:
+                        self._invalidate_file_caches(file_path)
                     elapsed = (time.time() - start_time) * 1000
                     if result.get("success"):
                         return {
@@ -9732,7 +11688,7 @@ class AdvancedSQLQueryEngine:
                                 if backup_path and os.path.exists(backup_path):
                                     shutil.copy2(backup_path, file_path)
                                     os.remove(backup_path)
-                                self._df_cache.pop(file_path, None)
+                                self._invalidate_file_caches(file_path)
                                 failed_cols_info = meta.get("columns_failed", [])
                                 extra_hint = f"（列名匹配失败: {failed_cols_info}）" if failed_cols_info else ""
                                 elapsed = (time.time() - start_time) * 1000
@@ -9745,7 +11701,7 @@ class AdvancedSQLQueryEngine:
                                     "execution_time_ms": round(elapsed, 1),
                                 }
 
-                            self._df_cache.pop(file_path, None)
+                            self._invalidate_file_caches(file_path)
                             elapsed = (time.time() - start_time) * 1000
                             result = {
                                 "success": True,
@@ -9802,7 +11758,7 @@ class AdvancedSQLQueryEngine:
                     if backup_path and os.path.exists(backup_path):
                         os.remove(backup_path)
 
-                    self._df_cache.pop(file_path, None)
+                    self._invalidate_file_caches(file_path)
 
                     elapsed = (time.time() - start_time) * 1000
                     return {
@@ -9820,6 +11776,7 @@ class AdvancedSQLQueryEngine:
                     os.remove(backup_path)
                 except Exception:
                     pass
+            self._invalidate_file_caches(file_path)
             raise  # 重新抛出让调用方处理
 
     # Fix: P1-concurrent — 线程级写锁上下文管理器(按文件路径隔离)
@@ -9961,6 +11918,140 @@ class AdvancedSQLQueryEngine:
             return val
         return val
 
+    @staticmethod
+    def _coerce_update_value(old_val: Any, new_val: Any) -> Any:
+        """SET新值与旧值类型兼容: 数值类型可互通(含numpy整数/浮点,避免uint8溢出),其他类型尝试转为旧值类型"""
+        # [FIX R54] NULL/None 值跳过类型强制转换 — 避免 None 被旧值类型转换(如 int(None) 异常后 fallback 到 0)
+        if new_val is not None and old_val != "" and new_val != "" and type(old_val) != type(new_val):
+            if isinstance(old_val, (int, float, np.integer, np.floating)) and isinstance(new_val, (int, float, np.integer, np.floating)):
+                pass  # 数值互通:不转换(P0-fix: numpy数值类型不走type转换避免溢出)
+            else:
+                try:
+                    new_val = type(old_val)(new_val)
+                except (ValueError, TypeError):
+                    pass
+        return new_val
+
+    @staticmethod
+    def _set_update_cell(df: pd.DataFrame, idx, col_name: str, new_val: Any) -> None:
+        """把SET新值写回df(链式SET的中间状态)
+
+        P0-fix: df.at赋值可能因numpy小dtype(uint8)溢出而截断或报错; 实际写Excel走changes列表,
+        故跳过溢出赋值不影响最终正确性.
+        """
+        import warnings as _w
+
+        with _w.catch_warnings():
+            _w.filterwarnings("ignore", message="Setting an item of incompatible dtype")
+            try:
+                df.at[idx, col_name] = new_val
+            except (ValueError, TypeError, OverflowError):
+                pass  # 值超出DataFrame列dtype范围,跳过中间状态更新
+
+    def _apply_update_set_vectorized(self, df: pd.DataFrame, col_name: str, value_expr, affected_indices: list, keep_state: bool) -> tuple[list, str | None]:
+        """整列求值一个SET表达式, 返回 (changes, 类型校验错误)
+
+        新值、类型校验、类型转换与变更记录与逐行路径逐项一致; 表达式不支持向量化,
+        或校验结果可能随逐行写入而变化(如写入后列类型类别改变)时抛 _NotVectorizable.
+        """
+        rows = pd.Index(affected_indices)
+        values = self._update_set_values(value_expr, df, rows)
+        if not isinstance(values, pd.Series):
+            type_err = self._validate_value_type(values, df, col_name)
+            if type_err:
+                return [], type_err
+            new_values = [values] * len(rows)
+        else:
+            new_values = values.tolist()
+            category = self._get_column_type_category(df, col_name)
+            if values.dtype.kind in "iuf":
+                numbers = values.to_numpy(dtype=np.float64)
+                with np.errstate(invalid="ignore"):
+                    bad = ~np.isfinite(numbers) | (np.abs(numbers) > 1e308)
+                if bad.any():
+                    if category != "numeric":
+                        raise _NotVectorizable("非有限数值写入非数值列")
+                    return [], self._validate_value_type(new_values[int(np.argmax(bad))], df, col_name)
+            elif category != "string" or any(isinstance(v, (int, float, np.integer, np.floating)) and not (isinstance(v, float) and np.isnan(v)) for v in new_values):
+                raise _NotVectorizable("非数值结果写入非字符串列")
+
+        changes = []
+        coerced = []
+        for idx, old_val, new_val in zip(affected_indices, df[col_name].loc[rows].tolist(), new_values):
+            new_val = self._coerce_update_value(old_val, new_val)
+            coerced.append(new_val)
+            if old_val != new_val:
+                changes.append(
+                    {
+                        "row": int(idx) + 2,  # +2 for header offset (0-indexed + header row)
+                        "column": col_name,
+                        "old_value": self._serialize_update_value(old_val),
+                        "new_value": self._serialize_update_value(new_val),
+                    }
+                )
+        if keep_state:
+            try:
+                df.loc[rows, col_name] = pd.Series(coerced, index=rows, dtype=object).infer_objects()
+            except (ValueError, TypeError, OverflowError):
+                for idx, new_val in zip(affected_indices, coerced):
+                    self._set_update_cell(df, idx, col_name, new_val)
+        return changes, None
+
+    def _update_set_values(self, expr: exp.Expression, df: pd.DataFrame, rows: pd.Index) -> Any:
+        """SET表达式在 rows 上的整列取值: 常量返回标量, 否则返回按 rows 索引的 Series
+
+        与 _evaluate_update_expression 的逐行结果一致: 整数运算结果为 int64, 含浮点/列值的运算及除法为 float64.
+        不支持的表达式或取值(非数值列参与算术、除数为0等)抛 _NotVectorizable.
+        """
+        if expr.find(exp.Column) is None:
+            return self._evaluate_update_expression(expr, df, rows[0])
+        if isinstance(expr, exp.Column):
+            return df[expr.name].loc[rows] if expr.name in df.columns else ""
+        if isinstance(expr, exp.Paren):
+            return self._update_set_values(expr.this, df, rows)
+        if isinstance(expr, exp.Neg):
+            return pd.Series(-self._update_set_numbers(expr.this, df, rows)[0], index=rows)
+        if isinstance(expr, (exp.Add, exp.Sub, exp.Mul, exp.Div, exp.Mod)):
+            left, left_int = self._update_set_numbers(expr.left, df, rows)
+            right, right_int = self._update_set_numbers(expr.right, df, rows)
+            if isinstance(expr, exp.Div):
+                if (right == 0).any():
+                    raise _NotVectorizable("除数为0")
+                return pd.Series(left / right, index=rows)
+            if isinstance(expr, exp.Mod):
+                if not (left_int and right_int) or (right == 0).any():
+                    raise _NotVectorizable("MOD 仅支持非零整数")
+                result = np.mod(left, right)
+            else:
+                result = self._MATH_BINARY_OPS[type(expr)](left, right)
+            if not (left_int and right_int):
+                return pd.Series(result, index=rows)
+            if not (np.abs(result) < 2**53).all():
+                raise _NotVectorizable("整数结果超出精确范围")
+            return pd.Series(result.astype(np.int64), index=rows)
+        if isinstance(expr, (exp.Concat, exp.Upper, exp.Lower, exp.Trim)):
+            args = expr.expressions if isinstance(expr, exp.Concat) else [expr.this]
+            columns = [self._update_set_values(arg, df, rows) for arg in args]
+            columns = [col.tolist() if isinstance(col, pd.Series) else [col] * len(rows) for col in columns]
+            if isinstance(expr, exp.Concat):
+                result = ["".join(str(v) if v is not None else "" for v in parts) for parts in zip(*columns)]
+            else:
+                method = {exp.Upper: str.upper, exp.Lower: str.lower, exp.Trim: str.strip}[type(expr)]
+                result = [None if v is None else method(str(v)) for v in columns[0]]
+            return pd.Series(result, index=rows, dtype=object)
+        raise _NotVectorizable(f"UPDATE SET 表达式不支持整列求值: {type(expr).__name__}")
+
+    def _update_set_numbers(self, expr: exp.Expression, df: pd.DataFrame, rows: pd.Index) -> tuple[np.ndarray, bool]:
+        """算术操作数的 float64 数组与"是否整数"; 非数值列/非数值常量抛 _NotVectorizable"""
+        values = self._update_set_values(expr, df, rows)
+        if isinstance(values, pd.Series):
+            if values.dtype.kind not in "iuf":
+                raise _NotVectorizable(f"非数值列参与算术: {values.dtype}")
+            return values.to_numpy(dtype=np.float64), values.dtype.kind in "iu"
+        if isinstance(values, bool) or not isinstance(values, (int, float)) or abs(values) >= 2**53:
+            raise _NotVectorizable(f"非数值常量参与算术: {values!r}")
+        return np.full(len(rows), float(values)), isinstance(values, int)
+
     def _serialize_update_value(self, val: Any) -> Any:
         """将值序列化为JSON安全类型(numpy->Python原生)-- 委托给_serialize_value"""
         return self._serialize_value(val)
@@ -10305,13 +12396,16 @@ class AdvancedSQLQueryEngine:
 
 # 模块级单例引擎,DataFrame缓存跨调用共享
 _shared_engine: AdvancedSQLQueryEngine | None = None
+_shared_engine_lock = threading.Lock()
 
 
 def _get_engine() -> AdvancedSQLQueryEngine:
-    """获取共享SQL引擎实例(缓存跨调用复用)"""
+    """获取共享SQL引擎实例(缓存跨调用复用,多线程并发调用时只创建一次)"""
     global _shared_engine
     if _shared_engine is None:
-        _shared_engine = AdvancedSQLQueryEngine()
+        with _shared_engine_lock:
+            if _shared_engine is None:
+                _shared_engine = AdvancedSQLQueryEngine()
     return _shared_engine
 
 
@@ -0,0 +1,126 @@
+"""
+启动缓存预热 - 服务启动后在后台把配置目录中的工作簿加载进 SQL 引擎缓存
+
+配置项为目录或 glob 模式(目录按 **/*.xlsx、**/*.xlsm 递归展开, 跳过 Excel 锁文件 ~$*),
+逐个文件调用 AdvancedSQLQueryEngine.preload_workbook: 全部 sheet 解析、清洗、类型推断后写入
+_df_cache, 启用了磁盘缓存层(EXCEL_MCP_SHEET_CACHE_DIR)时同时写入磁盘.
+
+缓存键使用绝对路径; 引擎在查询/写入入口同样把文件路径规范为绝对路径, 以相对路径查询也命中预热结果.
+"""
+
+import glob
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+_WORKBOOK_PATTERNS = ("**/*.xlsx", "**/*.xlsm")
+
+
+def parse_warm_targets(value: str | None) -> list[str]:
+    """拆分预热配置字符串(多个目录/glob 以 os.pathsep 或逗号分隔)"""
+    if not value:
+        return []
+    parts = value.replace(",", os.pathsep).split(os.pathsep)
+    return [part.strip() for part in parts if part.strip()]
+
+
+def expand_warm_targets(targets: list[str]) -> list[str]:
+    """把目录/glob 展开为去重、排序后的工作簿绝对路径列表; 不存在的目录或无匹配的模式记录警告后忽略"""
+    files: set[str] = set()
+    for target in targets:
+        target = os.path.expanduser(target)
+        if os.path.isdir(target):
+            matches = [path for pattern in _WORKBOOK_PATTERNS for path in glob.glob(os.path.join(target, pattern), recursive=True)]
+        else:
+            matches = glob.glob(target, recursive=True)
+        matches = [path for path in matches if path.lower().endswith((".xlsx", ".xlsm")) and not os.path.basename(path).startswith("~$") and os.path.isfile(path)]
+        if not matches:
+            logger.warning(f"缓存预热: 未找到工作簿: {target}")
+        files.update(os.path.abspath(path) for path in matches)
+    return sorted(files)
+
+
+def warm_workbooks(
+    files: list[str],
+    engine=None,
+    on_progress: Callable[[dict[str, Any]], None] | None = None,
+) -> dict[str, Any]:
+    """串行预热工作簿, 单个文件失败不影响其余文件
+
+    Args:
+        files: 工作簿路径列表(通常来自 expand_warm_targets)
+        engine: SQL 引擎, 默认使用共享引擎 _get_engine()
+        on_progress: 每处理完一个文件回调一次, 参数为 {"file", "success", "sheets", "ms", "error", "done", "total"}
+
+    Returns:
+        汇总: {"total", "warmed", "failed", "sheets", "elapsed_ms", "errors"}
+    """
+    if engine is None:
+        from .advanced_sql_query import _get_engine
+
+        engine = _get_engine()
+
+    summary: dict[str, Any] = {"total": len(files), "warmed": 0, "failed": 0, "sheets": 0, "elapsed_ms": 0.0, "errors": []}
+    started = time.time()
+    for done, path in enumerate(files, 1):
+        file_start = time.time()
+        error = None
+        sheets: list[str] = []
+        try:
+            sheets = engine.preload_workbook(path)
+        except Exception as e:
+            error = str(e)
+            logger.warning(f"缓存预热失败: {path} ({e})")
+        if error is None:
+            summary["warmed"] += 1
+            summary["sheets"] += len(sheets)
+        else:
+            summary["failed"] += 1
+            summary["errors"].append({"file": path, "error": error})
+        if on_progress is not None:
+            on_progress(
+                {
+                    "file": path,
+                    "success": error is None,
+                    "sheets": len(sheets),
+                    "ms": round((time.time() - file_start) * 1000, 1),
+                    "error": error,
+                    "done": done,
+                    "total": len(files),
+                }
+            )
+    summary["elapsed_ms"] = round((time.time() - started) * 1000, 1)
+    logger.info(f"缓存预热完成: {summary['warmed']}/{summary['total']} 个文件, {summary['sheets']} 个sheet, 耗时 {summary['elapsed_ms']}ms")
+    return summary
+
+
+def start_cache_warmer(
+    targets: list[str],
+    engine=None,
+    on_progress: Callable[[dict[str, Any]], None] | None = None,
+    on_complete: Callable[[dict[str, Any]], None] | None = None,
+) -> threading.Thread | None:
+    """在守护线程中展开并预热 targets, 立即返回, 不阻塞服务就绪; targets 为空时不启动线程
+
+    on_complete 在全部文件处理完后以 warm_workbooks 的汇总调用(展开目标失败时汇总含 "error").
+    """
+    if not targets:
+        return None
+
+    def _run():
+        try:
+            summary = warm_workbooks(expand_warm_targets(targets), engine=engine, on_progress=on_progress)
+        except Exception as e:
+            logger.warning(f"缓存预热中止: {e}")
+            summary = {"total": 0, "warmed": 0, "failed": 0, "sheets": 0, "elapsed_ms": 0.0, "errors": [], "error": str(e)}
+        if on_complete is not None:
+            on_complete(summary)
+
+    thread = threading.Thread(target=_run, name="excel-mcp-cache-warmer", daemon=True)
+    thread.start()
+    return thread
@@ -204,9 +204,8 @@ class HeaderAnalyzer:
         供 _load_excel_data 复用已打开的 workbook 时回填缓存使用。
         """
         cache_key = str(Path(file_path).resolve())
-        if cache_key not in _cache:
-            _cache[cache_key] = {}
-        _cache[cache_key][sheet_name] = info
+        # setdefault 为原子操作: 并行加载多个sheet时不会互相覆盖同一文件的缓存字典
+        _cache.setdefault(cache_key, {})[sheet_name] = info
 
     @classmethod
     def _do_analyze(cls, file_path: str, sheet_name: str) -> HeaderInfo:
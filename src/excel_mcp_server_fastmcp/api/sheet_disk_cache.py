@@ -0,0 +1,325 @@
+"""
+工作表磁盘缓存 - SQL 引擎 _df_cache 之下的可选持久层
+
+服务重启或新的 excel-cli 进程再次查询未修改的 xlsx 时, 跳过 calamine 解析 + _clean_dataframe +
+_optimize_dtypes, 直接内存映射已清洗、已推断类型的列.
+
+目录布局:
+    <cache_dir>/<sha1(绝对路径|sheet)>/<指纹>/
+        meta.json       列名、各列存储方式与 dtype、表头描述、列名映射
+        c<i>.npy        数值/布尔/datetime64 列 (mmap_mode="c", 写时复制, 不会改动缓存文件)
+        c<i>.codes.npy  category 列的 codes
+        objects.json    object/扩展类型列、category 的 categories、非默认索引 (带类型标记的 JSON)
+
+指纹为 xlsx 中该 sheet 的部件签名 (sheet/sharedStrings/styles 部件的 CRC 与大小, 见 xlsx_parts),
+无法读取部件签名时为 (文件大小, mtime_ns). 内容变化后旧条目自然失效, 按部件签名存取时同一文件其他
+sheet 的修改不影响本 sheet 命中; 同一 sheet 写入新版本时清理旧版本目录.
+
+读取条目不会执行缓存目录中的任何代码 (不使用 pickle, .npy 以 allow_pickle=False 加载); 缓存目录须只有
+服务进程的用户可写, 属于其他用户或组/其他用户可写的目录拒绝启用. 无法用带类型标记的 JSON 表示的单元格值
+(非常见类型) 所在的 sheet 不写入磁盘缓存.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import stat
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 缓存格式版本: 存储格式或清洗/类型推断逻辑变化时递增, 旧版本条目视为未命中
+_FORMAT_VERSION = 3
+
+
+def _load_mapped(path: str) -> np.ndarray:
+    """以写时复制方式内存映射 .npy, 并转为普通 ndarray 视图 (底层仍引用映射内存)"""
+    return np.load(path, mmap_mode="c").view(np.ndarray)
+
+
+def _encode_value(value):
+    """object 列单元格值 → JSON 值; JSON 没有的类型写为 {类型标记: 值}, 无法表示时抛 TypeError"""
+    if value is None or type(value) in (bool, str, int):
+        return value
+    if type(value) is float:
+        return value if math.isfinite(value) else {"float": repr(value)}
+    if value is pd.NaT:
+        return {"nat": None}
+    if value is pd.NA:
+        return {"na": None}
+    if isinstance(value, pd.Timestamp):
+        return {"timestamp": value.isoformat()}
+    if isinstance(value, datetime.datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"date": value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {"time": value.isoformat()}
+    if isinstance(value, pd.Timedelta):
+        return {"timedelta": value.value}
+    if isinstance(value, datetime.timedelta):
+        return {"pytimedelta": [value.days, value.seconds, value.microseconds]}
+    if isinstance(value, (np.bool_, np.integer, np.floating)):
+        return {"numpy": [value.dtype.str, _encode_value(value.item())]}
+    raise TypeError(f"磁盘缓存不支持的单元格类型: {type(value).__name__}")
+
+
+def _decode_value(value):
+    """_encode_value 的逆变换"""
+    if not isinstance(value, dict):
+        return value
+    ((tag, payload),) = value.items()
+    if tag == "float":
+        return float(payload)
+    if tag == "nat":
+        return pd.NaT
+    if tag == "na":
+        return pd.NA
+    if tag == "timestamp":
+        return pd.Timestamp(payload)
+    if tag == "datetime":
+        return datetime.datetime.fromisoformat(payload)
+    if tag == "date":
+        return datetime.date.fromisoformat(payload)
+    if tag == "time":
+        return datetime.time.fromisoformat(payload)
+    if tag == "timedelta":
+        return pd.Timedelta(payload)
+    if tag == "pytimedelta":
+        return datetime.timedelta(*payload)
+    if tag == "numpy":
+        return np.dtype(payload[0]).type(_decode_value(payload[1]))
+    raise ValueError(f"未知的单元格类型标记: {tag}")
+
+
+def _encode_values(values) -> dict:
+    """一列/索引的值 → {"dtype": dtype 名, "values": JSON 值列表}; 文本扩展类型的值本身就是 str/None"""
+    dtype = values.dtype
+    if isinstance(dtype, pd.StringDtype):
+        series = pd.Series(values, dtype=dtype, copy=False)
+        encoded = series.astype(object).where(series.notna(), None).tolist()
+    else:
+        encoded = [_encode_value(value) for value in values.tolist()]
+    return {"dtype": str(dtype), "values": encoded}
+
+
+def _decode_values(payload: dict):
+    """_encode_values 的逆变换, 返回指定 dtype 的数组; 恢复出的 dtype 与记录不一致时抛 ValueError"""
+    dtype = pd.api.types.pandas_dtype(payload["dtype"])
+    values = [_decode_value(value) for value in payload["values"]]
+    if dtype == object:
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+    array = np.array(values, dtype=dtype) if isinstance(dtype, np.dtype) else pd.array(values, dtype=dtype)
+    if array.dtype != dtype:
+        raise ValueError(f"列类型恢复不一致: {array.dtype} != {dtype}")
+    return array
+
+
+def _check_private_dir(path: str) -> None:
+    """缓存目录须属于当前用户且组/其他用户不可写, 否则抛 PermissionError (非 POSIX 系统不检查)"""
+    if os.name != "posix":
+        return
+    st = os.stat(path)
+    if st.st_uid != os.getuid() or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"缓存目录须只有当前用户可写 (属主 uid={st.st_uid}, 权限 {stat.filemode(st.st_mode)})")
+
+
+class SheetDiskCache:
+    """按 (路径, 文件大小, mtime, sheet) 缓存清洗后 DataFrame 的磁盘列式缓存"""
+
+    def __init__(self, cache_dir: str):
+        """
+        Args:
+            cache_dir: 缓存根目录, 不存在时自动创建 (权限 0700)
+
+        Raises:
+            OSError: 目录无法创建; PermissionError: 目录属于其他用户或组/其他用户可写
+        """
+        self.cache_dir = os.path.abspath(cache_dir)
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        _check_private_dir(self.cache_dir)
+        self._lock = threading.Lock()
+        self.hit_count = 0
+        self.miss_count = 0
+        self.store_count = 0
+
+    @staticmethod
+    def fingerprint(file_path: str) -> tuple[int, int]:
+        """文件指纹 (大小, mtime_ns); 需在解析文件之前获取, 避免把旧内容写到新指纹下"""
+        st = os.stat(file_path)
+        return st.st_size, st.st_mtime_ns
+
+    def _sheet_dir(self, file_path: str, sheet: str) -> str:
+        digest = hashlib.sha1(f"{os.path.abspath(file_path)}|{sheet}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest)
+
+    def _entry_dir(self, file_path: str, sheet: str, fingerprint: tuple[int, ...]) -> str:
+        return os.path.join(self._sheet_dir(file_path, sheet), "_".join(str(part) for part in fingerprint))
+
+    def load(
+        self,
+        file_path: str,
+        sheet: str,
+        fingerprint: tuple[int, ...],
+    ) -> tuple[pd.DataFrame, dict[str, str] | None, dict[str, str]] | None:
+        """
+        读取缓存条目.
+
+        Returns:
+            (df, 表头描述 或 None, 原始列名->清洗列名映射); 未命中或条目损坏时返回 None
+        """
+        entry_dir = self._entry_dir(file_path, sheet, fingerprint)
+        meta_path = os.path.join(entry_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            with self._lock:
+                self.miss_count += 1
+            return None
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != _FORMAT_VERSION or meta.get("path") != os.path.abspath(file_path) or meta.get("sheet") != sheet:
+                raise ValueError("缓存条目与请求不匹配")
+            objects = {}
+            if meta["has_objects"]:
+                with open(os.path.join(entry_dir, "objects.json"), encoding="utf-8") as f:
+                    objects = json.load(f)
+            if "index" in objects:
+                index = pd.Index(_decode_values(objects["index"]), dtype=objects["index"]["dtype"], name=objects["index"]["name"])
+            else:
+                index = pd.RangeIndex(meta["n_rows"])
+            columns = {}
+            for i, (name, kind) in enumerate(zip(meta["columns"], meta["kinds"])):
+                if kind == "array":
+                    columns[name] = _load_mapped(os.path.join(entry_dir, f"c{i}.npy"))
+                elif kind == "category":
+                    codes = _load_mapped(os.path.join(entry_dir, f"c{i}.codes.npy"))
+                    categories = objects[str(i)]
+                    dtype = pd.CategoricalDtype(pd.Index(_decode_values(categories), dtype=categories["dtype"]), ordered=categories["ordered"])
+                    columns[name] = pd.Categorical.from_codes(codes, dtype=dtype)
+                else:
+                    # 显式 dtype: 避免 object 列中的 Timestamp 被构造函数推断成 datetime64
+                    values = _decode_values(objects[str(i)])
+                    columns[name] = pd.Series(values, index=index, dtype=values.dtype, copy=False)
+            # copy=False: 各列保持独立 block, 数值列直接引用 mmap 数组而不合并拷贝
+            df = pd.DataFrame(columns, index=index, columns=meta["columns"], copy=False)
+        except Exception as e:
+            logger.warning("工作表磁盘缓存条目损坏, 已删除: %s (%s)", entry_dir, e)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            with self._lock:
+                self.miss_count += 1
+            return None
+        with self._lock:
+            self.hit_count += 1
+        return df, meta["header_descriptions"], meta["col_map"]
+
+    def store(
+        self,
+        file_path: str,
+        sheet: str,
+        fingerprint: tuple[int, ...],
+        df: pd.DataFrame,
+        header_descriptions: dict[str, str] | None,
+        col_map: dict[str, str],
+    ) -> bool:
+        """
+        写入缓存条目 (先写临时目录再原子重命名, 多进程并发写同一条目时以先完成者为准).
+
+        Returns:
+            是否写入成功; 失败 (磁盘满/无权限/列名重复等) 只记录日志, 不影响查询
+        """
+        if not df.columns.is_unique:
+            return False
+        sheet_dir = self._sheet_dir(file_path, sheet)
+        entry_dir = self._entry_dir(file_path, sheet, fingerprint)
+        if os.path.exists(entry_dir):
+            return True
+        tmp_dir = None
+        try:
+            os.makedirs(sheet_dir, exist_ok=True)
+            tmp_dir = tempfile.mkdtemp(prefix=".tmp_", dir=sheet_dir)
+            kinds: list[str] = []
+            objects: dict = {}
+            for i, name in enumerate(df.columns):
+                series = df[name]
+                dtype = series.dtype
+                if isinstance(dtype, pd.CategoricalDtype):
+                    np.save(os.path.join(tmp_dir, f"c{i}.codes.npy"), series.cat.codes.to_numpy())
+                    objects[str(i)] = {**_encode_values(dtype.categories), "ordered": bool(dtype.ordered)}
+                    kinds.append("category")
+                elif isinstance(dtype, np.dtype) and dtype.kind in "biufcmM":
+                    np.save(os.path.join(tmp_dir, f"c{i}.npy"), series.to_numpy())
+                    kinds.append("array")
+                else:
+                    # object/扩展类型列按值写入 JSON 并记录原 dtype
+                    objects[str(i)] = _encode_values(series.array)
+                    kinds.append("object")
+            index = df.index
+            if not (isinstance(index, pd.RangeIndex) and index.start == 0 and index.step == 1):
+                objects["index"] = {**_encode_values(index), "name": index.name}
+            if objects:
+                with open(os.path.join(tmp_dir, "objects.json"), "w", encoding="utf-8") as f:
+                    json.dump(objects, f, ensure_ascii=False, allow_nan=False)
+            meta = {
+                "version": _FORMAT_VERSION,
+                "path": os.path.abspath(file_path),
+                "sheet": sheet,
+                "n_rows": len(df),
+                "columns": [str(c) for c in df.columns],
+                "kinds": kinds,
+                "has_objects": bool(objects),
+                "header_descriptions": header_descriptions,
+                "col_map": col_map,
+            }
+            # meta.json 最后写入: 存在即代表条目完整
+            with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            try:
+                os.rename(tmp_dir, entry_dir)
+            except OSError:
+                # 其他进程已写入同一条目
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                return os.path.exists(entry_dir)
+            tmp_dir = None
+        except Exception as e:
+            logger.debug("工作表磁盘缓存写入失败: %s[%s] (%s)", file_path, sheet, e)
+            if tmp_dir:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+
+        # 清理同一 sheet 的旧版本 (文件已被修改, 旧指纹不会再命中)
+        current = os.path.basename(entry_dir)
+        for name in os.listdir(sheet_dir):
+            if name != current and not name.startswith(".tmp_"):
+                shutil.rmtree(os.path.join(sheet_dir, name), ignore_errors=True)
+        with self._lock:
+            self.store_count += 1
+        return True
+
+    def clear(self) -> None:
+        """删除全部缓存条目"""
+        for name in os.listdir(self.cache_dir):
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+        with self._lock:
+            self.hit_count = 0
+            self.miss_count = 0
+            self.store_count = 0
+
+    def get_stats(self) -> dict[str, int | str]:
+        """获取缓存统计信息"""
+        with self._lock:
+            return {
+                "cache_dir": self.cache_dir,
+                "hit_count": self.hit_count,
+                "miss_count": self.miss_count,
+                "store_count": self.store_count,
+            }
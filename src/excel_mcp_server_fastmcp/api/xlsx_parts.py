@@ -0,0 +1,72 @@
+"""
+xlsx 部件签名 - sheet 级增量缓存刷新
+
+xlsx/xlsm 是 zip 包, 每个 xl/worksheets/sheetN.xml 在中央目录中都带有自己的 CRC32 和解压后大小,
+读取中央目录不需要解压任何 sheet. 文件 mtime 变化时, 用 sheet 部件签名判断哪些 sheet 真正变了:
+签名未变的缓存条目直接复用, 只重新解析部件有变化的 sheet.
+
+sheet 的签名 = (sheet 部件 CRC, 大小, sharedStrings CRC, 大小, styles CRC, 大小, workbook CRC, 大小):
+- sheet XML 中的文本单元格只是 sharedStrings 的下标, sharedStrings 变化时所有 sheet 都要重新解析
+- styles 中的数字格式决定单元格是否按日期解析, 同样影响全部 sheet
+- workbook.xml 的 date1904 决定日期序列号的起点, 切换后所有日期列的值都会变
+不存在的共享部件记为 -1. 非 zip 文件(.xls)或结构无法识别时返回 None, 调用方退回按 mtime 失效.
+"""
+
+import posixpath
+import xml.etree.ElementTree as ET
+import zipfile
+
+# 影响所有 sheet 解析结果的共享部件(按 workbook 关系类型定位)
+_SHARED_PART_TYPES = ("sharedStrings", "styles")
+
+
+def _local_name(tag: str) -> str:
+    """去掉命名空间前缀(兼容 Transitional 与 Strict 两套 OOXML 命名空间)"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _part_name(target: str) -> str:
+    """workbook 关系中的 Target(相对 xl/ 或以 / 开头的包内绝对路径) 转为 zip 成员名"""
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join("xl", target))
+
+
+def read_sheet_part_signatures(file_path: str) -> dict[str, tuple[int, ...]] | None:
+    """
+    读取每个 sheet 的部件签名.
+
+    Returns:
+        {sheet名: (sheet CRC, sheet大小, sharedStrings CRC, 大小, styles CRC, 大小, workbook CRC, 大小)};
+        不是 zip 或缺少 workbook.xml/关系文件时返回 None
+    """
+    try:
+        with zipfile.ZipFile(file_path) as zf:
+            infos = {info.filename: info for info in zf.infolist()}
+            workbook = ET.fromstring(zf.read("xl/workbook.xml"))
+            rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError):
+        return None
+
+    relations = [rel for rel in rels if _local_name(rel.tag) == "Relationship"]
+    targets = {rel.get("Id"): rel.get("Target", "") for rel in relations}
+    shared: list[int] = []
+    for part_type in _SHARED_PART_TYPES:
+        target = next((rel.get("Target", "") for rel in relations if rel.get("Type", "").rsplit("/", 1)[-1] == part_type), None)
+        info = infos.get(_part_name(target)) if target else None
+        shared.extend((info.CRC, info.file_size) if info is not None else (-1, -1))
+    workbook_info = infos["xl/workbook.xml"]
+    shared.extend((workbook_info.CRC, workbook_info.file_size))
+
+    signatures: dict[str, tuple[int, ...]] = {}
+    for elem in workbook.iter():
+        if _local_name(elem.tag) != "sheet":
+            continue
+        rel_id = next((value for key, value in elem.attrib.items() if _local_name(key) == "id"), None)
+        target = targets.get(rel_id)
+        if not target:
+            continue
+        info = infos.get(_part_name(target))
+        if info is not None:
+            signatures[elem.get("name")] = (info.CRC, info.file_size, *shared)
+    return signatures
@@ -383,6 +383,29 @@ def cmd_query(args):
         return output(_fail(f"SQL查询失败: {e}"))
 
 
+def cmd_warm_cache(args):
+    """预热工作簿缓存（写入磁盘缓存层，供后续 CLI 进程和服务冷查询复用）。"""
+    from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+    from excel_mcp_server_fastmcp.api.cache_warmer import expand_warm_targets, parse_warm_targets, warm_workbooks
+
+    try:
+        targets = [t for value in args.paths for t in parse_warm_targets(value)]
+        engine = AdvancedSQLQueryEngine(disk_cache_dir=args.disk_cache_dir)
+        files = expand_warm_targets(targets)
+        if not files:
+            return output(_fail(f"未找到可预热的工作簿: {', '.join(targets)}"))
+        summary = warm_workbooks(files, engine=engine)
+        disk_stats = engine.get_cache_stats()["disk_cache"]
+        message = f"已预热 {summary['warmed']}/{summary['total']} 个文件, {summary['sheets']} 个工作表"
+        if disk_stats is None:
+            message += "（未启用磁盘缓存，预热结果仅在本进程内有效）"
+        result = _ok(message, data=summary, meta={"disk_cache": disk_stats})
+        result["success"] = summary["failed"] == 0
+        return output(result)
+    except Exception as e:
+        return output(_fail(f"缓存预热失败: {e}"))
+
+
 def cmd_compare_sheets(args):
     """对比两个工作表差异。"""
     from excel_mcp_server_fastmcp.api.excel_operations import ExcelOperations
@@ -1138,6 +1161,12 @@ def build_parser():
     p.add_argument("--format", default=None, choices=["table", "json", "csv"], help="输出格式")
     p.set_defaults(func=cmd_query)
 
+    # warm-cache
+    p = subparsers.add_parser("warm-cache", help="预热工作簿缓存（写入磁盘缓存层）")
+    p.add_argument("--paths", required=True, nargs="+", help="工作簿目录或 glob 模式，可多个")
+    p.add_argument("--disk-cache-dir", default=None, help="磁盘缓存目录（默认读取 EXCEL_MCP_SHEET_CACHE_DIR；须只有当前用户可写）")
+    p.set_defaults(func=cmd_warm_cache)
+
     # compare-sheets
     p = subparsers.add_parser("compare-sheets", help="按 ID 列比较两个工作表差异")
     p.add_argument("--file1", required=True, help="基准文件路径")
@@ -44,6 +44,7 @@ from .api.excel_operations import ExcelOperations
 from .utils.config import (
     MAX_FILE_SIZE_MB,
     MAX_SEARCH_FILES,
+    WARM_CACHE_ENV,
 )
 from .utils.validators import DataValidationError, ExcelValidator
 
@@ -192,9 +193,15 @@ class ToolCallTracker:
                 "max_time_ms": 0.0,
             }
         )
+        self._tasks: dict[str, dict[str, Any]] = {}
         self._lock = threading.Lock()
         self._start_time = datetime.now()
 
+    def update_task(self, task_name: str, **fields):
+        """更新后台任务（如启动缓存预热）的进度状态，随 get_stats 的 background_tasks 返回"""
+        with self._lock:
+            self._tasks.setdefault(task_name, {}).update(fields)
+
     def record(
         self,
         tool_name: str,
@@ -251,12 +258,14 @@ class ToolCallTracker:
                 "total_errors": sum(s["error_count"] for s in self._stats.values()),
                 "error_types": dict(sorted(global_error_types.items())),
                 "tools": tools,
+                "background_tasks": {name: dict(task) for name, task in self._tasks.items()},
             }
 
     def reset(self):
         """重置所有统计"""
         with self._lock:
             self._stats.clear()
+            self._tasks.clear()
             self._start_time = datetime.now()
 
 
@@ -1844,11 +1853,12 @@ def excel_update_query(file_path: str, update_expression: str, dry_run: bool = F
 @_validate_file_path()
 @_track_call
 def excel_insert_query(file_path: str, insert_expression: str, dry_run: bool = False) -> dict[str, Any]:
-    """SQL插入数据。支持单行/多行INSERT。
+    """SQL插入数据。支持单行/多行INSERT及 INSERT ... SELECT(按位置对应目标列)。
 
     示例::
         INSERT INTO 技能表 (技能名称, 伤害, 冷却) VALUES ('火球术', 300, 6)
         INSERT INTO Raids (RID, CID, Score) VALUES (6, 105, 7000), (7, 106, 8000)
+        INSERT INTO 归档 (ID, 名称) SELECT ID, 名称 FROM 技能表 WHERE 等级 > 5
 
     Args:
         file_path: Excel文件路径
@@ -1962,6 +1972,51 @@ def _collect_column_statistics(ws, data_start, num_cols, col_name_list):
     return col_stats, total_rows
 
 
+def _catalog_cell_value(value):
+    """引擎 DataFrame 中的值还原为 openpyxl 读出的 Python 值（numpy 标量→Python 值，整数值浮点数→int，Timestamp→datetime）"""
+    if hasattr(value, "to_pydatetime"):
+        return value.to_pydatetime()
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _catalog_column_statistics(file_path, sheet_name, col_name_list):
+    """
+    从SQL引擎的列统计目录取列统计 — 统计随引擎 DataFrame 缓存复用，重复查看不再逐行扫描
+
+    引擎 DataFrame 的列数与表头列数一致时按位置对应，否则返回 None 由调用方回退逐行扫描。
+
+    Args:
+        file_path: Excel文件路径
+        sheet_name: 工作表名称
+        col_name_list: 列名列表
+
+    Returns:
+        tuple[dict, int] | None: (列统计信息, 数据行数)，列统计信息额外含 distinct/min/max/sorted
+    """
+    from .api.advanced_sql_query import _get_engine
+
+    catalog = _get_engine().get_sheet_statistics(file_path, sheet_name)
+    if catalog is None or len(catalog["columns"]) != len(col_name_list):
+        return None
+    col_stats = {}
+    for col_name, stats in zip(col_name_list, catalog["columns"].values()):
+        head = [_catalog_cell_value(v) for v in stats["head"]]
+        col_stats[col_name] = {
+            "non_null": stats["rows"] - stats["null_count"],
+            "samples": head[:3],
+            "type_values": head,
+            "distinct": stats["distinct"],
+            "min": _catalog_cell_value(stats["min"]),
+            "max": _catalog_cell_value(stats["max"]),
+            "sorted": stats["sorted"],
+        }
+    return col_stats, catalog["row_count"]
+
+
 def _build_describe_columns(col_stats, col_name_list, is_dual_header, descriptions):
     """
     分析列数据类型并构建最终列信息列表（保留原始完整行为）
@@ -1996,6 +2051,8 @@ def _build_describe_columns(col_stats, col_name_list, is_dual_header, descriptio
             "non_null": s["non_null"],
             "sample_values": s["samples"],
         }
+        if "distinct" in s:
+            col_stats[col_name].update(distinct=s["distinct"], min=s["min"], max=s["max"], sorted=s["sorted"])
 
     return list(col_stats.values())
 
@@ -2103,7 +2160,8 @@ def excel_describe_table(file_path: str, sheet_name: str = None) -> dict[str, An
         data.header_type: 表头类型 ("dual"=双行 / "single"=单行)
         data.row_count: 数据行数
         data.column_count: 列数
-        data.columns: 列信息列表 [{name, type, description, non_null, sample_values}]
+        data.columns: 列信息列表 [{name, type, description, non_null, sample_values}]，
+            取自SQL引擎列统计时另含 distinct(近似去重数)/min/max(数值、日期列)/sorted("asc"/"desc"/null)
     """
     # 文件验证和加载
     if not file_path or not file_path.strip():
@@ -2156,8 +2214,9 @@ def excel_describe_table(file_path: str, sheet_name: str = None) -> dict[str, An
                 col_name = f"column_{col_idx + 1}"
             col_name_list.append(col_name)
 
-        # 单次遍历收集统计信息（提取为独立函数）
-        col_stats, total_rows = _collect_column_statistics(ws, data_start, num_cols, col_name_list)
+        # 优先取SQL引擎的列统计目录，列对不上时单次遍历收集统计信息
+        catalog = _catalog_column_statistics(file_path, sheet_name, col_name_list)
+        col_stats, total_rows = catalog if catalog is not None else _collect_column_statistics(ws, data_start, num_cols, col_name_list)
 
         # 推断类型并构建最终结果（提取为独立函数）
         columns = _build_describe_columns(col_stats, col_name_list, is_dual_header, descriptions)
@@ -2462,6 +2521,38 @@ def excel_run_python(
 
 
 # ==================== 主程序 ====================
+def _start_cache_warmup(targets: list[str]) -> threading.Thread | None:
+    """后台预热 targets 中的工作簿，进度与完成情况写入 _tracker 的 background_tasks["cache_warmup"]"""
+    from .api.cache_warmer import start_cache_warmer
+
+    if not targets:
+        return None
+    _tracker.update_task("cache_warmup", state="running", targets=list(targets), total=None, done=0, warmed=0, failed=0, sheets=0, started_at=datetime.now().isoformat())
+
+    counts = {"warmed": 0, "failed": 0, "sheets": 0}
+
+    def _on_progress(event: dict[str, Any]):
+        # 预热线程串行处理文件，计数只在该线程内累加
+        if event["success"]:
+            counts["warmed"] += 1
+            counts["sheets"] += event["sheets"]
+        else:
+            counts["failed"] += 1
+        _tracker.update_task("cache_warmup", total=event["total"], done=event["done"], last_file=event["file"], **counts)
+
+    def _on_complete(summary: dict[str, Any]):
+        _tracker.update_task(
+            "cache_warmup",
+            state="failed" if summary.get("error") else "completed",
+            total=summary["total"],
+            elapsed_ms=summary["elapsed_ms"],
+            errors=summary["errors"],
+            finished_at=datetime.now().isoformat(),
+        )
+
+    return start_cache_warmer(targets, on_progress=_on_progress, on_complete=_on_complete)
+
+
 def main():
     """Entry point for excel-mcp-server-fastmcp.
 
@@ -2470,6 +2561,7 @@ def main():
         --sse: Server-Sent Events远程模式
         --streamable-http: Streamable HTTP远程模式，推荐用于团队共享
         --mount-path=<path>: HTTP模式挂载路径
+        --warm-cache=<dir|glob>: 启动后在后台预热的工作簿目录或glob，可重复；也可通过环境变量 EXCEL_MCP_WARM_CACHE 配置
         --version, -v: 显示版本号
     """
     if len(sys.argv) > 1 and sys.argv[1] in ("--version", "-v"):
@@ -2478,14 +2570,20 @@ def main():
         logger.info(f"excel-mcp-server-fastmcp {__version__}")
         sys.exit(0)
 
+    from .api.cache_warmer import parse_warm_targets
+
     transport = "stdio"
     mount_path = None
+    warm_targets = parse_warm_targets(os.environ.get(WARM_CACHE_ENV))
     for arg in sys.argv[1:]:
         if arg in ("--stdio", "--sse", "--streamable-http"):
             transport = arg[2:]  # remove '--'
         elif arg.startswith("--mount-path="):
             mount_path = arg.split("=", 1)[1]
+        elif arg.startswith("--warm-cache="):
+            warm_targets.extend(parse_warm_targets(arg.split("=", 1)[1]))
 
+    _start_cache_warmup(warm_targets)
     mcp.run(transport=transport, mount_path=mount_path)
 
 
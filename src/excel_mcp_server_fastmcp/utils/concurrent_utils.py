@@ -24,6 +24,7 @@ def parallel_read_files(
     file_paths: list[str],
     read_fn: Callable[[str], Any],
     max_workers: int | None = None,
+    return_exceptions: bool = False,
 ) -> list[tuple[str, Any]]:
     """并行读取多个文件。
 
@@ -31,23 +32,27 @@ def parallel_read_files(
         file_paths: 待读取的文件路径列表
         read_fn: 单文件读取函数，接收文件路径，返回读取结果
         max_workers: 最大线程数（默认 min(4, cpu_count)）
+        return_exceptions: 读取失败时以异常对象作为 result（默认 False，即 None），
+            便于调用方把失败原因带进自己的错误信息
 
     Returns:
         与 file_paths 顺序对应的结果列表，每项为 (file_path, result) 元组。
-        读取失败的文件 result 为 None。
+        读取失败的文件 result 为 None（return_exceptions=True 时为异常对象）。
     """
     if not file_paths:
         return []
 
     workers = max_workers or _DEFAULT_MAX_WORKERS
-    # 单文件无需线程池开销
-    if len(file_paths) == 1:
-        try:
-            result = read_fn(file_paths[0])
-            return [(file_paths[0], result)]
-        except Exception as e:
-            logger.error(f"读取文件失败 {file_paths[0]}: {e}")
-            return [(file_paths[0], None)]
+    # 单文件(或单线程)无需线程池开销
+    if len(file_paths) == 1 or workers <= 1:
+        results = []
+        for fp in file_paths:
+            try:
+                results.append((fp, read_fn(fp)))
+            except Exception as e:
+                logger.error(f"读取文件失败 {fp}: {e}")
+                results.append((fp, e if return_exceptions else None))
+        return results
 
     results_map: dict[str, Any] = {}
     errors: list[str] = []
@@ -61,7 +66,7 @@ def parallel_read_files(
             except Exception as e:
                 logger.error(f"并行读取失败 {fp}: {e}")
                 errors.append(f"{fp}: {e}")
-                results_map[fp] = None
+                results_map[fp] = e if return_exceptions else None
 
     if errors:
         logger.warning(f"并行读取完成，{len(errors)}/{len(file_paths)} 个文件失败")
@@ -74,6 +79,7 @@ def parallel_map(
     items: list[Any],
     process_fn: Callable[[Any], Any],
     max_workers: int | None = None,
+    serial_threshold: int = 2,
 ) -> list[Any]:
     """并行处理列表中的每个元素。
 
@@ -81,6 +87,7 @@ def parallel_map(
         items: 待处理的项目列表
         process_fn: 处理函数，接收单个项目，返回处理结果
         max_workers: 最大线程数（默认 min(4, cpu_count)）
+        serial_threshold: 项目数不超过该值时直接串行执行（默认 2）
 
     Returns:
         与 items 顺序对应的结果列表。
@@ -90,7 +97,7 @@ def parallel_map(
 
     workers = max_workers or _DEFAULT_MAX_WORKERS
     # 少量项目无需线程池
-    if len(items) <= 2:
+    if len(items) <= serial_threshold or workers <= 1:
         return [process_fn(item) for item in items]
 
     results_map: dict[int, Any] = {}
@@ -7,13 +7,25 @@
 MAX_SEARCH_FILES = 100  # 最大搜索文件数
 
 # SQL 查询引擎配置
-MAX_CACHE_SIZE = 20  # 最大DataFrame缓存文件数，防止内存泄漏
+MAX_CACHE_SIZE = 20  # 最大DataFrame缓存文件数，防止内存泄漏（内存上限由 CACHE_TARGET_MEMORY_MB 控制）
 MAX_QUERY_CACHE_SIZE = 15  # 最大查询结果缓存数，防止内存泄漏
 QUERY_CACHE_TTL = 300  # 查询缓存TTL（5分钟）
-CACHE_TARGET_MEMORY_MB = 512.0  # 目标最大缓存内存（MB）
+QUERY_CACHE_MAX_CELLS = 100000  # 单条查询结果缓存的最大单元格数，超出不缓存
+MAX_PLAN_CACHE_SIZE = 256  # SQL解析计划缓存条目数（预处理+sqlglot解析结果）
+MAX_JOIN_INDEX_CACHE_SIZE = 64  # 列哈希索引缓存条目数（按 sheet+列，供JOIN构建侧与WHERE等值点查共用）
+POINT_INDEX_MIN_ROWS = 10_000  # sheet行数达到此值时WHERE等值/IN条件经列哈希索引定位行，ID列在加载时预建索引
+MAX_COLUMN_STATS_CACHE_SIZE = 512  # 列统计目录缓存条目数（按 sheet+列：最值/空值数/近似去重数/有序性/分块最值）
+ZONE_MAP_BLOCK_ROWS = 4096  # 列分块最值(zone map)的块行数；sheet行数超过一块时WHERE范围条件据此跳过不可能命中的块
+CACHE_TARGET_MEMORY_MB = 512.0  # DataFrame缓存字节预算（MB），超出后按最久未使用淘汰
+SHEET_DISK_CACHE_DIR_ENV = "EXCEL_MCP_SHEET_CACHE_DIR"  # 工作表磁盘缓存目录环境变量（未设置则不启用；目录须只有服务进程的用户可写，否则拒绝启用）
+SHEET_LOAD_MAX_WORKERS = 4  # 单次查询并行加载工作表/跨文件引用的最大线程数（1 表示串行）
+SHEET_PARALLEL_MIN_FILE_MB = 5  # 同一文件内多个sheet并行解析的最小文件大小（MB），小文件单句柄串行更快
+WARM_CACHE_ENV = "EXCEL_MCP_WARM_CACHE"  # 启动缓存预热的目录/glob 环境变量（多个以 os.pathsep 或逗号分隔）
 
 # 结果限制配置
 MAX_RESULT_ROWS = 500  # 最大结果行数（保护AI上下文窗口）
+MAX_CROSS_JOIN_ROWS = 5_000_000  # CROSS JOIN/非等值JOIN笛卡尔积的最大行数，超出时在分配内存前拒绝执行
+MAX_INSERT_SELECT_ROWS = 100_000  # INSERT ... SELECT 单条语句最多插入的行数（结果整体校验后一次流式追加）
 
 # 安全验证配置
 MAX_FILE_SIZE_MB = 50  # 最大文件大小（MB）
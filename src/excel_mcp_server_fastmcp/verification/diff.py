@@ -12,6 +12,8 @@ UNSTABLE_QUERY_INFO_KEYS = {
     "formatted_output",
     "sql_query",
     "record_count",
+    "cache_hit",
+    "load_timings",
 }
 
 
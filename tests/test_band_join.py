@@ -0,0 +1,165 @@
+"""
+区间(band)JOIN 测试
+
+ON 中的 BETWEEN 与 </<=/>/>= 列比较(可混合等值条件)按排序 + searchsorted 输出匹配行对,
+不再走 cross join + 过滤; 结果与逐行比较的笛卡尔积语义一致(NULL 不匹配, LEFT JOIN 保留未匹配行).
+外连接 ON 中的其余条件只过滤匹配行对, 没有留下匹配的保留侧行补 NULL 输出(与 SQLite 一致).
+"""
+
+import itertools
+import operator
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine, _band_join_positions
+
+
+@pytest.fixture
+def game(tmp_path):
+    path = str(tmp_path / "game.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "玩家"
+    ws.append(["pid", "exp", "server"])
+    for row in [(1, 0, 1), (2, 499, 1), (3, 500, 2), (4, 1200, 2), (5, None, 1), (6, 99999, 1)]:
+        ws.append(list(row))
+    levels = wb.create_sheet("等级")
+    levels.append(["lvl", "min_exp", "max_exp", "server"])
+    for server in (1, 2):
+        for lvl in range(1, 4):
+            levels.append([lvl, (lvl - 1) * 500, lvl * 500 - 1, server])
+    events = wb.create_sheet("活动")
+    events.append(["eid", "start", "end"])
+    for row in [(1, 0, 1000), (2, 400, 600), (3, 550, 2000)]:
+        events.append(list(row))
+    wb.save(path)
+    return path
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = AdvancedSQLQueryEngine()
+
+    def no_cross(*args):
+        raise AssertionError("区间JOIN不应构造笛卡尔积")
+
+    monkeypatch.setattr(engine, "_check_cross_join_size", no_cross)
+    return engine
+
+
+def _rows(result):
+    assert result["success"], result["message"]
+    return result["data"][1:]
+
+
+class TestBandJoin:
+    def test_between_lookup(self, game, engine):
+        sql = "SELECT p.pid, l.lvl FROM 玩家 p JOIN 等级 l ON p.exp BETWEEN l.min_exp AND l.max_exp WHERE l.server = 1 ORDER BY p.pid"
+        assert _rows(engine.execute_sql_query(game, sql)) == [[1, 1], [2, 1], [3, 2], [4, 3]]
+
+    def test_equality_partitions_range(self, game, engine):
+        sql = "SELECT p.pid, l.lvl FROM 玩家 p LEFT JOIN 等级 l ON p.server = l.server AND p.exp >= l.min_exp AND p.exp <= l.max_exp ORDER BY p.pid"
+        assert _rows(engine.execute_sql_query(game, sql)) == [[1, 1], [2, 1], [3, 2], [4, 3], [5, None], [6, None]]
+
+    def test_overlapping_intervals(self, game, engine):
+        sql = "SELECT p.pid, e.eid FROM 玩家 p JOIN 活动 e ON e.start <= p.exp AND p.exp < e.end ORDER BY p.pid, e.eid"
+        assert _rows(engine.execute_sql_query(game, sql)) == [[1, 1], [2, 1], [2, 2], [3, 1], [3, 2], [4, 3]]
+
+    def test_single_inequality_with_residual_condition(self, game, engine):
+        sql = "SELECT p.pid, e.eid FROM 玩家 p JOIN 活动 e ON p.exp > e.start AND p.pid <> e.eid ORDER BY p.pid, e.eid"
+        assert _rows(engine.execute_sql_query(game, sql)) == [[2, 1], [3, 1], [3, 2], [4, 1], [4, 2], [4, 3], [6, 1], [6, 2], [6, 3]]
+
+    def test_extra_join_conditions_not_ignored(self, game):
+        sql = "SELECT p.pid, l.lvl FROM 玩家 p JOIN 等级 l ON p.server = l.server AND l.lvl = 2 ORDER BY p.pid"
+        assert _rows(AdvancedSQLQueryEngine().execute_sql_query(game, sql)) == [[1, 2], [2, 2], [3, 2], [4, 2], [5, 2], [6, 2]]
+
+
+@pytest.fixture(scope="module")
+def roster(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("outer") / "roster.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "emp"
+    ws.append(["id", "dk", "t"])
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE emp (id INTEGER, dk INTEGER, t INTEGER)")
+    conn.execute("CREATE TABLE dept (dk INTEGER, x INTEGER, name TEXT)")
+    rng = np.random.default_rng(5)
+    for i in range(60):
+        row = [i, int(rng.integers(0, 7)), int(rng.integers(0, 21))]
+        ws.append(row)
+        conn.execute("INSERT INTO emp VALUES (?, ?, ?)", row)
+    dept = wb.create_sheet("dept")
+    dept.append(["dk", "x", "name"])
+    for dk in range(5):
+        for x in (1, 2, 3):
+            if (dk + x) % 4:
+                dept.append([dk, x, f"d{dk}{x}"])
+                conn.execute("INSERT INTO dept VALUES (?, ?, ?)", [dk, x, f"d{dk}{x}"])
+    wb.save(path)
+    yield path, conn
+    conn.close()
+
+
+OUTER_JOINS = [
+    "LEFT JOIN dept d ON e.dk = d.dk AND d.x = 2",
+    "LEFT JOIN dept d ON e.dk = d.dk AND e.t > d.x * 5",
+    "LEFT JOIN dept d ON e.dk = d.dk AND d.x = 99",
+    "LEFT JOIN dept d ON e.dk = d.dk AND (d.x = 1 OR e.t < 3)",
+    "LEFT JOIN dept d ON e.dk = d.dk AND e.t BETWEEN d.x AND d.x + 3 AND d.name <> 'd12'",
+    "LEFT JOIN dept d ON e.t > d.x * 5 AND d.name <> 'd11'",
+    "LEFT JOIN dept d ON e.t BETWEEN d.x AND d.x + 2 AND d.name <> 'd12'",
+    "RIGHT JOIN dept d ON e.dk = d.dk AND e.t > 15",
+    "FULL OUTER JOIN dept d ON e.dk = d.dk AND e.t > 15 AND d.x = 3",
+]
+
+
+class TestOuterJoinOnConditions:
+    @pytest.mark.parametrize("join", OUTER_JOINS)
+    def test_same_rows_as_sqlite(self, roster, join):
+        path, conn = roster
+        sql = f"SELECT e.id, d.x, d.name FROM emp e {join}"
+        actual = [tuple(None if pd.isna(v) else v for v in row) for row in _rows(AdvancedSQLQueryEngine().execute_sql_query(path, sql))]
+        assert sorted(actual, key=repr) == sorted(conn.execute(sql).fetchall(), key=repr)
+
+    def test_left_rows_keep_order(self, roster):
+        path, _ = roster
+        sql = "SELECT e.id, d.x FROM emp e LEFT JOIN dept d ON e.dk = d.dk AND d.x = 2"
+        ids = [row[0] for row in _rows(AdvancedSQLQueryEngine().execute_sql_query(path, sql))]
+        assert ids == list(range(60))
+
+    def test_right_only_condition_filters_right_table(self, roster, monkeypatch):
+        path, _ = roster
+        engine = AdvancedSQLQueryEngine()
+        filtered = []
+        original = engine._apply_row_filter
+        monkeypatch.setattr(engine, "_apply_row_filter", lambda cond, df: filtered.append(cond.sql()) or original(cond, df))
+        engine.execute_sql_query(path, "SELECT e.id, d.x FROM emp e LEFT JOIN dept d ON e.dk = d.dk AND d.x = 2 AND e.t > d.x")
+        # d.x = 2 在 JOIN 前过滤右表, 只有跨表条件逐行过滤
+        assert filtered == ["e.t > d.x"]
+
+
+OPS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+
+class TestBandJoinPositions:
+    @pytest.mark.parametrize("how", ["inner", "left"])
+    @pytest.mark.parametrize("ops", list(itertools.product(OPS, repeat=2)))
+    def test_matches_nested_loop(self, how, ops):
+        rng = np.random.default_rng(len(ops[0]) * 7 + len(ops[1]))
+        left = rng.integers(0, 6, (3, 30)).astype(float)
+        right = rng.integers(0, 6, (3, 25)).astype(float)
+        left[0, ::7] = right[1, ::6] = np.nan
+        ranges = [(left[0], ops[0], right[0]), (left[1], ops[1], right[1])]
+        left_pos, right_pos = _band_join_positions([pd.Series(left[2])], [pd.Series(right[2])], ranges, how)
+
+        expected = []
+        for i in range(left.shape[1]):
+            hits = [(i, j) for j in range(right.shape[1]) if left[2, i] == right[2, j] and all(OPS[op](lv[i], rv[j]) for lv, op, rv in ranges)]
+            expected.extend(hits or ([(i, -1)] if how == "left" else []))
+        assert sorted(zip(left_pos.tolist(), right_pos.tolist())) == expected
+        assert list(left_pos) == sorted(left_pos)
@@ -0,0 +1,138 @@
+"""
+启动缓存预热测试
+
+配置的目录/glob 在后台线程中展开并加载进引擎缓存(及磁盘缓存层), 不阻塞调用方;
+进度与完成情况写入工具调用统计的 background_tasks.
+"""
+
+import json
+import os
+import threading
+
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp import cli
+from excel_mcp_server_fastmcp.api import cache_warmer
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+from excel_mcp_server_fastmcp.api.cache_warmer import expand_warm_targets, parse_warm_targets, start_cache_warmer, warm_workbooks
+from excel_mcp_server_fastmcp.server import _start_cache_warmup, _tracker
+
+
+def _write_book(path, sheets=("物品",)):
+    wb = Workbook()
+    wb.remove(wb.active)
+    for title in sheets:
+        ws = wb.create_sheet(title)
+        ws.append(["编号", "名称"])
+        ws.append(["id", "name"])
+        for i in range(1, 6):
+            ws.append([i, f"{title} {i}"])
+    wb.save(path)
+
+
+@pytest.fixture
+def book_dir(tmp_path):
+    _write_book(str(tmp_path / "items.xlsx"), ("物品", "掉落"))
+    os.makedirs(tmp_path / "sub")
+    _write_book(str(tmp_path / "sub" / "shops.xlsm"))
+    (tmp_path / "~$items.xlsx").write_bytes(b"lock")
+    (tmp_path / "notes.txt").write_text("x")
+    return tmp_path
+
+
+class TestExpandTargets:
+    def test_directory_and_glob(self, book_dir):
+        files = expand_warm_targets([str(book_dir)])
+        assert [os.path.relpath(f, book_dir) for f in files] == ["items.xlsx", os.path.join("sub", "shops.xlsm")]
+        assert expand_warm_targets([str(book_dir / "*.xlsx"), str(book_dir / "items.xlsx")]) == [str(book_dir / "items.xlsx")]
+        assert expand_warm_targets([str(book_dir / "missing")]) == []
+
+    def test_parse_targets(self):
+        assert parse_warm_targets(f"a{os.pathsep} b ,c") == ["a", "b", "c"]
+        assert parse_warm_targets(None) == []
+
+
+class TestWarmWorkbooks:
+    def test_warmed_sheets_served_from_cache(self, book_dir):
+        engine = AdvancedSQLQueryEngine()
+        events = []
+        summary = warm_workbooks(expand_warm_targets([str(book_dir)]), engine=engine, on_progress=events.append)
+        assert summary["warmed"] == 2 and summary["failed"] == 0 and summary["sheets"] == 3
+        assert [e["done"] for e in events] == [1, 2] and all(e["total"] == 2 for e in events)
+
+        misses = engine.get_cache_stats()["df_cache"]["misses"]
+        result = engine.execute_sql_query(str(book_dir / "items.xlsx"), "SELECT name FROM 掉落 WHERE id = 2")
+        assert result["success"], result["message"]
+        assert result["data"][1] == ["掉落 2"]
+        assert engine.get_cache_stats()["df_cache"]["misses"] == misses
+
+    def test_relative_path_query_uses_warmed_entries(self, book_dir, monkeypatch):
+        engine = AdvancedSQLQueryEngine()
+        warm_workbooks(expand_warm_targets([str(book_dir)]), engine=engine)
+        misses = engine.get_cache_stats()["df_cache"]["misses"]
+
+        monkeypatch.chdir(book_dir / "sub")
+        result = engine.execute_sql_query(os.path.join("..", "items.xlsx"), "SELECT name FROM 物品 WHERE id = 3")
+        assert result["success"], result["message"]
+        assert result["data"][1] == ["物品 3"]
+        assert engine.execute_sql_query("shops.xlsm", "SELECT COUNT(*) AS n FROM 物品")["data"][1] == [5]
+        assert engine.get_cache_stats()["df_cache"]["misses"] == misses
+
+    def test_failure_does_not_stop_other_files(self, book_dir):
+        broken = book_dir / "broken.xlsx"
+        broken.write_bytes(b"not a workbook")
+        summary = warm_workbooks([str(broken), str(book_dir / "items.xlsx")], engine=AdvancedSQLQueryEngine())
+        assert summary["warmed"] == 1 and summary["failed"] == 1
+        assert summary["errors"][0]["file"] == str(broken)
+
+    def test_disk_tier_filled(self, book_dir, tmp_path_factory):
+        cache_dir = str(tmp_path_factory.mktemp("disk"))
+        warm_workbooks([str(book_dir / "items.xlsx")], engine=AdvancedSQLQueryEngine(disk_cache_dir=cache_dir))
+
+        fresh = AdvancedSQLQueryEngine(disk_cache_dir=cache_dir)
+        assert fresh.execute_sql_query(str(book_dir / "items.xlsx"), "SELECT COUNT(*) AS n FROM 物品")["data"][1] == [5]
+        assert fresh.get_cache_stats()["disk_cache"]["hit_count"] >= 1
+
+
+class TestBackgroundWarmup:
+    def test_start_returns_immediately(self, book_dir, monkeypatch):
+        release = threading.Event()
+        original = AdvancedSQLQueryEngine.preload_workbook
+
+        def slow_preload(self, path):
+            release.wait(10)
+            return original(self, path)
+
+        monkeypatch.setattr(AdvancedSQLQueryEngine, "preload_workbook", slow_preload)
+        done = []
+        thread = start_cache_warmer([str(book_dir)], engine=AdvancedSQLQueryEngine(), on_complete=done.append)
+        assert thread.daemon and thread.is_alive() and not done
+        release.set()
+        thread.join(10)
+        assert done[0]["warmed"] == 2
+        assert start_cache_warmer([]) is None
+
+    def test_progress_reported_in_tool_stats(self, book_dir, monkeypatch):
+        monkeypatch.setattr(cache_warmer, "warm_workbooks", lambda files, engine=None, on_progress=None: warm_workbooks(files, AdvancedSQLQueryEngine(), on_progress))
+        _tracker.reset()
+        thread = _start_cache_warmup([str(book_dir)])
+        thread.join(10)
+        task = _tracker.get_stats()["background_tasks"]["cache_warmup"]
+        assert task["state"] == "completed"
+        assert task["total"] == task["done"] == task["warmed"] == 2 and task["failed"] == 0 and task["sheets"] == 3
+        assert task["finished_at"] and task["errors"] == []
+        _tracker.reset()
+        assert _tracker.get_stats()["background_tasks"] == {}
+
+
+class TestCliWarmCache:
+    def test_warm_cache_command(self, book_dir, tmp_path_factory, capsys):
+        cache_dir = str(tmp_path_factory.mktemp("cli_disk"))
+        args = cli.build_parser().parse_args(["warm-cache", "--paths", str(book_dir), "--disk-cache-dir", cache_dir])
+        assert args.func(args) == 0
+        out = json.loads(capsys.readouterr().out)
+        assert out["data"]["warmed"] == 2 and out["meta"]["disk_cache"]["store_count"] >= 3
+
+        args = cli.build_parser().parse_args(["warm-cache", "--paths", str(book_dir / "missing")])
+        assert args.func(args) == 1
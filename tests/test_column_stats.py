@@ -0,0 +1,160 @@
+"""
+列统计目录与分块最值(zone map)测试
+
+缓存 sheet 的每列按需计算一次统计(空值数、近似去重数、最值、有序性、各块最值), 随 DataFrame 缓存复用/失效.
+WHERE 中数值列的范围/等值条件按块最值跳过不可能命中的块, 取值范围外的条件直接得到空候选;
+JOIN 规划取统计中的去重数; excel_describe_table 直接取统计目录. 结果与全表扫描一致.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api import advanced_sql_query
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine, _approx_distinct, _compute_column_stats
+from excel_mcp_server_fastmcp.server import excel_describe_table
+
+
+@pytest.fixture
+def monsters(tmp_path):
+    path = str(tmp_path / "monsters.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "怪物表"
+    ws.append(["ID", "等级", "血量", "名称", "掉率"])
+    for i in range(200):
+        ws.append([i, i // 10, (i * 37) % 101, f"m{i % 9}", None if 40 <= i < 80 else i / 4])
+    wb.save(path)
+    return path
+
+
+@pytest.fixture
+def zoned(monkeypatch):
+    monkeypatch.setattr(advanced_sql_query, "ZONE_MAP_BLOCK_ROWS", 16)
+
+
+@pytest.fixture
+def mask_sizes(monkeypatch):
+    sizes = []
+    original = AdvancedSQLQueryEngine._where_mask
+
+    def spy(self, expr, df, *args, **kwargs):
+        sizes.append(len(df))
+        return original(self, expr, df, *args, **kwargs)
+
+    monkeypatch.setattr(AdvancedSQLQueryEngine, "_where_mask", spy)
+    return sizes
+
+
+CONDITIONS = [
+    "等级 = 7",
+    "等级 BETWEEN 3 AND 4.5",
+    "等级 > 18 AND 名称 LIKE 'm%'",
+    "3 < 等级 AND 等级 <= 5 AND 血量 > 50",
+    "等级 > 5 AND 等级 < 3",
+    "等级 >= 1000",
+    "等级 = -1",
+    "血量 >= 99",
+    "掉率 > 10 AND 掉率 < 20",
+    "掉率 < 0",
+    "等级 = '7'",
+    "NOT 等级 = 7",
+    "等级 = 7 OR 等级 = 19",
+    "等级 NOT BETWEEN 1 AND 18",
+]
+
+
+class TestZoneMapFiltering:
+    @pytest.mark.parametrize("condition", CONDITIONS)
+    def test_same_rows_as_full_scan(self, monsters, monkeypatch, condition):
+        def run(engine):
+            return [
+                engine.execute_sql_query(monsters, f"SELECT ID, 血量 FROM 怪物表 WHERE {condition}")["data"],
+                engine.execute_update_query(monsters, f"UPDATE 怪物表 SET 名称 = 'x' WHERE {condition}", dry_run=True)["changes"],
+                engine.execute_delete_query(monsters, f"DELETE FROM 怪物表 WHERE {condition}", dry_run=True).get("affected_rows"),
+            ]
+
+        monkeypatch.setattr(advanced_sql_query, "ZONE_MAP_BLOCK_ROWS", 10**9)
+        expected = run(AdvancedSQLQueryEngine())
+        monkeypatch.setattr(advanced_sql_query, "ZONE_MAP_BLOCK_ROWS", 16)
+        assert run(AdvancedSQLQueryEngine()) == expected
+
+    def test_out_of_range_predicate_scans_nothing(self, monsters, zoned, mask_sizes):
+        result = AdvancedSQLQueryEngine().execute_sql_query(monsters, "SELECT COUNT(*) FROM 怪物表 WHERE 等级 > 100 AND UPPER(名称) = 'M1'")
+        assert result["data"][1:] == [[0]]
+        # 掩码只在空候选上求值(AND 的各子条件递归求值)
+        assert set(mask_sizes) == {0}
+
+    def test_only_overlapping_blocks_evaluated(self, monsters, zoned, mask_sizes):
+        result = AdvancedSQLQueryEngine().execute_sql_query(monsters, "SELECT ID FROM 怪物表 WHERE ID BETWEEN 20 AND 25")
+        assert [row[0] for row in result["data"][1:]] == list(range(20, 26))
+        # 第 2 块(16~31 行)
+        assert mask_sizes == [16]
+
+    def test_all_null_blocks_skipped(self, monsters, zoned, mask_sizes):
+        AdvancedSQLQueryEngine().execute_sql_query(monsters, "SELECT ID FROM 怪物表 WHERE 掉率 > -1")
+        # 40~79 行的掉率全为 NULL, 完全落在其中的 48~63、64~79 两块被跳过
+        assert mask_sizes == [168]
+
+    def test_small_sheets_not_zoned(self, monsters, mask_sizes):
+        AdvancedSQLQueryEngine().execute_sql_query(monsters, "SELECT ID FROM 怪物表 WHERE 等级 > 100")
+        assert mask_sizes == [200]
+
+
+class TestStatisticsCatalog:
+    def test_column_stats(self):
+        values = pd.Series([3.0, np.nan, 5.0, 5.0, np.nan, np.nan, 9.0])
+        stats = _compute_column_stats(values, block_rows=2)
+        assert (stats["rows"], stats["null_count"], stats["distinct"]) == (7, 3, 3)
+        assert (stats["min"], stats["max"], stats["sorted"]) == (3.0, 9.0, "asc")
+        mins, maxs = stats["zones"]
+        np.testing.assert_array_equal(mins, [3.0, 5.0, np.nan, 9.0])
+        np.testing.assert_array_equal(maxs, [3.0, 5.0, np.nan, 9.0])
+        assert stats["head"] == [3.0, 5.0, 5.0, 9.0]
+
+    def test_text_column_stats(self):
+        stats = _compute_column_stats(pd.Series(["c", "", None, "b", "a"], dtype=object), block_rows=2)
+        assert (stats["null_count"], stats["distinct"], stats["sorted"]) == (2, 3, "desc")
+        assert stats["min"] is None and stats["zones"] is None
+
+    def test_approx_distinct_large_column(self):
+        values = pd.Series(np.arange(400_000) % 150_000)
+        assert abs(_approx_distinct(values) - 150_000) < 150_000 * 0.05
+        assert _approx_distinct(pd.Series(np.arange(400_000) % 300)) == 300
+
+    def test_computed_once_and_invalidated_on_change(self, monsters, zoned):
+        engine = AdvancedSQLQueryEngine()
+        for level in (3, 4):
+            engine.execute_sql_query(monsters, f"SELECT ID FROM 怪物表 WHERE 等级 = {level}")
+        stats = engine.get_cache_stats()["column_stats_cache"]
+        assert (stats["entries"], stats["hits"]) == (1, 1)
+
+        assert engine.execute_update_query(monsters, "UPDATE 怪物表 SET 等级 = 500 WHERE ID = 0")["success"]
+        assert engine.execute_sql_query(monsters, "SELECT ID FROM 怪物表 WHERE 等级 > 100")["data"][1:] == [[0]]
+
+    def test_join_planner_uses_catalog_distinct(self, monsters):
+        engine = AdvancedSQLQueryEngine()
+        sql = "SELECT COUNT(*) FROM 怪物表 a JOIN 怪物表 b ON a.ID = b.ID JOIN 怪物表 c ON a.等级 = c.等级"
+        assert engine.execute_sql_query(monsters, sql)["data"][1:] == [[2000]]
+        stats = engine.get_sheet_statistics(monsters, "怪物表")["columns"]
+        assert stats["ID"]["distinct"] == 200 and stats["等级"]["distinct"] == 20
+        assert engine.get_cache_stats()["column_stats_cache"]["hits"] >= 2
+
+
+class TestDescribeFromCatalog:
+    def test_describe_reports_catalog_stats(self, monsters):
+        result = excel_describe_table(monsters, "怪物表")
+        assert result["success"], result["message"]
+        columns = {column["name"]: column for column in result["data"]["columns"]}
+        assert result["data"]["row_count"] == 200
+        assert columns["ID"]["sample_values"] == [0, 1, 2] and columns["ID"]["type"] == "number"
+        assert (columns["ID"]["min"], columns["ID"]["max"], columns["ID"]["sorted"]) == (0, 199, "asc")
+        assert (columns["掉率"]["non_null"], columns["掉率"]["sorted"]) == (160, "asc")
+        assert (columns["名称"]["type"], columns["名称"]["distinct"], columns["名称"]["min"]) == ("text", 9, None)
+
+    def test_repeat_describe_reuses_cache(self, monsters):
+        excel_describe_table(monsters, "怪物表")
+        hits = advanced_sql_query._get_engine().get_cache_stats()["column_stats_cache"]["hits"]
+        excel_describe_table(monsters, "怪物表")
+        assert advanced_sql_query._get_engine().get_cache_stats()["column_stats_cache"]["hits"] == hits + 5
@@ -0,0 +1,108 @@
+"""
+并发只读查询测试
+
+按查询状态保存在线程本地的执行上下文中, 同一引擎上的 SELECT 不再串行:
+慢查询不阻塞其他查询, 多线程并发结果与串行执行一致.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+
+
+def _write_book(path, offset):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "物品"
+    ws.append(["编号", "名称", "价格"])
+    ws.append(["id", "name", "price"])
+    for i in range(1, 21):
+        ws.append([i, f"item {i}", i * offset])
+    ws2 = wb.create_sheet("掉落")
+    ws2.append(["物品编号", "数量"])
+    ws2.append(["item_id", "qty"])
+    for i in range(1, 21):
+        ws2.append([i, i % 4 + offset])
+    wb.save(path)
+
+
+@pytest.fixture
+def books(tmp_path):
+    paths = []
+    for k in range(1, 4):
+        path = str(tmp_path / f"book{k}.xlsx")
+        _write_book(path, k)
+        paths.append(path)
+    return paths
+
+
+QUERIES = [
+    "SELECT 名称, 价格 FROM 物品 WHERE 价格 > 10 ORDER BY 价格 DESC",
+    "SELECT a.id, b.qty FROM 物品 a JOIN 掉落 b ON a.id = b.item_id WHERE b.qty > 2 ORDER BY a.id",
+    "SELECT qty, COUNT(*) AS n FROM 掉落 GROUP BY qty HAVING n > 1 ORDER BY qty",
+    "SELECT id, ROW_NUMBER() OVER (ORDER BY price DESC) AS rn FROM 物品 WHERE id <= 5",
+]
+
+
+class TestConcurrentQueries:
+    def test_slow_query_does_not_block_others(self, books):
+        engine = AdvancedSQLQueryEngine()
+        entered = threading.Event()
+        release = threading.Event()
+        original_join = engine._apply_join_clause
+
+        def slow_join(*args, **kwargs):
+            entered.set()
+            release.wait(10)
+            return original_join(*args, **kwargs)
+
+        engine._apply_join_clause = slow_join
+        slow_result = {}
+        slow = threading.Thread(target=lambda: slow_result.update(engine.execute_sql_query(books[0], QUERIES[1])))
+        slow.start()
+        try:
+            assert entered.wait(10)
+            fast = engine.execute_sql_query(books[1], QUERIES[0])
+            assert fast["success"], fast["message"]
+            assert not release.is_set() and slow.is_alive()  # 慢查询仍在执行中
+        finally:
+            release.set()
+            slow.join(10)
+        assert slow_result["success"], slow_result["message"]
+
+    def test_parallel_results_match_serial(self, books):
+        jobs = [(path, sql, limit) for path in books for sql in QUERIES for limit in (None, 50, 100)]
+        expected = {}
+        for path, sql, limit in jobs:
+            result = AdvancedSQLQueryEngine().execute_sql_query(path, sql, limit=limit)
+            assert result["success"], result["message"]
+            expected[(path, sql, limit)] = result["data"]
+
+        engine = AdvancedSQLQueryEngine()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda job: engine.execute_sql_query(job[0], job[1], limit=job[2]), jobs * 3))
+        for job, result in zip(jobs * 3, results):
+            assert result["success"], result["message"]
+            assert result["data"] == expected[job]
+
+    def test_query_state_is_per_thread(self, books):
+        engine = AdvancedSQLQueryEngine()
+        engine.execute_sql_query(books[0], QUERIES[0])
+        assert engine._current_file_path == books[0]
+
+        seen = {}
+
+        def other_thread():
+            seen["before"] = engine._current_file_path
+            engine.execute_sql_query(books[1], QUERIES[0])
+            seen["after"] = engine._current_file_path
+
+        worker = threading.Thread(target=other_thread)
+        worker.start()
+        worker.join(10)
+        assert seen == {"before": None, "after": books[1]}
+        assert engine._current_file_path == books[0]
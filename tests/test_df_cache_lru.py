@@ -0,0 +1,105 @@
+"""
+DataFrame 缓存字节预算 LRU 测试
+
+_df_cache 按写入时测量的字节数记账, 命中刷新最近使用顺序, 超出字节预算/文件数上限时淘汰最久未使用条目,
+单条目超过整个预算时不缓存.
+"""
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine, _SheetFrameCache
+
+
+def _entry(rows: int) -> tuple:
+    df = pd.DataFrame({"v": range(rows)}, dtype="int64")
+    return (1.0, {"s": df}, {})
+
+
+def _nbytes(entry: tuple) -> int:
+    return int(entry[1]["s"].memory_usage(deep=True).sum())
+
+
+@pytest.fixture
+def small_files(tmp_path):
+    paths = []
+    for k in range(3):
+        path = str(tmp_path / f"f{k}.xlsx")
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Data"
+        ws.append(["id", "value"])
+        for i in range(20):
+            ws.append([i, i * k])
+        wb.save(path)
+        paths.append(path)
+    return paths
+
+
+class TestSheetFrameCache:
+    def test_hit_bumps_recency(self):
+        a, b, c = _entry(100), _entry(100), _entry(100)
+        cache = _SheetFrameCache(max_files=10, max_bytes=_nbytes(a) * 2)
+        cache.store("f|a", "f", a)
+        cache.store("f|b", "f", b)
+        assert cache.lookup("f|a", 1.0) is a
+        cache.store("f|c", "f", c)
+        # b 最久未使用, 被淘汰; a 因命中被保留
+        assert list(cache) == ["f|a", "f|c"]
+        assert cache.evictions == 1
+
+    def test_oversized_entry_rejected_without_evicting(self):
+        small = _entry(10)
+        cache = _SheetFrameCache(max_files=10, max_bytes=_nbytes(small) * 3)
+        cache.store("f|small", "f", small)
+        assert not cache.store("g|huge", "g", _entry(10_000))
+        assert list(cache) == ["f|small"]
+        assert cache.get_stats()["rejected"] == 1
+
+    def test_file_limit_evicts_least_recent_file(self):
+        cache = _SheetFrameCache(max_files=2, max_bytes=10**9)
+        cache.store("f1|a", "f1", _entry(5))
+        cache.store("f1|b", "f1", _entry(5))
+        cache.store("f2|a", "f2", _entry(5))
+        cache.lookup("f1|a", 1.0)
+        cache.lookup("f1|b", 1.0)
+        cache.store("f3|a", "f3", _entry(5))
+        assert sorted(cache) == ["f1|a", "f1|b", "f3|a"]
+
+    def test_stats_and_resident_bytes(self):
+        evicted = []
+        a = _entry(50)
+        cache = _SheetFrameCache(max_files=10, max_bytes=10**9, on_evict=evicted.append)
+        cache.store("f|a", "f", a)
+        assert cache.lookup("f|a", 1.0) is a
+        # mtime 变化: 旧条目丢弃并计为未命中
+        assert cache.lookup("f|a", 2.0) is None
+        stats = cache.get_stats()
+        assert (stats["hits"], stats["misses"], stats["entries"], stats["resident_bytes"]) == (1, 1, 0, 0)
+        assert evicted == ["f|a"]
+
+        cache.store("f|a", "f", a)
+        assert cache.resident_bytes == _nbytes(a)
+        cache.evict_to(0)
+        assert len(cache) == 0 and cache.resident_bytes == 0
+
+
+class TestEngineCacheBudget:
+    def test_budget_and_stats_through_queries(self, small_files):
+        engine = AdvancedSQLQueryEngine()
+        engine.execute_sql_query(small_files[0], "SELECT * FROM Data")
+        one_entry = engine._df_cache.resident_bytes
+        assert one_entry > 0
+        engine._df_cache.max_bytes = one_entry * 2
+
+        engine.execute_sql_query(small_files[1], "SELECT * FROM Data")
+        engine.execute_sql_query(small_files[0], "SELECT id FROM Data")  # 命中, 刷新 f0 (换一条SQL绕开结果缓存)
+        engine.execute_sql_query(small_files[2], "SELECT * FROM Data")
+        assert sorted(engine._df_cache) == sorted([f"{small_files[0]}|Data", f"{small_files[2]}|Data"])
+        assert f"{small_files[1]}|Data" not in engine._col_map_cache
+
+        stats = engine.get_cache_stats()["df_cache"]
+        assert stats["hits"] == 1 and stats["misses"] == 3 and stats["evictions"] == 1
+        assert stats["resident_bytes"] == engine._df_cache.resident_bytes
+        assert engine.get_cache_stats()["disk_cache"] is None
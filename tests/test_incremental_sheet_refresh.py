@@ -0,0 +1,187 @@
+"""
+sheet 级增量缓存刷新测试
+
+文件 mtime 变化后按 zip 中央目录里各 sheet 部件(及 sharedStrings/styles/workbook)的 CRC 判断哪些 sheet 变了,
+只重新解析变化的 sheet; 磁盘缓存层同样按部件签名存取.
+"""
+
+import datetime
+import os
+import threading
+import zipfile
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+from excel_mcp_server_fastmcp.api.xlsx_parts import read_sheet_part_signatures
+
+SHEETS = ["表0", "表1", "表2"]
+
+WORKBOOK_XML = (
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+    '<sheet name="甲表" sheetId="1" r:id="rId1"/><sheet name="乙表" sheetId="2" r:id="rId2"/></sheets></workbook>'
+)
+WORKBOOK_RELS = (
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="/xl/worksheets/sheet2.xml"/>'
+    '<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>'
+    "</Relationships>"
+)
+
+
+@pytest.fixture
+def book(tmp_path):
+    path = str(tmp_path / "book.xlsx")
+    wb = Workbook()
+    wb.remove(wb.active)
+    for k, title in enumerate(SHEETS):
+        ws = wb.create_sheet(title)
+        ws.append(["编号", "名称", "数值"])
+        ws.append(["id", "name", "value"])
+        for i in range(1, 6):
+            ws.append([i, f"item {i}", i * (k + 1)])
+    wb.save(path)
+    return path
+
+
+def _edit(path, sheet, cell, value):
+    """修改一个单元格并保证 mtime 变化"""
+    stat = os.stat(path)
+    wb = load_workbook(path)
+    wb[sheet][cell] = value
+    wb.save(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 5))
+
+
+def _set_date1904(path):
+    """只改 workbook.xml 的 date1904, sheet 部件原样保留"""
+    stat = os.stat(path)
+    with zipfile.ZipFile(path) as zf:
+        parts = [(info, zf.read(info)) for info in zf.infolist()]
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for info, data in parts:
+            if info.filename == "xl/workbook.xml":
+                data = data.replace(b"<workbookPr />", b'<workbookPr date1904="1" />')
+            zf.writestr(info, data)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 5))
+
+
+def _cached_frames(engine, path):
+    return {name: engine._df_cache[f"{path}|{name}"][1][name] for name in SHEETS}
+
+
+class TestPartSignatures:
+    def test_signatures_follow_sheet_parts(self, book):
+        before = read_sheet_part_signatures(book)
+        assert list(before) == SHEETS
+        _edit(book, "表1", "C3", 999)
+        after = read_sheet_part_signatures(book)
+        assert after["表0"] == before["表0"] and after["表2"] == before["表2"]
+        assert after["表1"] != before["表1"]
+
+    def test_shared_strings_change_affects_every_sheet(self, tmp_path):
+        # openpyxl 写内联字符串, 这里手工构造带 sharedStrings 的最小包结构
+        def write(path, shared_strings):
+            with zipfile.ZipFile(path, "w") as zf:
+                zf.writestr("xl/workbook.xml", WORKBOOK_XML)
+                zf.writestr("xl/_rels/workbook.xml.rels", WORKBOOK_RELS)
+                zf.writestr("xl/worksheets/sheet1.xml", "<worksheet>1</worksheet>")
+                zf.writestr("xl/worksheets/sheet2.xml", "<worksheet>2</worksheet>")
+                zf.writestr("xl/sharedStrings.xml", shared_strings)
+
+        write(str(tmp_path / "a.xlsx"), "<sst><si><t>甲</t></si></sst>")
+        write(str(tmp_path / "b.xlsx"), "<sst><si><t>乙</t></si></sst>")
+        a = read_sheet_part_signatures(str(tmp_path / "a.xlsx"))
+        b = read_sheet_part_signatures(str(tmp_path / "b.xlsx"))
+        assert list(a) == ["甲表", "乙表"]
+        assert all(a[name][:2] == b[name][:2] and a[name] != b[name] for name in a)
+
+    def test_workbook_part_affects_every_sheet(self, book):
+        before = read_sheet_part_signatures(book)
+        _set_date1904(book)
+        after = read_sheet_part_signatures(book)
+        assert all(after[name][:2] == before[name][:2] and after[name] != before[name] for name in SHEETS)
+
+    def test_non_zip_returns_none(self, tmp_path):
+        path = tmp_path / "legacy.xls"
+        path.write_bytes(b"\xd0\xcf\x11\xe0 not a zip")
+        assert read_sheet_part_signatures(str(path)) is None
+
+
+class TestIncrementalRefresh:
+    def test_only_changed_sheet_reparsed(self, book):
+        engine = AdvancedSQLQueryEngine()
+        engine._load_data_with_cache(book)
+        frames = _cached_frames(engine, book)
+
+        _edit(book, "表1", "C3", 999)
+        parsed = []
+        original = engine._read_excel_sheets
+
+        def recording(file_path, sheet_names=None):
+            parsed.append(list(sheet_names or []))
+            return original(file_path, sheet_names)
+
+        engine._read_excel_sheets = recording
+        result = engine.execute_sql_query(book, "SELECT a.value, b.value AS v1 FROM 表0 a JOIN 表1 b ON a.id = b.id WHERE a.id = 1")
+        assert result["success"], result["message"]
+        assert result["data"][1] == [1, 999]
+        assert parsed == [["表1"]]
+
+        refreshed = _cached_frames(engine, book)
+        assert refreshed["表0"] is frames["表0"] and refreshed["表2"] is frames["表2"]
+        assert refreshed["表1"] is not frames["表1"]
+        assert engine.get_cache_stats()["df_cache"]["revalidated"] >= 1
+
+    def test_disk_tier_keyed_by_part_signature(self, book, tmp_path):
+        cache_dir = str(tmp_path / "disk")
+        AdvancedSQLQueryEngine(disk_cache_dir=cache_dir)._load_data_with_cache(book)
+        _edit(book, "表0", "C4", -1)
+
+        fresh = AdvancedSQLQueryEngine(disk_cache_dir=cache_dir)
+        fresh._load_data_with_cache(book)
+        stats = fresh.get_cache_stats()["disk_cache"]
+        assert stats["hit_count"] == 2 and stats["miss_count"] == 1
+        assert fresh.execute_sql_query(book, "SELECT value FROM 表0 WHERE id = 2")["data"][1] == [-1]
+
+    def test_date1904_switch_reparses_dates(self, tmp_path):
+        path = str(tmp_path / "dates.xlsx")
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "表"
+        ws.append(["编号", "日期"])
+        ws.append(["id", "day"])
+        ws.append([1, datetime.datetime(2024, 1, 1)])
+        wb.save(path)
+
+        engine = AdvancedSQLQueryEngine()
+        assert engine.execute_sql_query(path, "SELECT day FROM 表")["data"][1] == ["2024-01-01T00:00:00"]
+        _set_date1904(path)
+        # 1904 日期系统的序列号起点晚 1462 天
+        assert engine.execute_sql_query(path, "SELECT day FROM 表")["data"][1] == ["2028-01-02T00:00:00"]
+        assert engine.get_cache_stats()["df_cache"]["revalidated"] == 0
+
+    def test_part_signature_computed_outside_lock(self, book):
+        engine = AdvancedSQLQueryEngine()
+        engine._load_data_with_cache(book)
+        _edit(book, "表1", "C3", 999)
+        cache = engine._df_cache
+        acquired = []
+
+        def probe():
+            if cache._lock.acquire(timeout=1):
+                cache._lock.release()
+                acquired.append(True)
+
+        def signature():
+            # 另一个线程能拿到锁, 说明读中央目录时没有持有缓存锁
+            thread = threading.Thread(target=probe)
+            thread.start()
+            thread.join()
+            return read_sheet_part_signatures(book)["表0"]
+
+        assert cache.lookup(f"{book}|表0", os.path.getmtime(book), signature) is not None
+        assert acquired == [True]
@@ -0,0 +1,156 @@
+"""
+批量 INSERT 测试
+
+INSERT INTO t SELECT ... 复用 SELECT 引擎, 结果按位置对应目标列; 新行整体构造为一个 DataFrame 按列校验类型,
+再一次追加写入(超出 batch_insert_rows 单次上限时直接流式写入); 多行 VALUES 的校验错误与逐行校验一致.
+布尔目标列写回 TRUE/FALSE 单元格, 不写成 1/0.
+"""
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from excel_mcp_server_fastmcp.api import advanced_sql_query
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+
+
+@pytest.fixture
+def game(tmp_path):
+    path = str(tmp_path / "game.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "道具"
+    ws.append(["id", "name", "price", "rarity"])
+    for i in range(1, 21):
+        ws.append([i, f"item{i}", i * 10, "rare" if i % 5 == 0 else "common"])
+    archive = wb.create_sheet("归档")
+    archive.append(["id", "name", "price"])
+    archive.append([0, "seed", 1])
+    wb.save(path)
+    return path
+
+
+def _sheet_rows(path, sheet):
+    return [list(row) for row in load_workbook(path)[sheet].iter_rows(min_row=2, values_only=True)]
+
+
+class TestInsertSelect:
+    def test_copy_filtered_rows(self, game):
+        engine = AdvancedSQLQueryEngine()
+        result = engine.execute_insert_query(game, "INSERT INTO 归档 (id, name, price) SELECT id, name, price FROM 道具 WHERE rarity = 'rare'")
+        assert result["success"], result["message"]
+        assert result["affected_rows"] == 4
+        assert _sheet_rows(game, "归档") == [[0, "seed", 1], [5, "item5", 50], [10, "item10", 100], [15, "item15", 150], [20, "item20", 200]]
+
+    def test_transform_maps_columns_by_position(self, game):
+        sql = "INSERT INTO 归档 SELECT id + 100, UPPER(name), price * 2 FROM 道具 WHERE id <= 2"
+        result = AdvancedSQLQueryEngine().execute_insert_query(game, sql)
+        assert result["success"], result["message"]
+        assert _sheet_rows(game, "归档")[1:] == [[101, "ITEM1", 20], [102, "ITEM2", 40]]
+
+    def test_grouped_aggregate_into_column_subset(self, game):
+        sql = "INSERT INTO 归档 (id, price) SELECT MAX(id), SUM(price) FROM 道具 GROUP BY rarity ORDER BY 1"
+        result = AdvancedSQLQueryEngine().execute_insert_query(game, sql)
+        assert result["success"], result["message"]
+        assert _sheet_rows(game, "归档")[1:] == [[19, None, 1600], [20, None, 500]]
+
+    def test_column_count_mismatch(self, game):
+        result = AdvancedSQLQueryEngine().execute_insert_query(game, "INSERT INTO 归档 (id, name) SELECT id FROM 道具")
+        assert not result["success"]
+        assert "列数" in result["message"]
+
+    def test_type_error_reported_before_write(self, game):
+        result = AdvancedSQLQueryEngine().execute_insert_query(game, "INSERT INTO 归档 (id, price) SELECT id, name FROM 道具")
+        assert not result["success"]
+        assert "类型不匹配" in result["message"] and "item1" in result["message"]
+        assert _sheet_rows(game, "归档") == [[0, "seed", 1]]
+
+    def test_empty_result_inserts_nothing(self, game):
+        result = AdvancedSQLQueryEngine().execute_insert_query(game, "INSERT INTO 归档 (id) SELECT id FROM 道具 WHERE id > 100")
+        assert result["success"] and result["affected_rows"] == 0
+
+    def test_dry_run_preview_truncated(self, game, monkeypatch):
+        monkeypatch.setattr(advanced_sql_query, "MAX_RESULT_ROWS", 3)
+        result = AdvancedSQLQueryEngine().execute_insert_query(game, "INSERT INTO 归档 SELECT id, name, price FROM 道具", dry_run=True)
+        assert result["affected_rows"] == 20 and result["truncated"]
+        assert result["data"] == [{"id": i, "name": f"item{i}", "price": i * 10} for i in (1, 2, 3)]
+        assert _sheet_rows(game, "归档") == [[0, "seed", 1]]
+
+    def test_row_limit(self, game, monkeypatch):
+        monkeypatch.setattr(advanced_sql_query, "MAX_INSERT_SELECT_ROWS", 10)
+        result = AdvancedSQLQueryEngine().execute_insert_query(game, "INSERT INTO 归档 SELECT id, name, price FROM 道具")
+        assert not result["success"]
+        assert "超过限制(10)" in result["message"]
+
+    def test_beyond_batch_limit_streams_once(self, game, monkeypatch):
+        monkeypatch.setattr(advanced_sql_query, "_MANAGER_INSERT_LIMIT", 5)
+        calls = []
+        original = advanced_sql_query.StreamingWriter.batch_insert_rows
+
+        def spy(file_path, sheet_name, data, *args, **kwargs):
+            calls.append(len(data))
+            return original(file_path, sheet_name, data, *args, **kwargs)
+
+        monkeypatch.setattr(advanced_sql_query.StreamingWriter, "batch_insert_rows", spy)
+        result = AdvancedSQLQueryEngine().execute_insert_query(game, "INSERT INTO 归档 SELECT id, name, price FROM 道具")
+        assert result["success"], result["message"]
+        assert calls == [20]
+        assert len(_sheet_rows(game, "归档")) == 21
+
+
+@pytest.fixture
+def flags(tmp_path):
+    path = str(tmp_path / "flags.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "玩家"
+    ws.append(["id", "vip", "banned", "tier"])
+    for i in range(1, 7):
+        ws.append([i, i % 2 == 0, None if i == 3 else i > 4, i % 2])
+    wb.save(path)
+    return path
+
+
+class TestInsertSelectBool:
+    def test_bool_columns_round_trip(self, flags):
+        engine = AdvancedSQLQueryEngine()
+        before = engine.execute_sql_query(flags, "SELECT vip, banned, tier FROM 玩家 ORDER BY id")["data"][1:]
+        result = engine.execute_insert_query(flags, "INSERT INTO 玩家 (id, vip, banned, tier) SELECT id + 10, vip, banned, tier FROM 玩家")
+        assert result["success"], result["message"]
+        rows = _sheet_rows(flags, "玩家")
+        # 含空单元格的 banned 列同样写回布尔值; 0/1 整数列 tier 保持整数
+        assert rows[6:] == [[i + 10, *row[1:]] for i, row in enumerate(rows[:6], 1)]
+        assert {type(v) for row in rows[6:] for v in row[1:3] if v is not None} == {bool}
+        assert {type(row[3]) for row in rows[6:]} == {int}
+        after = engine.execute_sql_query(flags, "SELECT vip, banned, tier FROM 玩家 WHERE id > 10 ORDER BY id")["data"][1:]
+        assert after == before
+
+    def test_aggregate_into_bool_column(self, flags):
+        result = AdvancedSQLQueryEngine().execute_insert_query(flags, "INSERT INTO 玩家 (id, banned) SELECT MAX(id) + 90, MAX(banned) FROM 玩家")
+        assert result["success"], result["message"]
+        assert _sheet_rows(flags, "玩家")[-1] == [96, None, True, None]
+
+
+class TestMultiRowValues:
+    @pytest.mark.parametrize(
+        "values, message",
+        [
+            ("(1, 'a', 1), (2, 'b', 'x'), (3, 'c')", "写入了字符串 'x'"),
+            ("(1, 'a', 1), (2, 'b'), ('y', 'c', 'z')", "VALUES 值数量(2)"),
+            ("(1, 'a'), (2, 'b', 'x')", "VALUES 值数量(2)"),
+            ("('q', 'a'), (2, 'b', 'x')", "写入了字符串 'q'"),
+        ],
+    )
+    def test_first_error_in_row_order(self, game, values, message):
+        result = AdvancedSQLQueryEngine().execute_insert_query(game, f"INSERT INTO 归档 (id, name, price) VALUES {values}")
+        assert not result["success"]
+        assert message in result["message"]
+
+    def test_duplicate_target_column(self, game):
+        result = AdvancedSQLQueryEngine().execute_insert_query(game, "INSERT INTO 归档 (id, id) VALUES (1, 2)")
+        assert not result["success"]
+        assert "重复" in result["message"]
+
+    def test_rows_appended(self, game):
+        result = AdvancedSQLQueryEngine().execute_insert_query(game, "INSERT INTO 归档 (id, name, price) VALUES (7, 'x', 1.5), (8, '', -2)")
+        assert result["success"], result["message"]
+        assert _sheet_rows(game, "归档")[1:] == [[7, "x", 1.5], [8, None, -2]]
@@ -0,0 +1,94 @@
+"""
+JOIN 构建侧哈希索引缓存测试
+
+右表为缓存中的 sheet 时, 等值 JOIN 按 (sheet, 连接键列) 缓存构建侧的去重键与行位置数组,
+后续查询直接探测; sheet 刷新/缓存清理时索引同步失效, 结果与 pd.merge 一致.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine, _build_join_index, _probe_join_index
+
+
+@pytest.fixture
+def game(tmp_path):
+    path = str(tmp_path / "game.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "掉落"
+    ws.append(["drop_id", "item_id", "count"])
+    for i, item in enumerate([1, 2, 2, 3, 9, None], 1):
+        ws.append([i, item, i * 10])
+    items = wb.create_sheet("道具")
+    items.append(["id", "name"])
+    for i in range(1, 5):
+        items.append([i, f"item{i}"])
+    items.append([2, "item2b"])
+    wb.save(path)
+    return path
+
+
+def _rows(result):
+    assert result["success"], result["message"]
+    return result["data"][1:]
+
+
+JOIN_SQL = "SELECT d.drop_id, i.name FROM 掉落 d JOIN 道具 i ON d.item_id = i.id ORDER BY d.drop_id, i.name"
+
+
+class TestJoinIndexCache:
+    def test_repeated_join_probes_cached_index(self, game):
+        engine = AdvancedSQLQueryEngine()
+        expected = [[1, "item1"], [2, "item2"], [2, "item2b"], [3, "item2"], [3, "item2b"], [4, "item3"]]
+        assert _rows(engine.execute_sql_query(game, JOIN_SQL)) == expected
+        left_sql = "SELECT d.drop_id, i.name FROM 掉落 d LEFT JOIN 道具 i ON d.item_id = i.id WHERE d.drop_id >= 4 ORDER BY d.drop_id"
+        assert _rows(engine.execute_sql_query(game, left_sql)) == [[4, "item3"], [5, None], [6, None]]
+        stats = engine.get_cache_stats()["join_index_cache"]
+        assert stats == {"entries": 1, "hits": 1, "misses": 1, "evictions": 0}
+
+    def test_index_invalidated_with_sheet_refresh(self, game):
+        engine = AdvancedSQLQueryEngine()
+        engine.execute_sql_query(game, JOIN_SQL)
+        stat = os.stat(game)
+        wb = load_workbook(game)
+        wb["道具"]["B2"] = "renamed"
+        wb.save(game)
+        os.utime(game, (stat.st_atime, stat.st_mtime + 5))
+
+        assert _rows(engine.execute_sql_query(game, JOIN_SQL))[0] == [1, "renamed"]
+        assert engine.get_cache_stats()["join_index_cache"]["hits"] == 0
+        engine.clear_cache()
+        assert engine.get_cache_stats()["join_index_cache"]["entries"] == 0
+
+    def test_mismatched_key_types_use_merge(self, game):
+        engine = AdvancedSQLQueryEngine()
+        result = engine.execute_sql_query(game, "SELECT d.drop_id FROM 掉落 d JOIN 道具 i ON d.drop_id = i.name")
+        assert engine.get_cache_stats()["join_index_cache"]["entries"] == 0
+        assert not result["success"] or result["data"][1:] == []
+
+
+class TestProbeMatchesMerge:
+    @pytest.mark.parametrize("how", ["inner", "left"])
+    @pytest.mark.parametrize(
+        "left_keys, right_keys",
+        [
+            ([3, 1, 2, 1, 7], [1, 1, 2, 5]),
+            ([1.0, None, 2.0, 4.0], [None, 2.0, 2.0, 1.0]),
+            (["a", None, "b", 3], [np.nan, "b", 3, "c", "b"]),
+        ],
+    )
+    def test_same_rows_as_merge(self, how, left_keys, right_keys):
+        left = pd.DataFrame({"k": pd.Series(left_keys, dtype=object if "a" in left_keys else None), "a": range(len(left_keys))})
+        right = pd.DataFrame({"rk": pd.Series(right_keys, dtype=object if "c" in right_keys else None), "b": range(len(right_keys))})
+        left_pos, right_pos = _probe_join_index(_build_join_index(right["rk"]), left["k"], how)
+        probed = [(left["a"].iloc[lp], None if rp < 0 else right["b"].iloc[rp]) for lp, rp in zip(left_pos, right_pos)]
+        merged = left.merge(right, left_on="k", right_on="rk", how=how)
+        expected = [(a, None if pd.isna(b) else b) for a, b in zip(merged["a"], merged["b"])]
+        assert sorted(probed) == sorted(expected)
+        # 探测结果按左表行顺序输出
+        assert [a for a, _ in probed] == sorted(a for a, _ in probed)
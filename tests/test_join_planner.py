@@ -0,0 +1,106 @@
+"""
+多表 JOIN 规划测试
+
+WHERE 中只引用单个内连接表的条件在 JOIN 前先过滤该表; 星型内连接按估算扇出重排执行顺序,
+结果与列布局与原文顺序一致; 笛卡尔积超过 MAX_CROSS_JOIN_ROWS 时拒绝执行.
+"""
+
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api import advanced_sql_query
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+
+
+@pytest.fixture
+def game(tmp_path):
+    path = str(tmp_path / "game.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "掉落"
+    ws.append(["drop_id", "item_id", "monster_id", "count"])
+    for i in range(1, 41):
+        ws.append([i, i % 10 + 1, i % 4 + 1, i])
+    ws.append([41, 99, 1, 0])
+    items = wb.create_sheet("道具")
+    items.append(["id", "name", "rarity"])
+    for i in range(1, 11):
+        items.append([i, f"item{i}", "rare" if i % 5 == 0 else "common"])
+    monsters = wb.create_sheet("怪物")
+    monsters.append(["mid", "mname"])
+    for i in range(1, 5):
+        for _ in range(3):
+            monsters.append([i, f"m{i}"])
+    wb.save(path)
+    return path
+
+
+@pytest.fixture
+def engine():
+    engine = AdvancedSQLQueryEngine()
+    engine.join_inputs = []
+    engine.join_orders = []
+    prefilter, plan = engine._prefilter_join_input, engine._plan_join_order
+
+    def spy_prefilter(df, conditions):
+        filtered = prefilter(df, conditions)
+        engine.join_inputs.append((len(df), len(filtered)))
+        return filtered
+
+    def spy_plan(joins, *args):
+        ordered = plan(joins, *args)
+        engine.join_orders.append([join.this.alias for join in ordered])
+        return ordered
+
+    engine._prefilter_join_input = spy_prefilter
+    engine._plan_join_order = spy_plan
+    return engine
+
+
+def _data(result):
+    assert result["success"], result["message"]
+    return result["data"]
+
+
+class TestPredicatePushdown:
+    def test_single_table_conditions_filter_inputs(self, game, engine):
+        sql = "SELECT d.drop_id, i.name FROM 掉落 d JOIN 道具 i ON d.item_id = i.id WHERE i.rarity = 'rare' AND d.count > 30 ORDER BY d.drop_id"
+        assert _data(engine.execute_sql_query(game, sql))[1:] == [[34, "item5"], [39, "item10"]]
+        assert engine.join_inputs == [(41, 10), (10, 2)]
+
+    def test_left_join_null_side_not_filtered_early(self, game, engine):
+        sql = "SELECT d.drop_id FROM 掉落 d LEFT JOIN 道具 i ON d.item_id = i.id WHERE i.id IS NULL"
+        assert _data(engine.execute_sql_query(game, sql))[1:] == [[41]]
+        assert engine.join_inputs == [(41, 41)]
+
+    def test_self_join_conditions_stay_on_their_alias(self, game, engine):
+        sql = "SELECT a.id, b.id FROM 道具 a JOIN 道具 b ON a.rarity = b.rarity WHERE a.id = 5 AND b.id > 5"
+        assert _data(engine.execute_sql_query(game, sql))[1:] == [[5, 10]]
+
+
+class TestJoinReordering:
+    SQL = "SELECT * FROM 掉落 d JOIN 怪物 m ON d.monster_id = m.mid JOIN 道具 i ON i.id = d.item_id WHERE d.drop_id <= 8 ORDER BY d.drop_id, m.mname"
+
+    def test_selective_join_first_with_original_layout(self, game, engine):
+        reordered = _data(engine.execute_sql_query(game, self.SQL))
+        assert engine.join_orders == [["i", "m"]]
+
+        engine._plan_join_order = lambda joins, *args: joins
+        assert reordered == _data(engine.execute_sql_query(game, self.SQL))
+        assert reordered[0] == ["drop_id", "item_id", "monster_id", "count", "mid", "mname", "id", "name", "rarity"]
+        assert len(reordered) == 1 + 8 * 3
+
+    def test_non_star_joins_keep_text_order(self, game, engine):
+        sql = "SELECT d.drop_id FROM 掉落 d JOIN 怪物 m ON d.monster_id = m.mid LEFT JOIN 道具 i ON i.id = d.item_id WHERE d.drop_id = 1"
+        assert len(_data(engine.execute_sql_query(game, sql))) == 1 + 3
+        assert engine.join_orders == [["m", "i"]]
+
+
+class TestCrossJoinLimit:
+    def test_oversized_product_rejected(self, game, monkeypatch):
+        monkeypatch.setattr(advanced_sql_query, "MAX_CROSS_JOIN_ROWS", 200)
+        engine = AdvancedSQLQueryEngine()
+        result = engine.execute_sql_query(game, "SELECT COUNT(*) FROM 掉落 CROSS JOIN 道具")
+        assert not result["success"]
+        assert "CROSS JOIN" in result["message"]
+        assert _data(engine.execute_sql_query(game, "SELECT COUNT(*) FROM 怪物 CROSS JOIN 道具"))[1:] == [[120]]
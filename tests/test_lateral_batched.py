@@ -0,0 +1,100 @@
+"""
+LATERAL 批量执行测试
+
+等值关联的 LATERAL 子查询对内表只执行一次: ORDER BY + LIMIT 按连接键分组取每组 Top-N,
+聚合子查询按连接键 GROUP BY, 再哈希连接回左表; 非等值关联仍逐行执行.
+"""
+
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+
+ORDERS = [
+    (1, 1, 100, "north"),
+    (2, 1, 50, "south"),
+    (3, 2, 300, "south"),
+    (4, 3, 20, "north"),
+    (5, 1, 70, "north"),
+    (6, None, 10, "south"),
+    (7, 8, 40, None),
+]
+
+
+@pytest.fixture
+def shop(tmp_path):
+    path = str(tmp_path / "shop.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "客户"
+    ws.append(["id", "name", "region"])
+    for i in range(1, 9):
+        ws.append([i, f"c{i}", None if i == 8 else ["north", "south"][i % 2]])
+    orders = wb.create_sheet("订单")
+    orders.append(["oid", "cust_id", "amount", "region"])
+    for row in ORDERS:
+        orders.append(list(row))
+    wb.save(path)
+    return path
+
+
+@pytest.fixture
+def engine():
+    engine = AdvancedSQLQueryEngine()
+    sub_executions = []
+    original = engine._execute_subquery
+
+    def counting(subquery, worksheets):
+        sub_executions.append(str(subquery))
+        return original(subquery, worksheets)
+
+    def no_per_row(*args):
+        raise AssertionError("不应逐行执行 LATERAL")
+
+    engine._execute_subquery = counting
+    engine._apply_lateral_per_row = no_per_row
+    engine.sub_executions = sub_executions
+    return engine
+
+
+def _rows(result):
+    assert result["success"], result["message"]
+    return result["data"][1:]
+
+
+class TestBatchedLateral:
+    def test_top_n_per_key(self, shop, engine):
+        sql = "SELECT c.id, t.oid FROM 客户 c CROSS JOIN LATERAL (SELECT oid FROM 订单 o WHERE o.cust_id = c.id ORDER BY amount DESC LIMIT 2) t ORDER BY c.id, t.oid"
+        assert _rows(engine.execute_sql_query(shop, sql)) == [[1, 1], [1, 5], [2, 3], [3, 4], [8, 7]]
+        assert len(engine.sub_executions) == 1
+
+    def test_offset_within_group(self, shop, engine):
+        sql = "SELECT c.id, t.amount FROM 客户 c, LATERAL (SELECT amount FROM 订单 o WHERE o.cust_id = c.id ORDER BY amount LIMIT 1 OFFSET 1) t"
+        assert _rows(engine.execute_sql_query(shop, sql)) == [[1, 70]]
+
+    def test_left_join_keeps_unmatched_rows(self, shop, engine):
+        sql = "SELECT c.id, t.amount FROM 客户 c LEFT JOIN LATERAL (SELECT amount FROM 订单 o WHERE o.cust_id = c.id AND o.amount > 60) t ON TRUE WHERE c.id <= 4 ORDER BY c.id, t.amount"
+        assert _rows(engine.execute_sql_query(shop, sql)) == [[1, 70], [1, 100], [2, 300], [3, None], [4, None]]
+
+    def test_multiple_keys(self, shop, engine):
+        sql = "SELECT c.id, t.oid FROM 客户 c JOIN LATERAL (SELECT oid FROM 订单 o WHERE o.cust_id = c.id AND o.region = c.region) t ON TRUE ORDER BY t.oid"
+        assert _rows(engine.execute_sql_query(shop, sql)) == [[1, 2]]
+
+    def test_aggregate_returns_one_row_per_left_row(self, shop, engine):
+        sql = "SELECT c.id, t.n, t.mx FROM 客户 c CROSS JOIN LATERAL (SELECT COUNT(*) AS n, MAX(amount) AS mx FROM 订单 o WHERE o.cust_id = c.id) t WHERE c.id IN (1, 4) ORDER BY c.id"
+        assert _rows(engine.execute_sql_query(shop, sql)) == [[1, 3, 100], [4, 0, None]]
+
+    def test_uncorrelated_lateral_executed_once(self, shop, engine):
+        sql = "SELECT c.id, t.mx FROM 客户 c CROSS JOIN LATERAL (SELECT MAX(amount) AS mx FROM 订单) t WHERE c.id < 3 ORDER BY c.id"
+        assert _rows(engine.execute_sql_query(shop, sql)) == [[1, 300], [2, 300]]
+        assert len(engine.sub_executions) == 1
+
+
+class TestPerRowFallback:
+    def test_non_equi_correlation(self, shop):
+        sql = "SELECT c.id, t.oid FROM 客户 c LEFT JOIN LATERAL (SELECT oid FROM 订单 o WHERE o.cust_id > c.id ORDER BY oid LIMIT 1) t ON TRUE WHERE c.id >= 6 ORDER BY c.id"
+        assert _rows(AdvancedSQLQueryEngine().execute_sql_query(shop, sql)) == [[6, 7], [7, 7], [8, None]]
+
+    def test_cross_join_drops_rows_without_results(self, shop):
+        sql = "SELECT c.id, t.oid FROM 客户 c CROSS JOIN LATERAL (SELECT oid FROM 订单 o WHERE o.cust_id > c.id + 5 ORDER BY oid LIMIT 1) t ORDER BY c.id"
+        assert _rows(AdvancedSQLQueryEngine().execute_sql_query(shop, sql)) == [[1, 7], [2, 7]]
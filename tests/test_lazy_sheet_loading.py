@@ -0,0 +1,101 @@
+"""
+按需加载工作表测试
+
+冷查询只解析SQL引用的sheet(FROM/JOIN/子查询/CTE),其余sheet延迟到首次访问时加载,
+缓存按sheet粒度存储。
+"""
+
+import os
+
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine, _LazyWorksheets
+
+
+@pytest.fixture
+def multi_sheet_file(tmp_path):
+    """6个双行表头sheet的工作簿"""
+    file_path = str(tmp_path / "multi_sheet.xlsx")
+    wb = Workbook()
+    wb.remove(wb.active)
+    for k in range(6):
+        ws = wb.create_sheet(f"表{k}")
+        ws.append(["编号", "名称", "等级"])
+        ws.append(["id", "name", "level"])
+        for i in range(1, 21):
+            ws.append([i, f"item_{k}_{i}", i % 5])
+    wb.save(file_path)
+    return file_path
+
+
+def _cached_sheets(engine, file_path):
+    return sorted(key.split("|", 1)[1] for key in engine._df_cache if key.startswith(f"{file_path}|"))
+
+
+class TestLazySheetLoading:
+    def test_single_table_query_loads_one_sheet(self, multi_sheet_file):
+        engine = AdvancedSQLQueryEngine()
+        result = engine.execute_sql_query(multi_sheet_file, "SELECT 编号, name FROM 表3 WHERE 等级 = 2")
+        assert result["success"], result["message"]
+        assert _cached_sheets(engine, multi_sheet_file) == ["表3"]
+        # 未加载的sheet仍出现在可用表列表中
+        assert result["query_info"]["available_tables"] == [f"表{k}" for k in range(6)]
+
+    def test_join_subquery_and_cte_tables_collected(self, multi_sheet_file):
+        engine = AdvancedSQLQueryEngine()
+        sql = "WITH c AS (SELECT id FROM 表5) SELECT a.id FROM 表1 a JOIN 表2 b ON a.id = b.id WHERE a.id IN (SELECT id FROM c) AND a.id IN (SELECT id FROM 表4)"
+        result = engine.execute_sql_query(multi_sheet_file, sql)
+        assert result["success"], result["message"]
+        assert len(result["data"]) == 21
+        assert _cached_sheets(engine, multi_sheet_file) == ["表1", "表2", "表4", "表5"]
+
+    def test_unknown_table_lists_all_sheets(self, multi_sheet_file):
+        engine = AdvancedSQLQueryEngine()
+        result = engine.execute_sql_query(multi_sheet_file, "SELECT * FROM 不存在的表")
+        assert not result["success"]
+        assert "表0" in result["message"] and "表5" in result["message"]
+        assert _cached_sheets(engine, multi_sheet_file) == []
+
+    def test_sheet_cache_reused_and_revalidated_by_mtime(self, multi_sheet_file):
+        engine = AdvancedSQLQueryEngine()
+        engine.execute_sql_query(multi_sheet_file, "SELECT * FROM 表0")
+        cached_df = engine._df_cache[f"{multi_sheet_file}|表0"][1]["表0"]
+        engine.execute_sql_query(multi_sheet_file, "SELECT * FROM 表0 JOIN 表1 ON 表0.id = 表1.id")
+        assert engine._df_cache[f"{multi_sheet_file}|表0"][1]["表0"] is cached_df
+
+        # 只改mtime、sheet部件未变: 校验部件签名后继续复用
+        stat = os.stat(multi_sheet_file)
+        os.utime(multi_sheet_file, (stat.st_atime, stat.st_mtime + 10))
+        engine.execute_sql_query(multi_sheet_file, "SELECT * FROM 表0")
+        assert engine._df_cache[f"{multi_sheet_file}|表0"][1]["表0"] is cached_df
+        assert engine.get_cache_stats()["df_cache"]["revalidated"] == 1
+
+    def test_full_load_still_returns_every_sheet(self, multi_sheet_file):
+        engine = AdvancedSQLQueryEngine()
+        data = engine._load_data_with_cache(multi_sheet_file)
+        assert list(data.keys()) == [f"表{k}" for k in range(6)]
+        assert not isinstance(data, _LazyWorksheets)
+
+
+class TestLazyWorksheetsMapping:
+    def test_pending_sheet_loaded_on_first_access(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return "df"
+
+        data = _LazyWorksheets({"a": "df_a"}, {"b": loader})
+        assert "b" in data and data.keys() == ["a", "b"]
+        assert calls == []
+        assert data["b"] == "df" and data["b"] == "df"
+        assert calls == [1]
+
+    def test_copy_keeps_pending_entries(self):
+        data = _LazyWorksheets({}, {"b": lambda: "df"})
+        copied = data.copy()
+        assert isinstance(copied, _LazyWorksheets)
+        assert copied.get("b") == "df"
+        with pytest.raises(KeyError):
+            copied["missing"]
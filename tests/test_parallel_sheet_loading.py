@@ -0,0 +1,126 @@
+"""
+并行加载测试
+
+跨文件 @'path' 引用的多个外部文件、大文件内的多个sheet通过线程池并行加载;
+合并顺序固定, 结果与串行加载一致, query_info.load_timings 记录每次加载耗时.
+"""
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api import advanced_sql_query
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+from excel_mcp_server_fastmcp.utils.concurrent_utils import parallel_map, parallel_read_files
+
+
+def _write_book(path, sheets):
+    wb = Workbook()
+    wb.remove(wb.active)
+    for title, offset in sheets:
+        ws = wb.create_sheet(title)
+        ws.append(["编号", "名称", "数值"])
+        ws.append(["id", "name", "value"])
+        for i in range(1, 11):
+            ws.append([i, f"{title} {i}", i * offset])
+    wb.save(path)
+
+
+@pytest.fixture
+def workbooks(tmp_path):
+    main = str(tmp_path / "main.xlsx")
+    _write_book(main, [("物品", 1)])
+    _write_book(str(tmp_path / "drops.xlsx"), [("掉落", 2)])
+    _write_book(str(tmp_path / "shops.xlsx"), [("商店", 3)])
+    return main
+
+
+CROSS_SQL = "SELECT a.id, b.value AS drop_value, c.value AS shop_value FROM 物品 a JOIN 掉落@'drops.xlsx' b ON a.id = b.id JOIN 商店@'shops.xlsx' c ON a.id = c.id WHERE a.id <= 3"
+
+
+class TestParallelCrossFileLoading:
+    def test_parallel_matches_serial_with_load_timings(self, workbooks):
+        serial = AdvancedSQLQueryEngine()
+        serial._load_workers = 1
+        expected = serial.execute_sql_query(workbooks, CROSS_SQL)
+        assert expected["success"], expected["message"]
+
+        engine = AdvancedSQLQueryEngine()
+        result = engine.execute_sql_query(workbooks, CROSS_SQL)
+        assert result["success"], result["message"]
+        assert result["data"] == expected["data"] == [["a.id", "drop_value", "shop_value"], [1, 2, 3], [2, 4, 6], [3, 6, 9]]
+
+        # 主文件在前, 外部文件按固定顺序(SQL中从后向前)
+        timings = result["query_info"]["load_timings"]
+        assert [t["file"] for t in timings] == ["main.xlsx", "shops.xlsx", "drops.xlsx"]
+        assert timings[1]["sheets"] == ["商店"] and all(t["ms"] >= 0 for t in timings)
+
+        # 命中查询结果缓存时没有加载
+        again = engine.execute_sql_query(workbooks, CROSS_SQL)
+        assert again["query_info"]["cache_hit"] is True and again["query_info"]["load_timings"] == []
+
+    def test_external_files_dispatched_through_pool(self, workbooks, monkeypatch):
+        calls = []
+        original = advanced_sql_query.parallel_read_files
+
+        def recording(paths, read_fn, max_workers=None, **kwargs):
+            calls.append((list(paths), max_workers))
+            return original(paths, read_fn, max_workers=max_workers, **kwargs)
+
+        monkeypatch.setattr(advanced_sql_query, "parallel_read_files", recording)
+        engine = AdvancedSQLQueryEngine()
+        engine._load_workers = 3
+        assert engine.execute_sql_query(workbooks, CROSS_SQL)["success"]
+        assert len(calls) == 1
+        paths, workers = calls[0]
+        assert [p.rsplit("/", 1)[-1] for p in paths] == ["shops.xlsx", "drops.xlsx"] and workers == 3
+
+    def test_missing_external_file_still_reported(self, workbooks):
+        engine = AdvancedSQLQueryEngine()
+        result = engine.execute_sql_query(workbooks, "SELECT a.id FROM 物品 a JOIN 掉落@'nope.xlsx' b ON a.id = b.id")
+        assert not result["success"] and "nope.xlsx" in result["message"]
+
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_external_load_error_carries_reason(self, workbooks, tmp_path, workers):
+        (tmp_path / "broken.xlsx").write_bytes(b"not a workbook")
+        engine = AdvancedSQLQueryEngine()
+        engine._load_workers = workers
+        sql = "SELECT a.id FROM 物品 a JOIN 掉落@'drops.xlsx' b ON a.id = b.id JOIN 坏表@'broken.xlsx' c ON a.id = c.id"
+        result = engine.execute_sql_query(workbooks, sql)
+        # 工作线程里的失败原因随错误信息返回, 不再只有笼统的"无法加载"
+        assert not result["success"]
+        assert "无法加载跨文件引用的Excel数据" in result["message"] and "读取工作表列表失败" in result["message"]
+
+    def test_parallel_read_files_returns_exceptions(self):
+        def read(path):
+            if path == "bad":
+                raise OSError("磁盘错误")
+            return path.upper()
+
+        for workers in (1, 2):
+            results = parallel_read_files(["ok", "bad"], read, max_workers=workers, return_exceptions=True)
+            assert results[0] == ("ok", "OK") and isinstance(results[1][1], OSError) and str(results[1][1]) == "磁盘错误"
+            assert parallel_read_files(["ok", "bad"], read, max_workers=workers)[1] == ("bad", None)
+
+
+class TestParallelSheetParsing:
+    def test_sheet_groups_match_single_handle(self, tmp_path, monkeypatch):
+        path = str(tmp_path / "multi.xlsx")
+        _write_book(path, [(f"表{k}", k) for k in range(1, 6)])
+        serial = AdvancedSQLQueryEngine()
+        serial._load_workers = 1
+        expected = serial._read_excel_sheets(path)
+
+        monkeypatch.setattr(advanced_sql_query, "SHEET_PARALLEL_MIN_FILE_MB", 0)
+        engine = AdvancedSQLQueryEngine()
+        engine._load_workers = 3
+        frames, descriptions, col_maps = engine._read_excel_sheets(path)
+
+        assert list(frames) == list(expected[0]) == [f"表{k}" for k in range(1, 6)]
+        for name, df in frames.items():
+            pd.testing.assert_frame_equal(df, expected[0][name])
+        assert descriptions == expected[1] and col_maps == expected[2]
+
+    def test_parallel_map_serial_threshold(self):
+        assert parallel_map([1, 2], lambda x: x * 10, max_workers=2, serial_threshold=1) == [10, 20]
+        assert parallel_map([1, 2, 3], lambda x: x + 1, max_workers=1) == [2, 3, 4]
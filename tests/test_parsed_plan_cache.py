@@ -0,0 +1,94 @@
+"""
+SQL 解析计划缓存测试
+
+相同 SQL 且表结构(列名映射/中文表头)不变时复用预处理与 sqlglot 解析结果;
+缓存的解析树每次以副本交给执行阶段, 表结构变化后不再命中.
+"""
+
+import os
+from unittest.mock import patch
+
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api import advanced_sql_query
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+
+
+def _write_items(path, columns=("id", "name", "price")):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "物品"
+    ws.append(["编号", "名称", "价格"])
+    ws.append(list(columns))
+    for i in range(1, 4):
+        ws.append([i, f"item {i}", i * 10])
+    wb.save(path)
+
+
+@pytest.fixture
+def items_file(tmp_path):
+    path = str(tmp_path / "items.xlsx")
+    _write_items(path)
+    return path
+
+
+class TestParsedPlanCache:
+    def test_repeated_query_skips_preprocess_and_parse(self, items_file):
+        engine = AdvancedSQLQueryEngine()
+        sql = "SELECT 名称, 价格 FROM 物品 WHERE 价格 > 15 ORDER BY 价格 DESC"
+        first = engine.execute_sql_query(items_file, sql)
+        assert first["success"], first["message"]
+
+        with (
+            patch.object(engine, "_replace_cn_columns_in_sql", side_effect=AssertionError("预处理不应重复执行")),
+            patch.object(engine, "_preprocess_reserved_words", side_effect=AssertionError("预处理不应重复执行")),
+            patch.object(advanced_sql_query.sqlglot, "parse_one", side_effect=AssertionError("不应重复解析")),
+        ):
+            # 换一个 limit 绕开查询结果缓存, 只验证解析计划缓存
+            second = engine.execute_sql_query(items_file, sql, limit=10)
+        assert second["success"], second["message"]
+        assert second["query_info"]["cache_hit"] is False
+        assert second["data"] == first["data"]
+        stats = engine.get_cache_stats()["plan_cache"]
+        assert stats["hits"] >= 2  # 表名探测 + 解析计划
+
+    def test_cached_tree_is_not_mutated_by_execution(self, items_file):
+        engine = AdvancedSQLQueryEngine()
+        # WHERE 引用窗口函数别名会在执行阶段改写 AST
+        sql = "SELECT id, ROW_NUMBER() OVER (ORDER BY price DESC) AS rn FROM 物品 WHERE rn <= 2"
+        first = engine.execute_sql_query(items_file, sql)
+        second = engine.execute_sql_query(items_file, sql, limit=5)
+        assert first["success"] and second["success"]
+        assert second["data"] == first["data"]
+
+    def test_schema_change_misses(self, items_file):
+        engine = AdvancedSQLQueryEngine()
+        sql = "SELECT 价格 FROM 物品 WHERE id = 2"
+        assert engine.execute_sql_query(items_file, sql)["data"][1] == [20]
+
+        # 中文表头"价格"改映射到另一列, 旧的预处理结果不可复用
+        _write_items(items_file, columns=("id", "price", "name"))
+        stat = os.stat(items_file)
+        os.utime(items_file, (stat.st_atime, stat.st_mtime + 5))
+        result = engine.execute_sql_query(items_file, sql)
+        assert result["success"], result["message"]
+        assert result["data"][0] == ["name"]
+
+    def test_invalid_plans_are_cached_too(self, items_file):
+        engine = AdvancedSQLQueryEngine()
+        sql = "SELECT id FROM 物品 FETCH NEXT 2 ROWS ONLY"
+        first = engine.execute_sql_query(items_file, sql)
+        with patch.object(engine, "_validate_sql_support", side_effect=AssertionError("校验结果应来自缓存")):
+            second = engine.execute_sql_query(items_file, sql)
+        assert first["query_info"]["error_type"] == second["query_info"]["error_type"] == "unsupported_sql"
+
+    def test_lru_bound_and_clear(self, items_file):
+        engine = AdvancedSQLQueryEngine()
+        engine._plan_cache.max_entries = 3
+        for k in range(4):
+            engine.execute_sql_query(items_file, f"SELECT id FROM 物品 WHERE id > {k}")
+        assert len(engine._plan_cache) == 3
+        assert engine.get_cache_stats()["plan_cache"]["evictions"] > 0
+        engine.clear_cache()
+        assert len(engine._plan_cache) == 0
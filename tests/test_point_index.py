@@ -0,0 +1,124 @@
+"""
+WHERE 等值点查哈希索引测试
+
+行数达到 POINT_INDEX_MIN_ROWS 的缓存 sheet 上, WHERE 顶层 AND 中的 列 = 常量 / 列 IN (常量…) 经列哈希索引
+定位候选行, 完整 WHERE 只在候选行上求值(SELECT/UPDATE/DELETE 共用); 首列 ID 列在载入缓存时预建索引.
+结果与全列扫描一致.
+"""
+
+import datetime
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from excel_mcp_server_fastmcp.api import advanced_sql_query
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+
+
+@pytest.fixture
+def monsters(tmp_path):
+    path = str(tmp_path / "monsters.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "怪物表"
+    ws.append(["ID", "血量", "编码", "混合", "名称", "精英", "日期"])
+    for i in range(120):
+        ws.append(
+            [
+                i,
+                None if i % 7 == 0 else i % 50 + 0.0,
+                str(i % 40),
+                i % 30 if i % 2 else str(i % 30),
+                f"m{i % 60}" if i % 11 else None,
+                bool(i % 2),
+                datetime.datetime(2024, 1, 1 + i % 28),
+            ]
+        )
+    wb.save(path)
+    return path
+
+
+@pytest.fixture
+def indexed(monkeypatch):
+    monkeypatch.setattr(advanced_sql_query, "POINT_INDEX_MIN_ROWS", 100)
+
+
+def _index_stats(engine):
+    return engine.get_cache_stats()["join_index_cache"]
+
+
+CONDITIONS = [
+    "ID = 5",
+    "5.0 = ID",
+    "ID = '5'",
+    "血量 = 3",
+    "编码 = '5'",
+    "编码 = 5",
+    "混合 = 5",
+    "混合 = '4'",
+    "名称 = 'm7'",
+    "名称 = NULL",
+    "精英 = TRUE",
+    "日期 = '2024-01-05'",
+    "ID IN (1, 2, 300, NULL)",
+    "名称 IN ('m1', 'm2', 5)",
+    "混合 IN (5, '4', 7.0)",
+    "(ID IN (1, 2, 3, 100) AND 名称 IS NOT NULL) AND 编码 = '2'",
+    "ID = 5 OR ID = 6",
+    "NOT ID = 5",
+]
+
+
+class TestPointLookup:
+    @pytest.mark.parametrize("condition", CONDITIONS)
+    def test_same_rows_as_full_scan(self, monsters, monkeypatch, condition):
+        monkeypatch.setattr(advanced_sql_query, "POINT_INDEX_MIN_ROWS", 10**9)
+        scan_engine = AdvancedSQLQueryEngine()
+        expected = [
+            scan_engine.execute_sql_query(monsters, f"SELECT ID, 名称 FROM 怪物表 WHERE {condition}")["data"],
+            scan_engine.execute_update_query(monsters, f"UPDATE 怪物表 SET 名称 = 'x' WHERE {condition}", dry_run=True)["changes"],
+            scan_engine.execute_delete_query(monsters, f"DELETE FROM 怪物表 WHERE {condition}", dry_run=True).get("affected_rows"),
+        ]
+        monkeypatch.setattr(advanced_sql_query, "POINT_INDEX_MIN_ROWS", 100)
+        engine = AdvancedSQLQueryEngine()
+        assert [
+            engine.execute_sql_query(monsters, f"SELECT ID, 名称 FROM 怪物表 WHERE {condition}")["data"],
+            engine.execute_update_query(monsters, f"UPDATE 怪物表 SET 名称 = 'x' WHERE {condition}", dry_run=True)["changes"],
+            engine.execute_delete_query(monsters, f"DELETE FROM 怪物表 WHERE {condition}", dry_run=True).get("affected_rows"),
+        ] == expected
+
+    def test_index_built_once_and_probed(self, monsters, indexed):
+        engine = AdvancedSQLQueryEngine()
+        for name in ("m3", "m4"):
+            result = engine.execute_sql_query(monsters, f"SELECT ID FROM 怪物表 WHERE 名称 = '{name}' AND ID > 10")
+            assert result["success"], result["message"]
+        assert result["data"][1:] == [[64]]
+        # 首列 ID 在载入时预建 + 名称列首次点查时构建
+        assert _index_stats(engine)["entries"] == 2
+        assert _index_stats(engine)["hits"] == 1
+
+    def test_id_column_prebuilt_at_load(self, monsters, indexed):
+        engine = AdvancedSQLQueryEngine()
+        engine.execute_sql_query(monsters, "SELECT COUNT(*) FROM 怪物表")
+        assert _index_stats(engine)["entries"] == 1
+        assert engine.execute_sql_query(monsters, "SELECT 名称 FROM 怪物表 WHERE ID = 78")["data"][1:] == [["m18"]]
+        assert _index_stats(engine)["hits"] == 1
+
+    def test_small_sheets_scan(self, monsters):
+        engine = AdvancedSQLQueryEngine()
+        engine.execute_sql_query(monsters, "SELECT ID FROM 怪物表 WHERE 名称 = 'm3'")
+        assert _index_stats(engine)["entries"] == 0
+
+
+class TestWriteTargeting:
+    def test_update_and_delete_by_key(self, monsters, indexed):
+        engine = AdvancedSQLQueryEngine()
+        result = engine.execute_update_query(monsters, "UPDATE 怪物表 SET 血量 = 999 WHERE ID IN (3, 4)")
+        assert result["success"], result["message"]
+        assert engine.execute_sql_query(monsters, "SELECT ID, 血量 FROM 怪物表 WHERE 血量 = 999")["data"][1:] == [[3, 999], [4, 999]]
+
+        result = engine.execute_delete_query(monsters, "DELETE FROM 怪物表 WHERE ID = 3")
+        assert result["success"] and result["affected_rows"] == 1
+        ws = load_workbook(monsters)["怪物表"]
+        assert [ws.cell(row=r, column=1).value for r in (4, 5)] == [2, 4]
+        assert engine.execute_sql_query(monsters, "SELECT 血量 FROM 怪物表 WHERE ID = 4")["data"][1:] == [[999]]
@@ -0,0 +1,114 @@
+"""
+无拷贝执行与列投影下推测试
+
+单表查询只物化 SQL 引用到的列, 其余情况使用 Copy-on-Write 视图代替整表深拷贝;
+查询过程不修改缓存中的 DataFrame, WHERE 前快照只在空结果时用于建议.
+"""
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api import advanced_sql_query
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+
+
+@pytest.fixture
+def wide_file(tmp_path):
+    path = str(tmp_path / "wide.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "角色"
+    ws.append(["ID", "Name", "Level", *[f"attr{k}" for k in range(20)], "Loot(备注)"])
+    for i in range(1, 31):
+        ws.append([i, f"hero {i}", i * 2, *[i * k for k in range(20)], i % 3])
+    wb.save(path)
+    return path
+
+
+def _source(engine, path):
+    return engine._df_cache[f"{path}|角色"][1]["角色"]
+
+
+def _capture_base_columns(engine, monkeypatch):
+    """记录 WHERE 阶段拿到的列(投影后的 base_df)"""
+    seen = []
+    original = engine._apply_where_clause
+
+    def recording(parsed_sql, df, *args):
+        seen.append(list(df.columns))
+        return original(parsed_sql, df, *args)
+
+    monkeypatch.setattr(engine, "_apply_where_clause", recording)
+    return seen
+
+
+class TestProjectionPushdown:
+    def test_only_referenced_columns_materialized(self, wide_file, monkeypatch):
+        engine = AdvancedSQLQueryEngine()
+        seen = _capture_base_columns(engine, monkeypatch)
+        result = engine.execute_sql_query(wide_file, "SELECT ID, Name FROM 角色 WHERE Level > 50 ORDER BY ID")
+        assert result["success"], result["message"]
+        assert result["data"] == [["ID", "Name"]] + [[i, f"hero {i}"] for i in range(26, 31)]
+        assert seen == [["ID", "Name", "Level", "_ROW_NUMBER_"]]
+
+    def test_case_insensitive_and_short_name_matches_kept(self, wide_file, monkeypatch):
+        engine = AdvancedSQLQueryEngine()
+        seen = _capture_base_columns(engine, monkeypatch)
+        result = engine.execute_sql_query(wide_file, "SELECT name, loot FROM 角色 WHERE id = 4")
+        assert result["success"], result["message"]
+        assert result["data"][1] == ["hero 4", 1]
+        assert seen == [["ID", "Name", "Loot(备注)", "_ROW_NUMBER_"]]
+
+    @pytest.mark.parametrize(
+        "sql",
+        [
+            "SELECT * FROM 角色 WHERE ID = 1",
+            "SELECT t.* FROM 角色 t WHERE t.ID = 1",
+            "SELECT Nmae FROM 角色 WHERE ID = 1",
+            "SELECT t.Nmae FROM 角色 t WHERE t.ID = 1",
+        ],
+    )
+    def test_full_table_kept_when_needed(self, wide_file, monkeypatch, sql):
+        engine = AdvancedSQLQueryEngine()
+        seen = _capture_base_columns(engine, monkeypatch)
+        engine.execute_sql_query(wide_file, sql)
+        assert len(seen[0]) == 25  # 24列 + _ROW_NUMBER_
+
+    def test_unknown_column_error_lists_all_columns(self, wide_file):
+        result = AdvancedSQLQueryEngine().execute_sql_query(wide_file, "SELECT Nmae FROM 角色 WHERE ID = 1")
+        assert not result["success"]
+        assert "attr19" in result["message"]
+
+
+class TestCopyFreeExecution:
+    def test_cached_frame_not_copied_or_mutated(self, wide_file, monkeypatch):
+        engine = AdvancedSQLQueryEngine()
+        engine._load_data_with_cache(wide_file)
+        source = _source(engine, wide_file)
+        snapshot = source.copy()
+
+        calls = []
+        original_copy = pd.DataFrame.copy
+
+        def tracking_copy(self, deep=True):
+            if deep and self is source:
+                calls.append("deep copy of cached sheet")
+            return original_copy(self, deep=deep)
+
+        monkeypatch.setattr(pd.DataFrame, "copy", tracking_copy)
+        for sql in [
+            "SELECT * FROM 角色 WHERE Level > 50",
+            "SELECT Level, COUNT(*) AS n FROM 角色 GROUP BY Level HAVING n > 5",
+            "SELECT ID, CAST(Level AS CHAR) AS lv FROM 角色 WHERE UPPER(Name) LIKE 'HERO 1%'",
+            "SELECT a.ID, b.Name FROM 角色 a JOIN 角色 b ON a.ID = b.ID WHERE a.Level > 40",
+        ]:
+            assert engine.execute_sql_query(wide_file, sql)["success"]
+        if advanced_sql_query._copy_on_write_enabled():
+            assert calls == []
+        pd.testing.assert_frame_equal(_source(engine, wide_file), snapshot)
+
+    def test_empty_result_suggestion_uses_pre_where_rows(self, wide_file):
+        result = AdvancedSQLQueryEngine().execute_sql_query(wide_file, "SELECT ID FROM 角色 WHERE Level > 1000")
+        assert result["success"] and len(result["data"]) <= 1
+        assert "Level" in result["query_info"]["suggestion"]
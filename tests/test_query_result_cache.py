@@ -0,0 +1,117 @@
+"""
+查询结果缓存测试
+
+相同 SELECT(规范化后)且涉及文件指纹未变时直接返回缓存结果, query_info.cache_hit 标记命中;
+文件被修改、本引擎 UPDATE/INSERT/DELETE 写入、TTL 过期时失效.
+"""
+
+import os
+
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+
+
+def _write_items(path, prices, title="物品"):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = title
+    ws.append(["编号", "名称", "价格"])
+    ws.append(["id", "name", "price"])
+    for i, price in enumerate(prices, start=1):
+        ws.append([i, f"item {i}", price])
+    wb.save(path)
+
+
+@pytest.fixture
+def items_file(tmp_path):
+    path = str(tmp_path / "items.xlsx")
+    _write_items(path, [10, 20, 30])
+    return path
+
+
+class TestQueryResultCache:
+    def test_repeated_select_hits_cache(self, items_file):
+        engine = AdvancedSQLQueryEngine()
+        first = engine.execute_sql_query(items_file, "SELECT id, price FROM 物品 WHERE price > 15")
+        assert first["success"] and first["query_info"]["cache_hit"] is False
+
+        # 空白差异不影响命中
+        second = engine.execute_sql_query(items_file, "SELECT id,  price\n FROM 物品   WHERE price > 15;")
+        assert second["query_info"]["cache_hit"] is True
+        assert second["data"] == first["data"]
+        assert engine.get_cache_stats()["query_cache"]["hits"] == 1
+
+    def test_whitespace_inside_literals_is_significant(self, items_file):
+        engine = AdvancedSQLQueryEngine()
+        engine.execute_sql_query(items_file, "SELECT id FROM 物品 WHERE name = 'item 1'")
+        result = engine.execute_sql_query(items_file, "SELECT id FROM 物品 WHERE name = 'item  1'")
+        assert result["query_info"]["cache_hit"] is False
+        assert result["data"] == [["id"]]
+
+    def test_returned_result_is_a_copy(self, items_file):
+        engine = AdvancedSQLQueryEngine()
+        first = engine.execute_sql_query(items_file, "SELECT id FROM 物品")
+        first["data"].clear()
+        second = engine.execute_sql_query(items_file, "SELECT id FROM 物品")
+        assert second["query_info"]["cache_hit"] is True and len(second["data"]) == 4
+
+    def test_external_file_change_misses(self, items_file):
+        engine = AdvancedSQLQueryEngine()
+        engine.execute_sql_query(items_file, "SELECT SUM(price) AS total FROM 物品")
+        _write_items(items_file, [1, 2, 3, 4])
+        stat = os.stat(items_file)
+        os.utime(items_file, (stat.st_atime, stat.st_mtime + 5))
+        result = engine.execute_sql_query(items_file, "SELECT SUM(price) AS total FROM 物品")
+        assert result["query_info"]["cache_hit"] is False
+        assert result["data"][1] == [10]
+
+    def test_engine_update_invalidates(self, items_file):
+        engine = AdvancedSQLQueryEngine()
+        sql = "SELECT price FROM 物品 WHERE id = 1"
+        engine.execute_sql_query(items_file, sql)
+        update = engine.execute_update_query(items_file, "UPDATE 物品 SET price = 99 WHERE id = 1")
+        assert update["success"], update["message"]
+        assert len(engine._query_result_cache) == 0
+        result = engine.execute_sql_query(items_file, sql)
+        assert result["query_info"]["cache_hit"] is False and result["data"][1] == [99]
+
+    def test_engine_insert_and_delete_invalidate(self, items_file):
+        engine = AdvancedSQLQueryEngine()
+        sql = "SELECT COUNT(*) AS n FROM 物品"
+        engine.execute_sql_query(items_file, sql)
+        assert engine.execute_insert_query(items_file, "INSERT INTO 物品 (id, name, price) VALUES (4, 'item 4', 40)")["success"]
+        assert engine.execute_sql_query(items_file, sql)["data"][1] == [4]
+        assert engine.execute_delete_query(items_file, "DELETE FROM 物品 WHERE id = 4")["success"]
+        assert engine.execute_sql_query(items_file, sql)["data"][1] == [3]
+
+    def test_cross_file_reference_fingerprinted(self, items_file, tmp_path):
+        other = str(tmp_path / "other.xlsx")
+        _write_items(other, [5], title="对照")
+        engine = AdvancedSQLQueryEngine()
+        sql = "SELECT a.id FROM 物品 a JOIN 对照@'other.xlsx' b ON a.id = b.id"
+        assert engine.execute_sql_query(items_file, sql)["success"]
+        assert engine.execute_sql_query(items_file, sql)["query_info"]["cache_hit"] is True
+
+        _write_items(other, [5, 6], title="对照")
+        stat = os.stat(other)
+        os.utime(other, (stat.st_atime, stat.st_mtime + 5))
+        result = engine.execute_sql_query(items_file, sql)
+        assert result["query_info"]["cache_hit"] is False and len(result["data"]) == 3
+
+    def test_ttl_and_lru_bounds(self, items_file):
+        engine = AdvancedSQLQueryEngine()
+        engine._query_result_cache.max_entries = 2
+        for k in range(3):
+            engine.execute_sql_query(items_file, f"SELECT id FROM 物品 WHERE id > {k}")
+        assert len(engine._query_result_cache) == 2
+        assert engine.get_cache_stats()["query_cache"]["evictions"] == 1
+
+        engine._query_result_cache.ttl = -1
+        assert engine.execute_sql_query(items_file, "SELECT id FROM 物品 WHERE id > 2")["query_info"]["cache_hit"] is False
+
+    def test_nondeterministic_sql_not_cached(self, items_file):
+        engine = AdvancedSQLQueryEngine()
+        key, _files = engine._query_cache_key(items_file, "SELECT id, RAND() AS r FROM 物品", None, None, True, "table")
+        assert key is None
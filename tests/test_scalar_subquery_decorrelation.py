@@ -0,0 +1,107 @@
+"""
+关联标量子查询去关联测试
+
+等值关联的标量子查询(SELECT 列、WHERE 操作数、算术表达式中)改写为对内表按连接键分组的一次查询,
+再哈希左连接回外层行: 无匹配为 NULL(COUNT 为 0), 非聚合子查询对某行匹配多行时报错.
+"""
+
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+
+ORDERS = [
+    (1, 1, 100, "north"),
+    (2, 1, 50, "south"),
+    (3, 2, 300, "south"),
+    (4, 3, 20, "north"),
+    (5, 6, None, "north"),
+    (6, None, 10, "south"),
+    (7, 8, 40, None),
+]
+
+
+@pytest.fixture
+def shop(tmp_path):
+    path = str(tmp_path / "shop.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "客户"
+    ws.append(["id", "name", "region"])
+    for i in range(1, 9):
+        ws.append([i, f"c{i}", None if i == 8 else ["north", "south"][i % 2]])
+    orders = wb.create_sheet("订单")
+    orders.append(["oid", "cust_id", "amount", "region"])
+    for row in ORDERS:
+        orders.append(list(row))
+    wb.save(path)
+    return path
+
+
+@pytest.fixture
+def engine():
+    engine = AdvancedSQLQueryEngine()
+    sub_executions = []
+    original = engine._execute_subquery
+
+    def counting(subquery, worksheets):
+        sub_executions.append(str(subquery))
+        return original(subquery, worksheets)
+
+    engine._execute_subquery = counting
+    engine.sub_executions = sub_executions
+    return engine
+
+
+def _rows(result):
+    assert result["success"], result["message"]
+    return result["data"][1:]
+
+
+class TestSelectScalarSubquery:
+    def test_aggregate_left_joined_once(self, shop, engine):
+        sql = "SELECT id, (SELECT MAX(amount) FROM 订单 o WHERE o.cust_id = c.id) AS mx FROM 客户 c ORDER BY id"
+        assert _rows(engine.execute_sql_query(shop, sql)) == [[1, 100], [2, 300], [3, 20], [4, None], [5, None], [6, None], [7, None], [8, 40]]
+        assert len(engine.sub_executions) == 1
+
+    def test_count_without_match_is_zero(self, shop, engine):
+        sql = "SELECT id, (SELECT COUNT(*) FROM 订单 o WHERE o.cust_id = c.id) AS n FROM 客户 c ORDER BY id"
+        assert [row[1] for row in _rows(engine.execute_sql_query(shop, sql))] == [2, 1, 1, 0, 0, 1, 0, 1]
+
+    def test_multiple_keys_and_local_filter(self, shop, engine):
+        sql = "SELECT id, (SELECT SUM(amount) FROM 订单 o WHERE o.region = c.region AND o.cust_id = c.id AND o.amount > 10) AS s FROM 客户 c WHERE id <= 3 ORDER BY id"
+        assert _rows(engine.execute_sql_query(shop, sql)) == [[1, 50], [2, None], [3, None]]
+
+    def test_inside_arithmetic(self, shop, engine):
+        sql = "SELECT id, id * 1000 + (SELECT MAX(amount) FROM 订单 o WHERE o.cust_id = c.id) AS v FROM 客户 c WHERE id IN (1, 4) ORDER BY id"
+        assert _rows(engine.execute_sql_query(shop, sql)) == [[1, 1100], [4, None]]
+
+    def test_non_aggregate_single_match(self, shop, engine):
+        sql = "SELECT id, (SELECT amount FROM 订单 o WHERE o.cust_id = c.id) AS a FROM 客户 c WHERE id BETWEEN 2 AND 4 ORDER BY id"
+        assert _rows(engine.execute_sql_query(shop, sql)) == [[2, 300], [3, 20], [4, None]]
+
+    def test_non_aggregate_multiple_rows_is_error(self, shop, engine):
+        sql = "SELECT id, (SELECT amount FROM 订单 o WHERE o.cust_id = c.id) AS a FROM 客户 c ORDER BY id"
+        result = engine.execute_sql_query(shop, sql)
+        assert not result["success"]
+        assert "多行" in result["message"]
+
+
+class TestWhereScalarSubquery:
+    def test_correlated_aggregate_in_where(self, shop, engine):
+        sql = "SELECT id FROM 客户 c WHERE (SELECT COUNT(*) FROM 订单 o WHERE o.cust_id = c.id) >= 1 ORDER BY id"
+        result = engine.execute_sql_query(shop, sql)
+        assert [row[0] for row in _rows(result)] == [1, 2, 3, 6, 8]
+        assert result["query_info"]["where_path"] == "vectorized"
+        assert len(engine.sub_executions) == 1
+
+    def test_null_when_no_match(self, shop, engine):
+        # 客户8 region 为 NULL → 关联键为 NULL, 子查询结果为 NULL, 比较为 UNKNOWN
+        sql = "SELECT id FROM 客户 c WHERE c.id < (SELECT MAX(cust_id) FROM 订单 o WHERE o.region = c.region) ORDER BY id"
+        assert [row[0] for row in _rows(engine.execute_sql_query(shop, sql))] == [1, 2, 4]
+
+    def test_multiple_rows_error_not_swallowed(self, shop, engine):
+        sql = "SELECT id FROM 客户 c WHERE (SELECT amount FROM 订单 o WHERE o.cust_id = c.id) > 10"
+        result = engine.execute_sql_query(shop, sql)
+        assert not result["success"]
+        assert "多行" in result["message"]
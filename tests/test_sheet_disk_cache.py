@@ -0,0 +1,142 @@
+"""
+工作表磁盘缓存测试
+
+_df_cache 未命中时先查磁盘层 (按 路径/sheet/sheet部件签名 为键), 命中则直接映射已清洗的列,
+跳过 calamine 解析; 文件修改后旧条目失效. object 列以带类型标记的 JSON 存储, 读取条目不执行代码;
+组/其他用户可写的缓存目录拒绝启用.
+"""
+
+import datetime
+import os
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+from excel_mcp_server_fastmcp.api.sheet_disk_cache import SheetDiskCache
+from excel_mcp_server_fastmcp.api.xlsx_parts import read_sheet_part_signatures
+
+
+@pytest.fixture
+def dual_header_file(tmp_path):
+    """双行表头 + 低基数文本列 + 低基数混合列(category)"""
+    file_path = str(tmp_path / "items.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "物品"
+    ws.append(["编号", "名称", "品质", "价格", "档位"])
+    ws.append(["id", "name", "rarity", "price", "tier"])
+    for i in range(1, 201):
+        ws.append([i, f"item_{i}", ["普通", "稀有", "史诗"][i % 3], i * 1.5, ["S", 1, 2][i % 3]])
+    wb.save(file_path)
+    return file_path
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path / "sheet_cache")
+
+
+def _fail_parse(*args, **kwargs):
+    pytest.fail("磁盘缓存命中时不应再解析 xlsx")
+
+
+class TestSheetDiskCache:
+    def test_new_engine_reuses_disk_entry(self, dual_header_file, cache_dir, monkeypatch):
+        sql = "SELECT 品质, COUNT(*) AS cnt, SUM(价格) AS total FROM 物品 WHERE 编号 > 10 GROUP BY 品质 ORDER BY 品质"
+        first = AdvancedSQLQueryEngine(disk_cache_dir=cache_dir)
+        expected = first.execute_sql_query(dual_header_file, sql)
+        assert expected["success"], expected["message"]
+        assert first._disk_cache.get_stats()["store_count"] == 1
+
+        # 模拟进程重启: 新引擎实例, 内存缓存为空
+        second = AdvancedSQLQueryEngine(disk_cache_dir=cache_dir)
+        monkeypatch.setattr(second, "_read_excel_sheets", _fail_parse)
+        result = second.execute_sql_query(dual_header_file, sql)
+        assert result["success"], result["message"]
+        assert result["data"] == expected["data"]
+        assert second._disk_cache.get_stats()["hit_count"] == 1
+        # 表头描述与列名映射随条目一起恢复
+        assert second._header_descriptions["物品"]["id"] == "编号"
+
+    def test_round_trip_preserves_dtypes(self, dual_header_file, cache_dir):
+        engine = AdvancedSQLQueryEngine()
+        data, descs, col_maps = engine._read_excel_sheets(dual_header_file)
+        df = data["物品"]
+        # 文本列保持 read_excel 推断的 dtype(pandas 3 为 str 扩展类型), 混合列转 category
+        assert df["rarity"].dtype == pd.Series(["x"]).dtype
+        assert isinstance(df["tier"].dtype, pd.CategoricalDtype)
+
+        cache = SheetDiskCache(cache_dir)
+        fingerprint = read_sheet_part_signatures(dual_header_file)["物品"]
+        assert cache.store(dual_header_file, "物品", fingerprint, df, descs["物品"], col_maps["物品"])
+        cached_df, cached_desc, cached_map = cache.load(dual_header_file, "物品", fingerprint)
+        pd.testing.assert_frame_equal(cached_df, df)
+        assert cached_desc == descs["物品"] and cached_map == col_maps["物品"]
+        # 写时复制映射: 修改内存中的数据不影响缓存文件
+        cached_df.loc[0, "price"] = -1.0
+        again, _desc, _map = cache.load(dual_header_file, "物品", fingerprint)
+        assert again.loc[0, "price"] == df.loc[0, "price"]
+
+    def test_modified_file_misses_and_replaces_old_entry(self, dual_header_file, cache_dir):
+        AdvancedSQLQueryEngine(disk_cache_dir=cache_dir).execute_sql_query(dual_header_file, "SELECT * FROM 物品")
+        wb = load_workbook(dual_header_file)
+        wb["物品"]["D3"] = 99.5
+        wb.save(dual_header_file)
+
+        engine = AdvancedSQLQueryEngine(disk_cache_dir=cache_dir)
+        result = engine.execute_sql_query(dual_header_file, "SELECT * FROM 物品")
+        assert result["success"]
+        stats = engine._disk_cache.get_stats()
+        assert stats["hit_count"] == 0 and stats["store_count"] == 1
+        sheet_dir = engine._disk_cache._sheet_dir(dual_header_file, "物品")
+        assert len(os.listdir(sheet_dir)) == 1
+
+    def test_corrupt_entry_is_dropped(self, dual_header_file, cache_dir):
+        AdvancedSQLQueryEngine(disk_cache_dir=cache_dir).execute_sql_query(dual_header_file, "SELECT * FROM 物品")
+        cache = SheetDiskCache(cache_dir)
+        fingerprint = read_sheet_part_signatures(dual_header_file)["物品"]
+        entry_dir = cache._entry_dir(dual_header_file, "物品", fingerprint)
+        with open(os.path.join(entry_dir, "meta.json"), "w", encoding="utf-8") as f:
+            f.write("{broken")
+        assert cache.load(dual_header_file, "物品", fingerprint) is None
+        assert not os.path.exists(entry_dir)
+
+    def test_disabled_by_default(self, monkeypatch):
+        monkeypatch.delenv("EXCEL_MCP_SHEET_CACHE_DIR", raising=False)
+        assert AdvancedSQLQueryEngine()._disk_cache is None
+
+    def test_object_values_round_trip_without_pickle(self, cache_dir):
+        mixed = [None, True, 1, 2.5, float("nan"), "文本", pd.Timestamp("2024-01-02 03:04:05.123456789"), datetime.datetime(2024, 5, 6, 7, 8)]
+        mixed += [datetime.date(2024, 1, 1), datetime.time(12, 30), pd.Timedelta(seconds=90), pd.NaT]
+        df = pd.DataFrame(
+            {
+                "mixed": pd.Series(mixed, dtype=object),
+                "text": pd.Series(["a", None] * 6, dtype="string"),
+                "ints": pd.array([1, None] * 6, dtype="Int64"),
+                "cat": pd.Categorical(["x", "y", 3] * 4),
+            }
+        ).set_axis(pd.Index(range(10, 22), name="row"))
+        cache = SheetDiskCache(cache_dir)
+        assert cache.store("book.xlsx", "表", (1, 2), df, None, {})
+        entry_dir = cache._entry_dir("book.xlsx", "表", (1, 2))
+        assert sorted(name for name in os.listdir(entry_dir) if not name.endswith(".npy")) == ["meta.json", "objects.json"]
+        cached, _desc, _map = cache.load("book.xlsx", "表", (1, 2))
+        pd.testing.assert_frame_equal(cached, df)
+        assert [type(v) for v in cached["mixed"]] == [type(v) for v in mixed]
+
+    def test_unsupported_value_not_stored(self, cache_dir):
+        df = pd.DataFrame({"obj": pd.Series([object()], dtype=object)})
+        assert not SheetDiskCache(cache_dir).store("book.xlsx", "表", (1, 2), df, None, {})
+
+    @pytest.mark.skipif(os.name != "posix", reason="POSIX 权限检查")
+    def test_shared_writable_dir_refused(self, tmp_path, caplog):
+        shared = tmp_path / "shared"
+        shared.mkdir()
+        shared.chmod(0o777)
+        with pytest.raises(PermissionError):
+            SheetDiskCache(str(shared))
+        # 引擎记录警告后不启用磁盘缓存
+        assert AdvancedSQLQueryEngine(disk_cache_dir=str(shared))._disk_cache is None
+        assert oct(os.stat(SheetDiskCache(str(tmp_path / "own")).cache_dir).st_mode & 0o777) == "0o700"
@@ -0,0 +1,142 @@
+"""
+单次打开工作簿加载测试
+
+_read_excel_sheets 对整个文件只打开一次 CalamineWorkbook, 用 to_python() 的行数据构建 DataFrame,
+列类型推断结果需与原 pd.read_excel(header=None) + to_numeric 路径一致.
+"""
+
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+
+
+@pytest.fixture
+def typed_file(tmp_path):
+    """覆盖各类列类型的双表头工作簿 + 一个普通单表头sheet"""
+    file_path = str(tmp_path / "typed.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "类型"
+    ws.append(["编号", "数量", "单价", "编码", "日期", "备注", None])
+    ws.append(["id", "qty", "price", "code", "day", "note", None])
+    ws.append([1, 3, 1.5, "10", datetime.datetime(2024, 1, 1), "a", 7])
+    ws.append([2, None, 2.0, "20", datetime.datetime(2024, 1, 2), 5, 8])
+    ws.append([3, 4, 2.25, "30", None, None, 9])
+    ws2 = wb.create_sheet("普通")
+    ws2.append(["name", "score"])
+    ws2.append(["x", 1])
+    ws2.append(["y", 2])
+    wb.save(file_path)
+    return file_path
+
+
+class TestSingleOpenLoader:
+    def test_workbook_opened_once_without_read_excel(self, typed_file, monkeypatch):
+        import python_calamine
+
+        opened = []
+        original = python_calamine.CalamineWorkbook.from_path
+
+        def counting_from_path(path):
+            opened.append(path)
+            return original(path)
+
+        monkeypatch.setattr(python_calamine.CalamineWorkbook, "from_path", counting_from_path)
+        monkeypatch.setattr(pd, "read_excel", lambda *a, **k: pytest.fail("不应再调用 pd.read_excel"))
+
+        data, _descs, _maps = AdvancedSQLQueryEngine()._read_excel_sheets(typed_file)
+        assert list(data) == ["类型", "普通"]
+        assert opened == [typed_file]
+
+    def test_column_types_match_read_excel_semantics(self, typed_file):
+        data, descs, _maps = AdvancedSQLQueryEngine()._read_excel_sheets(typed_file)
+        df = data["类型"]
+        assert list(df.columns) == ["id", "qty", "price", "code", "day", "note", "col_6"]
+        assert df["id"].tolist() == [1, 2, 3] and df["id"].dtype.kind in "iu"
+        # 含空值的整数列 → float
+        assert df["qty"].dtype.kind == "f" and np.isnan(df["qty"].iloc[1])
+        assert df["price"].tolist() == [1.5, 2.0, 2.25]
+        # 数字字符串列: read_excel 推断为文本 dtype(pandas 3 的 str)时保持字符串, 推断为 object 时转数值
+        assert df["code"].tolist() == (["10", "20", "30"] if pd.Series(["x"]).dtype != object else [10, 20, 30])
+        # 日期保持 object, 与 read_excel 切片后的结果一致
+        assert df["day"].dtype == object and df["day"].iloc[0] == pd.Timestamp("2024-01-01")
+        # 混合列: 整数值 float 转为 int
+        assert df["note"].tolist()[:2] == ["a", 5]
+        # 表头为空的数值列整列推断: 数据为整数 → int
+        assert df["col_6"].tolist() == [7, 8, 9]
+        assert descs["类型"]["id"] == "编号"
+        assert data["普通"]["score"].tolist() == [1, 2]
+
+    def test_numeric_header_cell_follows_column_type(self, tmp_path):
+        file_path = str(tmp_path / "numeric_header.xlsx")
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "S"
+        ws.append(["name", 5])
+        ws.append(["a", 1.5])
+        ws.append(["b", 2])
+        wb.save(file_path)
+
+        data, _descs, _maps = AdvancedSQLQueryEngine()._read_excel_sheets(file_path)
+        # 整列为 float 时表头数字也按 float 转字符串 (与 read_excel(header=None) 一致): 5 → "5.0" → col_5_0
+        assert list(data["S"].columns) == ["name", "col_5_0"]
+        assert data["S"]["col_5_0"].tolist() == [1.5, 2.0]
+
+    def test_dtypes_match_installed_read_excel(self, tmp_path):
+        file_path = str(tmp_path / "dtypes.xlsx")
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "S"
+        ws.append(["name", "cat", "code", "mixed", "day", None, "blank", "qty", "flag"])
+        for i in range(150):
+            ws.append(
+                [
+                    f"item{i % 10}",
+                    None if i % 7 == 0 else "ABC"[i % 3],
+                    str(i % 40),
+                    "x" if i % 2 else i,
+                    datetime.datetime(2024, 1, 1 + i % 28),
+                    datetime.datetime(2024, 2, 1 + i % 28) if i % 5 else None,
+                    None,
+                    i * 1.5 if i % 4 else None,
+                    bool(i % 2),
+                ]
+            )
+        wb.save(file_path)
+
+        engine = AdvancedSQLQueryEngine()
+        df = engine._read_excel_sheets(file_path)[0]["S"]
+        # 原加载路径: read_excel(header=None) 切片后对 object 列 to_numeric, 再做同样的清洗与 dtype 优化
+        reference = pd.read_excel(file_path, engine="calamine", header=None, keep_default_na=False, na_values=[""]).iloc[1:].reset_index(drop=True)
+        for col in reference.columns:
+            if reference[col].dtype == object:
+                try:
+                    reference[col] = pd.to_numeric(reference[col], errors="raise")
+                except (ValueError, TypeError):
+                    pass
+        reference = engine._optimize_dtypes(engine._clean_dataframe(reference, col_map={}))
+        assert [str(dtype) for dtype in df.dtypes] == [str(dtype) for dtype in reference.dtypes]
+        pd.testing.assert_frame_equal(df.set_axis(reference.columns, axis=1), reference)
+
+    def test_text_columns_compare_as_strings(self, tmp_path):
+        file_path = str(tmp_path / "text.xlsx")
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "T"
+        ws.append(["id", "name", "cat"])
+        for i in range(200):
+            ws.append([i, f"item{i % 10}", "ABC"[i % 3]])
+        wb.save(file_path)
+
+        engine = AdvancedSQLQueryEngine()
+        counts = {}
+        for condition in ("name > 'item5'", "cat < 'B'", "cat BETWEEN 'A' AND 'B'"):
+            result = engine.execute_sql_query(file_path, f"SELECT COUNT(*) FROM T WHERE {condition}")
+            assert result["success"], result["message"]
+            counts[condition] = result["data"][1][0]
+        assert counts == {"name > 'item5'": 80, "cat < 'B'": 67, "cat BETWEEN 'A' AND 'B'": 134}
@@ -65,7 +65,6 @@ def complex_game_data():
 class TestComplexSQLScenarios:
     """复杂SQL场景测试 - 发现功能缺口"""
 
-    @pytest.mark.xfail(reason="多窗口函数+聚合+JOIN复合场景待完善")
     def test_nested_window_with_aggregate(self, complex_game_data):
         """场景：每个公会的平均装备等级，以及公会内角色的排名"""
         sql = """
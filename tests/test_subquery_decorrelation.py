@@ -0,0 +1,109 @@
+"""
+关联子查询去关联测试
+
+等值关联的 EXISTS / NOT EXISTS / IN (SELECT ...) 改写为对内表的一次哈希半连接/反连接,
+内层只引用内表的条件先过滤内表; 非等值关联等形式仍回退到逐行求值.
+"""
+
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+
+ORDERS = [
+    (1, 1, 100, "north"),
+    (2, 1, 50, "south"),
+    (3, 2, 300, "south"),
+    (4, 3, 20, "north"),
+    (5, 5, None, "north"),
+    (6, None, 10, "south"),
+    (7, 8, 40, None),
+]
+
+
+@pytest.fixture
+def shop(tmp_path):
+    path = str(tmp_path / "shop.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "客户"
+    ws.append(["id", "name", "region"])
+    for i in range(1, 9):
+        ws.append([i, f"c{i}", None if i == 8 else ["north", "south"][i % 2]])
+    orders = wb.create_sheet("订单")
+    orders.append(["oid", "cust_id", "amount", "region"])
+    for row in ORDERS:
+        orders.append(list(row))
+    wb.save(path)
+    return path
+
+
+@pytest.fixture
+def engine():
+    engine = AdvancedSQLQueryEngine()
+    sub_executions = []
+    original = engine._execute_subquery
+
+    def counting(subquery, worksheets):
+        sub_executions.append(str(subquery))
+        return original(subquery, worksheets)
+
+    engine._execute_subquery = counting
+    engine.sub_executions = sub_executions
+    return engine
+
+
+def _ids(result):
+    assert result["success"], result["message"]
+    return [row[0] for row in result["data"][1:]]
+
+
+class TestSemiAntiJoin:
+    @pytest.mark.parametrize(
+        "where, expected",
+        [
+            ("EXISTS (SELECT 1 FROM 订单 o WHERE o.cust_id = c.id)", [1, 2, 3, 5, 8]),
+            ("NOT EXISTS (SELECT 1 FROM 订单 o WHERE o.cust_id = c.id)", [4, 6, 7]),
+            ("EXISTS (SELECT 1 FROM 订单 o WHERE o.cust_id = c.id AND o.amount > 60)", [1, 2]),
+            # 多个关联键; NULL 键不匹配
+            ("EXISTS (SELECT 1 FROM 订单 o WHERE o.region = c.region AND c.id = o.cust_id)", [1]),
+            ("EXISTS (SELECT * FROM 订单 WHERE 订单.cust_id = c.id + 1)", [1, 2, 4, 7]),
+        ],
+    )
+    def test_exists_runs_inner_query_once(self, shop, engine, where, expected):
+        result = engine.execute_sql_query(shop, f"SELECT id FROM 客户 c WHERE {where} ORDER BY id")
+        assert _ids(result) == expected
+        assert result["query_info"]["where_path"] == "vectorized"
+        assert len(engine.sub_executions) == 1
+
+    def test_unaliased_outer_table(self, shop, engine):
+        sql = "SELECT id FROM 客户 WHERE EXISTS (SELECT 1 FROM 订单 WHERE 订单.cust_id = 客户.id) ORDER BY id"
+        assert _ids(engine.execute_sql_query(shop, sql)) == [1, 2, 3, 5, 8]
+
+    def test_uncorrelated_exists_evaluated_once(self, shop, engine):
+        sql = "SELECT id FROM 客户 WHERE EXISTS (SELECT 1 FROM 订单 WHERE amount > 250) AND id < 3 ORDER BY id"
+        assert _ids(engine.execute_sql_query(shop, sql)) == [1, 2]
+        assert len(engine.sub_executions) == 1
+
+
+class TestCorrelatedIn:
+    def test_in(self, shop, engine):
+        sql = "SELECT id FROM 客户 c WHERE 100 IN (SELECT amount FROM 订单 o WHERE o.cust_id = c.id)"
+        assert _ids(engine.execute_sql_query(shop, sql)) == [1]
+        assert len(engine.sub_executions) == 1
+
+    def test_not_in_null_semantics(self, shop, engine):
+        # 客户5 的订单金额为 NULL → UNKNOWN; 无订单的客户 → 空集合, NOT IN 为 TRUE
+        sql = "SELECT id FROM 客户 c WHERE 100 NOT IN (SELECT amount FROM 订单 o WHERE o.cust_id = c.id) ORDER BY id"
+        assert _ids(engine.execute_sql_query(shop, sql)) == [2, 3, 4, 6, 7, 8]
+
+
+class TestFallback:
+    def test_non_equi_correlation_uses_row_filter(self, shop):
+        result = AdvancedSQLQueryEngine().execute_sql_query(shop, "SELECT id FROM 客户 c WHERE EXISTS (SELECT 1 FROM 订单 o WHERE o.cust_id > c.id) ORDER BY id")
+        assert _ids(result) == [1, 2, 3, 4, 5, 6, 7]
+        assert result["query_info"]["where_path"] == "row"
+
+    def test_outer_state_restored_after_subquery(self, shop):
+        sql = "SELECT c.name FROM 客户 c WHERE EXISTS (SELECT 1 FROM 订单 o WHERE o.cust_id = c.id AND o.amount > 60) ORDER BY c.id"
+        assert _ids(AdvancedSQLQueryEngine().execute_sql_query(shop, sql)) == ["c1", "c2"]
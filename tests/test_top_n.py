@@ -0,0 +1,146 @@
+"""
+ORDER BY ... LIMIT Top-N 测试
+
+LIMIT(+OFFSET) 远小于行数时, 按第一排序键 O(n) 选出可能排进前 N 的候选行(并列行全部保留), 只对候选行稳定排序;
+外层 WHERE 限定 ROW_NUMBER/RANK 别名 <= k 的分组 Top-N 子查询在计算窗口前裁掉每个分区排不进前 k 的行.
+结果与整表排序一致, 排序键相同的行保持原顺序.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api import advanced_sql_query
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine, _group_top_n_mask
+
+
+@pytest.fixture
+def heroes(tmp_path):
+    path = str(tmp_path / "heroes.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "英雄"
+    ws.append(["ID", "战力", "职业", "名称", "等级", "评分"])
+    rng = np.random.default_rng(7)
+    for i in range(240):
+        ws.append(
+            [
+                i,
+                None if i % 17 == 0 else int(rng.integers(0, 60)),
+                ["战士", "法师", "刺客", None][i % 4],
+                f"h{int(rng.integers(0, 40)):02d}",
+                int(rng.integers(1, 6)),
+                "高" if i % 29 == 0 else float(rng.integers(0, 50)),
+            ]
+        )
+    wb.save(path)
+    return path
+
+
+def _data(result):
+    assert result["success"], result["message"]
+    return result["data"]
+
+
+def _full_sort_data(monkeypatch, path, sql):
+    """关闭 Top-N 候选裁剪, 得到整表排序的结果作为对照"""
+    with monkeypatch.context() as patch:
+        engine = AdvancedSQLQueryEngine()
+        patch.setattr(advanced_sql_query, "_top_n_positions", lambda *args: None)
+        patch.setattr(engine, "_window_top_n_cut", lambda parsed_sql, df: df)
+        return _data(engine.execute_sql_query(path, sql))
+
+
+ORDER_QUERIES = [
+    "SELECT * FROM 英雄 ORDER BY 战力 DESC LIMIT 10",
+    "SELECT * FROM 英雄 ORDER BY 战力 LIMIT 10",
+    "SELECT ID, 战力 FROM 英雄 ORDER BY 战力 DESC NULLS FIRST LIMIT 5",
+    "SELECT ID FROM 英雄 ORDER BY 战力 ASC NULLS LAST LIMIT 8",
+    "SELECT ID, 职业, 战力 FROM 英雄 ORDER BY 职业, 战力 DESC LIMIT 7 OFFSET 20",
+    "SELECT ID, 名称 FROM 英雄 ORDER BY 名称 DESC, ID LIMIT 12",
+    "SELECT ID, 等级 FROM 英雄 ORDER BY 等级 DESC LIMIT 9",
+    "SELECT ID, 评分 FROM 英雄 ORDER BY 评分 DESC LIMIT 6",
+    "SELECT ID, 战力 * 2 AS 双倍 FROM 英雄 ORDER BY 双倍 DESC LIMIT 4",
+    "SELECT ID, 战力 FROM 英雄 WHERE 等级 > 2 ORDER BY 2 DESC, ID LIMIT 5",
+    "SELECT 职业, SUM(战力) AS 总战力 FROM 英雄 GROUP BY 职业 ORDER BY 总战力 DESC LIMIT 1",
+    "SELECT DISTINCT 等级 FROM 英雄 ORDER BY 等级 DESC LIMIT 3",
+]
+
+
+class TestOrderByLimit:
+    @pytest.mark.parametrize("sql", ORDER_QUERIES)
+    def test_same_rows_as_full_sort(self, heroes, monkeypatch, sql):
+        expected = _full_sort_data(monkeypatch, heroes, sql)
+        assert _data(AdvancedSQLQueryEngine().execute_sql_query(heroes, sql)) == expected
+
+    def test_only_candidates_sorted(self, heroes, monkeypatch):
+        cuts = []
+        original = advanced_sql_query._top_n_positions
+
+        def spy(values, *args):
+            positions = original(values, *args)
+            cuts.append((len(values), len(positions)))
+            return positions
+
+        monkeypatch.setattr(advanced_sql_query, "_top_n_positions", spy)
+        engine = AdvancedSQLQueryEngine()
+        assert len(_data(engine.execute_sql_query(heroes, "SELECT ID FROM 英雄 ORDER BY 等级 DESC, ID LIMIT 3"))) == 4
+        assert cuts[0][0] == 240 and cuts[0][1] < 100
+        cuts.clear()
+        engine.execute_sql_query(heroes, "SELECT ID FROM 英雄 ORDER BY 战力 LIMIT 100")
+        assert cuts == []
+
+    def test_ties_keep_original_order(self, heroes):
+        rows = _data(AdvancedSQLQueryEngine().execute_sql_query(heroes, "SELECT ID, 等级 FROM 英雄 ORDER BY 等级 DESC LIMIT 10"))[1:]
+        assert [level for _, level in rows] == [5] * 10
+        ids = [row_id for row_id, _ in rows]
+        assert ids == sorted(ids)
+
+
+WINDOW_QUERIES = [
+    "SELECT * FROM (SELECT ID, 职业, 战力, ROW_NUMBER() OVER (PARTITION BY 职业 ORDER BY 战力 DESC) AS rn FROM 英雄) t WHERE rn <= 3",
+    "SELECT ID, 职业, ROW_NUMBER() OVER (PARTITION BY 职业 ORDER BY 战力 DESC, ID) AS rn FROM 英雄 WHERE rn = 1",
+    "SELECT ID, ROW_NUMBER() OVER (ORDER BY 战力) AS rn FROM 英雄 WHERE rn < 6 AND ID > 10",
+    "SELECT ID, 等级, RANK() OVER (PARTITION BY 等级 ORDER BY 战力 DESC) AS rk FROM 英雄 WHERE rk BETWEEN 2 AND 3",
+    "SELECT ID, RANK() OVER (ORDER BY 等级 DESC) AS rk FROM 英雄 WHERE 2 >= rk",
+    "SELECT * FROM (SELECT ID, 名称, ROW_NUMBER() OVER (PARTITION BY 名称 ORDER BY 战力) AS rn FROM 英雄) t WHERE rn IN (1, 2) ORDER BY 名称, rn",
+    "SELECT ID, ROW_NUMBER() OVER (PARTITION BY 职业 ORDER BY 战力) AS rn FROM 英雄 WHERE rn <= 2 OR ID = 5",
+]
+
+
+class TestWindowTopN:
+    @pytest.mark.parametrize("sql", WINDOW_QUERIES)
+    def test_same_rows_as_full_window(self, heroes, monkeypatch, sql):
+        expected = _full_sort_data(monkeypatch, heroes, sql)
+        assert _data(AdvancedSQLQueryEngine().execute_sql_query(heroes, sql)) == expected
+
+    def test_partitions_cut_before_window(self, heroes, monkeypatch):
+        sizes = []
+        original = AdvancedSQLQueryEngine._apply_window_functions
+
+        def spy(self, parsed_sql, df):
+            sizes.append(len(df))
+            return original(self, parsed_sql, df)
+
+        monkeypatch.setattr(AdvancedSQLQueryEngine, "_apply_window_functions", spy)
+        engine = AdvancedSQLQueryEngine()
+        sql = "SELECT ID, 职业, ROW_NUMBER() OVER (PARTITION BY 职业 ORDER BY ID DESC) AS rn FROM 英雄 WHERE rn <= 2"
+        assert [row[0] for row in _data(engine.execute_sql_query(heroes, sql))[1:]] == [239, 238, 237, 236, 235, 234, 233, 232]
+        assert 8 in sizes
+
+        sizes.clear()
+        # 内层还有其他窗口函数时需要全部行
+        engine.execute_sql_query(heroes, "SELECT ID, ROW_NUMBER() OVER (ORDER BY ID) AS rn, SUM(战力) OVER () AS s FROM 英雄 WHERE rn <= 2")
+        assert 240 in sizes
+
+
+class TestGroupTopNMask:
+    @pytest.mark.parametrize("n", [1, 2, 5])
+    def test_matches_groupby_min_rank(self, n):
+        rng = np.random.default_rng(n)
+        keys = rng.integers(0, 8, 500).astype(float)
+        keys[::13] = np.inf
+        codes = rng.integers(0, 30, 500)
+        expected = pd.Series(keys).groupby(codes).rank(method="min").to_numpy() <= n
+        np.testing.assert_array_equal(_group_top_n_mask(keys, codes, n), expected)
@@ -0,0 +1,105 @@
+"""
+UPDATE SET 整列向量化求值测试
+
+SET 表达式(常量、列引用、算术、CONCAT/UPPER/LOWER/TRIM)对 WHERE 命中的行整列求值一次,
+变更列表、类型校验错误与逐行求值完全一致; 不支持的表达式(CASE 等)回退逐行求值.
+"""
+
+import pytest
+from openpyxl import Workbook, load_workbook
+from sqlglot import exp
+
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine, _NotVectorizable
+
+
+@pytest.fixture
+def monsters(tmp_path):
+    path = str(tmp_path / "monsters.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "怪物表"
+    ws.append(["ID", "名称", "等级", "血量", "攻击", "备注", "空列"])
+    for i in range(40):
+        ws.append([i, f"m{i}" if i % 7 else None, i % 5, 1000 + i, None if i % 9 == 0 else (i % 13) * 1.5, ["a", "b", None, "12"][i % 4], None])
+    wb.save(path)
+    return path
+
+
+@pytest.fixture
+def row_engine(monkeypatch):
+    engine = AdvancedSQLQueryEngine()
+
+    def no_vectorize(*args):
+        raise _NotVectorizable("测试: 强制逐行求值")
+
+    monkeypatch.setattr(engine, "_apply_update_set_vectorized", no_vectorize)
+    return engine
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = AdvancedSQLQueryEngine()
+    engine.row_evaluations = 0
+    original = engine._evaluate_update_expression
+
+    def counting(expr, *args, **kwargs):
+        # 常量子表达式只求值一次, 只统计引用列的逐行求值
+        engine.row_evaluations += expr.find(exp.Column) is not None
+        return original(expr, *args, **kwargs)
+
+    monkeypatch.setattr(engine, "_evaluate_update_expression", counting)
+    return engine
+
+
+def _preview(engine, path, sql):
+    result = engine.execute_update_query(path, sql, dry_run=True)
+    result.pop("execution_time_ms", None)
+    return result
+
+
+class TestVectorizedSet:
+    @pytest.mark.parametrize(
+        "sql",
+        [
+            "UPDATE 怪物表 SET 血量 = 血量 * 1.1 WHERE 等级 > 2",
+            "UPDATE 怪物表 SET 血量 = 血量 + 5, 攻击 = 血量 - 1 WHERE 等级 = 1",
+            "UPDATE 怪物表 SET 血量 = 血量 / 4, 等级 = -等级 WHERE ID < 10",
+            "UPDATE 怪物表 SET 血量 = 血量 % 7 WHERE ID < 10",
+            "UPDATE 怪物表 SET 攻击 = 攻击 * 2 WHERE ID > 0 AND ID < 9",
+            "UPDATE 怪物表 SET 名称 = UPPER(名称), 备注 = LOWER(名称) WHERE ID < 10",
+            "UPDATE 怪物表 SET 备注 = 血量 * 2, 空列 = 等级 WHERE ID < 10",
+            "UPDATE 怪物表 SET 血量 = 等级, 等级 = 血量 WHERE ID < 10",
+            "UPDATE 怪物表 SET 等级 = 等级 * 1.5, 血量 = 等级 + 1 WHERE ID < 10",
+            "UPDATE 怪物表 SET 血量 = '123', 空列 = 'x' WHERE ID < 10",
+        ],
+    )
+    def test_same_changes_as_row_evaluation(self, monsters, engine, row_engine, sql):
+        result = _preview(engine, monsters, sql)
+        assert result["success"], result["message"]
+        assert engine.row_evaluations == 0
+        assert result == _preview(row_engine, monsters, sql)
+
+    @pytest.mark.parametrize(
+        "sql",
+        [
+            # 攻击列含 NULL → NaN 结果, 报错与逐行一致
+            "UPDATE 怪物表 SET 攻击 = 攻击 * 2 WHERE ID < 20",
+            "UPDATE 怪物表 SET 血量 = 'abc' WHERE ID < 10",
+        ],
+    )
+    def test_type_validation_errors_identical(self, monsters, engine, row_engine, sql):
+        result = _preview(engine, monsters, sql)
+        assert not result["success"]
+        assert result == _preview(row_engine, monsters, sql)
+
+    def test_unsupported_expression_falls_back(self, monsters, engine, row_engine):
+        sql = "UPDATE 怪物表 SET 血量 = CASE WHEN 等级 > 2 THEN 1 ELSE 2 END, 攻击 = 血量 / (等级 - 1) WHERE ID < 10"
+        result = _preview(engine, monsters, sql)
+        assert engine.row_evaluations > 0
+        assert result == _preview(row_engine, monsters, sql)
+
+    def test_written_to_file(self, monsters):
+        result = AdvancedSQLQueryEngine().execute_update_query(monsters, "UPDATE 怪物表 SET 血量 = 血量 * 2 WHERE 等级 = 4")
+        assert result["success"], result["message"]
+        ws = load_workbook(monsters)["怪物表"]
+        assert [ws.cell(row=r, column=4).value for r in (6, 7, 11)] == [2008, 1005, 2018]
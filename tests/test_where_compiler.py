@@ -0,0 +1,131 @@
+"""
+WHERE 向量化编译测试
+
+WHERE 条件树直接编译为整列三值布尔掩码(比较/LIKE/REGEXP/IN/BETWEEN/CASE/COALESCE/CAST/字符串与数值函数),
+只有 EXISTS、ALL/ANY、关联子查询等结构回退到逐行过滤; query_info["where_path"] 报告所走路径.
+"""
+
+import pytest
+import sqlglot
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+
+
+@pytest.fixture
+def heroes(tmp_path):
+    path = str(tmp_path / "heroes.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "角色"
+    ws.append(["ID", "Name", "Level", "Guild"])
+    for i in range(1, 13):
+        ws.append([i, f"Hero {i}", None if i % 4 == 0 else i * 1.5, ["red", "blue", None][i % 3]])
+    wb.save(path)
+    return path
+
+
+def _ids(result):
+    assert result["success"], result["message"]
+    return [row[0] for row in result["data"][1:]]
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = AdvancedSQLQueryEngine()
+
+    def no_row_filter(condition, df):
+        raise AssertionError(f"不应逐行过滤: {condition}")
+
+    monkeypatch.setattr(engine, "_apply_row_filter", no_row_filter)
+    return engine
+
+
+class TestVectorizedWhere:
+    @pytest.mark.parametrize(
+        "where, expected",
+        [
+            ("Level > 10", [7, 9, 10, 11]),
+            ("Level BETWEEN 3 AND 9", [2, 3, 5, 6]),
+            ("Level IS NULL", [4, 8, 12]),
+            ("Guild IS NOT NULL AND ID < 5", [1, 3, 4]),
+            ("Name LIKE 'hero 1'", [1]),
+            ("Name LIKE 'HERO 1_'", [10, 11, 12]),
+            ("Name REGEXP '1$'", [1, 11]),
+            ("ID IN (2, 3, 99)", [2, 3]),
+            ("UPPER(Name) = 'HERO 3' OR Level * 2 > 30", [3, 11]),
+            ("LENGTH(Name) > 6 AND ROUND(Level) >= 15", [10, 11]),
+            ("CASE WHEN Level > 10 THEN 'big' ELSE 'small' END = 'big'", [7, 9, 10, 11]),
+            ("COALESCE(Level, 0) = 0", [4, 8, 12]),
+            ("CAST(Level AS INT) = 4", [3]),
+            ("Level > (SELECT AVG(Level) FROM 角色)", [7, 9, 10, 11]),
+            ("ID IN (SELECT ID FROM 角色 WHERE Level > 15)", [11]),
+        ],
+    )
+    def test_conditions_compiled_to_masks(self, heroes, engine, where, expected):
+        result = engine.execute_sql_query(heroes, f"SELECT ID FROM 角色 WHERE {where} ORDER BY ID")
+        assert _ids(result) == expected
+        assert result["query_info"]["where_path"] == "vectorized"
+
+    def test_qualified_columns_after_join(self, heroes, engine):
+        sql = "SELECT a.ID FROM 角色 a JOIN 角色 b ON a.ID = b.ID WHERE a.Level > 10 AND b.Guild = 'blue' ORDER BY a.ID"
+        assert _ids(engine.execute_sql_query(heroes, sql)) == [7, 10]
+
+    def test_select_alias_in_where(self, heroes, engine):
+        result = engine.execute_sql_query(heroes, "SELECT ID, Level * 2 AS dbl FROM 角色 WHERE dbl > 20 ORDER BY ID")
+        assert result["data"] == [["ID", "dbl"], [7, 21.0], [9, 27.0], [10, 30.0], [11, 33.0]]
+
+
+class TestThreeValuedLogic:
+    @pytest.mark.parametrize(
+        "where, expected",
+        [
+            # NULL 行的比较结果是 UNKNOWN, 取反后仍被排除
+            ("NOT (Level > 5)", [1, 2, 3]),
+            ("Level <> 3", [1, 3, 5, 6, 7, 9, 10, 11]),
+            # 候选含 NULL 时 NOT IN 永不为 TRUE
+            ("Level NOT IN (3, NULL)", []),
+            ("Level IN (3, NULL)", [2]),
+            ("Level = NULL", []),
+            # UNKNOWN OR TRUE = TRUE; UNKNOWN AND FALSE = FALSE
+            ("Level > 100 OR ID = 4", [4]),
+            ("NOT (Level > 100 AND ID = 4)", [1, 2, 3, 5, 6, 7, 8, 9, 10, 11, 12]),
+        ],
+    )
+    def test_null_semantics(self, heroes, engine, where, expected):
+        assert _ids(engine.execute_sql_query(heroes, f"SELECT ID FROM 角色 WHERE {where} ORDER BY ID")) == expected
+
+    def test_empty_subquery_in(self, heroes, engine):
+        sql = "SELECT ID FROM 角色 WHERE Level NOT IN (SELECT Level FROM 角色 WHERE ID > 100) ORDER BY ID"
+        assert _ids(engine.execute_sql_query(heroes, sql)) == list(range(1, 13))
+
+
+class TestMixedTypes:
+    def test_mixed_column_compared_elementwise(self, tmp_path):
+        path = str(tmp_path / "mixed.xlsx")
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "数据"
+        ws.append(["ID", "Value"])
+        for i, value in enumerate([5, "n/a", 20, "15", None], 1):
+            ws.append([i, value])
+        wb.save(path)
+        result = AdvancedSQLQueryEngine().execute_sql_query(path, "SELECT ID FROM 数据 WHERE Value > 10 ORDER BY ID")
+        assert _ids(result) == [3, 4]
+        assert result["query_info"]["where_path"] == "vectorized"
+
+
+class TestFallback:
+    def test_non_equi_correlated_exists_uses_row_filter(self, heroes):
+        sql = "SELECT ID FROM 角色 a WHERE EXISTS (SELECT 1 FROM 角色 b WHERE b.Level > a.Level * 6) ORDER BY ID"
+        result = AdvancedSQLQueryEngine().execute_sql_query(heroes, sql)
+        assert _ids(result) == [1]
+        assert result["query_info"]["where_path"] == "row"
+
+    def test_correlated_subquery_detection(self):
+        where = sqlglot.parse_one("SELECT ID FROM 角色 a WHERE Level > (SELECT AVG(Level) FROM 角色 b WHERE b.ID < a.ID)", dialect="mysql").args["where"].this
+        assert AdvancedSQLQueryEngine._subquery_is_correlated(where.right)
+        assert not AdvancedSQLQueryEngine._subquery_is_correlated(sqlglot.parse_one("SELECT AVG(Level) FROM 角色 b WHERE b.ID < 3", dialect="mysql"))
+
+    def test_no_where_reports_no_path(self, heroes):
+        assert "where_path" not in AdvancedSQLQueryEngine().execute_sql_query(heroes, "SELECT ID FROM 角色")["query_info"]
@@ -0,0 +1,257 @@
+"""
+窗口框架(ROWS/RANGE BETWEEN)测试
+
+聚合与取值窗口函数按 ROWS/RANGE 框架求值: 整表按 (分区, 排序键) 排序一次, 每行框架为排序后的 [lo, hi) 区间,
+SUM/COUNT/AVG/STDDEV/VARIANCE 窄框架直接相加、宽框架取分区内前缀和之差, MIN/MAX 用稀疏表, FIRST/LAST/NTH_VALUE 按位置取值.
+结果与 SQLite 的窗口框架逐行一致; 有 ORDER BY 的 STDDEV/VARIANCE 为严格的累计值; 框架和与逐项顺序相加完全相等.
+"""
+
+import math
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api import advanced_sql_query
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+
+COLUMNS = ["ID", "职业", "时间", "金币", "等级"]
+
+
+def _rows():
+    rng = np.random.default_rng(3)
+    rows = []
+    for i in range(150):
+        rows.append(
+            [
+                i,
+                ["战士", "法师", "刺客"][i % 3],
+                int(rng.integers(0, 40)),
+                None if i % 11 == 0 else int(rng.integers(-50, 200)),
+                float(rng.integers(1, 30)) / 2,
+            ]
+        )
+    return rows
+
+
+@pytest.fixture(scope="module")
+def sheets(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("frames") / "frames.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "流水"
+    ws.append(COLUMNS)
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE 流水 (ID INTEGER, 职业 TEXT, 时间 INTEGER, 金币 INTEGER, 等级 REAL)")
+    for row in _rows():
+        ws.append(row)
+        conn.execute("INSERT INTO 流水 VALUES (?, ?, ?, ?, ?)", row)
+    wb.save(path)
+    yield path, conn
+    conn.close()
+
+
+def _data(result):
+    assert result["success"], result["message"]
+    return result["data"]
+
+
+def _same(actual, expected):
+    if expected is None or (isinstance(expected, float) and math.isnan(expected)):
+        return actual is None or (isinstance(actual, float) and math.isnan(actual))
+    if isinstance(expected, float) or isinstance(actual, float):
+        return actual is not None and abs(actual - expected) < 1e-9 * max(1.0, abs(expected))
+    return actual == expected
+
+
+FRAME_QUERIES = [
+    "AVG(金币) OVER (PARTITION BY 职业 ORDER BY 时间, ID ROWS BETWEEN 6 PRECEDING AND CURRENT ROW)",
+    "SUM(金币) OVER (ORDER BY ID ROWS BETWEEN 2 PRECEDING AND 3 FOLLOWING)",
+    "SUM(金币) OVER (PARTITION BY 职业 ORDER BY ID ROWS UNBOUNDED PRECEDING)",
+    "SUM(金币) OVER (PARTITION BY 职业 ORDER BY ID ROWS BETWEEN CURRENT ROW AND UNBOUNDED FOLLOWING)",
+    "SUM(金币) OVER (PARTITION BY 职业 ORDER BY ID ROWS BETWEEN 3 FOLLOWING AND 5 FOLLOWING)",
+    "SUM(金币) OVER (ORDER BY ID ROWS BETWEEN 5 PRECEDING AND 2 PRECEDING)",
+    "SUM(金币) OVER (ORDER BY ID ROWS BETWEEN 2 PRECEDING AND 3 PRECEDING)",
+    "COUNT(金币) OVER (PARTITION BY 职业 ORDER BY ID DESC ROWS BETWEEN 4 PRECEDING AND 1 FOLLOWING)",
+    "COUNT(*) OVER (ORDER BY ID ROWS BETWEEN 10 PRECEDING AND 10 FOLLOWING)",
+    "MIN(金币) OVER (PARTITION BY 职业 ORDER BY 时间, ID ROWS BETWEEN 3 PRECEDING AND 3 FOLLOWING)",
+    "MAX(等级) OVER (ORDER BY ID ROWS BETWEEN 20 PRECEDING AND CURRENT ROW)",
+    "MAX(金币) OVER (PARTITION BY 职业 ORDER BY ID ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)",
+    "SUM(金币) OVER (PARTITION BY 职业 ORDER BY 时间 RANGE BETWEEN 5 PRECEDING AND CURRENT ROW)",
+    "AVG(等级) OVER (ORDER BY 时间 DESC RANGE BETWEEN 3 PRECEDING AND 2 FOLLOWING)",
+    "COUNT(*) OVER (PARTITION BY 职业 ORDER BY 等级 RANGE BETWEEN 1.5 PRECEDING AND 0.5 FOLLOWING)",
+    "MIN(金币) OVER (ORDER BY 时间 RANGE BETWEEN CURRENT ROW AND 4 FOLLOWING)",
+    "SUM(等级) OVER (PARTITION BY 职业 ORDER BY 时间 RANGE BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)",
+    "COUNT(*) OVER (PARTITION BY 职业 RANGE BETWEEN CURRENT ROW AND CURRENT ROW)",
+    "FIRST_VALUE(金币) OVER (PARTITION BY 职业 ORDER BY ID ROWS BETWEEN 2 PRECEDING AND CURRENT ROW)",
+    "LAST_VALUE(金币) OVER (PARTITION BY 职业 ORDER BY ID ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING)",
+    "NTH_VALUE(金币, 2) OVER (ORDER BY ID ROWS BETWEEN 3 PRECEDING AND CURRENT ROW)",
+    "LAST_VALUE(职业) OVER (ORDER BY 时间 RANGE BETWEEN CURRENT ROW AND 2 FOLLOWING)",
+]
+
+
+class TestFramesMatchSqlite:
+    @pytest.mark.parametrize("window", FRAME_QUERIES)
+    def test_same_values_as_sqlite(self, sheets, window):
+        path, conn = sheets
+        sql = f"SELECT ID, {window} AS v FROM 流水 ORDER BY ID"
+        expected = conn.execute(sql).fetchall()
+        actual = _data(AdvancedSQLQueryEngine().execute_sql_query(path, sql))[1:]
+        assert [row[0] for row in actual] == [row[0] for row in expected]
+        mismatched = [(a, e) for a, e in zip(actual, expected) if not _same(a[1], e[1])]
+        assert mismatched == []
+
+    def test_integer_sums_stay_integers(self, sheets):
+        path, _ = sheets
+        sql = "SELECT ID, SUM(金币) OVER (ORDER BY ID ROWS BETWEEN 1 PRECEDING AND CURRENT ROW) AS s FROM 流水 ORDER BY ID LIMIT 3"
+        rows = _data(AdvancedSQLQueryEngine().execute_sql_query(path, sql))[1:]
+        coins = [row[3] for row in _rows()[:3]]
+        assert [row[1] for row in rows] == [None, coins[1], coins[1] + coins[2]]
+        assert all(type(row[1]) is int for row in rows[1:])
+
+
+@pytest.fixture(scope="module")
+def scores(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("exact") / "scores.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "成绩"
+    ws.append(["id", "guild_id", "score"])
+    rng = np.random.default_rng(8)
+    # 公会 0 的成绩全为 7.2
+    rows = [[i, i % 8, 7.2 if i % 8 == 0 else float(rng.integers(0, 1000)) / 10] for i in range(480)]
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+    return path, pd.DataFrame(rows, columns=["id", "guild_id", "score"])
+
+
+class TestExactFrameSums:
+    def test_one_row_frame_is_exact(self, scores):
+        path, frame = scores
+        sql = "SELECT id, AVG(score) OVER (PARTITION BY guild_id ORDER BY id ROWS BETWEEN 6 PRECEDING AND CURRENT ROW) AS a FROM 成绩 ORDER BY id"
+        rows = _data(AdvancedSQLQueryEngine().execute_sql_query(path, sql))[1:]
+        # 每个分区第一行的框架只有本行
+        assert [row[1] for row in rows[:8]] == frame["score"][:8].tolist()
+
+    def test_equal_values_are_exact(self, scores):
+        path, _ = scores
+        sql = (
+            "SELECT AVG(score) OVER (PARTITION BY guild_id ORDER BY id ROWS BETWEEN 6 PRECEDING AND CURRENT ROW) AS moving, "
+            "AVG(score) OVER (PARTITION BY guild_id ORDER BY id) AS running, "
+            "SUM(score) OVER (PARTITION BY guild_id ORDER BY id) AS total FROM 成绩 WHERE guild_id = 0 ORDER BY id"
+        )
+        rows = _data(AdvancedSQLQueryEngine().execute_sql_query(path, sql))[1:]
+        assert {(moving, running) for moving, running, _ in rows} == {(7.2, 7.2)}
+        assert [row[2] for row in rows] == [7.2 * n for n in range(1, 61)]
+
+    def test_sums_match_sequential_addition(self, scores):
+        path, frame = scores
+        sql = (
+            "SELECT id, SUM(score) OVER (PARTITION BY guild_id ORDER BY id ROWS BETWEEN 6 PRECEDING AND CURRENT ROW) AS moving, "
+            "SUM(score) OVER (PARTITION BY guild_id ORDER BY id) AS running FROM 成绩 WHERE guild_id > 0 ORDER BY id"
+        )
+        rows = _data(AdvancedSQLQueryEngine().execute_sql_query(path, sql))[1:]
+        moving, running = {}, {}
+        for _, group in frame[frame["guild_id"] > 0].groupby("guild_id"):
+            values = group["score"].tolist()
+            for position, row_id in enumerate(group["id"]):
+                moving[row_id] = sum(values[max(0, position - 6) : position + 1])
+                running[row_id] = math.fsum(values[: position + 1])
+        # 窄框架逐项相加, 与顺序求和完全相等; 累计和的误差不随整表行数增长
+        assert [row[1] for row in rows] == [moving[row[0]] for row in rows]
+        np.testing.assert_allclose([row[2] for row in rows], [running[row[0]] for row in rows], rtol=1e-14)
+
+
+class TestRunningStddev:
+    def test_cumulative_stddev_is_exact(self, sheets):
+        path, _ = sheets
+        sql = "SELECT ID, 职业, 金币, STDDEV(金币) OVER (PARTITION BY 职业 ORDER BY ID) AS s, VAR_POP(金币) OVER (PARTITION BY 职业 ORDER BY ID) AS v FROM 流水 ORDER BY ID"
+        frame = pd.DataFrame(_data(AdvancedSQLQueryEngine().execute_sql_query(path, sql))[1:], columns=["ID", "职业", "金币", "s", "v"])
+        coins = pd.to_numeric(frame["金币"])
+        expected_std = coins.groupby(frame["职业"]).transform(lambda x: x.expanding().std())
+        expected_var = coins.groupby(frame["职业"]).transform(lambda x: x.expanding().var(ddof=0))
+        np.testing.assert_allclose(pd.to_numeric(frame["s"]), expected_std, rtol=1e-9)
+        np.testing.assert_allclose(pd.to_numeric(frame["v"]), expected_var, rtol=1e-9)
+
+    def test_moving_stddev_matches_rolling(self, sheets):
+        path, _ = sheets
+        sql = "SELECT ID, 等级, STDDEV_SAMP(等级) OVER (ORDER BY ID ROWS BETWEEN 4 PRECEDING AND CURRENT ROW) AS s FROM 流水 ORDER BY ID"
+        frame = pd.DataFrame(_data(AdvancedSQLQueryEngine().execute_sql_query(path, sql))[1:], columns=["ID", "等级", "s"])
+        expected = pd.to_numeric(frame["等级"]).rolling(5, min_periods=2).std()
+        np.testing.assert_allclose(pd.to_numeric(frame["s"]), expected, rtol=1e-9)
+
+    def test_whole_partition_population_variance(self, sheets):
+        path, _ = sheets
+        sql = "SELECT 职业, VARIANCE_POP(等级) OVER (PARTITION BY 职业) AS v FROM 流水"
+        rows = _data(AdvancedSQLQueryEngine().execute_sql_query(path, sql))[1:]
+        levels = pd.DataFrame(_rows(), columns=COLUMNS).groupby("职业")["等级"].var(ddof=0)
+        assert all(abs(v - levels[job]) < 1e-9 for job, v in rows)
+
+
+class TestFrameErrors:
+    @pytest.mark.parametrize(
+        "window, message",
+        [
+            ("SUM(金币) OVER (ORDER BY ID ROWS BETWEEN UNBOUNDED FOLLOWING AND CURRENT ROW)", "UNBOUNDED FOLLOWING"),
+            ("SUM(金币) OVER (ORDER BY ID ROWS BETWEEN 1.5 PRECEDING AND CURRENT ROW)", "必须为整数"),
+            ("SUM(金币) OVER (ORDER BY 职业 RANGE BETWEEN 1 PRECEDING AND CURRENT ROW)", "数值列"),
+            ("SUM(金币) OVER (ORDER BY 时间, ID RANGE BETWEEN 1 PRECEDING AND CURRENT ROW)", "只有一列"),
+            ("COUNT(DISTINCT 金币) OVER (ORDER BY ID ROWS BETWEEN 1 PRECEDING AND CURRENT ROW)", "DISTINCT"),
+        ],
+    )
+    def test_rejected(self, sheets, window, message):
+        path, _ = sheets
+        result = AdvancedSQLQueryEngine().execute_sql_query(path, f"SELECT {window} AS v FROM 流水")
+        assert not result["success"]
+        assert message in result["message"]
+
+
+class TestKernels:
+    def test_frame_extreme_matches_slices(self):
+        rng = np.random.default_rng(0)
+        values = rng.normal(size=300)
+        values[::7] = np.nan
+        lo = rng.integers(0, 300, 500)
+        hi = np.minimum(lo + rng.integers(0, 80, 500), 300)
+        for reduce, reference in ((np.fmin, np.nanmin), (np.fmax, np.nanmax)):
+            expected = [reference(values[a:b]) if np.any(~np.isnan(values[a:b])) else np.nan for a, b in zip(lo, hi)]
+            np.testing.assert_array_equal(advanced_sql_query._frame_extreme(values, lo, hi, reduce), expected)
+
+    def test_frame_sum_matches_slices(self):
+        rng = np.random.default_rng(1)
+        values = rng.integers(0, 1000, 600) / 10
+        codes = np.repeat(np.arange(6), 100)
+        part_start = np.repeat(np.arange(0, 600, 100), 100)
+        lo = np.minimum(part_start + rng.integers(0, 100, 600), part_start + 99)
+        hi = np.minimum(lo + rng.integers(0, 90, 600), part_start + 100)
+        lo[::5] = part_start[::5]
+        expected = [sum(values[a:b].tolist()) for a, b in zip(lo, hi)]
+        actual = advanced_sql_query._frame_sum(values, lo, hi, codes, part_start)
+        narrow = (hi - lo) <= advanced_sql_query._FRAME_DIRECT_SUM_ROWS
+        # 窄框架逐项相加, 与顺序求和完全相等; 宽框架为分区内前缀和之差
+        assert narrow.any() and not narrow.all()
+        assert actual[narrow].tolist() == np.asarray(expected)[narrow].tolist()
+        np.testing.assert_allclose(actual, expected, rtol=1e-12)
+
+    def test_frame_search_within_partitions(self):
+        codes = np.array([0, 0, 0, 0, 1, 1, 1])
+        keys = np.array([1.0, 2.0, 2.0, np.nan, 1.0, 5.0, np.nan])
+        assert advanced_sql_query._frame_search(codes, keys, keys - 1, "left").tolist() == [0, 0, 0, 3, 4, 5, 6]
+        assert advanced_sql_query._frame_search(codes, keys, keys, "right").tolist() == [1, 3, 3, 4, 5, 6, 7]
+
+    @pytest.mark.parametrize("partitions", [6, 150])
+    def test_frame_search_matches_per_partition(self, partitions):
+        # 6 个分区走逐分区 searchsorted, 150 个分区(平均不足 8 行)走合并 lexsort
+        rng = np.random.default_rng(partitions)
+        codes = np.sort(rng.integers(0, partitions, 400))
+        keys = rng.integers(0, 50, 400).astype(float)
+        keys[::9] = np.nan
+        order = np.lexsort((keys, codes))
+        codes, keys = codes[order], keys[order]
+        starts = np.searchsorted(codes, codes)
+        for side, offset in (("left", -3.0), ("right", 2.5), ("left", np.nan)):
+            expected = [start + np.searchsorted(keys[codes == code], key + offset, side=side) for code, key, start in zip(codes, keys, starts)]
+            assert advanced_sql_query._frame_search(codes, keys, keys + offset, side).tolist() == expected
@@ -0,0 +1,165 @@
+"""
+窗口函数共用排序测试
+
+同一 (PARTITION BY, ORDER BY) 的窗口函数在一次查询中共用一份排序布局(行位置排列、分区号、并列段),
+ROW_NUMBER/RANK/DENSE_RANK/PERCENT_RANK/CUME_DIST/NTILE/LAG/LEAD 与聚合窗口都在该布局上整列求值;
+写入结果列后以该列分区/排序的布局失效. 结果与 SQLite 逐行一致.
+"""
+
+import math
+import sqlite3
+
+import numpy as np
+import pytest
+from openpyxl import Workbook
+
+from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
+
+COLUMNS = ["ID", "职业", "时间", "金币"]
+
+
+@pytest.fixture(scope="module")
+def sheets(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("shared") / "shared.xlsx")
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "流水"
+    ws.append(COLUMNS)
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE 流水 (ID INTEGER, 职业 TEXT, 时间 INTEGER, 金币 INTEGER)")
+    rng = np.random.default_rng(11)
+    for i in range(120):
+        row = [i, ["战士", "法师", "刺客", "牧师"][i % 4], int(rng.integers(0, 15)), None if i % 9 == 0 else int(rng.integers(0, 100))]
+        ws.append(row)
+        conn.execute("INSERT INTO 流水 VALUES (?, ?, ?, ?)", row)
+    wb.save(path)
+    yield path, conn
+    conn.close()
+
+
+@pytest.fixture
+def layout_calls(monkeypatch):
+    calls = []
+    original = AdvancedSQLQueryEngine._window_layout
+
+    def spy(self, df, partition_cols, order_cols, ascending):
+        calls.append((tuple(partition_cols), tuple(order_cols)))
+        return original(self, df, partition_cols, order_cols, ascending)
+
+    monkeypatch.setattr(AdvancedSQLQueryEngine, "_window_layout", spy)
+    return calls
+
+
+def _data(result):
+    assert result["success"], result["message"]
+    return result["data"]
+
+
+def _same(actual, expected):
+    if isinstance(expected, float) or isinstance(actual, float):
+        return actual is not None and expected is not None and math.isclose(actual, expected, abs_tol=1e-9)
+    return actual == expected
+
+
+WINDOW_EXPRS = [
+    "ROW_NUMBER() OVER (PARTITION BY 职业 ORDER BY 时间, ID)",
+    "RANK() OVER (PARTITION BY 职业 ORDER BY 时间)",
+    "RANK() OVER (ORDER BY 时间 DESC, 职业)",
+    "DENSE_RANK() OVER (PARTITION BY 职业 ORDER BY 时间 DESC)",
+    "PERCENT_RANK() OVER (PARTITION BY 职业 ORDER BY 时间)",
+    "CUME_DIST() OVER (ORDER BY 时间)",
+    "NTILE(5) OVER (PARTITION BY 职业 ORDER BY ID)",
+    "NTILE(4) OVER (ORDER BY 时间, ID)",
+    "LAG(金币) OVER (PARTITION BY 职业 ORDER BY ID)",
+    "LAG(金币, 2, -1) OVER (PARTITION BY 职业 ORDER BY ID)",
+    "LEAD(金币, 3, 0) OVER (ORDER BY 时间, ID)",
+    "LEAD(时间) OVER (PARTITION BY 职业 ORDER BY 时间 DESC, ID)",
+    "SUM(金币) OVER (PARTITION BY 职业 ORDER BY ID)",
+    "COUNT(金币) OVER (PARTITION BY 职业 ORDER BY 时间)",
+    "AVG(金币) OVER (PARTITION BY 职业)",
+]
+
+
+class TestAgainstSqlite:
+    @pytest.mark.parametrize("window", WINDOW_EXPRS)
+    def test_same_values_as_sqlite(self, sheets, window):
+        path, conn = sheets
+        sql = f"SELECT ID, {window} AS w FROM 流水"
+        actual = dict(map(tuple, _data(AdvancedSQLQueryEngine().execute_sql_query(path, sql))[1:]))
+        expected = dict(conn.execute(sql).fetchall())
+        mismatched = [key for key in expected if not _same(actual[key], expected[key])]
+        assert not mismatched, [(key, actual[key], expected[key]) for key in mismatched[:5]]
+
+    def test_mixed_windows_in_one_query(self, sheets, layout_calls):
+        path, conn = sheets
+        spec = "PARTITION BY 职业 ORDER BY 时间, ID"
+        sql = (
+            f"SELECT ID, ROW_NUMBER() OVER ({spec}) AS rn, RANK() OVER ({spec}) AS rk, LAG(金币) OVER ({spec}) AS prev, "
+            f"LEAD(金币, 1, 0) OVER ({spec}) AS next, SUM(金币) OVER ({spec}) AS running, "
+            "DENSE_RANK() OVER (ORDER BY 时间) AS dr FROM 流水 ORDER BY ID"
+        )
+        rows = _data(AdvancedSQLQueryEngine().execute_sql_query(path, sql))[1:]
+        assert [tuple(row) for row in rows] == conn.execute(sql).fetchall()
+        # 两种窗口规格各排序一次
+        assert sorted(layout_calls) == [((), ("时间",)), (("职业",), ("时间", "ID"))]
+
+
+class TestSharedLayout:
+    def test_result_column_invalidates_layout(self, sheets, layout_calls):
+        path, conn = sheets
+        sql = "SELECT ID, SUM(金币) OVER (PARTITION BY 职业) AS total, RANK() OVER (ORDER BY total DESC) AS rk, ROW_NUMBER() OVER (ORDER BY total DESC) AS rn FROM 流水"
+        rows = _data(AdvancedSQLQueryEngine().execute_sql_query(path, sql))[1:]
+        totals = dict(conn.execute("SELECT 职业, SUM(金币) FROM 流水 GROUP BY 职业").fetchall())
+        ranks = {total: rank for rank, total in enumerate(sorted(totals.values(), reverse=True))}
+        assert {row[2] for row in rows} == {rank * 30 + 1 for rank in ranks.values()}
+        assert sorted(row[3] for row in rows) == list(range(1, 121))
+        assert layout_calls.count(((), ("total",))) == 1
+
+    def test_layouts_not_kept_between_queries(self, sheets, layout_calls):
+        path, _ = sheets
+        engine = AdvancedSQLQueryEngine()
+        for low in (0, 1):
+            engine.execute_sql_query(path, f"SELECT ID, ROW_NUMBER() OVER (ORDER BY 时间) AS rn FROM 流水 WHERE ID >= {low}")
+        assert len(layout_calls) == 2
+        assert engine._window_layouts is None
+
+    def test_output_follows_first_window_order(self, sheets):
+        path, _ = sheets
+        sql = "SELECT ID, 时间, LAG(ID) OVER (ORDER BY 时间 DESC, ID) AS prev FROM 流水"
+        rows = _data(AdvancedSQLQueryEngine().execute_sql_query(path, sql))[1:]
+        assert [row[:2] for row in rows] == sorted((row[:2] for row in rows), key=lambda r: (-r[1], r[0]))
+        assert [row[2] for row in rows[1:]] == [row[0] for row in rows[:-1]]
+
+
+class TestSemantics:
+    def test_null_order_keys_rank_together(self, sheets):
+        path, _ = sheets
+        sql = "SELECT ID, RANK() OVER (ORDER BY 金币) AS rk, DENSE_RANK() OVER (ORDER BY 金币) AS dr FROM 流水 WHERE 金币 IS NULL OR 金币 < 10"
+        rows = _data(AdvancedSQLQueryEngine().execute_sql_query(path, sql))[1:]
+        nulls = [(rk, dr) for row_id, rk, dr in rows if row_id % 9 == 0]
+        # NULL 排在最后且彼此并列
+        assert len(set(nulls)) == 1
+        assert nulls[0][0] == len(rows) - len(nulls) + 1
+        assert nulls[0][1] == max(dr for _, _, dr in rows)
+
+    def test_lag_default_only_outside_partition(self, sheets):
+        path, conn = sheets
+        sql = "SELECT ID, LAG(金币, 1, -1) OVER (ORDER BY ID) AS prev FROM 流水 WHERE ID < 12"
+        rows = [tuple(row) for row in _data(AdvancedSQLQueryEngine().execute_sql_query(path, sql))[1:]]
+        assert rows[0] == (0, -1)
+        assert rows[1] == (1, None)
+        assert rows == conn.execute(sql + " ORDER BY ID").fetchall()
+
+    def test_count_distinct_over_partition(self, sheets):
+        path, conn = sheets
+        sql = "SELECT ID, 职业, COUNT(DISTINCT 时间) OVER (PARTITION BY 职业) AS kinds FROM 流水"
+        rows = _data(AdvancedSQLQueryEngine().execute_sql_query(path, sql))[1:]
+        expected = dict(conn.execute("SELECT 职业, COUNT(DISTINCT 时间) FROM 流水 GROUP BY 职业").fetchall())
+        assert {(job, kinds) for _, job, kinds in rows} == set(expected.items())
+
+    def test_ntile_uneven_buckets(self, sheets):
+        path, _ = sheets
+        sql = "SELECT ID, NTILE(3) OVER (PARTITION BY 职业 ORDER BY ID) AS t FROM 流水 WHERE ID < 9"
+        rows = _data(AdvancedSQLQueryEngine().execute_sql_query(path, sql))[1:]
+        # 战士 3 行, 其余职业 2 行: 前 n % 3 个桶多一行
+        assert dict(map(tuple, rows)) == {0: 1, 4: 2, 8: 3, 1: 1, 5: 2, 2: 1, 6: 2, 3: 1, 7: 2}
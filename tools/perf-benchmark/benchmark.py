@@ -8,10 +8,12 @@
 
 次指标:
     cold_load_ms  — 纯数据加载耗时 (load_data_with_cache 首次)。
+    cold_load_multi_ms — 多 sheet 工作簿全量加载耗时 (单次打开 workbook, 逐 sheet 构建 DataFrame)。
     warm_query_ms — 缓存命中时第二次聚合查询耗时 (基线下限)。
     orderby_ms    — ORDER BY DESC LIMIT 排序查询耗时。
 
-工作负载: 10K 行 × 6 列双行表头游戏配置表 (固定随机种子, 可复现)。
+工作负载: 10K 行 × 6 列双行表头游戏配置表 (固定随机种子, 可复现);
+多 sheet 工作负载: 8 个 sheet × 2K 行, 同样的表结构。
 
 设计原则:
     1. 每个指标用全新子进程测量, 隔离缓存污染。
@@ -38,7 +40,11 @@ COLS = 6
 REPEAT = 3  # 每个指标重复测量取中位数, 降低噪声
 SEED = 20260629
 
+MULTI_SHEETS = 8
+MULTI_ROWS = 2000
+
 TEST_FILE = REPO_ROOT / "tools" / "perf-benchmark" / "fixture_10k.xlsx"
+MULTI_TEST_FILE = REPO_ROOT / "tools" / "perf-benchmark" / "fixture_multi_sheet.xlsx"
 
 # 子进程测量脚本: 每个 metric 一个独立进程, 避免缓存共享
 # 通过环境变量 _BENCH_METRIC 选择要测量的指标
@@ -46,6 +52,7 @@ _PROBE = """
 import os, sys, time, gc
 sys.path.insert(0, os.path.join(os.environ["_BENCH_ROOT"], "src"))
 fp = os.environ["_BENCH_FILE"]
+multi_fp = os.environ["_BENCH_MULTI_FILE"]
 metric = os.environ["_BENCH_METRIC"]
 
 from excel_mcp_server_fastmcp.api.advanced_sql_query import AdvancedSQLQueryEngine
@@ -59,6 +66,13 @@ if metric == "cold_load":
     assert data and "Sheet1" in data, "加载失败"
     print(f"VALUE={t1 - t0}")
 
+elif metric == "cold_load_multi":
+    t0 = time.perf_counter()
+    data = engine._load_data_with_cache(multi_fp)
+    t1 = time.perf_counter()
+    assert len(data) == int(os.environ["_BENCH_MULTI_SHEETS"]), "多sheet加载失败"
+    print(f"VALUE={t1 - t0}")
+
 elif metric == "cold_query":
     sql = "SELECT 稀有度, COUNT(*) AS cnt, AVG(攻击力) AS avg_atk FROM Sheet1 GROUP BY 稀有度"
     t0 = time.perf_counter()
@@ -90,24 +104,14 @@ else:
 """
 
 
-def build_fixture() -> None:
-    """构建 10K 行 × 6 列双行表头测试文件 (固定种子, 可复现)."""
-    if TEST_FILE.exists():
-        # 已存在则跳过, 保持每次迭代文件一致 (mtime 也固定, 命中缓存逻辑可复现)
-        return
-    from openpyxl import Workbook
-
-    rng = random.Random(SEED)
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Sheet1"
-
+def _fill_sheet(ws, rng: random.Random, rows: int) -> None:
+    """写入双行表头 + rows 行游戏配置数据."""
     # 双行表头: 第1行中文描述, 第2行英文字段名
     ws.append(["ID", "名称", "稀有度", "攻击力", "生命值", "价格"])
     ws.append(["item_id", "item_name", "rarity", "attack", "hp", "price"])
 
     rarities = ["Common", "Rare", "Epic", "Legendary", "Mythic"]
-    for i in range(1, ROWS + 1):
+    for i in range(1, rows + 1):
         ws.append(
             [
                 i,
@@ -119,8 +123,29 @@ def build_fixture() -> None:
             ]
         )
 
-    wb.save(TEST_FILE)
-    wb.close()
+
+def build_fixture() -> None:
+    """构建 10K 行 × 6 列双行表头测试文件 + 多 sheet 测试文件 (固定种子, 可复现)."""
+    from openpyxl import Workbook
+
+    # 已存在则跳过, 保持每次迭代文件一致 (mtime 也固定, 命中缓存逻辑可复现)
+    if not TEST_FILE.exists():
+        rng = random.Random(SEED)
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Sheet1"
+        _fill_sheet(ws, rng, ROWS)
+        wb.save(TEST_FILE)
+        wb.close()
+
+    if not MULTI_TEST_FILE.exists():
+        rng = random.Random(SEED)
+        wb = Workbook()
+        wb.remove(wb.active)
+        for k in range(1, MULTI_SHEETS + 1):
+            _fill_sheet(wb.create_sheet(f"Sheet{k}"), rng, MULTI_ROWS)
+        wb.save(MULTI_TEST_FILE)
+        wb.close()
 
 
 def measure_once(metric: str) -> float:
@@ -128,6 +153,8 @@ def measure_once(metric: str) -> float:
     env = os.environ.copy()
     env["_BENCH_ROOT"] = str(REPO_ROOT)
     env["_BENCH_FILE"] = str(TEST_FILE)
+    env["_BENCH_MULTI_FILE"] = str(MULTI_TEST_FILE)
+    env["_BENCH_MULTI_SHEETS"] = str(MULTI_SHEETS)
     env["_BENCH_METRIC"] = metric
 
     proc = subprocess.run(
@@ -160,11 +187,13 @@ def main() -> int:
     build_fixture()
 
     print(f"[benchmark] fixture: {TEST_FILE.name} ({ROWS} rows × {COLS} cols)", file=sys.stderr)
+    print(f"[benchmark] fixture: {MULTI_TEST_FILE.name} ({MULTI_SHEETS} sheets × {MULTI_ROWS} rows)", file=sys.stderr)
     print(f"[benchmark] repeat per metric: {REPEAT}", file=sys.stderr)
 
     # 各指标独立测量, 互不污染
     cold_query = measure_median("cold_query")
     cold_load = measure_median("cold_load")
+    cold_load_multi = measure_median("cold_load_multi")
     warm_query = measure_median("warm_query")
     orderby = measure_median("orderby")
 
@@ -173,12 +202,14 @@ def main() -> int:
     # ASI 行记录为次指标 metadata
     print(f"METRIC cold_query_ms={cold_query * 1000:.2f}")
     print(f"ASI cold_load_ms={cold_load * 1000:.2f}")
+    print(f"ASI cold_load_multi_ms={cold_load_multi * 1000:.2f}")
     print(f"ASI warm_query_ms={warm_query * 1000:.2f}")
     print(f"ASI orderby_ms={orderby * 1000:.2f}")
     print(f"ASI cold_warm_ratio={(cold_query / warm_query if warm_query > 0 else 0):.1f}")
 
     print(
-        f"[benchmark] cold_query={cold_query * 1000:.1f}ms  cold_load={cold_load * 1000:.1f}ms  warm_query={warm_query * 1000:.1f}ms  orderby={orderby * 1000:.1f}ms",
+        f"[benchmark] cold_query={cold_query * 1000:.1f}ms  cold_load={cold_load * 1000:.1f}ms  cold_load_multi={cold_load_multi * 1000:.1f}ms  "
+        f"warm_query={warm_query * 1000:.1f}ms  orderby={orderby * 1000:.1f}ms",
         file=sys.stderr,
     )
     return 0